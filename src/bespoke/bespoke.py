@@ -17,6 +17,7 @@ It defines classes_and_methods
 # Imports
 #===================================================================================================
 import sys
+import logging
 from os import getcwd
 from socket import gethostname
 from os.path import abspath, basename, join
@@ -66,6 +67,11 @@ def cli_parser():
                         default=join(CWD, XSD_PATH_DEFAULT),
                         help="Path to the Bespoke xsd directory")
     
+    parser.add_argument('--store-results',
+                        dest='store_results',
+                        action='store_true',
+                        help="Move the collected results into the deduplicated results store")
+    
     # Process arguments
     args = parser.parse_args()
     return args  
@@ -94,8 +100,14 @@ def display_error(extended_message, exception, exit_code=1):
 def main(args):
     exit_code = 0
     
+    logging.basicConfig(format='%(levelname)s - %(message)s')
+    
     try: 
-        test_run = ExecuteTestRun(CWD, args.xsd_path, args.global_config, args.test_run_config)
+        test_run = ExecuteTestRun(CWD, 
+                                  args.xsd_path, 
+                                  args.global_config, 
+                                  args.test_run_config,
+                                  store_results=args.store_results)
         test_run.execute_test_run()
     except ExecutionError as e:
         exit_code = display_error("Failed to execute test run.", e)
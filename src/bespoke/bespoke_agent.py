@@ -7,22 +7,479 @@
 
 .. moduleauthor:: Ryan Gard <ryan.a.gard@outlook.com>
 """
-__version__ = 0.2
+__version__ = 0.3
 
 # ===================================================================================================
 # Imports
 # ===================================================================================================
+import os
 import sys
-import _winreg
-import win32net
-import win32netcon
+import json
+import signal
+import socket
+import logging
+from argparse import ArgumentParser
+from base64 import b64encode, b64decode
 from platform import platform, machine
-from os import environ, makedirs
-from os.path import join, isdir
-from subprocess import check_call, CalledProcessError
+from os import environ, makedirs, read
+from os.path import join, isdir, isfile, dirname
+from struct import Struct
+from subprocess import Popen, PIPE, STDOUT, check_call, CalledProcessError
 from shutil import copytree
+from threading import Thread, Lock, Timer
+from time import sleep
+from Queue import Queue
 from PySTAF import STAFHandle, STAFException
 
+try:
+    import _winreg
+    import win32net
+    import win32netcon
+except ImportError:
+    _winreg = win32net = win32netcon = None     #Only available on Windows.
+
+# ===================================================================================================
+# Globals
+# ===================================================================================================
+RECONNECT_WAIT = 5              #Seconds to wait before reconnecting to the Bespoke server.
+CHUNK_SIZE = 65536              #Bytes of file data or process output sent per message.
+HEADER = Struct('!I')           #Every message is JSON prefixed with its length in bytes.
+TOKEN_VARIABLE = 'BESPOKE_AGENT_TOKEN'  #Environment variable holding the shared token.
+
+_LOGGER = logging.getLogger(__name__)
+
+# ===================================================================================================
+# Classes
+# ===================================================================================================
+class AgentSession(object):
+    """A connection to the Bespoke server that stays open for as long as the server wants. The
+    server sends requests tagged with a unique id and every request is performed on its own
+    thread, so many requests can be in flight at once on the one connection. Everything the agent
+    sends back is tagged with the id of the request it belongs to:
+
+        {"id": 7, "type": "output", "data": <base64>}       Process output as it is produced.
+        {"id": 7, "type": "data", "data": <base64>}         File contents for a "Pull" request.
+        {"id": 7, "type": "result", "exit_code": 0, "message": "", "timed_out": false}
+
+    The server sends the contents of a "Push" request as "data" messages with the id of the
+    request followed by an "end" message. The agent announces itself with the shared token of
+    the server, which drops agents that don't know it.
+
+    Args:
+        sock (socket) = A socket connected to the Bespoke server.
+        name (str) = The name the agent announces itself with.
+        token (str) = The token shared with the Bespoke server.
+
+    Raises:
+        None.
+    """
+
+    def __init__(self, sock, name, token):
+        self._sock = sock
+        self._name = name
+        self._token = token
+        self._send_lock = Lock()
+        self._lock = Lock()
+        self._pushes = {}           #{id:Queue} of the "Push" requests waiting for data.
+        self._processes = {}        #{id:Popen} of the "Exec" requests. (None until started)
+        self._cancelled = set()     #The ids of the "Exec" requests cancelled before they started.
+        self._timed_out = set()     #The ids of the "Exec" requests killed by their timeout.
+        self._handlers = {'Exec': self._exec,
+                          'MakeDir': self._make_dir,
+                          'Ping': self._ping,
+                          'Pull': self._pull,
+                          'Push': self._push}
+
+    def _cancel(self, request_id):
+        """Cancel a running "Exec" or "Push" request.
+
+        Args:
+            request_id (int) = The id of the request to cancel.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        with self._lock:
+            process = self._processes.get(request_id)
+            push = self._pushes.get(request_id)
+
+            #The process is killed as soon as it starts.
+            if process is None and request_id in self._processes:
+                self._cancelled.add(request_id)
+
+        if process is not None:
+            kill_tree(process)
+
+        if push is not None:
+            push.put(None)
+
+    def _exec(self, request_id, params):
+        """Execute a command through the shell and stream its output as it is produced.
+
+        Args:
+            request_id (int) = The id of the request.
+            params ({str:obj}) = "command" and optionally "working_dir", "env_vars" and
+                "timeout" in seconds.
+
+        Returns:
+            (int) = The exit code of the command or None if it was killed by its timeout.
+
+        Raises:
+            None.
+        """
+
+        #JSON decodes every string as unicode but the environment of a process must be "str".
+        env = dict(environ)
+        env.update((native_str(key), native_str(value))
+                   for key, value in (params.get('env_vars') or {}).items())
+
+        working_dir = params.get('working_dir')
+        timer = None
+
+        try:
+            #Start the shell in its own process group so a timeout kills the children it started.
+            process = Popen(native_str(params['command']),
+                            cwd=native_str(working_dir) if working_dir is not None else None,
+                            env=env,
+                            shell=True,
+                            stdout=PIPE,
+                            stderr=STDOUT,
+                            preexec_fn=None if os.name == 'nt' else os.setsid)
+
+            with self._lock:
+                self._processes[request_id] = process
+                cancelled = request_id in self._cancelled
+
+            if cancelled:
+                kill_tree(process)
+
+            if params.get('timeout'):
+                timer = Timer(params['timeout'], self._time_out, [request_id])
+                timer.daemon = True
+                timer.start()
+
+            while True:
+                data = read(process.stdout.fileno(), CHUNK_SIZE)
+
+                if not data:
+                    break
+
+                self.send({'id': request_id, 'type': 'output', 'data': b64encode(data)})
+
+            exit_code = process.wait()
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+            with self._lock:
+                self._processes.pop(request_id, None)
+                self._cancelled.discard(request_id)
+
+        return None if request_id in self._timed_out else exit_code
+
+    def _make_dir(self, request_id, params):
+        """Create a directory and its parents if it doesn't exist yet.
+
+        Args:
+            request_id (int) = The id of the request.
+            params ({str:obj}) = "path" of the directory and optionally "fail_if_exists".
+
+        Returns:
+            (int)
+
+        Raises:
+            OSError: The directory could not be created or already exists and "fail_if_exists"
+                is set.
+        """
+
+        if params.get('fail_if_exists') and isdir(params['path']):
+            raise OSError('The directory "{0}" already exists!'.format(params['path']))
+
+        make_dirs(params['path'])
+
+        return 0
+
+    def _perform(self, request_id, action, params):
+        """Perform a request and send the result back to the server.
+
+        Args:
+            request_id (int) = The id of the request.
+            action (str) = The action to perform.
+            params ({str:obj}) = The parameters for the action.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        message = ''
+
+        try:
+            if action in self._handlers:
+                exit_code = self._handlers[action](request_id, params)
+            else:
+                exit_code = perform_action(action, params)
+        except Exception, e:
+            exit_code = 1
+            message = str(e)
+
+        with self._lock:
+            timed_out = request_id in self._timed_out
+            self._timed_out.discard(request_id)
+
+        if timed_out:
+            message = 'The command timed out after {0} seconds!'.format(params['timeout'])
+
+        self.send({'id': request_id,
+                   'type': 'result',
+                   'exit_code': exit_code,
+                   'message': message,
+                   'timed_out': timed_out})
+
+    def _ping(self, request_id, params):
+        """Answer a ping from the server.
+
+        Args:
+            request_id (int) = The id of the request.
+            params ({str:obj}) = Ignored.
+
+        Returns:
+            (int)
+
+        Raises:
+            None.
+        """
+
+        return 0
+
+    def _pull(self, request_id, params):
+        """Stream the contents of a file to the server.
+
+        Args:
+            request_id (int) = The id of the request.
+            params ({str:obj}) = "path" of the file.
+
+        Returns:
+            (int)
+
+        Raises:
+            None.
+        """
+
+        with open(params['path'], 'rb') as pull_file:
+            while True:
+                data = pull_file.read(CHUNK_SIZE)
+
+                if not data:
+                    break
+
+                self.send({'id': request_id, 'type': 'data', 'data': b64encode(data)})
+
+        return 0
+
+    def _push(self, request_id, params):
+        """Write the contents the server sends for a request to a file.
+
+        Args:
+            request_id (int) = The id of the request.
+            params ({str:obj}) = "path" of the file and optionally "overwrite" and "text" to
+                convert the line endings to the ones of this machine.
+
+        Returns:
+            (int)
+
+        Raises:
+            IOError: The file already exists and "overwrite" is not set.
+        """
+
+        with self._lock:
+            push = self._pushes[request_id]
+
+        try:
+            if not params.get('overwrite', True) and isfile(params['path']):
+                raise IOError('The file "{0}" already exists!'.format(params['path']))
+
+            make_dirs(dirname(params['path']))
+            pending = ''
+
+            with open(params['path'], 'wb') as push_file:
+                while True:
+                    data = push.get()
+
+                    #The data ends with an empty string and a cancel with None.
+                    if data is None:
+                        return 1
+                    elif not data:
+                        push_file.write(pending)
+
+                        return 0
+
+                    if params.get('text'):
+                        #A "\r\n" split between two chunks is finished with the next chunk.
+                        data = pending + data
+                        pending = '\r' if data.endswith('\r') else ''
+                        data = data[:len(data) - len(pending)]
+                        data = data.replace('\r\n', '\n').replace('\n', os.linesep)
+
+                    push_file.write(data)
+        finally:
+            with self._lock:
+                self._pushes.pop(request_id, None)
+
+    def _time_out(self, request_id):
+        """Kill an "Exec" request that ran past its timeout.
+
+        Args:
+            request_id (int) = The id of the request.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        with self._lock:
+            self._timed_out.add(request_id)
+
+        self._cancel(request_id)
+
+    def _receive_exact(self, size):
+        """Read exactly "size" bytes from the server.
+
+        Args:
+            size (int) = The number of bytes to read.
+
+        Returns:
+            (str) = The bytes or None if the server closed the connection.
+
+        Raises:
+            socket.error: The connection failed.
+        """
+
+        chunks = []
+
+        while size > 0:
+            chunk = self._sock.recv(min(size, CHUNK_SIZE * 2))
+
+            if not chunk:
+                return None
+
+            chunks.append(chunk)
+            size -= len(chunk)
+
+        return ''.join(chunks)
+
+    def receive(self):
+        """Read one message from the server.
+
+        Args:
+            None.
+
+        Returns:
+            ({str:obj}) = The message or None if the server closed the connection.
+
+        Raises:
+            socket.error: The connection failed.
+        """
+
+        header = self._receive_exact(HEADER.size)
+
+        if header is None:
+            return None
+
+        payload = self._receive_exact(HEADER.unpack(header)[0])
+
+        return None if payload is None else json.loads(payload)
+
+    def run(self):
+        """Announce the agent and perform the requests of the server until it disconnects.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        try:
+            self.send({'type': 'hello',
+                       'name': self._name,
+                       'token': self._token,
+                       'version': __version__})
+
+            while True:
+                message = self.receive()
+
+                if message is None:
+                    break
+
+                request_id = message.get('id')
+                message_type = message.get('type', 'request')
+
+                if message_type == 'request':
+                    #Register the request before its thread starts so it can be cancelled.
+                    with self._lock:
+                        if message['action'] == 'Push':
+                            self._pushes[request_id] = Queue()
+                        elif message['action'] == 'Exec':
+                            self._processes[request_id] = None
+
+                    thread = Thread(target=self._perform,
+                                    args=(request_id, message['action'], message['params']))
+                    thread.daemon = True
+                    thread.start()
+                elif message_type == 'cancel':
+                    self._cancel(request_id)
+                elif message_type in ('data', 'end'):
+                    with self._lock:
+                        push = self._pushes.get(request_id)
+
+                    if push is not None:
+                        push.put(b64decode(message['data']) if message_type == 'data' else '')
+        except (socket.error, ValueError, KeyError), e:
+            _LOGGER.error('Lost the connection to the Bespoke server! Reason: %s', e)
+        finally:
+            #Requests still running finish on their own but their results are lost.
+            with self._lock:
+                pushes = list(self._pushes.values())
+
+            for push in pushes:
+                push.put(None)
+
+            self._sock.close()
+
+    def send(self, message):
+        """Send a message to the server. Messages from different requests never interleave.
+
+        Args:
+            message ({str:obj}) = The message.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        payload = json.dumps(message)
+
+        try:
+            with self._send_lock:
+                self._sock.sendall(HEADER.pack(len(payload)) + payload)
+        except socket.error:
+            #The connection is gone and "run" is tearing the session down.
+            pass
+
 # ===================================================================================================
 # Functions
 # ===================================================================================================
@@ -49,6 +506,73 @@ def staf_get_var(staf_handle, var_name):
     return result.resultObj
 
 
+def native_str(value):
+    """Convert a string decoded from JSON back to the "str" type the operating system expects.
+        
+    Args:
+        value (str) = The string.
+    
+    Returns:
+        (str) = The string encoded with the file system encoding.
+    
+    Raises:
+        None.
+    """
+
+    if isinstance(value, unicode):
+        return value.encode(sys.getfilesystemencoding() or 'utf-8')
+
+    return str(value)
+
+
+def make_dirs(path):
+    """Create a directory and its parents if it doesn't exist yet. Concurrent requests may
+    create the same directory, which is fine.
+
+    Args:
+        path (str) = The directory to create.
+
+    Returns:
+        None.
+
+    Raises:
+        OSError: The directory could not be created.
+    """
+
+    try:
+        makedirs(path)
+    except OSError:
+        if not isdir(path):
+            raise
+
+
+def kill_tree(process):
+    """Kill a process and every process it started. On Windows "taskkill" walks the process
+    tree, elsewhere the process is expected to lead its own process group.
+        
+    Args:
+        process (Popen) = The process to kill.
+    
+    Returns:
+        None.
+    
+    Raises:
+        None.
+    """
+
+    try:
+        if os.name == 'nt':
+            with open(os.devnull, 'w') as devnull:
+                check_call(['taskkill', '/T', '/F', '/PID', str(process.pid)],
+                           stdout=devnull,
+                           stderr=devnull)
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except (OSError, CalledProcessError):
+        #The process already ended.
+        pass
+
+
 def xcopy(src, tgt):
     """Xcopy a tool from the Bespoke staging directory to a target location.
         
@@ -208,10 +732,100 @@ def set_auto_logon(domain, username, password):
     return True
 
 
+def perform_action(wb_action, wb_params):
+    """Perform one of the actions Bespoke can ask of the agent.
+        
+    Args:
+        wb_action (str) = The action to perform.
+        wb_params ({str:obj}) = The parameters to use for the action.
+        
+    Returns:
+        (int) = The exit code for the action.
+    
+    Raises:
+        None.
+    """
+
+    exit_code = 1
+
+    if wb_action == 'Xcopy':
+        exit_code = 0 if xcopy(wb_params['source_path'],
+                               wb_params['target_path']) else 1
+    elif wb_action == 'MSI':
+        exit_code = 0 if msi(wb_params.pop('source_msi'), wb_params) else 1
+    elif wb_action == 'ShareFolder':
+        exit_code = 0 if share_folder(wb_params['share_name'],
+                                      wb_params['path']) else 1
+    elif wb_action == 'SetAutoLogon':
+        exit_code = 0 if set_auto_logon(wb_params['Domain'],
+                                        wb_params['User'],
+                                        wb_params['Password']) else 1
+    else:
+        print("The action '{0}' is not recognized!".format(wb_action))
+
+    return exit_code
+
+
+def serve(host, port, name, token):
+    """Keep a connection to the Bespoke server open and perform its requests. The agent
+    reconnects whenever the connection is lost.
+        
+    Args:
+        host (str) = The host name of the Bespoke server.
+        port (int) = The port the Bespoke server listens for agents on.
+        name (str) = The name the agent announces itself with.
+        token (str) = The token shared with the Bespoke server.
+        
+    Returns:
+        None.
+    
+    Raises:
+        None.
+    """
+
+    while True:
+        try:
+            sock = socket.create_connection((host, port))
+        except socket.error, e:
+            _LOGGER.warning('Failed to connect to the Bespoke server "%s:%d"! Reason: %s',
+                            host, port, e)
+            sleep(RECONNECT_WAIT)
+            continue
+
+        #Requests are small and latency matters more than packet count.
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+        AgentSession(sock, name, token).run()
+
+        sleep(RECONNECT_WAIT)
+
+
 # ===================================================================================================
 # Main
 # ===================================================================================================
 def main():
+    parser = ArgumentParser(description='Perform actions on behalf of Bespoke.')
+    parser.add_argument('--server', metavar='HOST:PORT',
+                        help='Stay connected to the Bespoke server and perform its requests '
+                             'instead of the one action in the STAF variables.')
+    parser.add_argument('--name', default=socket.gethostname(),
+                        help='The name to announce to the Bespoke server.')
+    parser.add_argument('--token', default=environ.get(TOKEN_VARIABLE),
+                        help='The token shared with the Bespoke server. Defaults to the {0} '
+                             'environment variable.'.format(TOKEN_VARIABLE))
+
+    args = parser.parse_args()
+
+    if args.server is not None:
+        if not args.token:
+            parser.error('A token is required to connect to the Bespoke server!')
+
+        logging.basicConfig(format='%(asctime)s %(levelname)s - %(message)s')
+
+        host, port = args.server.rsplit(':', 1)
+        serve(host, int(port), args.name, args.token)
+
     staf_handle_name = 'wb_agent'  # The name of the handle.
     staf_handle = None  # The handle for communicating with STAF.
 
@@ -230,20 +844,7 @@ def main():
     wb_params = staf_get_var(staf_handle, 'params')
 
     # Perform the requested action.
-    if wb_action == 'Xcopy':
-        exit_code = 0 if xcopy(wb_params['source_path'],
-                               wb_params['target_path']) else 1
-    elif wb_action == 'MSI':
-        exit_code = 0 if msi(wb_params.pop('source_msi'), wb_params) else 1
-    elif wb_action == 'ShareFolder':
-        exit_code = 0 if share_folder(wb_params['share_name'],
-                                      wb_params['path']) else 1
-    elif wb_action == 'SetAutoLogon':
-        exit_code = 0 if set_auto_logon(wb_params['Domain'],
-                                        wb_params['User'],
-                                        wb_params['Password']) else 1
-    else:
-        print("The action '{0}' is not recognized!".format(wb_action))
+    exit_code = perform_action(wb_action, wb_params)
 
     # exit
     sys.exit(exit_code)
@@ -0,0 +1,374 @@
+"""
+.. module:: artifact_server
+   :platform: Linux, Windows
+   :synopsis: This module provides an embedded HTTP server that lets SystemUnderTests pull
+       artifacts from the Bespoke server.
+   :license: BSD, see LICENSE for more details.
+
+.. moduleauthor:: Caleb Moniot <cmoniot@gmail.com>
+"""
+__version__ = 0.1
+
+# ===================================================================================================
+# Imports
+# ===================================================================================================
+import re
+import json
+import posixpath
+from urllib import quote, unquote
+from threading import Thread
+from SocketServer import ThreadingMixIn
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from os.path import isdir, isfile, join, getsize
+from util import file_digest, directory_manifest, directory_digest
+
+# ===================================================================================================
+# Globals
+# ===================================================================================================
+TRANSFER_CHUNK_SIZE = 64 * 1024     #Number of bytes sent at a time.
+MANIFEST_CONTENT_TYPE = 'application/json'
+FILE_CONTENT_TYPE = 'application/octet-stream'
+
+_RGX_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# ===================================================================================================
+# Classes
+# ===================================================================================================
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """An HTTP server that handles every request in its own thread so many SUTs can pull at once.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+class _ArtifactRequestHandler(BaseHTTPRequestHandler):
+    """Serve files and directory manifests from the roots of the :class:`ArtifactServer`. URLs
+    have the form "/<root name>/<relative path>". Files support ETags and single byte range
+    requests so interrupted downloads can be resumed. Directories are served as a JSON manifest
+    with the size and digest of every file so a client can fetch only what it is missing.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def _resolve(self):
+        """Map the request path onto a local file or directory.
+
+        Args:
+            None.
+
+        Returns:
+            (str): The local path or None if the path is outside the roots.
+
+        Raises:
+            None.
+        """
+
+        path = unquote(self.path.split('?', 1)[0].split('#', 1)[0])
+        parts = [p for p in posixpath.normpath(path).split('/') if p not in ('', '.')]
+
+        if len(parts) == 0 or '..' in parts or parts[0] not in self.server.roots:
+            return None
+
+        return join(self.server.roots[parts[0]], *parts[1:])
+
+    def _send_error(self, code, message, headers=None):
+        """Send an error response with a plain text body.
+
+        Args:
+            code (int): The HTTP status code.
+            message (str): The body of the response.
+            headers ({str:str})(opt): Extra headers to send.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        self.send_response(code)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(message)))
+
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+
+        self.end_headers()
+
+        if self.command != 'HEAD':
+            self.wfile.write(message)
+
+    def _send_manifest(self, local_path):
+        """Send the manifest of a directory.
+
+        Args:
+            local_path (str): The local directory.
+
+        Returns:
+            None.
+
+        Raises:
+            IOError: A file in the directory could not be read.
+            OSError: A file in the directory does not exist.
+        """
+
+        files, dirs = directory_manifest(local_path)
+        body = json.dumps({'files': files, 'dirs': dirs})
+        etag = '"{0}"'.format(directory_digest(local_path))
+
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', MANIFEST_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _send_file(self, local_path):
+        """Send a file or the requested byte range of a file.
+
+        Args:
+            local_path (str): The local file.
+
+        Returns:
+            None.
+
+        Raises:
+            IOError: The file could not be read.
+            OSError: The file does not exist.
+        """
+
+        size = getsize(local_path)
+        etag = '"{0}"'.format(file_digest(local_path))
+
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+            return
+
+        start, end = 0, size - 1
+        partial = False
+        range_header = self.headers.get('Range')
+
+        #A range is only honoured if the client still has the same version of the file.
+        if range_header is not None and self.headers.get('If-Range', etag) == etag:
+            match = _RGX_RANGE.match(range_header.strip())
+
+            if match is None or match.groups() == ('', ''):
+                self._send_error(416,
+                                 'Unsupported range!',
+                                 {'Content-Range': 'bytes */{0}'.format(size)})
+                return
+
+            first, last = match.groups()
+
+            if first == '':
+                #A suffix range asks for the last N bytes.
+                start = max(size - int(last), 0)
+            else:
+                start = int(first)
+                end = min(int(last), size - 1) if last != '' else size - 1
+
+            if start >= size or start > end:
+                self._send_error(416,
+                                 'Range not satisfiable!',
+                                 {'Content-Range': 'bytes */{0}'.format(size)})
+                return
+
+            partial = True
+
+        self.send_response(206 if partial else 200)
+        self.send_header('Content-Type', FILE_CONTENT_TYPE)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', etag)
+
+        if partial:
+            self.send_header('Content-Range', 'bytes {0}-{1}/{2}'.format(start, end, size))
+
+        self.end_headers()
+
+        if self.command == 'HEAD':
+            return
+
+        remaining = end - start + 1
+
+        with open(local_path, 'rb') as file_handle:
+            file_handle.seek(start)
+
+            while remaining > 0:
+                chunk = file_handle.read(min(TRANSFER_CHUNK_SIZE, remaining))
+
+                if not chunk:
+                    break
+
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+
+    def do_GET(self):
+        """Handle a GET request.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        local_path = self._resolve()
+
+        try:
+            if local_path is not None and isfile(local_path):
+                self._send_file(local_path)
+            elif local_path is not None and isdir(local_path):
+                self._send_manifest(local_path)
+            else:
+                self._send_error(404, 'Not found!')
+        except (IOError, OSError) as e:
+            self._send_error(500, str(e))
+
+    def do_HEAD(self):
+        """Handle a HEAD request.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        self.do_GET()
+
+    def log_message(self, format, *args):
+        """Keep request logging off the console of the Bespoke server."""
+
+        pass
+
+class ArtifactServer(object):
+    """An embedded HTTP server that serves artifacts from a set of named local directories so
+    SystemUnderTests can pull artifacts in parallel and resume interrupted downloads instead of
+    having every byte pushed through STAF.
+
+    Args:
+        roots ({str:str}): The local directories to serve keyed by the name used in URLs.
+        hostname (str): The hostname SystemUnderTests use to reach the Bespoke server.
+        port (int)(opt): The port to listen on. A free port is picked if 0.
+
+    Raises:
+        :class:`ArtifactServerError`: The server could not listen on the port.
+    """
+
+    def __init__(self, roots, hostname, port=0):
+        self._hostname = hostname
+
+        try:
+            self._server = _ThreadingHTTPServer(('', int(port)), _ArtifactRequestHandler)
+        except (IOError, OSError) as e:
+            raise ArtifactServerError('Failed to listen on port "{0}"! Reason: {1}'.format(port,
+                                                                                        str(e)))
+
+        self._server.roots = dict(roots)
+        self._thread = None
+
+    def start(self):
+        """Start serving requests in the background.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        if self._thread is None:
+            self._thread = Thread(target=self._server.serve_forever)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """Stop serving requests and release the port.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+
+        self._server.server_close()
+
+    def url(self, root, relative_path=''):
+        """Build the URL of an artifact.
+
+        Args:
+            root (str): The name of the root directory that holds the artifact.
+            relative_path (str)(opt): The path of the artifact relative to the root.
+
+        Returns:
+            (str)
+
+        Raises:
+            :class:`ArtifactServerError`: The root is not served.
+        """
+
+        if root not in self._server.roots:
+            raise ArtifactServerError('The root "{0}" is not served!'.format(root))
+
+        path = posixpath.join(root, relative_path.replace('\\', '/'))
+
+        return 'http://{0}:{1}/{2}'.format(self._hostname, self.port, quote(path))
+
+    @property
+    def port(self):
+        """The port the server listens on.
+
+        Returns:
+            (int)
+        """
+
+        return self._server.server_address[1]
+
+# ===================================================================================================
+# Exceptions
+# ===================================================================================================
+class ArtifactServerError(Exception):
+    """Exception for errors in the artifact_server module.
+
+    Args:
+        msg (str): A message describing the error.
+    """
+
+    def __init__(self, msg):
+        self.message = self.msg = msg
+
+    def __str__(self):
+        return "Artifact Server Error: {0}".format(self.msg)
@@ -18,7 +18,7 @@ from lxml import etree as et
 from os.path import isfile
 from collections import OrderedDict, Counter
 from copy import deepcopy
-from hypervisor import VBoxMachine, VagrantMachine, VMError
+from hypervisor import VBoxMachine, VagrantMachine, LocalMachine, VMError
 from core import Tool, Build, TestCase, TestPlan, SystemUnderTest, CoreError
 
 # ===================================================================================================
@@ -520,6 +520,26 @@ class GlobalConfig(_Config):
         self._extract_simple_text(self._content, xml_root, 'ResultsPath', self.valid_path)
         self._extract_simple_text(self._content, xml_root, 'ResultsURL', self.valid_path)
         self._extract_simple_text(self._content, xml_root, 'GlobalLog', self.valid_path)
+        
+        #The staging settings are optional.
+        if xml_root.find('StagingPath') is not None:
+            self._extract_simple_text(self._content, xml_root, 'StagingPath', self.valid_path)
+            
+        if xml_root.find('MaxConcurrentStaging') is not None:
+            self._extract_simple_text(self._content, xml_root, 'MaxConcurrentStaging')
+            
+        if xml_root.find('ArtifactServerPort') is not None:
+            self._extract_simple_text(self._content, 
+                                      xml_root, 
+                                      'ArtifactServerPort', 
+                                      self.valid_port)
+            
+        if xml_root.find('AgentServerPort') is not None:
+            self._extract_simple_text(self._content, xml_root, 'AgentServerPort', self.valid_port)
+            
+        if xml_root.find('AgentToken') is not None:
+            self._extract_simple_text(self._content, xml_root, 'AgentToken')
+            
         self._extract_list_simple_text(self._content, 
                                        xml_root.find('ResourceConfigs'), 
                                        'ResourceConfig', 
@@ -1191,13 +1211,19 @@ class ResourceConfig(_Config):
         
         hypervisor = vm_host.attrib['hypervisor'] 
         host = vm_host.attrib['host']
+        op_limits = {'apply_snapshot':vm_host.attrib.get('max_concurrent_restores'),
+                     'start':vm_host.attrib.get('max_concurrent_starts'),
+                     'stop':vm_host.attrib.get('max_concurrent_stops')}
+        op_timeouts = {'apply_snapshot':vm_host.attrib.get('restore_timeout'),
+                       'start':vm_host.attrib.get('start_timeout'),
+                       'stop':vm_host.attrib.get('stop_timeout')}
         
         if not ResourceConfig.valid_network_address(host):
             raise ConfigError("The host address '{0}' is not valid!".format(host), 
                         self._config_file)
         
         for xml_vm in vm_host:    
-            self._process_vm(xml_vm, host, hypervisor)
+            self._process_vm(xml_vm, host, hypervisor, op_limits, op_timeouts)
     
     def _process_vm_tempalte(self, vm_template, host, provider):
         """Process a VM template etree element.
@@ -1246,13 +1272,15 @@ class ResourceConfig(_Config):
         # Finally add the a SUT to the ResourceConfig content.
         self._add_sut_to_content(actual_content, 'template')
         
-    def _process_vm(self, vm, host, hypervisor):
+    def _process_vm(self, vm, host, hypervisor, op_limits=None, op_timeouts=None):
         """Process a VM etree element.
         
         Args:
             vm (etree) = The VM etree object to process.
             host (str) = The host of the VM.
             hypervisor (str) = The hypervisor of the VM host.
+            op_limits ({str:str}) = The concurrent operation limits of the VM host.
+            op_timeouts ({str:str}) = The operation timeouts in seconds of the VM host.
         
         Returns:
             None.
@@ -1261,7 +1289,10 @@ class ResourceConfig(_Config):
             None.
         """
         
-        actual_content = {'Host':host, 'HyperVisor':hypervisor}
+        actual_content = {'Host':host, 
+                          'HyperVisor':hypervisor, 
+                          'OperationLimits':op_limits, 
+                          'OperationTimeouts':op_timeouts}
         
         # Populate the content dictionary.
         self._extract_simple_text(actual_content, vm, 'Alias')
@@ -1330,7 +1361,19 @@ class ResourceConfig(_Config):
         # TODO: We neeed to support the potential of credentials for VBox host.
         if content['HyperVisor'] == 'VirtualBox':
             try:
-                content['Machine'] = VBoxMachine(content['Host'], content['Name'])
+                content['Machine'] = VBoxMachine(content['Host'], 
+                                                 content['Name'], 
+                                                 op_limits=content['OperationLimits'],
+                                                 op_timeouts=content['OperationTimeouts'])
+            except VMError as e:
+                raise ConfigError('Failed to initialize "{0}" virtual machine! Reason: '
+                                  '{1}'.format(content['Alias'], e.msg), self.xml_config_file)
+        elif content['HyperVisor'] == 'Local':
+            # The sandbox for a local machine is the Bespoke root itself.
+            try:
+                content['Machine'] = LocalMachine(content['Host'], 
+                                                  content['Name'], 
+                                                  content['BespokeRoot'])
             except VMError as e:
                 raise ConfigError('Failed to initialize "{0}" virtual machine! Reason: '
                                   '{1}'.format(content['Alias'], e.msg), self.xml_config_file)
@@ -1677,6 +1720,7 @@ class TestPlanConfig(_Config):
         description = xml_step.find("Description").text
         resource_id = xml_step.find("ResourceID").text
         directory = xml_step.find("Directory").text
+        transfer_mode = xml_step.find("Directory").attrib.get('transfer', 'copy')
         interpreter = xml_step.find("Interpreter").text
         executable = xml_step.find("Executable").text
         post_wait = int(xml_step.find("PostWait").text)
@@ -1699,7 +1743,8 @@ class TestPlanConfig(_Config):
                                     timeout, 
                                     post_wait, 
                                     restart, 
-                                    restart_wait)
+                                    restart_wait,
+                                    transfer_mode)
         except CoreError as e:
             raise ConfigError(e.msg, self._config_file)
     
@@ -1720,6 +1765,7 @@ class TestPlanConfig(_Config):
         for xml_test_prep in xml_test_preps:
             sut_name = xml_test_prep.find("VirtualMachine").text
             resource_id = xml_test_prep.attrib['resource_id']
+            cleanup = xml_test_prep.attrib.get('cleanup', 'full')
             checkpoint = xml_test_prep.find("Checkpoint").text
             post_wait = int(xml_test_prep.find("PostWait").text)
             timeout = int(xml_test_prep.find("TimeOut").text)
@@ -1746,7 +1792,8 @@ class TestPlanConfig(_Config):
                                         post_wait, 
                                         timeout,
                                         restart,
-                                        restart_wait)
+                                        restart_wait,
+                                        cleanup)
             except CoreError as e:
                 raise ConfigError(e.msg, self._config_file)
             
@@ -13,18 +13,34 @@ __version__ = 0.2
 # Imports
 # ===================================================================================================
 import abc
-from time import sleep
+import json
+import logging
+from time import sleep, time
+from zipfile import ZipFile, BadZipfile
+from threading import Thread, BoundedSemaphore, Lock, Event
 from collections import OrderedDict
+from itertools import groupby
 from uuid import uuid1
 from datetime import datetime, timedelta
-from os.path import join, dirname, isdir, isfile
-from PySTAF import STAFHandle, STAFException
+from os import makedirs, remove, rename
+from os.path import join, dirname, basename, isdir, isfile, splitext, relpath
+from urllib import quote
+from PySTAF import STAFException
 from hypervisor import VMError
-from util import retry, unix_style_path
+from util import retry, unix_style_path, directory_manifest, directory_digest, payload_files, \
+compression_ratio
+from core.artifact_cache import LocalArtifactCache, CacheError, PARTIAL_SUFFIX, ARCHIVE_SUFFIX, \
+write_archive
+from core.copy_sourcer import CopyBasic, CopyFTP, CopyHTTP, CopyError
+from core.staf_pool import STAFHandlePool
+from core.process_supervisor import ProcessSupervisor, SupervisorError
+from core.transport import LocalTransport, STAFTransport, AgentTransport, TransportError
 
 # ===================================================================================================
 # Globals
 # ===================================================================================================
+_LOGGER = logging.getLogger(__name__)
+
 class BespokeGlobals(object):
     """This class contains global variables that are required to run Bespoke. Many of these
     variables need to be set at run time for Bespoke to work correctly.
@@ -55,6 +71,28 @@ class BespokeGlobals(object):
     # The maximum amount of time for a TestCommand wait in seconds.
     MAX_TEST_COMMAND_WAIT = 500
 
+    # The maximum number of SUTs an artifact is staged to at the same time.
+    MAX_CONCURRENT_STAGING = 4
+
+    # Transfers smaller than this many bytes are always sent uncompressed.
+    COMPRESSION_MIN_SIZE = 1024 * 1024
+
+    # Transfers over links faster than this many bytes per second are sent uncompressed.
+    COMPRESSION_MAX_THROUGHPUT = 40 * 1024 * 1024
+
+    # Transfers are only compressed if a sample compresses to this fraction of its size or less.
+    COMPRESSION_MAX_RATIO = 0.6
+
+    # The number of seconds between syncs of the results of a running test. (0 disables syncing)
+    RESULTS_STREAM_INTERVAL = 60
+
+    # A results file that is still growing is synced at least once every this many intervals.
+    RESULTS_STREAM_MAX_DEFER = 5
+
+    # Extensions of files that are already compressed and won't shrink any further.
+    COMPRESSED_EXTENSIONS = ('.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.rar', '.cab', '.msi',
+                             '.jar', '.png', '.jpg', '.jpeg', '.gif', '.mp4', '.avi')
+
     # TODO: This doesn't look to be necessary on the SUT.
     #The directory that stores configs on the SUT.
     CONFIGS = 'configs'
@@ -75,10 +113,34 @@ class BespokeGlobals(object):
     # The directory that stores test results on the SUT.
     RESULTS = 'results'
 
+    # The directory under the local staging path that holds the Bespoke directory structure.
+    SKELETON = 'skeleton'
+
+    # The directory that stores content addressed artifacts on the SUT. Survives re-installs.
+    CACHE = 'cache'
+
+    # The directory under the cache that stores delta synchronized directories on the SUT.
+    SYNC = 'sync'
+
+    # The suffix of the manifest file kept next to a delta synchronized directory on the SUT.
+    SYNC_MANIFEST_SUFFIX = '.manifest'
+
     # TODO: This doesn't look to be necessary on the SUT.
     # The directory that stores test reports on the SUT.
     REPORTS = 'reports'
 
+    # The directory under the local results path that holds the results store.
+    RESULTS_STORE = '.store'
+
+    # The registered STAF handles shared by every test in the process.
+    STAF_HANDLE_POOL = STAFHandlePool()
+
+    # Tracks the processes started on SUTs without blocking a thread per process.
+    PROCESS_SUPERVISOR = ProcessSupervisor(STAF_HANDLE_POOL)
+
+    # The server the Bespoke agents running in daemon mode connect to. None if it is disabled.
+    AGENT_SERVER = None
+
     # Local Bespoke server hostname. Needs to be set at runtime.
     BESPOKE_SERVER_HOSTNAME = ''
 
@@ -107,6 +169,15 @@ class BespokeGlobals(object):
     # The absolute local path to the results. Needs to be set at runtime.
     ABS_LOCAL_RESULTS = ''
 
+    # The absolute local path to the artifact staging area. Needs to be set at runtime.
+    ABS_LOCAL_STAGING = ''
+
+    # The base URL of the artifact server on the Bespoke server. Empty if the server is disabled.
+    ARTIFACT_SERVER_URL = ''
+
+    # The maximum amount of time for a SystemUnderTest to download an artifact in seconds.
+    ARTIFACT_PULL_TIMEOUT = 3600
+
     # TODO: Do we need to know this?
     # The absolute local path to the reports. Needs to be set at runtime.
     # ABS_LOCAL_REPORTS = ''
@@ -175,6 +246,7 @@ class _Test(object):
         self._sut = sut
         self._status = 'NotRan'
         self._staf_handle = None
+        self._transport = None
 
     @abc.abstractmethod
     def execute(self):
@@ -194,7 +266,10 @@ class _Test(object):
         pass
 
     def _init_staf_handle(self):
-        """Create a STAF handle.
+        """Check out a STAF handle from the shared pool and create the transport used to reach the
+        SUT. A sandbox SUT lives on the Bespoke server so it is reached through the local file 
+        system and subprocesses instead of STAF. A SUT whose agent is connected to the agent
+        server under its alias or network address is reached through the agent.
         
         Args:
             None.
@@ -207,13 +282,27 @@ class _Test(object):
         """
 
         try:
-            self._staf_handle = STAFHandle(str(uuid1()), STAFHandle.Standard)
+            self._staf_handle = BespokeGlobals.STAF_HANDLE_POOL.checkout()
         except STAFException, e:
             raise FatalError("Error registering with STAF, RC: {0}, "
                              "Result: {1}".format(e.rc, e.result))
 
+        server = BespokeGlobals.AGENT_SERVER
+        agents = server.agents if server is not None else []
+        names = [name for name in (self._sut.alias, self._sut.network_address) if name in agents]
+
+        if self._sut.is_sandbox:
+            self._transport = LocalTransport()
+        elif len(names) > 0:
+            self._transport = AgentTransport(server, names[0])
+        else:
+            self._transport = STAFTransport(self._sut.network_address,
+                                            self._staf_handle,
+                                            BespokeGlobals.PROCESS_SUPERVISOR)
+
     def _close_staf_handle(self):
-        """Close the STAF handle.
+        """Return the STAF handle to the shared pool. A handle that raised a STAF error is not
+        pooled again.
         
         Args:
             None.
@@ -222,14 +311,33 @@ class _Test(object):
             None.
         
         Raises:
-            :class:`FatalError`: Failed to unregister STAF handle.
+            None.
         """
 
-        try:
-            self._staf_handle.unregister()
-        except STAFException, e:
-            raise FatalError("Error unregistering with STAF, RC: {0}, "
-                             "Result: {1}".format(e.rc, e.result))
+        if self._staf_handle is not None:
+            BespokeGlobals.STAF_HANDLE_POOL.checkin(self._staf_handle,
+                                                    healthy=not self._staf_handle.failed)
+            self._staf_handle = None
+            self._transport = None
+
+    def _get_transport(self, location=None):
+        """Get the transport used to reach a machine. The transport of the SUT is created once 
+        when the STAF handle is checked out, other machines are reached through STAF.
+        
+        Args:
+            location (str)(opt) = The machine to reach. Defaults to the SUT.
+            
+        Returns:
+            (:class:`Transport`)
+        
+        Raises:
+            None.
+        """
+
+        if location is None or location == self._sut.network_address:
+            return self._transport
+
+        return STAFTransport(location, self._staf_handle, BespokeGlobals.PROCESS_SUPERVISOR)
 
     def _create_remote_dir(self, directory):
         """Create a directory on the SUT.
@@ -244,20 +352,132 @@ class _Test(object):
             :class:`CoreError`: Failed to create the directory on the SUT.
         """
 
-        staf_request = ('CREATE DIRECTORY "{0}" FULLPATH '
-                        'FAILIFEXISTS'.format(unix_style_path(directory)))
+        try:
+            self._get_transport().create_dir(directory, fail_if_exists=True)
+        except TransportError as e:
+            raise CoreError(e.msg)
 
-        result = self._staf_handle.submit(self._sut.network_address, 'fs', staf_request)
+    def _compress_transfer(self, local_path):
+        """Decide if a file or directory should be compressed before it is sent to the SUT. Only
+        large payloads that compress well are compressed, and only while the link to the SUT is 
+        slower than COMPRESSION_MAX_THROUGHPUT (or hasn't been measured yet). Only Windows SUTs
+        are sent compressed payloads because extracting them with STAF doesn't restore the file
+        modes (e.g. the executable bit) that other operating systems rely on.
+        
+        Args:
+            local_path (str) = The local file/directory path to send.
+            
+        Returns:
+            (bln)
+        
+        Raises:
+            None.
+        """
 
-        if result.rc != result.Ok:
-            raise CoreError(result.result)
+        if self._sut.os != 'Windows':
+            return False
+
+        try:
+            if sum(size for _, size in payload_files(local_path)) < \
+               BespokeGlobals.COMPRESSION_MIN_SIZE:
+                return False
+
+            throughput = self._sut.link_throughput
+
+            if throughput is not None and throughput >= BespokeGlobals.COMPRESSION_MAX_THROUGHPUT:
+                return False
+
+            return compression_ratio(local_path) <= BespokeGlobals.COMPRESSION_MAX_RATIO
+        except (IOError, OSError):
+            return False
+
+    def _record_transfer(self, local_path, start):
+        """Record the throughput of an uncompressed transfer to or from the SUT. Transfers that
+        are too small to measure the link are ignored.
+        
+        Args:
+            local_path (str) = The local file/directory path that was transferred.
+            start (float) = The time the transfer started.
+            
+        Returns:
+            None.
+        
+        Raises:
+            None.
+        """
+
+        try:
+            size = sum(size for _, size in payload_files(local_path))
+        except OSError:
+            return
+
+        if size >= BespokeGlobals.COMPRESSION_MIN_SIZE:
+            self._sut.record_transfer(size, time() - start)
+
+    def _staf_compressed_copy(self, local_path, remote_path):
+        """Copy a file or directory from the local machine to the SUT as a compressed archive and
+        extract it on the SUT.
+        
+        Args:
+            local_path (str) = The local file/directory path to copy.
+            remote_path (str) = The copy destination (absolute) on the SUT.
+            
+        Returns:
+            None.
+        
+        Raises:
+            :class:`CoreError`: Failed to copy or extract the file/directory on the SUT.
+        """
+
+        archive_name = str(uuid1()) + ARCHIVE_SUFFIX
+        local_archive = join(BespokeGlobals.ABS_LOCAL_STAGING, archive_name)
+        remote_archive = join(self._sut.bespoke_root, archive_name)
+
+        #A file is extracted next to its destination under the name of its destination.
+        remote_directory = remote_path if isdir(local_path) else dirname(remote_path)
 
-    def _staf_dir_copy(self, local_path, remote_path):
-        """Copy a directory from the local machine to the SUT.
+        try:
+            if not isdir(BespokeGlobals.ABS_LOCAL_STAGING):
+                makedirs(BespokeGlobals.ABS_LOCAL_STAGING)
+
+            write_archive(local_path, local_archive, basename(remote_path))
+        except (IOError, OSError) as e:
+            if isfile(local_archive):
+                remove(local_archive)
+
+            raise CoreError('Failed to compress "{0}"! Reason: {1}'.format(local_path, str(e)))
+
+        try:
+            self._staf_file_copy(local_archive, remote_archive, compress=False)
+
+            staf_request = 'CREATE DIRECTORY "{0}" FULLPATH'.format(
+                unix_style_path(remote_directory))
+
+            result = self._staf_handle.submit(self._sut.network_address, 'fs', staf_request)
+
+            if result.rc != result.Ok:
+                raise CoreError(result.result)
+
+            staf_request = 'UNZIP ZIPFILE "{0}" TODIRECTORY "{1}" REPLACE'.format(
+                unix_style_path(remote_archive),
+                unix_style_path(remote_directory))
+
+            result = self._staf_handle.submit(self._sut.network_address, 'zip', staf_request)
+
+            if result.rc != result.Ok:
+                raise CoreError(result.result)
+        finally:
+            remove(local_archive)
+            self._delete_remote_entry(remote_archive)
+
+    def _staf_dir_copy(self, local_path, remote_path, compress=True):
+        """Copy a directory from the local machine to the SUT. The directory is compressed on the
+        wire when that is expected to be faster.
         
         Args:
             local_path (str) = The local path from which to copy.
             remote_path (str) = The copy destination (absolute) on the SUT. 
+            compress (bln)(opt) = Allow the directory to be compressed.
             
         Returns:
             None.
@@ -266,24 +486,41 @@ class _Test(object):
             :class:`CoreError`: Failed to copy the directory to the SUT.
         """
 
-        staf_request = ('COPY DIRECTORY "{0}" TODIRECTORY "{1}" TOMACHINE "{2}" RECURSE '
-                        'KEEPEMPTYDIRECTORIES'.format(unix_style_path(local_path),
-                                                      unix_style_path(remote_path),
-                                                      self._sut.network_address))
+        transport = self._get_transport()
 
-        result = self._staf_handle.submit('local', 'fs', staf_request)
+        #There is no link to compress for or measure when the SUT is on this machine.
+        if transport.is_local:
+            compress = False
 
-        if result.rc != result.Ok:
-            raise CoreError(result.result)
+        if compress and self._compress_transfer(local_path):
+            self._staf_compressed_copy(local_path, remote_path)
+            return
+
+        start = time()
 
-    def _staf_file_copy(self, local_path, remote_path, overwrite=True, is_text_file=False):
-        """Copy a file from the local machine to the SUT.
+        try:
+            transport.copy_dir(local_path, remote_path)
+        except TransportError as e:
+            raise CoreError(e.msg)
+
+        if not transport.is_local:
+            self._record_transfer(local_path, start)
+
+    def _staf_file_copy(self, 
+                        local_path, 
+                        remote_path, 
+                        overwrite=True, 
+                        is_text_file=False, 
+                        compress=True):
+        """Copy a file from the local machine to the SUT. Binary files are compressed on the wire
+        when that is expected to be faster.
         
         Args:
             local_path (str) = The local file path to copy.
             remote_path (str) = The copy destination (absolute) on the SUT.
             overwrite (bln)(opt) = Specify to enable overwrite or not.
             is_text_file (bln)(opt) = Specify if source file is text or not.
+            compress (bln)(opt) = Allow the file to be compressed.
             
         Returns:
             None.
@@ -292,236 +529,1030 @@ class _Test(object):
             :class:`CoreError`: Failed to copy the file to the SUT.
         """
 
-        staf_create_request = ('CREATE DIRECTORY "{0}" '
-                               'FULLPATH'.format(unix_style_path(dirname(remote_path))))
-
-        result = self._staf_handle.submit(self._sut.network_address, 'fs', staf_create_request)
+        transport = self._get_transport()
 
-        if result.rc != result.Ok:
-            raise CoreError(result.Ok)
+        #There is no link to compress for or measure when the SUT is on this machine.
+        if transport.is_local:
+            compress = False
 
-        staf_copy_request = ('COPY FILE "{0}" TOFILE "{1}" '
-                             'TOMACHINE "{2}"'.format(unix_style_path(local_path),
-                                                      unix_style_path(remote_path),
-                                                      self._sut.network_address))
-        if is_text_file:
-            staf_copy_request += ' TEXT'
+        if compress and overwrite and not is_text_file and self._compress_transfer(local_path):
+            self._staf_compressed_copy(local_path, remote_path)
+            return
 
-        if not overwrite:
-            staf_copy_request += ' FAILIFEXISTS'
+        start = time()
 
-        result = self._staf_handle.submit('local', 'fs', staf_copy_request)
+        try:
+            transport.copy_file(local_path, remote_path, overwrite, is_text_file)
+        except TransportError as e:
+            raise CoreError(e.msg)
 
-        if result.rc != result.Ok:
-            raise CoreError(result.result)
+        if not transport.is_local:
+            self._record_transfer(local_path, start)
 
-    def _staf_start_proc(self,
-                         command,
-                         working_dir,
-                         wait,
-                         params=[],
-                         env_vars={},
-                         location='local'):
-        """Start a process via STAF.
+    def _staf_remote_copy(self, remote_source_path, remote_target_path):
+        """Copy a file or directory from one location on the SUT to another location on the SUT.
         
         Args:
-            command (str) = The command to execute.
-            working_dir (str) = The working directory to start the process from within.
-            wait (int) = The amount of time in seconds for STAF to wait before terminating the 
-                process.
-            params ([str])(opt) = A list of parameters to pass to the command.
-            env_vars ({str:str:})(opt) = A dictionary of environment variables to set on the target 
-                machine for the process.    
-            location (str)(opt) = The machine to execute the process on.
-        
+            remote_source_path (str) = The absolute source path on the SUT.
+            remote_target_path (str) = The copy destination (absolute) on the SUT.
+            
         Returns:
-            ((int), (str)) = The exit code of the "command" and the command output.
+            None.
         
         Raises:
-            :class:`CoreError`: The process failed to execute or the underlying command failed in 
-                some way.
+            :class:`CoreError`: Failed to copy the file/directory on the SUT.
         """
 
-        staf_request = ('START SHELL COMMAND "{0}" WORKDIR "{1}" WAIT '
-                        '{2}s STDERRTOSTDOUT RETURNSTDOUT'.format(unix_style_path(command),
-                                                                  unix_style_path(working_dir),
-                                                                  str(wait)))
-        if len(params) != 0:
-            staf_request += ' PARMS {0}'.format(" ".join(params))
+        if self._remote_entry_type(remote_source_path) == 'D':
+            staf_request = ('COPY DIRECTORY "{0}" TODIRECTORY "{1}" TOMACHINE "{2}" RECURSE '
+                            'KEEPEMPTYDIRECTORIES')
+        else:
+            staf_request = 'COPY FILE "{0}" TOFILE "{1}" TOMACHINE "{2}"'
 
-        if len(env_vars) != 0:
-            for key in env_vars:
-                staf_request += ' ENV {0}={1}'.format(key, env_vars[key])
+        #The copy is submitted to the SUT so the bytes never leave the SUT.
+        staf_request = staf_request.format(unix_style_path(remote_source_path),
+                                           unix_style_path(remote_target_path),
+                                           self._sut.network_address)
 
-        result = self._staf_handle.submit(location, 'process', staf_request)
+        result = self._staf_handle.submit(self._sut.network_address, 'fs', staf_request)
 
         if result.rc != result.Ok:
             raise CoreError(result.result)
 
-        #Return the exit code from the executed command and STDOUT.
-        return (int(result.resultObj['rc']), result.resultObj['fileList'][0]['data'])
-
-    @retry(BespokeGlobals.PING_RETRY_COUNT, CoreError, 1)
-    def _ping(self):
-        """This method will attempt to contact the target SystemUnderTest via STAF.
+    def _remote_entry_type(self, remote_path):
+        """Get the STAF entry type of a file or directory on the SUT.
         
         Args:
-            None.
-        
+            remote_path (str) = The absolute path on the SUT.
+            
         Returns:
-            None.
+            (str) = 'F' for a file, 'D' for a directory or None if the entry does not exist.
         
         Raises:
-            :class:`CoreError`: The host was not available via STAF.
-            :class:`FatalError`: Failure to communicate with the STAF service.
+            :class:`CoreError`: Failed to query the SUT.
         """
 
-        result = self._staf_handle.submit(self._sut.network_address, 'ping', 'ping')
+        staf_request = 'GET ENTRY "{0}" TYPE'.format(unix_style_path(remote_path))
 
-        #16 is ping timeout for STAF
-        if result.rc == result.NoPathToMachine:
-            raise CoreError('Could not ping "{0}" '
-                            'network address!'.format(self._sut.network_address))
+        result = self._staf_handle.submit(self._sut.network_address, 'fs', staf_request)
+
+        if result.rc == result.DoesNotExist:
+            return None
         elif result.rc != result.Ok:
-            raise FatalError(result.result)
+            raise CoreError(result.result)
 
-    def _graceful_restart(self, wait):
-        """Gracefully shutdown and then boot the SystemUnderTest.
+        return result.result
+
+    def _staf_cached_copy(self, local_path, archive=False):
+        """Copy a file or directory from the local machine into the content addressed artifact
+        cache on the SUT. The artifact is first stored in the local staging area to calculate its
+        digest and the transfer is skipped entirely if the SUT already holds the same bytes. Files
+        are pulled by the SUT from the artifact server when it is running.
         
         Args:
-            wait (bln) = Wait for restart to complete.
-        
+            local_path (str) = The local file/directory path to copy.
+            archive (bln)(opt) = Pack the directory into a single compressed archive and copy the
+                archive instead of the directory.
+            
         Returns:
-            (bln)
+            (str) = The absolute path of the cached artifact on the SUT.
         
         Raises:
-            :class:`CoreError`: Restart failed, may be recoverable.
+            :class:`CoreError`: Failed to cache the artifact on the SUT.
         """
 
-        self._sut.shutdown(True)
-        self._sut.start()
-
-        if wait:
-            sleep(BespokeGlobals.VM_BOOT_WAIT)
+        local_cache = LocalArtifactCache(BespokeGlobals.ABS_LOCAL_STAGING)
 
-    @property
-    def message(self):
-        """A message attached to results. Most likely this is a message associated with a failure or
-        fatal error.
-        
-        Returns:
-            (str)
-        """
+        try:
+            if archive:
+                digest, staged_path = local_cache.store_archive(local_path)
+            else:
+                digest, staged_path = local_cache.store(local_path)
+        except CacheError as e:
+            raise CoreError(e.msg)
+
+        remote_cache = join(self._sut.bespoke_root, BespokeGlobals.CACHE)
+        remote_entry = join(remote_cache, digest)
+        remote_partial = remote_entry + PARTIAL_SUFFIX
+        name = basename(staged_path)
+
+        if self._remote_entry_type(join(remote_entry, name)) is not None:
+            return join(remote_entry, name)
+
+        #Clear out any partial entry left behind by an interrupted transfer.
+        self._delete_remote_entry(remote_partial)
+
+        if isdir(staged_path):
+            self._staf_dir_copy(staged_path, join(remote_partial, name))
+        elif not self._http_pull(staged_path, join(remote_partial, name)):
+            self._staf_file_copy(staged_path, join(remote_partial, name))
+
+        #Only publish the entry after every byte has arrived.
+        staf_request = ('MOVE DIRECTORY "{0}" TODIRECTORY "{1}" TOMACHINE "{2}" RECURSE '
+                        'KEEPEMPTYDIRECTORIES'.format(unix_style_path(remote_partial),
+                                                      unix_style_path(remote_entry),
+                                                      self._sut.network_address))
 
-        return self._message
+        result = self._staf_handle.submit(self._sut.network_address, 'fs', staf_request)
 
-    @property
-    def name(self):
-        """The name of the test.
-        
-        Returns:
-            (str)
-        """
+        if result.rc != result.Ok:
+            raise CoreError(result.result)
 
-        return self._name
+        return join(remote_entry, name)
 
-    @property
-    def status(self):
-        """The current status of the test.
+    def _http_pull(self, staged_path, remote_path):
+        """Have the SUT download a file in the local staging area from the artifact server. The
+        download runs on the SUT so many SUTs can pull at once without every byte being pushed
+        through STAF by the Bespoke server.
         
+        Args:
+            staged_path (str) = The file in the local staging area to download.
+            remote_path (str) = The download destination (absolute) on the SUT.
+            
         Returns:
-            (str):
-                'NotRan'
-                'Running'
-                'Paused'
-                'Pass'
-                'Fail'
-                'Fatal'
-                'Critical'
+            (bln) = True if the SUT downloaded the file. False if the artifact server isn't running,
+                the SUT is a sandbox or the download failed, in which case the file must be copied.
+        
+        Raises:
+            None.
         """
 
-        return self._status
+        if BespokeGlobals.ARTIFACT_SERVER_URL == '' or self._sut.is_sandbox:
+            return False
 
-    @property
-    def sut(self):
-        """The SystemUnderTest associated with the test object.
-        
-        Returns:
-            (:class:`SystemUnderTest`)
-        """
+        url = '{0}/staging/{1}'.format(BespokeGlobals.ARTIFACT_SERVER_URL, quote(
+            unix_style_path(relpath(staged_path, BespokeGlobals.ABS_LOCAL_STAGING))))
 
-        return self._sut
+        remote_path = unix_style_path(remote_path)
 
-class _TestResults(_Test):
-    """This class is the abstract base class for all test classes with result artifacts.
-    
-    Args:
-        name (str) = The name of the test.
-        sut (:class:`SystemUnderTest`) = The SUT to execute remote STAF process calls against.
-        
-    Raises:
-        None.
-    """
+        if self._sut.os == 'Windows':
+            command = 'powershell'
+            params = ['-NoProfile', '-NonInteractive', '-Command', 'Invoke-WebRequest',
+                      '-UseBasicParsing', '-Uri', url, '-OutFile', remote_path]
+        else:
+            command = 'curl'
+            params = ['--fail', '--silent', '--show-error', '--output', remote_path, url]
 
-    __metaclass__ = abc.ABCMeta
+        try:
+            self._get_transport().create_dir(dirname(remote_path))
 
-    def __init__(self, name, sut):
-        super(_TestResults, self).__init__(name, sut)
+            exit_code, _ = self._staf_start_proc(command,
+                                                 dirname(remote_path),
+                                                 BespokeGlobals.ARTIFACT_PULL_TIMEOUT,
+                                                 params,
+                                                 location=self._sut.network_address)
+        except (CoreError, TransportError):
+            return False
 
-        self._uuid = str(uuid1())
-        self._local_results_path = join(BespokeGlobals.ABS_LOCAL_RESULTS, self._uuid)
-        self._remote_results_path = join(self._sut.bespoke_root, BespokeGlobals.RESULTS, self._uuid)
-        self._setup_has_ran = False
+        return exit_code == 0
 
-    def _setup_results(self):
-        """Prepare the remote results directory.
+    def _staf_archive_copy(self, local_path, remote_path):
+        """Copy a directory from the local machine to the SUT as a single compressed archive and
+        extract it on the SUT. This avoids a STAF round trip for every file in the directory and 
+        the archive is cached on both ends so an unchanged directory is only packed and sent once.
+        An archive the SUT already holds is extracted in a single round trip.
         
         Args:
-            None.
-        
+            local_path (str) = The local directory path to copy.
+            remote_path (str) = The copy destination (absolute) on the SUT.
+            
         Returns:
             None.
         
         Raises:
-            :class:`CoreError`: Failed to create the remote results directory.
-            :class:`FatalError`: Failure to communicate with the STAF service.
+            :class:`CoreError`: Failed to copy or extract the directory on the SUT.
         """
 
-        self._ping()
+        try:
+            key, staged_path = LocalArtifactCache(BespokeGlobals.ABS_LOCAL_STAGING).store_archive(
+                local_path)
+        except CacheError as e:
+            raise CoreError(e.msg)
+
+        staf_request = 'UNZIP ZIPFILE "{0}" TODIRECTORY "{1}" REPLACE'
+
+        #Optimistically extract out of the remote cache before checking that the archive is there.
+        remote_archive = join(self._sut.bespoke_root,
+                              BespokeGlobals.CACHE,
+                              key,
+                              basename(staged_path))
+
+        result = self._staf_handle.submit(self._sut.network_address,
+                                          'zip',
+                                          staf_request.format(unix_style_path(remote_archive),
+                                                              unix_style_path(remote_path)))
+
+        if result.rc == result.Ok:
+            return
+        elif result.rc == result.DoesNotExist:
+            _LOGGER.debug('The archive of "%s" is not cached on "%s" yet.', local_path,
+                          self._sut.alias)
+        else:
+            _LOGGER.warning('Failed to extract the cached archive of "%s" on "%s"! Copying the '
+                            'archive again. Reason: %s', local_path, self._sut.alias, result.result)
 
-        self._create_remote_dir(self._remote_results_path)
+        remote_archive = self._staf_cached_copy(local_path, archive=True)
 
-        self._setup_has_ran = True
+        result = self._staf_handle.submit(self._sut.network_address,
+                                          'zip',
+                                          staf_request.format(unix_style_path(remote_archive),
+                                                              unix_style_path(remote_path)))
 
-    def _get_remote_results(self):
-        """Copy the results from the SUT to the local machine.
+        if result.rc != result.Ok:
+            raise CoreError(result.result)
+
+    def _staf_sync_copy(self, local_path, remote_path):
+        """Synchronize a directory on the SUT with a directory on the local machine. A manifest 
+        with the size and digest of every file last sent is kept next to the remote directory so
+        only new or changed files are copied and files that no longer exist locally are deleted.
         
         Args:
-            None.
-        
+            local_path (str) = The local directory path to synchronize from.
+            remote_path (str) = The directory (absolute) on the SUT to synchronize.
+            
         Returns:
             None.
         
         Raises:
-            :class:`CoreError`: Failed to retrieve the remote results from SUT.
+            :class:`CoreError`: Failed to synchronize the directory on the SUT.
         """
 
-        if not self._setup_has_ran:
-            raise CoreError('The results object must be setup before executing!')
+        remote_manifest_path = remote_path.rstrip('/\\') + BespokeGlobals.SYNC_MANIFEST_SUFFIX
 
-        staf_request = ('COPY DIRECTORY "{0}" TODIRECTORY "{1}" TOMACHINE "{2}" RECURSE '
-                        'KEEPEMPTYDIRECTORIES'.format(unix_style_path(self._remote_results_path),
-                                                      unix_style_path(self._local_results_path),
-                                                      BespokeGlobals.BESPOKE_SERVER_HOSTNAME))
+        #An empty manifest would delete everything on the SUT so a missing directory is an error.
+        if not isdir(local_path):
+            raise CoreError('The directory "{0}" does not exist!'.format(local_path))
 
-        result = self._staf_handle.submit(self._sut.network_address, 'fs', staf_request)
+        try:
+            local_files, local_dirs = directory_manifest(local_path)
+        except (IOError, OSError) as e:
+            raise CoreError('Failed to build the manifest for "{0}"! '
+                            'Reason: {1}'.format(local_path, str(e)))
 
-        if result.rc != 0:
-            raise CoreError('Failed to copy the results directory '
-                            '"{0}" from remote machine!'.format(self._remote_results_path))
+        remote_manifest = self._read_remote_manifest(remote_manifest_path)
 
-    @abc.abstractmethod
-    def execute(self):
+        if remote_manifest is None:
+            #Nothing is known about the remote directory so start over with a full copy.
+            self._delete_remote_entry(remote_path)
+            self._staf_dir_copy(local_path, remote_path)
+        else:
+            remote_files, remote_dirs = remote_manifest
+
+            for name in set(remote_files) - set(local_files):
+                self._delete_remote_entry(join(remote_path, name))
+
+            for name in set(remote_dirs) - set(local_dirs):
+                self._delete_remote_entry(join(remote_path, name))
+
+            for name in sorted(set(local_dirs) - set(remote_dirs)):
+                staf_request = 'CREATE DIRECTORY "{0}" FULLPATH'.format(
+                    unix_style_path(join(remote_path, name)))
+
+                result = self._staf_handle.submit(self._sut.network_address, 'fs', staf_request)
+
+                if result.rc != result.Ok:
+                    raise CoreError(result.result)
+
+            for name in sorted(local_files):
+                if remote_files.get(name) != local_files[name]:
+                    self._staf_file_copy(join(local_path, name), join(remote_path, name))
+
+        #The manifest is written last so an interrupted synchronization is repaired next time.
+        self._write_remote_manifest(remote_manifest_path, local_files, local_dirs)
+
+    def _read_remote_manifest(self, remote_manifest_path):
+        """Read a delta synchronization manifest from the SUT.
+        
+        Args:
+            remote_manifest_path (str) = The path (absolute) of the manifest on the SUT.
+            
+        Returns:
+            (({str:(int, str)}, [str])) = The size and hex digest of every file keyed by relative
+                path and a list of the relative paths of every directory. None is returned if the
+                manifest does not exist or can't be read.
+        
+        Raises:
+            :class:`CoreError`: Failed to query the SUT.
+        """
+
+        staf_request = 'GET FILE "{0}"'.format(unix_style_path(remote_manifest_path))
+
+        result = self._staf_handle.submit(self._sut.network_address, 'fs', staf_request)
+
+        if result.rc == result.DoesNotExist:
+            return None
+        elif result.rc != result.Ok:
+            raise CoreError(result.result)
+
+        try:
+            manifest = json.loads(result.result)
+
+            return ({name: tuple(entry) for name, entry in manifest['files'].items()},
+                    list(manifest['dirs']))
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    def _write_remote_manifest(self, remote_manifest_path, files, dirs):
+        """Write a delta synchronization manifest to the SUT.
+        
+        Args:
+            remote_manifest_path (str) = The path (absolute) of the manifest on the SUT.
+            files ({str:(int, str)}) = The size and hex digest of every file keyed by relative path.
+            dirs ([str]) = A list of the relative paths of every directory.
+            
+        Returns:
+            None.
+        
+        Raises:
+            :class:`CoreError`: Failed to write the manifest to the SUT.
+        """
+
+        local_manifest_path = join(BespokeGlobals.ABS_LOCAL_STAGING,
+                                   str(uuid1()) + BespokeGlobals.SYNC_MANIFEST_SUFFIX)
+
+        try:
+            if not isdir(BespokeGlobals.ABS_LOCAL_STAGING):
+                makedirs(BespokeGlobals.ABS_LOCAL_STAGING)
+
+            with open(local_manifest_path, 'w') as manifest_file:
+                json.dump({'files': files, 'dirs': dirs}, manifest_file)
+        except (IOError, OSError) as e:
+            raise CoreError('Failed to write the manifest "{0}"! '
+                            'Reason: {1}'.format(local_manifest_path, str(e)))
+
+        try:
+            self._staf_file_copy(local_manifest_path, remote_manifest_path)
+        finally:
+            remove(local_manifest_path)
+
+    def _delete_remote_entry(self, remote_path):
+        """Delete a file or directory on the SUT if it exists.
+        
+        Args:
+            remote_path (str) = The absolute path on the SUT to delete.
+            
+        Returns:
+            None.
+        
+        Raises:
+            :class:`CoreError`: Failed to delete the file/directory on the SUT.
+        """
+
+        staf_request = ('DELETE ENTRY "{0}" RECURSE '
+                        'CONFIRM '.format(unix_style_path(remote_path)))
+
+        result = self._staf_handle.submit(self._sut.network_address, 'fs', staf_request)
+
+        if result.rc not in [result.Ok, result.DoesNotExist]:
+            raise CoreError(result.result)
+
+    def _staf_start_proc(self,
+                         command,
+                         working_dir,
+                         wait,
+                         params=[],
+                         env_vars={},
+                         location='local'):
+        """Start a process via STAF.
+        
+        Args:
+            command (str) = The command to execute.
+            working_dir (str) = The working directory to start the process from within.
+            wait (int) = The amount of time in seconds for STAF to wait before terminating the 
+                process.
+            params ([str])(opt) = A list of parameters to pass to the command.
+            env_vars ({str:str:})(opt) = A dictionary of environment variables to set on the target 
+                machine for the process.    
+            location (str)(opt) = The machine to execute the process on.
+        
+        Returns:
+            ((int), (str)) = The exit code of the "command" and the command output.
+        
+        Raises:
+            :class:`CoreError`: The process failed to execute or the underlying command failed in 
+                some way.
+        """
+
+        process = self._staf_start_proc_async(command,
+                                              working_dir,
+                                              wait,
+                                              params,
+                                              env_vars,
+                                              location)
+
+        try:
+            return process.result()
+        except (SupervisorError, TransportError) as e:
+            raise CoreError(e.msg)
+
+    def _staf_start_proc_async(self,
+                               command,
+                               working_dir,
+                               wait,
+                               params=[],
+                               env_vars={},
+                               location='local'):
+        """Start a process without waiting for it to end. The process is stopped if it runs longer
+        than "wait" seconds. Processes started through STAF are tracked by the shared
+        :class:`ProcessSupervisor` and processes on a sandbox SUT are started locally.
+        
+        Args:
+            command (str) = The command to execute.
+            working_dir (str) = The working directory to start the process from within.
+            wait (int) = The amount of time in seconds to wait before terminating the process.
+            params ([str])(opt) = A list of parameters to pass to the command.
+            env_vars ({str:str:})(opt) = A dictionary of environment variables to set on the target 
+                machine for the process.    
+            location (str)(opt) = The machine to execute the process on.
+        
+        Returns:
+            (obj) = Call "result()" for the exit code and command output.
+        
+        Raises:
+            :class:`CoreError`: The process failed to start.
+        """
+
+        try:
+            return self._get_transport(location).start_proc(command,
+                                                            working_dir,
+                                                            wait,
+                                                            params,
+                                                            env_vars)
+        except TransportError as e:
+            raise CoreError(e.msg)
+
+    @retry(BespokeGlobals.PING_RETRY_COUNT, CoreError, 1)
+    def _ping(self):
+        """This method will attempt to contact the target SystemUnderTest.
+        
+        Args:
+            None.
+        
+        Returns:
+            None.
+        
+        Raises:
+            :class:`CoreError`: The host was not available.
+            :class:`FatalError`: Failure to communicate with the transport.
+        """
+
+        try:
+            reachable = self._get_transport().ping()
+        except TransportError as e:
+            raise FatalError(e.msg)
+
+        if not reachable:
+            raise CoreError('Could not ping "{0}" '
+                            'network address!'.format(self._sut.network_address))
+
+    def _graceful_restart(self, wait):
+        """Gracefully shutdown and then boot the SystemUnderTest.
+        
+        Args:
+            wait (bln) = Wait for restart to complete.
+        
+        Returns:
+            (bln)
+        
+        Raises:
+            :class:`CoreError`: Restart failed, may be recoverable.
+        """
+
+        self._sut.shutdown(True)
+        self._sut.start()
+
+        if wait and not self._sut.is_sandbox:
+            sleep(BespokeGlobals.VM_BOOT_WAIT)
+
+    @property
+    def message(self):
+        """A message attached to results. Most likely this is a message associated with a failure or
+        fatal error.
+        
+        Returns:
+            (str)
+        """
+
+        return self._message
+
+    @property
+    def name(self):
+        """The name of the test.
+        
+        Returns:
+            (str)
+        """
+
+        return self._name
+
+    @property
+    def status(self):
+        """The current status of the test.
+        
+        Returns:
+            (str):
+                'NotRan'
+                'Running'
+                'Paused'
+                'Pass'
+                'Fail'
+                'Fatal'
+                'Critical'
+        """
+
+        return self._status
+
+    @property
+    def sut(self):
+        """The SystemUnderTest associated with the test object.
+        
+        Returns:
+            (:class:`SystemUnderTest`)
+        """
+
+        return self._sut
+
+class _ResultsStreamer(object):
+    """Copy the results of a running test from the SUT to the local machine on an interval so
+    partial results are available before the test finishes and survive a crash of the SUT. The
+    streamer remembers the size and modification time (the offset) of every file it has synced,
+    so each sync only copies files that are new or have been appended to since the last one. A
+    file that is still growing is deferred until it settles so it isn't copied on every interval,
+    but never for more than RESULTS_STREAM_MAX_DEFER intervals.
+    
+    Args:
+        sut (:class:`SystemUnderTest`) = The SUT that holds the results.
+        remote_path (str) = The results directory on the SUT.
+        local_path (str) = The local results directory.
+        interval (int)(opt) = The number of seconds between syncs.
+        
+    Raises:
+        None.
+    """
+
+    def __init__(self, sut, remote_path, local_path, interval=None):
+        self._sut = sut
+        self._remote_path = remote_path
+        self._local_path = local_path
+        self._interval = interval or BespokeGlobals.RESULTS_STREAM_INTERVAL
+        self._synced = {}       #{relative path:(size, modified)} of the local copies.
+        self._growing = {}      #{relative path:((size, modified), deferred intervals)}
+        self._stop_event = Event()
+        self._thread = None
+
+    def _copy_file(self, staf_handle, name, state):
+        """Copy a single results file from the SUT. The file is copied next to its local copy and 
+        renamed into place so a reader never sees a half written file.
+        
+        Args:
+            staf_handle (:class:`STAFHandle`) = The STAF handle to submit requests with.
+            name (str) = The path of the file relative to the results directory.
+            state ((int, str)) = The size and modification time of the remote file.
+            
+        Returns:
+            None.
+        
+        Raises:
+            :class:`CoreError`: Failed to copy the file.
+        """
+
+        local_file = join(self._local_path, name)
+        partial_file = local_file + PARTIAL_SUFFIX
+
+        try:
+            if not isdir(dirname(local_file)):
+                makedirs(dirname(local_file))
+        except OSError as e:
+            raise CoreError('Failed to create the local results directory "{0}"! '
+                            'Reason: {1}'.format(dirname(local_file), str(e)))
+
+        staf_request = 'COPY FILE "{0}" TOFILE "{1}" TOMACHINE "{2}"'.format(
+            unix_style_path(join(self._remote_path, name)),
+            unix_style_path(partial_file),
+            BespokeGlobals.BESPOKE_SERVER_HOSTNAME)
+
+        result = staf_handle.submit(self._sut.network_address, 'fs', staf_request)
+
+        if result.rc != result.Ok:
+            raise CoreError(result.result)
+
+        try:
+            if isfile(local_file):
+                remove(local_file)
+
+            rename(partial_file, local_file)
+        except OSError as e:
+            raise CoreError('Failed to replace the local results file "{0}"! '
+                            'Reason: {1}'.format(local_file, str(e)))
+
+        self._synced[name] = state
+        self._growing.pop(name, None)
+
+    def _list(self, staf_handle, entry_type):
+        """List the entries of the remote results directory.
+        
+        Args:
+            staf_handle (:class:`STAFHandle`) = The STAF handle to submit requests with.
+            entry_type (str) = 'F' for files or 'D' for directories.
+            
+        Returns:
+            ({str:(int, str)}) = The size and modification time of every entry keyed by its path
+                relative to the results directory.
+        
+        Raises:
+            :class:`CoreError`: Failed to list the remote results directory.
+        """
+
+        staf_request = 'LIST DIRECTORY "{0}" RECURSE TYPE {1} LONG'.format(
+            unix_style_path(self._remote_path),
+            entry_type)
+
+        result = staf_handle.submit(self._sut.network_address, 'fs', staf_request)
+
+        if result.rc != result.Ok:
+            raise CoreError(result.result)
+
+        try:
+            return dict((entry['name'], (int(entry['size']), entry['lastModifiedTimestamp']))
+                        for entry in result.resultObj)
+        except (KeyError, TypeError, ValueError):
+            raise CoreError('Unexpected listing of the remote results directory '
+                            '"{0}"!'.format(self._remote_path))
+
+    def _run(self):
+        """Sync the results on every interval until the streamer is stopped. Sync failures are
+        ignored because the final reconciliation copies whatever was missed.
+        
+        Args:
+            None.
+            
+        Returns:
+            None.
+        
+        Raises:
+            None.
+        """
+
+        staf_handle = None
+
+        try:
+            while not self._stop_event.wait(self._interval):
+                try:
+                    if staf_handle is None:
+                        staf_handle = BespokeGlobals.STAF_HANDLE_POOL.checkout()
+
+                    self.sync(staf_handle)
+                except CoreError:
+                    pass
+                except STAFException:
+                    #Check out a fresh handle for the next sync.
+                    if staf_handle is not None:
+                        BespokeGlobals.STAF_HANDLE_POOL.checkin(staf_handle, healthy=False)
+                        staf_handle = None
+        finally:
+            if staf_handle is not None:
+                BespokeGlobals.STAF_HANDLE_POOL.checkin(staf_handle,
+                                                        healthy=not staf_handle.failed)
+
+    def reconcile(self, staf_handle):
+        """Bring the local results in line with the finished test: copy every file that differs,
+        create empty directories and remove files that were deleted on the SUT after they were
+        synced.
+        
+        Args:
+            staf_handle (:class:`STAFHandle`) = The STAF handle to submit requests with.
+            
+        Returns:
+            None.
+        
+        Raises:
+            :class:`CoreError`: Failed to reconcile the results.
+        """
+
+        listing = self.sync(staf_handle, final=True)
+
+        for name in set(self._synced) - set(listing):
+            try:
+                if isfile(join(self._local_path, name)):
+                    remove(join(self._local_path, name))
+            except OSError as e:
+                raise CoreError('Failed to remove the stale results file "{0}"! '
+                                'Reason: {1}'.format(name, str(e)))
+
+            del self._synced[name]
+
+        for name in self._list(staf_handle, 'D'):
+            try:
+                if not isdir(join(self._local_path, name)):
+                    makedirs(join(self._local_path, name))
+            except OSError as e:
+                raise CoreError('Failed to create the local results directory "{0}"! '
+                                'Reason: {1}'.format(name, str(e)))
+
+    def start(self):
+        """Start syncing in the background.
+        
+        Args:
+            None.
+            
+        Returns:
+            None.
+        
+        Raises:
+            None.
+        """
+
+        if self._thread is None:
+            self._thread = Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """Stop syncing and wait for a sync in progress to finish.
+        
+        Args:
+            None.
+            
+        Returns:
+            None.
+        
+        Raises:
+            None.
+        """
+
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+
+    def sync(self, staf_handle, final=False):
+        """Copy the results files that are new or have changed since the last sync.
+        
+        Args:
+            staf_handle (:class:`STAFHandle`) = The STAF handle to submit requests with.
+            final (bln)(opt) = Copy growing files right away instead of waiting for them to settle.
+            
+        Returns:
+            ({str:(int, str)}) = The listing of the remote results files.
+        
+        Raises:
+            :class:`CoreError`: Failed to list the results or to copy a file during the final sync.
+        """
+
+        listing = self._list(staf_handle, 'F')
+
+        for name, state in sorted(listing.items()):
+            if self._synced.get(name) == state:
+                continue
+
+            last_state, deferred = self._growing.get(name, (None, 0))
+
+            #Wait for a file that changed since the last poll to settle unless it has been
+            #deferred too often already.
+            if not final and last_state != state and \
+               deferred < BespokeGlobals.RESULTS_STREAM_MAX_DEFER:
+                self._growing[name] = (state, deferred + 1)
+                continue
+
+            try:
+                self._copy_file(staf_handle, name, state)
+            except CoreError:
+                if final:
+                    raise
+
+        return listing
+
+    @property
+    def synced(self):
+        """Indicates that at least one results file has been synced.
+        
+        Returns:
+            (bln)
+        """
+
+        return len(self._synced) != 0
+
+class _TestResults(_Test):
+    """This class is the abstract base class for all test classes with result artifacts.
+    
+    Args:
+        name (str) = The name of the test.
+        sut (:class:`SystemUnderTest`) = The SUT to execute remote STAF process calls against.
+        
+    Raises:
+        None.
+    """
+
+    __metaclass__ = abc.ABCMeta
+
+    def __init__(self, name, sut):
+        super(_TestResults, self).__init__(name, sut)
+
+        self._uuid = str(uuid1())
+        self._local_results_path = join(BespokeGlobals.ABS_LOCAL_RESULTS, self._uuid)
+        self._remote_results_path = join(self._sut.bespoke_root, BespokeGlobals.RESULTS, self._uuid)
+        self._setup_has_ran = False
+        self._results_streamer = None
+
+    def _setup_results(self):
+        """Prepare the remote results directory.
+        
+        Args:
+            None.
+        
+        Returns:
+            None.
+        
+        Raises:
+            :class:`CoreError`: Failed to create the remote results directory.
+            :class:`FatalError`: Failure to communicate with the STAF service.
+        """
+
+        self._ping()
+
+        self._create_remote_dir(self._remote_results_path)
+
+        self._setup_has_ran = True
+
+    def _get_remote_results(self):
+        """Copy the results from the SUT to the local machine.
+        
+        Args:
+            None.
+        
+        Returns:
+            None.
+        
+        Raises:
+            :class:`CoreError`: Failed to retrieve the remote results from SUT.
+        """
+
+        if not self._setup_has_ran:
+            raise CoreError('The results object must be setup before executing!')
+
+        #Results that were streamed during the test only need the changes since the last sync.
+        if self._results_streamer is not None and self._results_streamer.synced:
+            try:
+                self._results_streamer.reconcile(self._staf_handle)
+                return
+            except CoreError:
+                #Fall back to a full copy, which reports its own failure.
+                pass
+
+        if self._compress_remote_results():
+            try:
+                self._get_compressed_remote_results()
+                return
+            except CoreError:
+                #Fall back to a plain copy, which reports its own failure.
+                pass
+
+        start = time()
+        staf_request = ('COPY DIRECTORY "{0}" TODIRECTORY "{1}" TOMACHINE "{2}" RECURSE '
+                        'KEEPEMPTYDIRECTORIES'.format(unix_style_path(self._remote_results_path),
+                                                      unix_style_path(self._local_results_path),
+                                                      BespokeGlobals.BESPOKE_SERVER_HOSTNAME))
+
+        result = self._staf_handle.submit(self._sut.network_address, 'fs', staf_request)
+
+        if result.rc != 0:
+            raise CoreError('Failed to copy the results directory '
+                            '"{0}" from remote machine!'.format(self._remote_results_path))
+
+        self._record_transfer(self._local_results_path, start)
+
+    def _start_results_stream(self):
+        """Start syncing the results from the SUT while the test runs.
+        
+        Args:
+            None.
+        
+        Returns:
+            None.
+        
+        Raises:
+            None.
+        """
+
+        if BespokeGlobals.RESULTS_STREAM_INTERVAL > 0 and self._results_streamer is None:
+            self._results_streamer = _ResultsStreamer(self._sut,
+                                                      self._remote_results_path,
+                                                      self._local_results_path)
+            self._results_streamer.start()
+
+    def _stop_results_stream(self):
+        """Stop syncing the results from the SUT. The results synced so far are kept so the final
+        copy only has to reconcile the difference.
+        
+        Args:
+            None.
+        
+        Returns:
+            None.
+        
+        Raises:
+            None.
+        """
+
+        if self._results_streamer is not None:
+            self._results_streamer.stop()
+
+    def _compress_remote_results(self):
+        """Decide if the remote results should be compressed before they are copied back. The
+        results can't be sampled without copying them, so the listing of the results directory is
+        the sample: files with the extension of a compressed format are assumed not to shrink.
+        
+        Args:
+            None.
+        
+        Returns:
+            (bln)
+        
+        Raises:
+            None.
+        """
+
+        throughput = self._sut.link_throughput
+
+        if throughput is not None and throughput >= BespokeGlobals.COMPRESSION_MAX_THROUGHPUT:
+            return False
+
+        staf_request = 'LIST DIRECTORY "{0}" RECURSE TYPE F LONG'.format(
+            unix_style_path(self._remote_results_path))
+
+        result = self._staf_handle.submit(self._sut.network_address, 'fs', staf_request)
+
+        if result.rc != result.Ok:
+            return False
+
+        total = compressible = 0
+
+        try:
+            for entry in result.resultObj:
+                size = int(entry['size'])
+                total += size
+
+                if splitext(entry['name'])[1].lower() not in BespokeGlobals.COMPRESSED_EXTENSIONS:
+                    compressible += size
+        except (KeyError, TypeError, ValueError):
+            return False
+
+        return (total >= BespokeGlobals.COMPRESSION_MIN_SIZE and
+                compressible >= total * (1 - BespokeGlobals.COMPRESSION_MAX_RATIO))
+
+    def _get_compressed_remote_results(self):
+        """Compress the results on the SUT, copy the archive to the local machine and extract it.
+        
+        Args:
+            None.
+        
+        Returns:
+            None.
+        
+        Raises:
+            :class:`CoreError`: Failed to compress, copy or extract the remote results.
+        """
+
+        remote_archive = self._remote_results_path + ARCHIVE_SUFFIX
+        local_archive = self._local_results_path + ARCHIVE_SUFFIX
+
+        staf_request = 'ADD ZIPFILE "{0}" DIRECTORY "{1}" RECURSE RELATIVETO "{1}"'.format(
+            unix_style_path(remote_archive),
+            unix_style_path(self._remote_results_path))
+
+        try:
+            result = self._staf_handle.submit(self._sut.network_address, 'zip', staf_request)
+
+            if result.rc != result.Ok:
+                raise CoreError(result.result)
+
+            staf_request = 'COPY FILE "{0}" TOFILE "{1}" TOMACHINE "{2}"'.format(
+                unix_style_path(remote_archive),
+                unix_style_path(local_archive),
+                BespokeGlobals.BESPOKE_SERVER_HOSTNAME)
+
+            start = time()
+            result = self._staf_handle.submit(self._sut.network_address, 'fs', staf_request)
+
+            if result.rc != result.Ok:
+                raise CoreError(result.result)
+
+            self._record_transfer(local_archive, start)
+
+            try:
+                with ZipFile(local_archive) as archive:
+                    archive.extractall(self._local_results_path)
+            except (IOError, OSError, BadZipfile) as e:
+                raise CoreError('Failed to extract the results archive "{0}"! '
+                                'Reason: {1}'.format(local_archive, str(e)))
+        finally:
+            if isfile(local_archive):
+                remove(local_archive)
+
+            self._delete_remote_entry(remote_archive)
+
+    @abc.abstractmethod
+    def execute(self):
         """Execute the test object and record results.
         
         Args:
@@ -557,6 +1588,16 @@ class _TestResults(_Test):
 
         return self._remote_results_path
 
+    @property
+    def uuid(self):
+        """The unique identifier of the results of the test.
+        
+        Returns:
+            (str)
+        """
+
+        return self._uuid
+
 class _TestContainer(object):
     """This class is the abstract base class for container classes that hold _TestContainer or
     _Test objects.
@@ -659,6 +1700,36 @@ class _Installer(_TestResults):
         self._tool = tool
         self._timeout = timeout
 
+    @property
+    def tool(self):
+        """The tool to install.
+        
+        Returns:
+            (:class:`Tool`)
+        """
+
+        return self._tool
+
+    @property
+    def timeout(self):
+        """The maximum amount of time to allow for execution.
+        
+        Returns:
+            (int)
+        """
+
+        return self._timeout
+
+    @abc.abstractproperty
+    def local_source_path(self):
+        """The local path of the tool file/directory that is copied to the SUT.
+        
+        Returns:
+            (str)
+        """
+
+        pass
+
     @abc.abstractmethod
     def _stage(self):
         """Stage the tool on the SUT for installation.
@@ -710,6 +1781,7 @@ class _Installer(_TestResults):
         try:
             self._init_staf_handle()
             self._setup_results()
+            self._tool.stage()
             self._stage()
             self._install()
             self._get_remote_results()
@@ -718,70 +1790,315 @@ class _Installer(_TestResults):
             self._status = 'Fatal'
             self._message = e.msg
         finally:
-            self._close_staf_handle()
-
-        #Notify TestCase that a failure occurred.
-        if self._status == 'Fatal': raise FatalError(self._message)
-
-class BasicInstaller(_Installer):
-    """Install a basic type tool onto a SUT.
+            self._close_staf_handle()
+
+        #Notify TestCase that a failure occurred.
+        if self._status == 'Fatal': raise FatalError(self._message)
+
+class BasicInstaller(_Installer):
+    """Install a basic type tool onto a SUT.
+    
+    Args:
+        tool (:class:`Tool`) = The desired tool to use for installer.
+        sut (:class:`SystemUnderTest`) = The SUT to execute remote STAF process calls against.
+        timeout (int) = The number of seconds to wait before timing out installation.
+        
+    Raises:
+        :class:`CoreError` = Fatal error occurred and unreliable results possibly recorded.
+    """
+
+    def __init__(self, tool, sut, timeout):
+        super(BasicInstaller, self).__init__(tool, sut, timeout)
+
+    @property
+    def local_source_path(self):
+        """The local path of the tool file/directory that is copied to the SUT.
+        
+        Returns:
+            (str)
+        """
+
+        return join(BespokeGlobals.ABS_LOCAL_TOOLS, self._tool.install_properties['source_path'])
+
+    def _stage(self):
+        """Stage the tool on the SUT for installation. (Note: this isn't necessary for basic
+        install hence the empty function.)
+        
+        Args:
+            None.
+            
+        Returns:
+            None.
+        
+        Raises:
+            :class:`CoreError`: Failed to stage the tool.
+        """
+
+        pass
+
+    def _install(self):
+        """Perform the installation of the tool on the SUT.
+        
+        Args:
+            None.
+            
+        Returns:
+            None.
+        
+        Raises:
+            :class:`CoreError`: Failed to install the tool.
+        """
+
+        local_source_path = self.local_source_path
+
+        remote_target_path = self._tool.install_properties['target_path']
+
+        if self._tool.source_copy_once and (isdir(local_source_path) or
+                                            isfile(local_source_path)):
+            self._staf_remote_copy(self._staf_cached_copy(local_source_path), remote_target_path)
+        elif isdir(local_source_path):
+            self._staf_dir_copy(local_source_path, remote_target_path)
+        elif isfile(local_source_path):
+            self._staf_file_copy(local_source_path, remote_target_path)
+        else:
+            raise CoreError('Failed to stage tool "{0}" on remote machine! The file/directory '
+                            '"{1}" does not exist!'.format(self._tool.name, local_source_path))
+
+    def execute(self):
+        """Install the tool onto the SUT.
+        
+        Args:
+            None.
+            
+        Returns:
+            None.
+        
+        Raises:
+            :class:`CoreError`: Fatal error occurred and unreliable results possibly recorded.
+        """
+
+        super(BasicInstaller, self).execute()
+
+class MSIInstaller(_Installer):
+    """Install an MSI onto a Windows SUT.
+    
+    Args:
+        tool (:class:`Tool`) = The desired tool to use for installer.
+        sut (:class:`SystemUnderTest`) = The SUT to execute remote STAF process calls against.
+        timeout (int) = The number of seconds to wait before timing out installation.
+        
+    Raises:
+        :class:`CoreError` = Fatal error occurred and unreliable results possibly recorded.
+    """
+
+    def __init__(self, tool, sut, timeout):
+        super(MSIInstaller, self).__init__(tool, sut, timeout)
+
+        #For storing the remote path on the SUT.
+        self._remote_target_path = None
+
+    @property
+    def local_source_path(self):
+        """The local path of the MSI package that is copied to the SUT.
+        
+        Returns:
+            (str)
+        """
+
+        return join(BespokeGlobals.ABS_LOCAL_TOOLS, self._tool.install_properties['source_file'])
+
+    def _stage(self):
+        """Stage the tool on the SUT for installation.
+        
+        Args:
+            None.
+            
+        Returns:
+            None.
+        
+        Raises:
+            :class:`CoreError`: Fatal error occurred and unreliable results possibly recorded.
+        """
+
+        local_source_path = self.local_source_path
+
+        self._remote_target_path = join(self._sut.bespoke_root,
+                                        BespokeGlobals.TOOLS,
+                                        self._tool.install_properties['source_file'])
+
+        if isfile(local_source_path) and self._tool.source_copy_once:
+            #Install straight out of the cache so the package crosses the wire once per SUT.
+            self._remote_target_path = self._staf_cached_copy(local_source_path)
+        elif isfile(local_source_path):
+            self._staf_file_copy(local_source_path, self._remote_target_path)
+        else:
+            raise CoreError('Failed to stage tool "{0}" on remote machine! The file/directory '
+                            '"{1}" does not exist!'.format(self._tool.name, local_source_path))
+
+    def _install(self):
+        """Perform the installation of the tool on the SUT.
+        
+        Args:
+            None.
+            
+        Returns:
+            None.
+        
+        Raises:
+            :class:`CoreError`: Failed to stage the tool.
+        """
+
+        msi_command = 'msiexec'
+
+        #Build a list of MSI params formatted correctly for MSI execution.
+        msi_params = ['/i {0}'.format(self._remote_target_path),
+                      '/qn',
+                      '/L {0}//msi_install.log'.format(self._remote_results_path)]
+
+        for key in self._tool.install_properties:
+            if key != 'source_file':
+                msi_params.append('{0}="{1}"'.format(key, self._tool.install_properties[key]))
+
+        exit_code, out = self._staf_start_proc(msi_command,
+                                               self._sut.bespoke_root,
+                                               self._timeout,
+                                               msi_params,
+                                               location=self._sut.network_address)
+
+        if exit_code != 0:
+            raise CoreError('Failed to install tool "{0}": {1}'.format(self._tool.name, out))
+
+    def execute(self):
+        """Install the tool onto the SUT.
+        
+        Args:
+            None.
+            
+        Returns:
+            None.
+        
+        Raises:
+            :class:`CoreError`: Fatal error occurred and unreliable results possibly recorded.
+        """
+
+        super(BasicInstaller, self).execute()
+
+class _ArtifactStager(_Test):
+    """Copy an artifact into the artifact cache of a single SUT. Used by :class:`FanOutStager`.
+    
+    Args:
+        local_path (str) = The local file/directory path to stage.
+        sut (:class:`SystemUnderTest`) = The SUT to stage the artifact on.
+        
+    Raises:
+        None.
+    """
+
+    def __init__(self, local_path, sut):
+        super(_ArtifactStager, self).__init__('{0}_Stager'.format(sut.alias), sut)
+
+        self._local_path = local_path
+        self._message = ''
+
+    def execute(self):
+        """Stage the artifact on the SUT. Failures are recorded rather than raised because the 
+        installer will try again on its own.
+        
+        Args:
+            None.
+            
+        Returns:
+            None.
+        
+        Raises:
+            None.
+        """
+
+        self._status = 'Running'
+
+        try:
+            self._init_staf_handle()
+            self._ping()
+            self._staf_cached_copy(self._local_path)
+            self._status = 'Pass'
+        except (CoreError, FatalError) as e:
+            self._status = 'Fail'
+            self._message = e.msg
+        finally:
+            if self._staf_handle is not None:
+                try:
+                    self._close_staf_handle()
+                except FatalError:
+                    pass
+
+class FanOutStager(object):
+    """Stage one artifact on many SUTs at the same time. The artifact is read and stored in the
+    local staging area once and then copied into the artifact cache of every SUT with at most
+    "max_concurrent" copies in flight. Installers that use the artifact cache then find the 
+    artifact already on the SUT.
     
     Args:
-        tool (:class:`Tool`) = The desired tool to use for installer.
-        sut (:class:`SystemUnderTest`) = The SUT to execute remote STAF process calls against.
-        timeout (int) = The number of seconds to wait before timing out installation.
+        local_path (str) = The local file/directory path to stage.
+        suts ([:class:`SystemUnderTest`]) = The SUTs to stage the artifact on.
+        max_concurrent (int)(opt) = The maximum number of SUTs to copy to at the same time.
+        progress_callback (func)(opt) = A function called with the SUT alias, status and message
+            whenever the staging status of a SUT changes.
         
     Raises:
-        :class:`CoreError` = Fatal error occurred and unreliable results possibly recorded.
+        None.
     """
 
-    def __init__(self, tool, sut, timeout):
-        super(BasicInstaller, self).__init__(tool, sut, timeout)
+    def __init__(self, local_path, suts, max_concurrent=None, progress_callback=None):
+        self._local_path = local_path
+        self._stagers = [_ArtifactStager(local_path, sut) for sut in suts]
+        self._max_concurrent = max_concurrent or BespokeGlobals.MAX_CONCURRENT_STAGING
+        self._progress_callback = progress_callback
+        self._progress = OrderedDict((sut.alias, ('NotRan', '')) for sut in suts)
+        self._progress_lock = Lock()
+        self._status = 'NotRan'
+        self._message = ''
 
-    def _stage(self):
-        """Stage the tool on the SUT for installation. (Note: this isn't necessary for basic
-        install hence the empty function.)
+    def _report(self, stager):
+        """Record the status of a SUT and notify the progress callback.
         
         Args:
-            None.
+            stager (:class:`_ArtifactStager`) = The stager of the SUT.
             
         Returns:
             None.
         
         Raises:
-            :class:`CoreError`: Failed to stage the tool.
+            None.
         """
 
-        pass
+        with self._progress_lock:
+            self._progress[stager.sut.alias] = (stager.status, stager.message)
 
-    def _install(self):
-        """Perform the installation of the tool on the SUT.
+        if self._progress_callback is not None:
+            self._progress_callback(stager.sut.alias, stager.status, stager.message)
+
+    def _stage(self, semaphore, stager):
+        """Stage the artifact on a single SUT once a slot is available.
         
         Args:
-            None.
+            semaphore (:class:`BoundedSemaphore`) = Limits the number of copies in flight.
+            stager (:class:`_ArtifactStager`) = The stager of the SUT.
             
         Returns:
             None.
         
         Raises:
-            :class:`CoreError`: Failed to install the tool.
+            None.
         """
 
-        local_source_path = join(BespokeGlobals.ABS_LOCAL_TOOLS,
-                                 self._tool.install_properties['source_path'])
-
-        remote_target_path = self._tool.install_properties['target_path']
-
-        if isdir(local_source_path):
-            self._staf_dir_copy(local_source_path, remote_target_path)
-        elif isfile(local_source_path):
-            self._staf_file_copy(local_source_path, remote_target_path)
-        else:
-            raise CoreError('Failed to stage tool "{0}" on remote machine! The file/directory '
-                            '"{1}" does not exist!'.format(self._tool.name, local_source_path))
+        with semaphore:
+            stager._status = 'Running'
+            self._report(stager)
+            stager.execute()
+            self._report(stager)
 
     def execute(self):
-        """Install the tool onto the SUT.
+        """Stage the artifact on every SUT and wait for all copies to finish.
         
         Args:
             None.
@@ -790,31 +2107,117 @@ class BasicInstaller(_Installer):
             None.
         
         Raises:
-            :class:`CoreError`: Fatal error occurred and unreliable results possibly recorded.
+            None.
         """
 
-        super(BasicInstaller, self).execute()
+        self._status = 'Running'
 
-class MSIInstaller(_Installer):
-    """Install an MSI onto a Windows SUT.
+        #Read the artifact once up front so the stagers all share the staged copy.
+        try:
+            LocalArtifactCache(BespokeGlobals.ABS_LOCAL_STAGING).store(self._local_path)
+        except CacheError as e:
+            self._status = 'Fail'
+            self._message = e.msg
+
+            return
+
+        semaphore = BoundedSemaphore(self._max_concurrent)
+        threads = [Thread(target=self._stage, args=(semaphore, stager))
+                   for stager in self._stagers]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        failures = ['"{0}": {1}'.format(stager.sut.alias, stager.message)
+                    for stager in self._stagers if stager.status != 'Pass']
+
+        if failures:
+            self._status = 'Fail'
+            self._message = 'Failed to stage "{0}" on {1} of {2} SUTs! Reasons: {3}'.format(
+                self._local_path, len(failures), len(self._stagers), ' '.join(failures))
+        else:
+            self._status = 'Pass'
+
+    @property
+    def progress(self):
+        """The staging status and message of every SUT keyed by SUT alias.
+        
+        Returns:
+            ({str:((str), (str))})
+        """
+
+        with self._progress_lock:
+            return OrderedDict(self._progress)
+
+    @property
+    def message(self):
+        """A message describing the SUTs that failed to stage the artifact.
+        
+        Returns:
+            (str)
+        """
+
+        return self._message
+
+    @property
+    def status(self):
+        """The status of the staging.
+        
+        Returns:
+            (str)
+        """
+
+        return self._status
+
+class ArtifactPrefetcher(object):
+    """Stage tools and builds on the Bespoke server in the background so they are ready locally 
+    by the time the installers need them. Staging runs concurrently with the VM snapshot restores
+    and boots of the test cases with at most "max_concurrent" tools copied at the same time. 
+    Failures are recorded rather than raised because the installer will try again on its own.
     
     Args:
-        tool (:class:`Tool`) = The desired tool to use for installer.
-        sut (:class:`SystemUnderTest`) = The SUT to execute remote STAF process calls against.
-        timeout (int) = The number of seconds to wait before timing out installation.
+        tools ([:class:`Tool`]) = The tools and builds to stage.
+        max_concurrent (int)(opt) = The maximum number of tools to copy at the same time.
         
     Raises:
-        :class:`CoreError` = Fatal error occurred and unreliable results possibly recorded.
+        None.
     """
 
-    def __init__(self, tool, sut, timeout):
-        super(MSIInstaller, self).__init__(tool, sut, timeout)
+    def __init__(self, tools, max_concurrent=None):
+        self._tools = list(tools)
+        self._max_concurrent = max_concurrent or BespokeGlobals.MAX_CONCURRENT_STAGING
+        self._thread = None
+        self._failures = OrderedDict()    #{tool_name:message}
+        self._failures_lock = Lock()
+        self._status = 'NotRan'
+        self._message = ''
 
-        #For storing the remote path on the SUT.
-        self._remote_target_path = None
+    def _prefetch(self, semaphore, tool):
+        """Stage a single tool once a slot is available.
+        
+        Args:
+            semaphore (:class:`BoundedSemaphore`) = Limits the number of copies in flight.
+            tool (:class:`Tool`) = The tool to stage.
+            
+        Returns:
+            None.
+        
+        Raises:
+            None.
+        """
 
-    def _stage(self):
-        """Stage the tool on the SUT for installation.
+        with semaphore:
+            try:
+                tool.stage()
+            except CoreError as e:
+                with self._failures_lock:
+                    self._failures[tool.name] = e.msg
+
+    def _run(self):
+        """Stage every tool and wait for all copies to finish.
         
         Args:
             None.
@@ -823,24 +2226,29 @@ class MSIInstaller(_Installer):
             None.
         
         Raises:
-            :class:`CoreError`: Fatal error occurred and unreliable results possibly recorded.
+            None.
         """
 
-        local_source_path = join(BespokeGlobals.ABS_LOCAL_TOOLS,
-                                 self._tool.install_properties['source_file'])
+        semaphore = BoundedSemaphore(self._max_concurrent)
+        threads = [Thread(target=self._prefetch, args=(semaphore, tool)) for tool in self._tools]
 
-        self._remote_target_path = join(self._sut.bespoke_root,
-                                        BespokeGlobals.TOOLS,
-                                        self._tool.install_properties['source_file'])
+        for thread in threads:
+            thread.start()
 
-        if isfile(local_source_path):
-            self._staf_file_copy(local_source_path, self._remote_target_path)
+        for thread in threads:
+            thread.join()
+
+        if self._failures:
+            self._status = 'Fail'
+            self._message = 'Failed to prefetch {0} of {1} tools! Reasons: {2}'.format(
+                len(self._failures), 
+                len(self._tools), 
+                ' '.join('"{0}": {1}'.format(name, msg) for name, msg in self._failures.items()))
         else:
-            raise CoreError('Failed to stage tool "{0}" on remote machine! The file/directory '
-                            '"{1}" does not exist!'.format(self._tool.name, local_source_path))
+            self._status = 'Pass'
 
-    def _install(self):
-        """Perform the installation of the tool on the SUT.
+    def start(self):
+        """Start staging in the background.
         
         Args:
             None.
@@ -849,31 +2257,17 @@ class MSIInstaller(_Installer):
             None.
         
         Raises:
-            :class:`CoreError`: Failed to stage the tool.
+            None.
         """
 
-        msi_command = 'msiexec'
-
-        #Build a list of MSI params formatted correctly for MSI execution.
-        msi_params = ['/i {0}'.format(self._remote_target_path),
-                      '/qn',
-                      '/L {0}//msi_install.log'.format(self._remote_results_path)]
-
-        for key in self._tool.install_properties:
-            if key != 'source_file':
-                msi_params.append('{0}="{1}"'.format(key, self._tool.install_properties[key]))
-
-        exit_code, out = self._staf_start_proc(msi_command,
-                                               self._sut.bespoke_root,
-                                               self._timeout,
-                                               msi_params,
-                                               location=self._sut.network_address)
-
-        if exit_code != 0:
-            raise CoreError('Failed to install tool "{0}": {1}'.format(self._tool.name, out))
+        if self._thread is None:
+            self._status = 'Running'
+            self._thread = Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
 
-    def execute(self):
-        """Install the tool onto the SUT.
+    def wait(self):
+        """Wait for staging to finish.
         
         Args:
             None.
@@ -882,10 +2276,31 @@ class MSIInstaller(_Installer):
             None.
         
         Raises:
-            :class:`CoreError`: Fatal error occurred and unreliable results possibly recorded.
+            None.
         """
 
-        super(BasicInstaller, self).execute()
+        if self._thread is not None:
+            self._thread.join()
+
+    @property
+    def message(self):
+        """A message describing the tools that failed to stage.
+        
+        Returns:
+            (str)
+        """
+
+        return self._message
+
+    @property
+    def status(self):
+        """The status of the staging.
+        
+        Returns:
+            (str)
+        """
+
+        return self._status
 
 class Tool(object):
     """Store information about available tools.
@@ -930,6 +2345,44 @@ class Tool(object):
         self._source_properties = source_properties
         self._install_properties = install_properties
 
+        self._stage_lock = Lock()
+        self._staged = False
+
+    def _get_copier(self):
+        """Get the copy sourcer for the source type of the tool.
+        
+        Args:
+            None.
+            
+        Returns:
+            (:class:`_CopySourcer`) = The copier or None if the tool isn't copied.
+        
+        Raises:
+            None.
+        """
+
+        properties = self._source_properties
+
+        if self._source_type == 'basic_copy':
+            return CopyBasic(properties['source_path'], self.local_path, mirror=True)
+        elif self._source_type == 'ftp_copy':
+            return CopyFTP(unix_style_path(properties['source_path']),
+                           self.local_path,
+                           properties['source_server'],
+                           properties['source_server_port'],
+                           properties['source_server_user'] or 'anonymous',
+                           properties['source_server_password'])
+        elif self._source_type == 'http_copy':
+            #A request target must be an absolute path unlike a path on a FTP server.
+            return CopyHTTP('/' + unix_style_path(properties['source_path']).lstrip('/'),
+                            self.local_path,
+                            properties['source_server'],
+                            properties['source_server_port'],
+                            properties['source_server_user'] or None,
+                            properties['source_server_password'])
+
+        return None
+
     @property
     def name(self):
         """The name of the tool.
@@ -1022,8 +2475,34 @@ class Tool(object):
 
         return self._install_properties
 
+    @property
+    def local_path(self):
+        """The local path the tool is staged to on the Bespoke server.
+        
+        Returns:
+            (str)
+            (None)
+        """
+
+        if not self._source_properties or 'target_path' not in self._source_properties:
+            return None
+
+        return join(BespokeGlobals.ABS_LOCAL_TOOLS, self._source_properties['target_path'])
+
+    @property
+    def staged(self):
+        """Indicates that the tool has been staged on the Bespoke server.
+        
+        Returns:
+            (bln)
+        """
+
+        return self._staged
+
     def stage(self):
-        """Stage the tool on the Bespoke server.
+        """Stage the tool on the Bespoke server. The tool is only copied once no matter how many
+        installers use it, and a caller that arrives while the tool is being copied (e.g. by the
+        :class:`ArtifactPrefetcher`) waits for that copy instead of starting another.
         
         Args:
             None.
@@ -1034,7 +2513,21 @@ class Tool(object):
         Raises:
             :class:`CoreError`: Fatal error occurred and unreliable results possibly recorded.
         """
-        pass
+
+        with self._stage_lock:
+            if self._staged:
+                return
+
+            copier = self._get_copier()
+
+            if copier is not None:
+                try:
+                    copier.copy()
+                except CopyError as e:
+                    raise CoreError('Failed to stage the tool "{0}" on the Bespoke server! '
+                                    'Reason: {1}'.format(self._name, e.msg))
+
+            self._staged = True
 
 class Build(Tool):
     """Store information about available builds.
@@ -1088,23 +2581,44 @@ class TestPrep(_Test):
         timeout (int) = The number of seconds to wait before timing out operations.
         postwait (int) = The number of seconds to wait post test before continuing.
         checkpoint (str)(opt) = The virtual machine checkpoint name to restore.
+        cleanup (str)(opt) = How the Bespoke root directory on the SUT is cleaned.
+            'full' = Delete everything except the artifact cache.
+            'incremental' = Only delete the contents of the results and tests directories.
         
     Raises:
-        None.
+        :class:`CoreError`: An unknown cleanup mode was specified.
     """
 
+    #===============================================================================================
+    # Class Constants
+    #===============================================================================================
+    _CLEANUP_MODES = ('full', 'incremental')
+
+    #The directories that make up a Bespoke installation on the SUT.
+    _SKELETON = (BespokeGlobals.BUILDS,
+                 BespokeGlobals.CONFIGS,
+                 BespokeGlobals.RESULTS,
+                 BespokeGlobals.TEST_PLANS,
+                 BespokeGlobals.TESTS,
+                 BespokeGlobals.TOOLS)
+
     def __init__(self,
                  name,
                  sut,
                  timeout,
                  post_wait,
-                 checkpoint=''):
+                 checkpoint='',
+                 cleanup='full'):
 
         super(TestPrep, self).__init__(name, sut)
 
         self._checkpoint = checkpoint
         self._timeout = timeout
         self._post_wait = post_wait
+        self._cleanup = cleanup
+
+        if self._cleanup not in self._CLEANUP_MODES:
+            raise CoreError('The cleanup mode "{0}" is not supported!'.format(self._cleanup))
 
     def _prep_vm(self):
         """Prepare the SystemUnderTest by applying snapshot if necessary.
@@ -1129,15 +2643,21 @@ class TestPrep(_Test):
                                                                               e.vm_name))
             try:
                 self._sut.apply_snapshot(self._checkpoint)
-                self._sut.start()
-                sleep(BespokeGlobals.VM_BOOT_WAIT)
+                self._start_or_resume()
             except VMError as e:
                 raise CoreError("{} Host: {}, Virtual Machine: {}".format(e.msg, e.host, e.vm_name))
         else:
+            if self._sut.current_state() == 'Suspended':
+                try:
+                    self._sut.resume()
+                except VMError as e:
+                    raise CoreError("{} Host: {}, Virtual Machine: {}".format(e.msg,
+                                                                              e.host,
+                                                                              e.vm_name))
             if self._sut.current_state() == 'Stopped':
                 try:
                     self._sut.start()
-                    sleep(BespokeGlobals.VM_BOOT_WAIT)
+                    self._wait_for_boot()
                 except VMError as e:
                     raise CoreError("{} Host: {}, Virtual Machine: {}".format(e.msg,
                                                                               e.host,
@@ -1146,36 +2666,134 @@ class TestPrep(_Test):
                 raise CoreError('The System Under Test "{}" is not '
                                 'in a valid state for testing!'.format(self._sut.alias))
 
-    def _install_bespoke(self):
-        """Create the directory structure on target SystemUnderTest for Bespoke and install
-        necessary modules along with the test agent.
+    def _start_or_resume(self):
+        """Bring up the SystemUnderTest after a checkpoint is applied. A checkpoint taken from a 
+        running SystemUnderTest leaves it suspended, so it only needs to be resumed which skips
+        the boot wait entirely.
+        
+        Args:
+            None.
+        
+        Returns:
+            None.
+        
+        Raises:
+            :class:`VMError`: Failed to start or resume the SystemUnderTest.
+        """
+
+        if self._sut.current_state() == 'Suspended':
+            self._sut.resume()
+        else:
+            self._sut.start()
+            self._wait_for_boot()
+
+    def _wait_for_boot(self):
+        """Wait for the SystemUnderTest to boot. Sandboxes don't boot so there is nothing to wait for.
+        
+        Args:
+            None.
+        
+        Returns:
+            None.
+        
+        Raises:
+            None.
+        """
+
+        if not self._sut.is_sandbox:
+            sleep(BespokeGlobals.VM_BOOT_WAIT)
+
+    def _install_bespoke(self):
+        """Create the directory structure on target SystemUnderTest for Bespoke and install
+        necessary modules along with the test agent.
+        
+        Args:
+            None.
+        
+        Returns:
+            None.
+        
+        Raises:
+            :class:`CoreError`: Failed to install Bespoke on the SUT.
+        """
+
+        entries = self._list_root_dir()
+
+        #Delete any existing instances of Bespoke on remote machine.
+        if self._cleanup == 'incremental':
+            self._clean_root_dir(entries)
+        else:
+            self._delete_root_dir(entries)
+            entries = [entry for entry in entries if entry == BespokeGlobals.CACHE]
+
+        self._sut.forget_staged()
+
+        #Create the Bespoke directory structure.
+        if not set(self._SKELETON).issubset(entries):
+            self._create_skeleton()
+
+    def _clean_root_dir(self, entries):
+        """Delete the contents of the results and tests directories on the SUT. Everything else,
+        such as the tools, builds and artifact cache, is kept for the next test case.
         
         Args:
+            entries ([str]) = The names of the entries in the Bespoke root directory.
+            
+        Returns:
             None.
         
+        Raises:
+            :class:`CoreError`: Failed to delete the contents of a directory on the SUT.
+        """
+
+        for entry in (BespokeGlobals.RESULTS, BespokeGlobals.TESTS):
+            if entry not in entries:
+                continue
+
+            staf_request = 'DELETE ENTRY "{0}" CHILDREN RECURSE CONFIRM'.format(
+                unix_style_path(join(self._sut.bespoke_root, entry)))
+
+            result = self._staf_handle.submit(self._sut.network_address, 'fs', staf_request)
+
+            if result.rc not in [result.Ok, result.DoesNotExist]:
+                raise CoreError(result.result)
+
+    def _create_skeleton(self):
+        """Create the Bespoke directory structure on the SUT. The structure is sent as an archive
+        of empty directories which is extracted in a single round trip once the SUT caches it.
+        
+        Args:
+            None.
+            
         Returns:
             None.
         
         Raises:
-            :class:`CoreError`: Failed to install Bespoke on the SUT.
+            :class:`CoreError`: Failed to create the directory structure on the SUT.
         """
 
-        #Delete any existing instances of Bespoke on remote machine.
-        self._delete_root_dir()
+        local_skeleton = join(BespokeGlobals.ABS_LOCAL_STAGING, BespokeGlobals.SKELETON)
 
-        #Create the Bespoke directory structure.
-        self._create_remote_dir(join(self._sut.bespoke_root, BespokeGlobals.BUILDS))
-        self._create_remote_dir(join(self._sut.bespoke_root, BespokeGlobals.CONFIGS))
-        self._create_remote_dir(join(self._sut.bespoke_root, BespokeGlobals.RESULTS))
-        self._create_remote_dir(join(self._sut.bespoke_root, BespokeGlobals.TEST_PLANS))
-        self._create_remote_dir(join(self._sut.bespoke_root, BespokeGlobals.TESTS))
-        self._create_remote_dir(join(self._sut.bespoke_root, BespokeGlobals.TOOLS))
+        try:
+            for directory in self._SKELETON:
+                if not isdir(join(local_skeleton, directory)):
+                    makedirs(join(local_skeleton, directory))
+        except OSError as e:
+            raise CoreError('Failed to create the local directory structure "{0}"! '
+                            'Reason: {1}'.format(local_skeleton, str(e)))
 
-    def _delete_root_dir(self):
-        """Delete the Bespoke root directory on the SUT if it exists.
+        self._staf_archive_copy(local_skeleton, self._sut.bespoke_root)
+
+    def _delete_root_dir(self, entries):
+        """Delete the contents of the Bespoke root directory on the SUT. The artifact cache is 
+        kept so artifacts staged by earlier test cases don't need to be copied again.
+        
+        STAF can't exclude an entry from a delete, so when there is a cache to keep the other
+        entries are deleted one at a time. There are only a handful of them (the Bespoke
+        directory structure) and keeping the cache saves far more than those round trips.
         
         Args:
-            None.
+            entries ([str]) = The names of the entries in the Bespoke root directory.
             
         Returns:
             None.
@@ -1184,14 +2802,40 @@ class TestPrep(_Test):
             :class:`CoreError`: Failed to delete the Bespoke root directory on the SUT.
         """
 
-        staf_request = ('DELETE ENTRY "{0}" RECURSE '
-                        'CONFIRM '.format(unix_style_path(self._sut.bespoke_root)))
+        if len(entries) == 0:
+            return
+        elif BespokeGlobals.CACHE not in entries:
+            self._delete_remote_entry(self._sut.bespoke_root)
+            return
+
+        for entry in entries:
+            if entry != BespokeGlobals.CACHE:
+                self._delete_remote_entry(join(self._sut.bespoke_root, entry))
+
+    def _list_root_dir(self):
+        """List the Bespoke root directory on the SUT.
+        
+        Args:
+            None.
+            
+        Returns:
+            ([str]) = The names of the entries in the directory. (Empty if it doesn't exist.)
+        
+        Raises:
+            :class:`CoreError`: Failed to list the Bespoke root directory on the SUT.
+        """
+
+        staf_request = 'LIST DIRECTORY "{0}"'.format(unix_style_path(self._sut.bespoke_root))
 
         result = self._staf_handle.submit(self._sut.network_address, 'fs', staf_request)
 
-        if result.rc not in [result.Ok, result.DoesNotExist]:
+        if result.rc == result.DoesNotExist:
+            return []
+        elif result.rc != result.Ok:
             raise CoreError(result.result)
 
+        return list(result.resultObj)
+
     def execute(self):
         """Prepare a target SystemUnderTest for testing.
         
@@ -1245,11 +2889,20 @@ class TestStep(_TestResults):
         test_params ({str:str}) = Parameters to pass to the test executable.
         timeout (int) = The number of seconds to wait before timing out operations.
         post_wait (int) = The number of seconds to wait post test before continuing.
+        transfer_mode (str)(opt) = The method used to stage the test directory on the SUT.
+            'copy'
+            'archive'
+            'sync'
         
     Raises:
-        None.
+        :class:`CoreError`: An unknown transfer mode was specified.
     """
 
+    #===============================================================================================
+    # Class Constants
+    #===============================================================================================
+    _TRANSFER_MODES = ('copy', 'archive', 'sync')
+
     def __init__(self,
                  description,
                  sut,
@@ -1258,7 +2911,8 @@ class TestStep(_TestResults):
                  test_exec,
                  test_params,
                  timeout,
-                 post_wait):
+                 post_wait,
+                 transfer_mode='copy'):
 
         super(TestStep, self).__init__(description, sut)
 
@@ -1269,10 +2923,14 @@ class TestStep(_TestResults):
         self._test_params = test_params
         self._timeout = timeout
         self._post_wait = post_wait
+        self._transfer_mode = transfer_mode
         self._remote_target_path = join(self._sut.bespoke_root,
                                         BespokeGlobals.TESTS,
                                         self._test_directory)
 
+        if self._transfer_mode not in self._TRANSFER_MODES:
+            raise CoreError('The transfer mode "{0}" is not supported!'.format(self._transfer_mode))
+
     def _stage_test_step(self):
         """Copy test artifacts to SUT.
         
@@ -1288,12 +2946,40 @@ class TestStep(_TestResults):
 
         local_source_path = join(BespokeGlobals.ABS_LOCAL_TESTS, self._test_directory)
 
-        if isdir(local_source_path):
-            self._staf_dir_copy(local_source_path, self._remote_target_path)
-        else:
+        if not isdir(local_source_path):
             raise CoreError('Failed to stage test step "{0}" on remote machine! The test directory '
                             '"{1}" does not exist!'.format(self._description, local_source_path))
 
+        try:
+            digest = directory_digest(local_source_path)
+        except (IOError, OSError) as e:
+            raise CoreError('Failed to stage test step "{0}" on remote machine! Reason: '
+                            '{1}'.format(self._description, str(e)))
+
+        #An earlier step in this test case already staged the identical directory.
+        if self._sut.staged_digest(self._remote_target_path) == digest:
+            return
+
+        #Don't trust a partially staged directory if staging fails.
+        self._sut.mark_staged(self._remote_target_path, None)
+
+        if self._transfer_mode == 'archive':
+            self._staf_archive_copy(local_source_path, self._remote_target_path)
+        elif self._transfer_mode == 'sync':
+            #Synchronize a mirror in the cache, which survives between test cases, then copy it
+            #into place locally on the SUT so test output never ends up in the mirror.
+            remote_mirror_path = join(self._sut.bespoke_root,
+                                      BespokeGlobals.CACHE,
+                                      BespokeGlobals.SYNC,
+                                      self._test_directory)
+
+            self._staf_sync_copy(local_source_path, remote_mirror_path)
+            self._staf_remote_copy(remote_mirror_path, self._remote_target_path)
+        else:
+            self._staf_dir_copy(local_source_path, self._remote_target_path)
+
+        self._sut.mark_staged(self._remote_target_path, digest)
+
     def _execute_test_step(self):
         """Execute the test step executable on the SUT.
         
@@ -1342,8 +3028,14 @@ class TestStep(_TestResults):
             self._init_staf_handle()
             self._setup_results()
             self._stage_test_step()
-            self._execute_test_step()
-            sleep(self._post_wait)
+            self._start_results_stream()
+
+            try:
+                self._execute_test_step()
+                sleep(self._post_wait)
+            finally:
+                self._stop_results_stream()
+
             self._get_remote_results()
             self._status = 'Pass'
         except CoreError as e:
@@ -1407,6 +3099,77 @@ class TestCase(_TestContainer):
 
         self._tests.append(PowerControl("{0}_PowerControl".format(name), sut, event_type, wait))
 
+    def _execute_test(self, test):
+        """Execute a single test and record a failure or fatal error.
+        
+        Args:
+            test (:class:`_Test`) = The test to execute.
+            
+        Returns:
+            None.
+        
+        Raises:
+            :class:`FatalError`: Fatal error occurred and unreliable results possibly recorded.
+        """
+
+        try:
+            self._update_resource_timeouts(test.timeout)
+            test.execute()
+        except Failure as e:
+            self._status = 'Fail'
+            self._message = ('The "{0}" test in the test case "{1}" failed with the '
+                             'message: "{2}"'.format(test.name, self.name, e.msg))
+        except FatalError as e:
+            self._checkin_resources()
+            self._status = 'Fatal'
+            self._message = ('The "{0}" test in the test case "{1}" encountered the fatal '
+                             'error: "{2}"'.format(test.name, self.name, e.msg))
+            raise FatalError(self._message)
+
+    def _stage_shared_artifacts(self, installers):
+        """Stage every cached artifact that is installed on more than one SUT with a
+        :class:`FanOutStager` so the artifact is sent to all the SUTs concurrently. The installers 
+        then find the artifact already cached on their SUT.
+        
+        Args:
+            installers ([:class:`_Installer`]) = Installers of the test case that run back to back.
+            
+        Returns:
+            None.
+        
+        Raises:
+            None.
+        """
+
+        shared_artifacts = OrderedDict()    #{local path:(tool, [SUT])}
+
+        for installer in installers:
+            if installer.tool.source_copy_once:
+                _, suts = shared_artifacts.setdefault(installer.local_source_path,
+                                                      (installer.tool, []))
+
+                if installer.sut not in suts:
+                    suts.append(installer.sut)
+
+        for local_path, (tool, suts) in shared_artifacts.items():
+            if len(suts) < 2:
+                continue
+
+            #Wait for the tool to be staged (e.g. by the ArtifactPrefetcher) so the artifact isn't
+            #cached while it is still being copied. A failure is left for the installers to report.
+            try:
+                tool.stage()
+            except CoreError as e:
+                _LOGGER.warning('Skipped the fan out of "%s"! %s', local_path, e.msg)
+                continue
+
+            stager = FanOutStager(local_path, suts)
+            stager.execute()
+
+            if stager.status == 'Fail':
+                _LOGGER.warning('Failed to fan out "%s"! The installers copy it on their own. '
+                                'Reason: %s', local_path, stager.message)
+
     def _checkin_resources(self):
         """Check-in all resources for the test case.
         
@@ -1536,7 +3299,8 @@ class TestCase(_TestContainer):
                       post_wait,
                       timeout,
                       restart,
-                      restart_wait):
+                      restart_wait,
+                      cleanup='full'):
 
         """Add a "TestPrep" to the test case.
         
@@ -1550,6 +3314,7 @@ class TestCase(_TestContainer):
                 components.
             restart (bln) = Restart the computer after test step execution..
             restart_wait (bln) = Wait for restart to complete.
+            cleanup (str)(opt) = How the Bespoke root directory on the SUT is cleaned.
                 
         Returns:
             None.
@@ -1557,7 +3322,7 @@ class TestCase(_TestContainer):
         Raises:
             :class:`CoreError`: The requested "resource_id" is already in use by another "TestPep".
                 The "TestPrep" requested the same SUT as another "TestPrep" already defined in 
-                this test case.
+                this test case. The cleanup mode is unknown.
         """
 
         if resource_id in self._test_preps.keys():
@@ -1570,7 +3335,7 @@ class TestCase(_TestContainer):
                                                                        self._name))
 
         try:
-            tmp_test_prep = TestPrep(resource_id, sut, timeout, post_wait, checkpoint)
+            tmp_test_prep = TestPrep(resource_id, sut, timeout, post_wait, checkpoint, cleanup)
         except CoreError as e:
             raise CoreError('The TestCase "{0}" could not be created because of an error in the '
                             'TestPrep "{1}": {2}'.format(self._name, resource_id, e.msg))
@@ -1592,7 +3357,8 @@ class TestCase(_TestContainer):
                       timeout,
                       post_wait,
                       restart,
-                      restart_wait):
+                      restart_wait,
+                      transfer_mode='copy'):
 
         """Add a "TestStep" to the test case.
         
@@ -1608,12 +3374,14 @@ class TestCase(_TestContainer):
             post_wait (int) = The number of seconds to wait post test before continuing.
             restart (bln) = Restart the computer after test step execution..
             restart_wait (bln) = Wait for restart to complete.
+            transfer_mode (str)(opt) = The method used to stage the test directory on the SUT.
             
         Raises:
             None.
         
         Raises:
-            :class:`CoreError`: The "TestStep" specified an invalid "resource_id". 
+            :class:`CoreError`: The "TestStep" specified an invalid "resource_id" or transfer
+                mode. 
         """
 
         if resource_id not in self._test_preps.keys():
@@ -1629,7 +3397,8 @@ class TestCase(_TestContainer):
                                     test_exec,
                                     test_params,
                                     timeout,
-                                    post_wait))
+                                    post_wait,
+                                    transfer_mode))
 
         if restart:
             self._add_power_event(desc, sut, 'restart', restart_wait)
@@ -1677,20 +3446,16 @@ class TestCase(_TestContainer):
 
         self._checkout_resources()
 
-        for test in self._tests:
-            try:
-                self._update_resource_timeouts(test.timeout)
-                test.execute()
-            except Failure as e:
-                self._status = 'Fail'
-                self._message = ('The "{0}" test in the test case "{1}" failed with the '
-                                 'message: "{2}"'.format(test.name, self.name, e.msg))
-            except FatalError as e:
-                self._checkin_resources()
-                self._status = 'Fatal'
-                self._message = ('The "{0}" test in the test case "{1}" encountered the fatal '
-                                 'error: "{2}"'.format(test.name, self.name, e.msg))
-                raise FatalError(self._message)
+        for is_installer, tests in groupby(self._tests, lambda test: isinstance(test, _Installer)):
+            tests = list(tests)
+
+            #Tests run in order, but the artifacts shared by installers that run back to back are
+            #staged to all of their SUTs at once before the first of them runs.
+            if is_installer:
+                self._stage_shared_artifacts(tests)
+
+            for test in tests:
+                self._execute_test(test)
 
         if self._status == 'Fail':
             self._checkin_resources()
@@ -1699,6 +3464,27 @@ class TestCase(_TestContainer):
         self._status = 'Pass'
         self._checkin_resources()
 
+    @property
+    def get_tools(self):
+        """The tools and builds installed by the test case.
+        
+        Returns:
+            ([:class:`Tool`])
+        """
+
+        return [test.tool for test in self._tests if isinstance(test, _Installer)]
+
+    @property
+    def get_tests(self):
+        """The test preps, installers, test steps and power events of the test case in the order
+        they execute.
+        
+        Returns:
+            ([:class:`_Test`])
+        """
+
+        return list(self._tests)
+
 class TestPlan(_TestContainer):
     """This is a simple container class for TestCases.
     
@@ -1838,6 +3624,16 @@ class TestRun(_TestContainer):
 
         self._status = 'Pass'
 
+    @property
+    def get_test_plans(self):
+        """The test plans contained within the run.
+        
+        Returns:
+            ([:class:`TestPlan`])
+        """
+
+        return self._test_plans
+
 class SystemUnderTest(object):
     """A class that contains information about the system under test and functions for manipulating
     the state of the SUT.
@@ -1902,6 +3698,12 @@ class SystemUnderTest(object):
         self._in_use = False
         self._lock_expiration = datetime.now()
 
+        #Content digests of the directories staged on the SUT keyed by remote path.
+        self._staged_directories = {}
+
+        #Measured throughput of uncompressed transfers to/from the SUT in bytes per second.
+        self._link_throughput = None
+
         if self._machine_type not in self._MACHINE_TYPES:
             raise CoreError("The machine type '{0}' is not supported!".format(self._machine_type),False)
 
@@ -2014,6 +3816,126 @@ class SystemUnderTest(object):
 
         return self._available_tools
 
+    @property
+    def is_sandbox(self):
+        """Indicates that the SystemUnderTest is a sandbox directory on the Bespoke server. Sandboxes
+        don't need to boot and must never receive OS power events.
+        
+        Returns:
+            (bln)
+        """
+
+        return self._machine.is_sandbox
+
+    @property
+    def operation_progress(self):
+        """The most recent progress report for the current or last long running machine operation
+        such as a snapshot restore.
+        
+        Returns:
+            (:class:`OperationProgress`): The progress or None if not reported by the hypervisor.
+        """
+
+        return self._machine.last_progress
+
+    @property
+    def link_throughput(self):
+        """The measured throughput of the link to the SUT in bytes per second.
+        
+        Returns:
+            (float)
+            (None) = Nothing has been measured yet.
+        """
+
+        return self._link_throughput
+
+    def record_transfer(self, size, seconds):
+        """Record an uncompressed transfer to or from the SUT. Recent transfers are given more 
+        weight so the measurement follows changes in the link.
+        
+        Args:
+            size (int) = The number of bytes transferred.
+            seconds (float) = The duration of the transfer.
+            
+        Returns:
+            None.
+        
+        Raises:
+            None.
+        """
+
+        throughput = size / max(seconds, 0.001)
+
+        if self._link_throughput is None:
+            self._link_throughput = throughput
+        else:
+            self._link_throughput = (self._link_throughput + throughput) / 2.0
+
+    def staged_digest(self, remote_path):
+        """The content digest of the directory last staged at a path on the SystemUnderTest.
+        
+        Args:
+            remote_path (str): The absolute path on the SystemUnderTest.
+        
+        Returns:
+            (str): The hex digest or None if nothing is known to be staged at the path.
+        
+        Raises:
+            None.
+        """
+
+        return self._staged_directories.get(remote_path)
+
+    def mark_staged(self, remote_path, digest):
+        """Record the content digest of a directory staged on the SystemUnderTest.
+        
+        Args:
+            remote_path (str): The absolute path on the SystemUnderTest.
+            digest (str): The hex digest of the staged directory or None to forget the path.
+        
+        Returns:
+            None.
+        
+        Raises:
+            None.
+        """
+
+        if digest is None:
+            self._staged_directories.pop(remote_path, None)
+        else:
+            self._staged_directories[remote_path] = digest
+
+    def forget_staged(self):
+        """Forget every staged directory. This must be called whenever the contents of the 
+        SystemUnderTest can no longer be trusted such as after a restart or snapshot restore.
+        
+        Args:
+            None.
+        
+        Returns:
+            None.
+        
+        Raises:
+            None.
+        """
+
+        self._staged_directories.clear()
+
+    def cancel_operation(self):
+        """Request cancellation of the long running machine operation in progress.
+        
+        Args:
+            None.
+        
+        Returns:
+            None.
+        
+        Raises:
+            None.
+        """
+
+        self._machine.cancel()
+
     def checkout(self, timeout):
         """Reserve SystemUnderTest for a period of time.
         
@@ -2141,6 +4063,8 @@ class SystemUnderTest(object):
             :class:`CoreError`: Failed to stop SystemUnderTest.
         """
 
+        self.forget_staged()
+
         try:
             self._machine.stop()
         except VMError, e:
@@ -2159,6 +4083,8 @@ class SystemUnderTest(object):
             :class:`CoreError`: Failed to restart SystemUnderTest.
         """
 
+        self.forget_staged()
+
         try:
             self._machine.restart()
         except VMError, e:
@@ -2177,11 +4103,49 @@ class SystemUnderTest(object):
             :class:`CoreError`: Failed to shutdown SystemUnderTest.
         """
 
+        self.forget_staged()
+
         try:
             self._machine.shutdown(wait)
         except VMError, e:
             raise CoreError(e.msg, True)
 
+    def suspend(self):
+        """Save the execution state of the SystemUnderTest and stop it.
+        
+        Args:
+            None.
+        
+        Returns:
+            None.
+        
+        Raises:
+            :class:`CoreError`: Failed to suspend SystemUnderTest.
+        """
+
+        try:
+            self._machine.suspend()
+        except VMError, e:
+            raise CoreError(e.msg, True)
+
+    def resume(self):
+        """Resume the SystemUnderTest from its saved execution state.
+        
+        Args:
+            None.
+        
+        Returns:
+            None.
+        
+        Raises:
+            :class:`CoreError`: Failed to resume SystemUnderTest.
+        """
+
+        try:
+            self._machine.resume()
+        except VMError, e:
+            raise CoreError(e.msg, True)
+
     def apply_snapshot(self, name):
         """Apply a snapshot to the SystemUnderTest.
         
@@ -2196,11 +4160,32 @@ class SystemUnderTest(object):
                 applied.
         """
 
+        self.forget_staged()
+
         try:
             self._machine.apply_snapshot(name)
         except VMError, e:
             raise CoreError(e.msg, True)
 
+    def take_snapshot(self, name):
+        """Take a snapshot of the SystemUnderTest. A snapshot of a running SystemUnderTest captures
+        the running state so it can be resumed instead of booted after the snapshot is applied.
+        
+        Args:
+            name (str): The name of the snapshot to take.
+        
+        Returns:
+            None.
+        
+        Raises:
+            :class:`CoreError`: The snapshot failed to be taken.
+        """
+
+        try:
+            self._machine.take_snapshot(name)
+        except VMError, e:
+            raise CoreError(e.msg, True)
+
 class PowerControl(_Test):
     """Send the power events 'shutdown' and 'restart' to the SUT.
     
@@ -2223,6 +4208,25 @@ class PowerControl(_Test):
         self._wait = wait
         self._command_timeout = 10
 
+    def _sandbox_power_control(self):
+        """Issue power control events to a sandbox SUT through the machine rather than the OS. (The
+        OS of a sandbox is the Bespoke server itself!)
+        
+        Args:
+            None.
+        
+        Returns:
+            None.
+        
+        Raises:
+            :class:`CoreError`: Failed to execute the power event.
+        """
+
+        if self._power_event_type == 'restart':
+            self._sut.restart()
+        else:
+            self._sut.shutdown(True)
+
     def _linux_power_control(self):
         """Issue power control commands to a Linux platform SUT.
         
@@ -2290,14 +4294,18 @@ class PowerControl(_Test):
             self._init_staf_handle()
             self._ping()
 
-            if self._sut.os == 'Linux':
+            if self._sut.is_sandbox:
+                self._sandbox_power_control()
+            elif self._sut.os == 'Linux':
                 self._linux_power_control()
             elif self._sut.os == 'Windows':
                 self._windows_power_control()
             else:
                 raise CoreError("Unknown OS platform: {0}".format(self._sut.os))
 
-            if self._wait:
+            self._sut.forget_staged()
+
+            if self._wait and not self._sut.is_sandbox:
                 sleep(BespokeGlobals.VM_BOOT_WAIT)
 
             self._status = 'Pass'
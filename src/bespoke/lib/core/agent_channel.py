@@ -0,0 +1,722 @@
+"""
+.. module:: core.agent_channel
+   :platform: Linux, Windows
+   :synopsis: This module accepts the persistent connections of Bespoke agents running in daemon
+       mode and multiplexes requests to them over those connections.
+   :license: BSD, see LICENSE for more details.
+
+.. moduleauthor:: Caleb Moniot <cmoniot@gmail.com>
+"""
+__version__ = 0.1
+
+# ===================================================================================================
+# Imports
+# ===================================================================================================
+import hmac
+import json
+import socket
+from time import time
+from base64 import b64encode, b64decode
+from struct import Struct
+from threading import Thread, Lock, Event, Condition
+
+# ===================================================================================================
+# Globals
+# ===================================================================================================
+AGENT_PORT = 8921               #The port agents connect to by default.
+CHUNK_SIZE = 65536              #Bytes of file data sent per message.
+HEADER = Struct('!I')           #Every message is JSON prefixed with its length in bytes.
+GREETING_TIMEOUT = 10           #Seconds a new agent has to announce itself.
+MAX_GREETING_SIZE = 4096        #Bytes a greeting may have since the agent isn't trusted yet.
+TOKEN_VARIABLE = 'BESPOKE_AGENT_TOKEN'  #Environment variable holding the shared token.
+
+# ===================================================================================================
+# Classes
+# ===================================================================================================
+class AgentRequest(object):
+    """A request sent to an agent. The result is filled in by the reader thread of the connection
+    when the agent sends it.
+
+    Args:
+        request_id (int): The id of the request on its connection.
+        on_output (callable)(opt): Called with every chunk of process output as it arrives.
+            The output is collected and returned by "result()" if None.
+        sink (file)(opt): The file that receives the data of a "Pull" request.
+
+    Raises:
+        None.
+    """
+
+    def __init__(self, request_id, on_output=None, sink=None):
+        self._id = request_id
+        self._on_output = on_output
+        self._sink = sink
+        self._output = []
+        self._exit_code = None
+        self._message = None
+        self._error = None
+        self._timed_out = False
+        self._done = Event()
+
+    def _complete(self, exit_code=None, message=None, error=None, timed_out=False):
+        """Record the outcome of the request and wake up anybody waiting on it.
+
+        Args:
+            exit_code (int)(opt): The exit code of the request.
+            message (str)(opt): The message the agent sent with the result.
+            error (str)(opt): Why the request could not be completed.
+            timed_out (bln)(opt): The agent killed the request when it ran past its timeout.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        self._exit_code = exit_code
+        self._message = message
+        self._error = error
+        self._timed_out = timed_out
+        self._done.set()
+
+    def _receive(self, message_type, data):
+        """Handle output or file data the agent sent for the request.
+
+        Args:
+            message_type (str): "output" or "data".
+            data (str): The decoded bytes.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        if message_type == 'data' and self._sink is not None:
+            self._sink.write(data)
+        elif self._on_output is not None:
+            self._on_output(data)
+        else:
+            self._output.append(data)
+
+    def done(self):
+        """Determine if the request has completed.
+
+        Args:
+            None.
+
+        Returns:
+            (bln)
+
+        Raises:
+            None.
+        """
+
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """Wait for the request to complete.
+
+        Args:
+            timeout (float)(opt): The maximum number of seconds to wait. Waits forever if None.
+
+        Returns:
+            ((int), (str)): The exit code and the collected output or, if there is no output, the
+                message of the agent.
+
+        Raises:
+            :class:`AgentError`: The connection was lost, the agent killed the request when it
+                ran past its timeout or the request is still running after "timeout" seconds.
+        """
+
+        #Waiting in short slices keeps the main thread responsive to KeyboardInterrupt.
+        deadline = None if timeout is None else time() + timeout
+
+        while not self._done.wait(1):
+            if deadline is not None and time() >= deadline:
+                raise AgentError('The request "{0}" is still running!'.format(self._id))
+
+        if self._error is not None:
+            raise AgentError(self._error)
+        elif self._timed_out:
+            raise AgentError('The request "{0}" timed out! {1}'.format(self._id, self._message))
+
+        output = ''.join(self._output)
+
+        return (self._exit_code, output or self._message)
+
+    @property
+    def id(self):
+        """The id of the request on its connection.
+
+        Returns:
+            (int)
+        """
+
+        return self._id
+
+    @property
+    def timed_out(self):
+        """The agent killed the request when it ran past its timeout.
+
+        Returns:
+            (bln)
+        """
+
+        return self._timed_out
+
+class AgentConnection(object):
+    """The persistent connection of one agent. Requests are tagged with an id and sent without
+    waiting for earlier requests to complete, and a reader thread hands everything the agent sends
+    back to the request it belongs to, so any number of requests can be in flight at once.
+
+    Args:
+        sock (socket): The connected socket of the agent.
+        name (str): The name the agent announced itself with.
+
+    Raises:
+        None.
+    """
+
+    def __init__(self, sock, name):
+        self._sock = sock
+        self._name = name
+        self._send_lock = Lock()
+        self._lock = Lock()
+        self._next_id = 0
+        self._requests = {}         #{id::class:`AgentRequest`}
+        self._closed = False
+
+        self._thread = Thread(target=self._read)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _read(self):
+        """Dispatch the messages of the agent until the connection closes, then fail every
+        request that is still waiting.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        try:
+            while True:
+                message = receive_message(self._sock)
+
+                if message is None:
+                    break
+
+                with self._lock:
+                    request = self._requests.get(message.get('id'))
+
+                if request is None:
+                    continue
+                elif message['type'] in ('output', 'data'):
+                    request._receive(message['type'], b64decode(message['data']))
+                elif message['type'] == 'result':
+                    with self._lock:
+                        self._requests.pop(request.id, None)
+
+                    request._complete(message['exit_code'],
+                                      message.get('message'),
+                                      timed_out=message.get('timed_out', False))
+        except (socket.error, ValueError, KeyError):
+            pass
+
+        self.close()
+
+    def _send(self, message):
+        """Send a message to the agent.
+
+        Args:
+            message ({str:obj}): The message.
+
+        Returns:
+            None.
+
+        Raises:
+            :class:`AgentError`: The connection is closed.
+        """
+
+        try:
+            send_message(self._sock, self._send_lock, message)
+        except socket.error as e:
+            self.close()
+
+            raise AgentError('Lost the connection to the agent "{0}"! '
+                             'Reason: {1}'.format(self._name, str(e)))
+
+    def cancel(self, request):
+        """Ask the agent to stop a running "Exec" or "Push" request.
+
+        Args:
+            request (:class:`AgentRequest`): The request to cancel.
+
+        Returns:
+            None.
+
+        Raises:
+            :class:`AgentError`: The connection is closed.
+        """
+
+        self._send({'id': request.id, 'type': 'cancel'})
+
+    def close(self):
+        """Close the connection and fail every request that hasn't completed.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        with self._lock:
+            self._closed = True
+            requests, self._requests = list(self._requests.values()), {}
+
+        #Shut the socket down first since closing it doesn't wake up a thread blocked on it.
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+
+        self._sock.close()
+
+        for request in requests:
+            request._complete(error='Lost the connection to the agent "{0}"!'.format(self._name))
+
+    def execute(self, command, working_dir=None, timeout=None, env_vars={}, on_output=None):
+        """Execute a command through the shell of the agent machine.
+
+        Args:
+            command (str): The command line to execute.
+            working_dir (str)(opt): The working directory of the command.
+            timeout (int)(opt): The number of seconds before the agent kills the command.
+            env_vars ({str:str})(opt): Environment variables to set for the command.
+            on_output (callable)(opt): Called with the output of the command as it arrives.
+
+        Returns:
+            (:class:`AgentRequest`)
+
+        Raises:
+            :class:`AgentError`: The connection is closed.
+        """
+
+        return self.request('Exec',
+                            {'command': command,
+                             'working_dir': working_dir,
+                             'timeout': timeout,
+                             'env_vars': env_vars},
+                            on_output=on_output)
+
+    def pull(self, remote_path, local_file):
+        """Copy a file from the agent machine.
+
+        Args:
+            remote_path (str): The file on the agent machine.
+            local_file (file): An open file to write the contents into. The caller closes it once
+                the request has completed.
+
+        Returns:
+            (:class:`AgentRequest`)
+
+        Raises:
+            :class:`AgentError`: The connection is closed.
+        """
+
+        return self.request('Pull', {'path': remote_path}, sink=local_file)
+
+    def push(self, local_path, remote_path, overwrite=True, is_text_file=False):
+        """Copy a file to the agent machine. The contents are sent by the calling thread and are
+        interleaved with the messages of other requests.
+
+        Args:
+            local_path (str): The local file to copy.
+            remote_path (str): The copy destination on the agent machine.
+            overwrite (bln)(opt): Replace the destination if it exists.
+            is_text_file (bln)(opt): Convert the line endings for the agent machine.
+
+        Returns:
+            (:class:`AgentRequest`)
+
+        Raises:
+            :class:`AgentError`: The connection is closed or the local file could not be read.
+        """
+
+        request = self.request('Push', {'path': remote_path,
+                                        'overwrite': overwrite,
+                                        'text': is_text_file})
+
+        try:
+            with open(local_path, 'rb') as push_file:
+                while True:
+                    data = push_file.read(CHUNK_SIZE)
+
+                    if not data:
+                        break
+
+                    self._send({'id': request.id, 'type': 'data', 'data': b64encode(data)})
+        except IOError as e:
+            self.cancel(request)
+
+            raise AgentError('Failed to read "{0}"! Reason: {1}'.format(local_path, str(e)))
+
+        self._send({'id': request.id, 'type': 'end'})
+
+        return request
+
+    def request(self, action, params, on_output=None, sink=None):
+        """Send a request to the agent without waiting for it to complete.
+
+        Args:
+            action (str): The action for the agent to perform. ("Exec", "MakeDir", "Ping",
+                "Pull", "Push" or any action of the one-shot agent such as "MSI")
+            params ({str:obj}): The parameters of the action.
+            on_output (callable)(opt): Called with every chunk of output as it arrives.
+            sink (file)(opt): The file that receives the data of a "Pull" request.
+
+        Returns:
+            (:class:`AgentRequest`)
+
+        Raises:
+            :class:`AgentError`: The connection is closed.
+        """
+
+        with self._lock:
+            if self._closed:
+                raise AgentError('The connection to the agent "{0}" is '
+                                 'closed!'.format(self._name))
+
+            self._next_id += 1
+            request = AgentRequest(self._next_id, on_output, sink)
+            self._requests[request.id] = request
+
+        self._send({'id': request.id, 'type': 'request', 'action': action, 'params': params})
+
+        return request
+
+    @property
+    def closed(self):
+        """The connection to the agent has been closed.
+
+        Returns:
+            (bln)
+        """
+
+        return self._closed
+
+    @property
+    def name(self):
+        """The name the agent announced itself with.
+
+        Returns:
+            (str)
+        """
+
+        return self._name
+
+class AgentServer(object):
+    """Listen for agents running in daemon mode and keep the latest connection of each agent by
+    name. An agent that reconnects replaces its old connection. Agents must announce themselves
+    with the token shared with the server, so the server only accepts connections on the
+    configured interface from agents that know the token.
+
+    Args:
+        host (str): The address of the interface to listen on.
+        token (str): The token shared with the agents.
+        port (int)(opt): The port to listen on. A free port is picked if 0.
+
+    Raises:
+        :class:`AgentError`: No token was given or the port could not be opened.
+    """
+
+    def __init__(self, host, token, port=AGENT_PORT):
+        self._connections = {}      #{name::class:`AgentConnection`}
+        self._condition = Condition()
+
+        if not token:
+            raise AgentError('A token is required to accept agents!')
+
+        self._token = str(token)
+
+        try:
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._sock.bind((host, port))
+            self._sock.listen(16)
+        except socket.error as e:
+            raise AgentError('Failed to listen for agents on port {0}! '
+                             'Reason: {1}'.format(port, str(e)))
+
+        self._thread = Thread(target=self._accept)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _accept(self):
+        """Accept agent connections until the server is closed.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        while True:
+            try:
+                sock = self._sock.accept()[0]
+            except socket.error:
+                return
+
+            thread = Thread(target=self._greet, args=(sock,))
+            thread.daemon = True
+            thread.start()
+
+    def _greet(self, sock):
+        """Read the greeting of a new agent and register its connection. Agents that don't send
+        the shared token and their name within GREETING_TIMEOUT seconds and MAX_GREETING_SIZE
+        bytes are dropped.
+
+        Args:
+            sock (socket): The socket of the agent.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            message = receive_message(sock, MAX_GREETING_SIZE, time() + GREETING_TIMEOUT)
+            name = message['name']
+            token = str(message['token'])
+            sock.settimeout(None)
+        except (socket.error, ValueError, KeyError, TypeError, UnicodeError):
+            sock.close()
+            return
+
+        if not isinstance(name, basestring) or not name:
+            sock.close()
+            return
+
+        #Compare in constant time so the token can't be guessed one character at a time.
+        if not hmac.compare_digest(token, self._token):
+            sock.close()
+            return
+
+        connection = AgentConnection(sock, name)
+
+        with self._condition:
+            previous = self._connections.get(name)
+            self._connections[name] = connection
+            self._condition.notify_all()
+
+        if previous is not None:
+            previous.close()
+
+    def close(self):
+        """Stop listening and close the connection of every agent.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        #Shut the socket down first since closing it doesn't wake up a thread blocked on it.
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+
+        self._sock.close()
+
+        with self._condition:
+            connections, self._connections = list(self._connections.values()), {}
+
+        for connection in connections:
+            connection.close()
+
+    def get(self, name, timeout=None):
+        """Get the connection of an agent, waiting for it to connect if necessary.
+
+        Args:
+            name (str): The name of the agent.
+            timeout (float)(opt): The maximum number of seconds to wait. Doesn't wait if None.
+
+        Returns:
+            (:class:`AgentConnection`)
+
+        Raises:
+            :class:`AgentError`: The agent isn't connected.
+        """
+
+        deadline = time() + (timeout or 0)
+
+        with self._condition:
+            while True:
+                connection = self._connections.get(name)
+
+                if connection is not None and not connection.closed:
+                    return connection
+
+                remaining = deadline - time()
+
+                if remaining <= 0:
+                    raise AgentError('The agent "{0}" is not connected!'.format(name))
+
+                self._condition.wait(min(remaining, 1))
+
+    @property
+    def port(self):
+        """The port the server listens on.
+
+        Returns:
+            (int)
+        """
+
+        return self._sock.getsockname()[1]
+
+    @property
+    def agents(self):
+        """The names of the connected agents.
+
+        Returns:
+            ([str])
+        """
+
+        with self._condition:
+            return sorted(name for name, connection in self._connections.items()
+                          if not connection.closed)
+
+# ===================================================================================================
+# Functions
+# ===================================================================================================
+def receive_message(sock, max_size=None, deadline=None):
+    """Read one message from a socket.
+
+    Args:
+        sock (socket): The socket to read from.
+        max_size (int)(opt): The largest message in bytes to accept. Any size if None.
+        deadline (float)(opt): The time by which the whole message must have arrived. Waits
+            forever if None.
+
+    Returns:
+        ({str:obj}): The message or None if the peer closed the connection.
+
+    Raises:
+        socket.error: The connection failed or the deadline passed.
+        ValueError: The message is larger than "max_size" or isn't valid JSON.
+    """
+
+    header = _receive_exact(sock, HEADER.size, deadline)
+
+    if header is None:
+        return None
+
+    size = HEADER.unpack(header)[0]
+
+    #Check the size before reading so a peer can't make us buffer whatever it claims to send.
+    if max_size is not None and size > max_size:
+        raise ValueError('The message of {0} bytes is larger than {1} bytes!'.format(size,
+                                                                                      max_size))
+
+    payload = _receive_exact(sock, size, deadline)
+
+    return None if payload is None else json.loads(payload)
+
+def send_message(sock, lock, message):
+    """Send one message on a socket. The lock keeps messages sent by different threads from
+    interleaving.
+
+    Args:
+        sock (socket): The socket to send on.
+        lock (:class:`Lock`): The send lock of the socket.
+        message ({str:obj}): The message.
+
+    Returns:
+        None.
+
+    Raises:
+        socket.error: The connection failed.
+    """
+
+    payload = json.dumps(message)
+
+    with lock:
+        sock.sendall(HEADER.pack(len(payload)) + payload)
+
+def _receive_exact(sock, size, deadline=None):
+    """Read exactly "size" bytes from a socket.
+
+    Args:
+        sock (socket): The socket to read from.
+        size (int): The number of bytes to read.
+        deadline (float)(opt): The time by which all the bytes must have arrived. Waits forever
+            if None.
+
+    Returns:
+        (str): The bytes or None if the peer closed the connection.
+
+    Raises:
+        socket.error: The connection failed or the deadline passed.
+    """
+
+    chunks = []
+
+    while size > 0:
+        #A peer trickling bytes would restart a plain socket timeout on every read.
+        if deadline is not None:
+            remaining = deadline - time()
+
+            if remaining <= 0:
+                raise socket.timeout('timed out')
+
+            sock.settimeout(remaining)
+
+        chunk = sock.recv(min(size, CHUNK_SIZE * 2))
+
+        if not chunk:
+            return None
+
+        chunks.append(chunk)
+        size -= len(chunk)
+
+    return ''.join(chunks)
+
+# ===================================================================================================
+# Exceptions
+# ===================================================================================================
+class AgentError(Exception):
+    """Exception for errors in the agent_channel module.
+
+    Args:
+        msg (str): A message describing the error.
+    """
+
+    def __init__(self, msg):
+        self.message = self.msg = msg
+
+    def __str__(self):
+        return "Agent Error: {0}".format(self.msg)
@@ -0,0 +1,231 @@
+"""
+.. module:: core.artifact_cache
+   :platform: Linux, Windows
+   :synopsis: This module provides a content addressed store for artifacts staged on the Bespoke
+       server.
+   :license: BSD, see LICENSE for more details.
+
+.. moduleauthor:: Caleb Moniot <cmoniot@gmail.com>
+"""
+__version__ = 0.1
+
+# ===================================================================================================
+# Imports
+# ===================================================================================================
+import shutil
+from uuid import uuid1
+from zipfile import ZipFile, ZIP_DEFLATED
+from os import makedirs, rename, walk
+from os.path import isdir, isfile, join, basename, relpath
+from util import file_digest, directory_digest
+
+# ===================================================================================================
+# Globals
+# ===================================================================================================
+PARTIAL_SUFFIX = '.part'    #Suffix for cache entries that are still being written.
+ARCHIVE_SUFFIX = '.zip'     #Suffix for archived directories.
+
+# ===================================================================================================
+# Classes
+# ===================================================================================================
+class LocalArtifactCache(object):
+    """A content addressed store for files and directories on the Bespoke server. Each artifact is
+    kept at "<root>/<digest>/<name>" so the original name is preserved, and an entry is only
+    written once no matter how many times the same bytes are stored. Entries are written to a
+    partial directory first and renamed into place so a reader never sees a half written entry.
+
+    Args:
+        root (str): The staging directory that holds the cache.
+
+    Raises:
+        None.
+    """
+
+    def __init__(self, root):
+        self._root = root
+
+    @property
+    def root(self):
+        """The staging directory that holds the cache.
+
+        Returns:
+            (str)
+        """
+
+        return self._root
+
+    def digest(self, path):
+        """Calculate the content digest of a file or directory.
+
+        Args:
+            path (str): The file or directory.
+
+        Returns:
+            (str): The hex digest.
+
+        Raises:
+            :class:`CacheError`: The path does not exist or could not be read.
+        """
+
+        try:
+            if isdir(path):
+                return directory_digest(path)
+            elif isfile(path):
+                return file_digest(path)
+        except (IOError, OSError) as e:
+            raise CacheError('Failed to calculate the digest of "{0}"! Reason: {1}'.format(path,
+                                                                                         str(e)))
+
+        raise CacheError('The file/directory "{0}" does not exist!'.format(path))
+
+    def contains(self, key):
+        """Determine if the cache holds an artifact with the given key.
+
+        Args:
+            key (str): The cache key of the artifact.
+
+        Returns:
+            (bln)
+
+        Raises:
+            None.
+        """
+
+        return isdir(join(self._root, key))
+
+    def store(self, path):
+        """Store a file or directory in the cache unless the cache already holds the same bytes.
+
+        Args:
+            path (str): The file or directory to store.
+
+        Returns:
+            ((str), (str)): The hex digest of the artifact and the path of the cached copy.
+
+        Raises:
+            :class:`CacheError`: The artifact could not be stored.
+        """
+
+        digest = self.digest(path)
+        name = basename(path.rstrip('/\\'))
+
+        def write(target):
+            if isdir(path):
+                shutil.copytree(path, target, symlinks=True)
+            else:
+                shutil.copy2(path, target)
+
+        return (digest, self._write_entry(path, digest, name, write))
+
+    def store_archive(self, path):
+        """Store a directory in the cache as a single compressed archive unless the cache already
+        holds an archive of the same bytes. The archive holds the contents of the directory so
+        extracting it into a directory gives the same result as copying the directory.
+
+        Args:
+            path (str): The directory to archive.
+
+        Returns:
+            ((str), (str)): The cache key of the archive and the path of the cached archive. The 
+                key is the hex digest of the directory followed by the archive suffix so archives
+                never collide with a plain copy of the same directory.
+
+        Raises:
+            :class:`CacheError`: The path is not a directory or the archive could not be stored.
+        """
+
+        if not isdir(path):
+            raise CacheError('The directory "{0}" does not exist!'.format(path))
+
+        key = self.digest(path) + ARCHIVE_SUFFIX
+        name = basename(path.rstrip('/\\')) + ARCHIVE_SUFFIX
+
+        return (key, self._write_entry(path, key, name, lambda target: write_archive(path, target)))
+
+    def _write_entry(self, path, key, name, write):
+        """Write a cache entry through a partial directory so the entry appears atomically.
+
+        Args:
+            path (str): The file or directory being stored. (Only used for error messages.)
+            key (str): The cache key of the artifact.
+            name (str): The name of the artifact inside the entry.
+            write (func): A function that accepts the target path and writes the artifact to it.
+
+        Returns:
+            (str): The path of the cached artifact.
+
+        Raises:
+            :class:`CacheError`: The entry could not be written.
+        """
+
+        entry = join(self._root, key)
+
+        if not isdir(entry):
+            partial = '{0}.{1}{2}'.format(entry, uuid1().hex, PARTIAL_SUFFIX)
+
+            try:
+                makedirs(partial)
+                write(join(partial, name))
+                rename(partial, entry)
+            except (IOError, OSError, shutil.Error) as e:
+                #Another writer may have stored the same bytes first, which is fine.
+                if not isdir(entry):
+                    raise CacheError('Failed to store "{0}" in the artifact cache! '
+                                     'Reason: {1}'.format(path, str(e)))
+            finally:
+                if isdir(partial):
+                    shutil.rmtree(partial, ignore_errors=True)
+
+        return join(entry, name)
+
+# ===================================================================================================
+# Functions
+# ===================================================================================================
+def write_archive(path, target, name=None):
+    """Write a file or the contents of a directory to a compressed archive. File contents are
+    streamed into the archive so memory use doesn't depend on the file size.
+
+    Args:
+        path (str): The file or directory to archive.
+        target (str): The path of the archive to write.
+        name (str)(opt): The name of a file inside the archive. Defaults to the file name.
+
+    Returns:
+        None.
+
+    Raises:
+        IOError: A file could not be read or the archive could not be written.
+        OSError: A file does not exist.
+    """
+
+    with ZipFile(target, 'w', ZIP_DEFLATED, allowZip64=True) as archive:
+        if not isdir(path):
+            archive.write(path, name or basename(path))
+            return
+
+        for root, dirs, files in walk(path):
+            dirs.sort()
+
+            #Record empty directories explicitly so they survive extraction.
+            if root != path and not dirs and not files:
+                archive.write(root, relpath(root, path))
+
+            for file_name in sorted(files):
+                full_path = join(root, file_name)
+                archive.write(full_path, relpath(full_path, path))
+
+# ===================================================================================================
+# Exceptions
+# ===================================================================================================
+class CacheError(Exception):
+    """Exception for errors in the artifact_cache module.
+
+    Args:
+        msg (str): A message describing the error.
+    """
+
+    def __init__(self, msg):
+        self.message = self.msg = msg
+
+    def __str__(self):
+        return "Cache Error: {0}".format(self.msg)
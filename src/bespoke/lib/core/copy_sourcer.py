@@ -13,16 +13,61 @@ __version__ = 0.1
 # Imports
 # ===================================================================================================
 import abc
+import io
+import sys
+import json
+import ctypes
 import shutil
-import win32wnet
+import socket
 import errno
-from os import makedirs
-from ftplib import FTP
-from os.path import isdir, isfile, basename, dirname, exists
+import posixpath
+from calendar import timegm
+from time import strptime, time
+from base64 import b64encode
+from urllib import quote
+from threading import Thread, Lock
+from Queue import Queue, Empty
+from httplib import HTTPConnection, HTTPException
+from os import makedirs, remove, rename, rmdir, stat, strerror, utime, walk
+from ftplib import FTP, all_errors, error_perm, error_reply
+from os.path import isdir, isfile, islink, dirname, join, getsize, getmtime, normpath, relpath
+from util import file_digest
+from artifact_server import MANIFEST_CONTENT_TYPE
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None    #Not available on Windows.
 
 # ===================================================================================================
 # Globals
 # ===================================================================================================
+HTTP_CHUNK_SIZE = 64 * 1024         #Number of bytes read from a HTTP response at a time.
+HTTP_TIMEOUT = 60                   #Socket timeout in seconds for HTTP connections.
+FTP_CHUNK_SIZE = 64 * 1024          #Number of bytes read from a FTP data connection at a time.
+FTP_TIMEOUT = 60                    #Socket timeout in seconds for FTP connections.
+FTP_SEGMENT_SIZE = 16 * 1024 * 1024 #Minimum number of bytes downloaded by a single FTP segment.
+MAX_CONCURRENT_DOWNLOADS = 4        #Default number of files fetched at the same time.
+MAX_CONCURRENT_COPIES = 8           #Default number of files copied at the same time.
+LARGE_FILE_SIZE = 64 * 1024 * 1024  #Files at least this big are copied by the kernel if possible.
+LARGE_COPY_BUFFER = 8 * 1024 * 1024 #Buffer size for large files the kernel can't copy. 
+FICLONE = 0x40049409                #Linux ioctl that clones (reflinks) a whole file.
+DOWNLOAD_RETRIES = 3                #Number of attempts to finish a single download.
+PARTIAL_SUFFIX = '.part'            #Suffix for files that are still being downloaded.
+VALIDATOR_SUFFIX = '.validator'     #Suffix for the ETag of a partial download.
+
+#Errors that mean a kernel copy method isn't supported for the pair of files.
+_UNSUPPORTED_ERRNOS = (errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTTY,
+                       errno.EBADF)
+
+if sys.platform.startswith('linux'):
+    _libc = ctypes.CDLL(None, use_errno=True)
+    _libc.sendfile.restype = ctypes.c_ssize_t
+    
+    if hasattr(_libc, 'copy_file_range'):
+        _libc.copy_file_range.restype = ctypes.c_ssize_t
+else:
+    _libc = None
 
 # ===================================================================================================
 # Classes 
@@ -62,6 +107,26 @@ class _CopySourcer(object):
         
         pass
     
+    def _remove(self, *paths):
+        """Remove files if they exist.
+        
+        Args:
+            paths ([str]): The files to remove.
+        
+        Returns:
+            None
+        
+        Raises:
+            None.
+        """
+        
+        for path in paths:
+            if isfile(path):
+                try:
+                    remove(path)
+                except OSError:
+                    pass
+                
     @property
     def was_copied(self):
         """Indicates that the item(s) were successfully copied.
@@ -85,18 +150,348 @@ class CopyBasic(_CopySourcer):
     Args:
         local source (str): The path to the source file.
         local destination (str): The local path the file will be copied to. 
+        mirror (bln)(opt): Update a destination directory in place by only copying the files 
+            that changed and removing the files that no longer exist in the source instead of
+            recursively deleting the destination first.
+        compare_digests (bln)(opt): In mirror mode compare the SHA-1 digest of files with the same
+            size instead of their modification time.
+        max_concurrent (int)(opt): The maximum number of files copied at the same time when the
+            source is a directory.
         
     Raises:
         None.
     """
     
-    def __init__(self, source, destination):
+    def __init__(self, 
+                 source, 
+                 destination, 
+                 mirror=False, 
+                 compare_digests=False, 
+                 max_concurrent=MAX_CONCURRENT_COPIES):
         super(CopyBasic, self).__init__(source, destination)
         
+        self._mirror = mirror
+        self._compare_digests = compare_digests
+        self._max_concurrent = max(int(max_concurrent), 1)
+        self._bytes_copied = 0
+        self._elapsed = 0.0
+        self._lock = Lock()
+        
+    def _is_current(self, source, destination):
+        """Determine if a destination file already matches the source file.
+        
+        Args:
+            source (str): The source file.
+            destination (str): The destination file.
+        
+        Returns:
+            (bln)
+        
+        Raises:
+            None.
+        """
+        
+        try:
+            source_stat = stat(source)
+            destination_stat = stat(destination)
+            
+            if source_stat.st_size != destination_stat.st_size:
+                return False
+            elif self._compare_digests:
+                return file_digest(source) == file_digest(destination)
+            else:
+                return int(source_stat.st_mtime) == int(destination_stat.st_mtime)
+        except (IOError, OSError):
+            return False
+        
+    def _clone_file(self, source_file, target_file):
+        """Clone a file with a reflink so the copy shares the blocks of the source until either is
+        written to. Only works on Linux when both files are on the same Btrfs/XFS filesystem.
+        
+        Args:
+            source_file (file): The source file open for reading.
+            target_file (file): The empty target file open for writing.
+        
+        Returns:
+            (bln): True if the file was cloned.
+        
+        Raises:
+            IOError: The clone failed for a reason other than lack of support.
+        """
+        
+        if fcntl is None or _libc is None:
+            return False
+        
+        try:
+            fcntl.ioctl(target_file.fileno(), FICLONE, source_file.fileno())
+        except IOError as e:
+            if e.errno in _UNSUPPORTED_ERRNOS:
+                return False
+            raise
+        
+        return True
+    
+    def _kernel_copy(self, function, source_file, target_file, offset, size):
+        """Copy the rest of a file inside the kernel with "copy_file_range" or "sendfile" so the
+        data never passes through a Python buffer.
+        
+        Args:
+            function (str): The name of the libc function to use.
+            source_file (file): The source file open for reading.
+            target_file (file): The target file open for writing.
+            offset (int): The number of bytes already copied.
+            size (int): The size of the source file.
+        
+        Returns:
+            (int): The number of bytes copied so far. This is less than the size if the function
+                is not supported for these files.
+        
+        Raises:
+            OSError: The copy failed for a reason other than lack of support.
+        """
+        
+        if _libc is None or not hasattr(_libc, function):
+            return offset
+        
+        if function == 'copy_file_range':
+            call = lambda count: _libc.copy_file_range(source_file.fileno(), None, 
+                                                       target_file.fileno(), None, count, 0)
+        else:
+            call = lambda count: _libc.sendfile(target_file.fileno(), source_file.fileno(), 
+                                                None, count)
+            
+        source_file.seek(offset)
+        target_file.seek(offset)
+        
+        while offset < size:
+            copied = call(ctypes.c_size_t(min(size - offset, 1024 * 1024 * 1024)))
+            
+            if copied < 0:
+                error = ctypes.get_errno()
+                
+                if error == errno.EINTR:
+                    continue
+                elif error in _UNSUPPORTED_ERRNOS:
+                    break
+                
+                raise OSError(error, '{0} failed: {1}'.format(function, strerror(error)))
+            elif copied == 0:
+                break
+            
+            offset += copied
+            
+        return offset
+    
+    def _buffered_copy(self, source_file, target_file, offset):
+        """Copy the rest of a file through one large reusable buffer. The buffer is a multiple of 
+        the page size so reads and writes stay aligned.
+        
+        Args:
+            source_file (file): The source file open for reading.
+            target_file (file): The target file open for writing.
+            offset (int): The number of bytes already copied.
+        
+        Returns:
+            None
+        
+        Raises:
+            IOError: The copy failed.
+        """
+        
+        buffer = bytearray(LARGE_COPY_BUFFER)
+        view = memoryview(buffer)
+        source_file.seek(offset)
+        target_file.seek(offset)
+        
+        while True:
+            count = source_file.readinto(buffer)
+            
+            if not count:
+                break
+            
+            written = 0
+            
+            #An unbuffered file may write fewer bytes than it was given.
+            while written < count:
+                written += target_file.write(view[written:count])
+            
+    def _copy_file(self, source, target):
+        """Copy the contents of a file. Files smaller than LARGE_FILE_SIZE are copied with a plain
+        buffered copy. Larger files are copied with the fastest method the platform supports: 
+        CopyFileW on Windows, then a reflink clone, "copy_file_range" and "sendfile" on Linux, 
+        and finally a large buffered copy.
+        
+        Args:
+            source (str): The source file.
+            target (str): The target file.
+        
+        Returns:
+            None
+        
+        Raises:
+            IOError: The file could not be copied.
+            OSError: The file could not be copied.
+        """
+        
+        size = getsize(source)
+        
+        if size < LARGE_FILE_SIZE:
+            shutil.copyfile(source, target)
+            return
+        elif sys.platform == 'win32':
+            if ctypes.windll.kernel32.CopyFileW(unicode(source), unicode(target), False):
+                return
+            
+        with io.open(source, 'rb', buffering=0) as source_file:
+            with io.open(target, 'wb', buffering=0) as target_file:
+                if self._clone_file(source_file, target_file):
+                    return
+                
+                offset = self._kernel_copy('copy_file_range', source_file, target_file, 0, size)
+                offset = self._kernel_copy('sendfile', source_file, target_file, offset, size)
+                
+                if offset < size:
+                    self._buffered_copy(source_file, target_file, offset)
+                    
+    def _walk_source(self, pending, wanted, directories, errors):
+        """Walk the source directory and queue every file for the copy workers. Directories are
+        created as they are found so a file is never queued before its parent directory exists.
+        A None is queued for every worker once the walk is finished.
+        
+        Args:
+            pending (:class:`Queue`): The queue of (source, target) file pairs.
+            wanted (set): Collects every destination path that exists in the source.
+            directories ([(str, str)]): Collects every (source, target) directory pair.
+            errors ([str]): Collects the reason of every failure.
+        
+        Returns:
+            None
+        
+        Raises:
+            None.
+        """
+        
+        try:
+            for root, dirs, files in walk(self._src, 
+                                          onerror=lambda e: errors.append(str(e)), 
+                                          followlinks=True):
+                target_root = normpath(join(self._dst, relpath(root, self._src)))
+                wanted.add(target_root)
+                directories.append((root, target_root))
+                
+                if isfile(target_root) or islink(target_root):
+                    remove(target_root)
+                    
+                if not isdir(target_root):
+                    makedirs(target_root)
+                    
+                for name in files:
+                    wanted.add(join(target_root, name))
+                    pending.put((join(root, name), join(target_root, name)))
+        except (IOError, OSError) as e:
+            errors.append(str(e))
+        finally:
+            for _ in range(self._max_concurrent):
+                pending.put(None)
+                
+    def _copy_files(self, pending, errors):
+        """Copy queued files that are missing or changed until a None is taken from the queue. 
+        The contents, permissions and modification time of every file are copied.
+        
+        Args:
+            pending (:class:`Queue`): The queue of (source, target) file pairs.
+            errors ([str]): Collects the reason of every failure.
+        
+        Returns:
+            None
+        
+        Raises:
+            None.
+        """
+        
+        while True:
+            job = pending.get()
+            
+            if job is None:
+                return
+            
+            source, target = job
+            
+            try:
+                if isdir(target) and not islink(target):
+                    shutil.rmtree(target)
+                    
+                if not self._is_current(source, target):
+                    self._copy_file(source, target)
+                    shutil.copystat(source, target)
+                    
+                    with self._lock:
+                        self._bytes_copied += getsize(target)
+            except (IOError, OSError, shutil.Error) as e:
+                #Keep consuming so the walk never blocks on a full queue.
+                errors.append(str(e))
+                
+    def _mirror_directory(self):
+        """Make the destination directory an exact copy of the source directory. Only files that
+        are missing or changed are copied and files/directories that no longer exist in the 
+        source are removed. Modification times are preserved so the next mirror can skip the
+        files that didn't change. The source is walked by one thread while a bounded pool of 
+        workers copies the files, which keeps several requests in flight on network shares.
+        
+        Args:
+            None
+        
+        Returns:
+            None
+        
+        Raises:
+            :class:`CopyError`: Could not mirror the directory.
+        """
+        
+        pending = Queue(maxsize=self._max_concurrent * 64)
+        wanted = set()
+        directories = []
+        errors = []
+        
+        workers = [Thread(target=self._walk_source, args=(pending, wanted, directories, errors))]
+        workers += [Thread(target=self._copy_files, args=(pending, errors)) 
+                    for _ in range(self._max_concurrent)]
+        
+        for thread in workers:
+            thread.start()
+            
+        for thread in workers:
+            thread.join()
+            
+        if len(errors) > 0:
+            raise CopyError("Could not mirror '{0}' to '{1}'! Reasons: {2}"
+                            .format(self._src, self._dst, ' '.join(errors)))
+        
+        try:
+            #Remove whatever no longer exists in the source, deepest entries first.
+            for root, dirs, files in walk(self._dst, topdown=False):
+                for name in files:
+                    if normpath(join(root, name)) not in wanted:
+                        remove(join(root, name))
+                        
+                for name in dirs:
+                    if normpath(join(root, name)) not in wanted:
+                        if islink(join(root, name)):
+                            remove(join(root, name))
+                        else:
+                            rmdir(join(root, name))
+                            
+            #Directory metadata is copied last since copying files into them changes it.
+            for source, target in reversed(directories):
+                shutil.copystat(source, target)
+        except (IOError, OSError, shutil.Error) as e:
+            raise CopyError("Could not mirror '{0}' to '{1}'! Reason: {2}"
+                            .format(self._src, self._dst, str(e)))
+            
     def copy(self):
         """Copies files/directories from a remote source to a local destination. If a folder is
         used as the source a recurisve copy will be performed and the destination will be 
-        recursively deleted.
+        recursively deleted unless mirror mode is enabled.
         
         Args:
             None
@@ -108,95 +503,1235 @@ class CopyBasic(_CopySourcer):
             :class:`CopyError`: Could not copy.
         """
         
+        self._bytes_copied = 0
+        start = time()
+        
         try:
             if isdir(self._src):
-                if isdir(self._dst):
+                if isdir(self._dst) and not self._mirror:
                     try:
                         shutil.rmtree(self._dst)
                     except shutil.Error as e:
                         raise CopyError("Could not remove all file in {0}.".format(self._dst))
-                shutil.copytree(self._src, self._dst)
+                self._mirror_directory()
             elif isfile(self._src):
                 dir_name = dirname(self._dst)
-                if exists(dir_name):
-                    try:
-                        shutil.copy(self._src, self._dst)
-                    except (OSError, shutil.Error, OSError, IOError) as e:
-                        if e.errno != errno.EEXIST:
-                            raise CopyError("Could not create {0}".format(self._dst))
                 try: 
-                    makedirs(dir_name)
-                    shutil.copy(self._src, self._dst)
+                    if dir_name != '' and not isdir(dir_name):
+                        makedirs(dir_name)
                 except OSError as e:
                     if e.errno != errno.EEXIST:
-                        raise CopyError("Could not create {0}".format(self._dst))
+                        raise CopyError("Could not create {0}".format(dir_name))
+                self._copy_file(self._src, self._dst)
+                shutil.copymode(self._src, self._dst)
+                self._bytes_copied = getsize(self._dst)
             else:
                 raise CopyError("Could not determine the type of object at given path '{0}'!"
                                 .format(self._src))
-        except (IOError, OSError, WindowsError, shutil.Error) as e:
+        except (IOError, OSError, shutil.Error) as e:
             raise CopyError("Could not copy files/directories from '{0}' to '{1}'!"
                             .format(self._src, self._dst))
             
+        self._elapsed = time() - start
         self._copy_state = True
+        
+    @property
+    def bytes_copied(self):
+        """The number of bytes copied by the last copy. Files skipped in mirror mode are not 
+        counted.
+        
+        Args:
+            None.
+        
+        Returns:
+            (int)
+        
+        Raises:
+            None.
+        """
+        
+        return self._bytes_copied
+    
+    @property
+    def throughput(self):
+        """The average throughput of the last copy in bytes per second.
+        
+        Args:
+            None.
+        
+        Returns:
+            (float)
+        
+        Raises:
+            None.
+        """
+        
+        return self._bytes_copied / self._elapsed if self._elapsed > 0 else 0.0
 
-#TODO: Implement the CopyFTP function. 
+class _FTPSessionPool(object):
+    """A thread safe pool of logged-in FTP control connections keyed by host, port and user so 
+    consecutive downloads from the same server skip the connect and login round trips.
+    
+    Args:
+        timeout (int)(opt): The socket timeout in seconds for new connections.
+        
+    Raises:
+        None.
+    """
+    
+    def __init__(self, timeout=FTP_TIMEOUT):
+        self._timeout = timeout
+        self._idle = {}     #{(host, port, username):[FTP]}
+        self._lock = Lock()
+        
+    def acquire(self, host, port, username, password):
+        """Take an idle session that is still alive or log in a new one. Sessions are always in
+        binary mode so file sizes and REST offsets are byte accurate.
+        
+        Args:
+            host (str): The server hostname or IP address.
+            port (int): The server port.
+            username (str): The username used to log into the server.
+            password (str): The password for the username.
+        
+        Returns:
+            (:class:`FTP`)
+        
+        Raises:
+            :class:`CopyError`: Could not connect or log into the server.
+        """
+        
+        while True:
+            with self._lock:
+                idle = self._idle.get((host, port, username), [])
+                session = idle.pop() if len(idle) > 0 else None
+                
+            if session is None:
+                break
+            
+            try:
+                session.voidcmd('NOOP')
+                
+                return session
+            except all_errors:
+                session.close()
+                
+        session = FTP(timeout=self._timeout)
+        
+        try:
+            session.connect(host, port)
+            session.login(username, password)
+            session.voidcmd('TYPE I')
+        except all_errors as e:
+            session.close()
+            raise CopyError("Could not log into the FTP server '{0}' as '{1}'! Reason: {2}"
+                            .format(host, username, str(e)))
+            
+        return session
+        
+    def release(self, host, port, username, session):
+        """Return a session to the pool once its last transfer has completed.
+        
+        Args:
+            host (str): The server hostname or IP address.
+            port (int): The server port.
+            username (str): The username the session is logged in as.
+            session (:class:`FTP`): The session to return.
+        
+        Returns:
+            None.
+        
+        Raises:
+            None.
+        """
+        
+        with self._lock:
+            self._idle.setdefault((host, port, username), []).append(session)
+            
+    def close(self):
+        """Log out of every idle session in the pool.
+        
+        Args:
+            None.
+        
+        Returns:
+            None.
+        
+        Raises:
+            None.
+        """
+        
+        with self._lock:
+            for sessions in self._idle.values():
+                for session in sessions:
+                    try:
+                        session.quit()
+                    except all_errors:
+                        session.close()
+                        
+            self._idle.clear()
 
-# class CopyFTP(_CopySourcer):
-#     """Copy files/directories from a ftp server (source) to a local folder (destination).
-#     
-#     Args:
-#         source (str): The path to the source file.
-#         destination (str): The local path the file will be copied to. 
-#         port (str): The port used to connect to the ftp server.
-#         username (str): The username used to log into the ftp server.
-#         password (str): The password for the username used to log into the ftp server.
-#         
-#     Raises:
-#         None.
-#     """
-#     
-#     def __init__(self, source, destination, port = 21, username, password):
-#         super(CopyBasic, self).__init__(source, destination)
-#         
-#         self._username = username
-#         self._password = password
-#         self._port = port
-#         self._ftp_host = self._source # Added for clarity. 
-#         
-#     def copy(self):
-#         """Copies files/directories from a remote source to a local destination.
-#         
-#         Args:
-#             None
-#         
-#         Returns:
-#             None
-#         
-#         Raises:
-#             :class:`CopyError`: Could not copy.
-#         """
-#         try:        # Create a connection
-#             ftp = FTP(self._ftp_host, self._port, self._username, self._password)
-#         except:
-#             pass
-        
-        
-        
-        
-#TODO: Implement thie CopyHTTP function. http://docs.python.org/2/library/httplib.html
-class CopyHTTP(_CopySourcer):
-    """Copy files/directories from a
+class CopyFTP(_CopySourcer):
+    """Copy a file or a directory from a FTP server to a local destination. Logged-in sessions are
+    pooled so they are reused across files and copies. Files at least twice the segment size are
+    downloaded as several segments in parallel using REST offsets if the server supports it. A 
+    source path that ends with "/" or that the server can change into is treated as a directory
+    and its tree is mirrored with a bounded pool of workers. Local files with the same size and modification time as the remote file are
+    skipped so copying an unchanged build drop again is cheap.
     
     Args:
-        source (str): The path to the source file.
-        destination (str): The local path the file will be copied to. 
+        source (str): The path to the source file/directory on the server.
+        destination (str): The local path the file/directory will be copied to. 
+        server (str): The hostname or IP address of the FTP server.
+        port (int)(opt): The port of the FTP server.
+        username (str)(opt): The username used to log into the FTP server.
+        password (str)(opt): The password for the username used to log into the FTP server.
+        max_concurrent (int)(opt): The maximum number of sessions used at the same time.
+        segment_size (int)(opt): The minimum number of bytes downloaded by a single segment.
+        pool (:class:`_FTPSessionPool`)(opt): The session pool to use. Sessions are shared with 
+            every other CopyFTP object by default.
         
     Raises:
         None.
     """
     
-    def __init__(self, name):
-        self._name = name
+    #===============================================================================================
+    # Class Constants
+    #===============================================================================================
+    _DEFAULT_POOL = _FTPSessionPool()
+    
+    def __init__(self,
+                 source,
+                 destination,
+                 server,
+                 port=21,
+                 username='anonymous',
+                 password='',
+                 max_concurrent=MAX_CONCURRENT_DOWNLOADS,
+                 segment_size=FTP_SEGMENT_SIZE,
+                 pool=None):
+        
+        super(CopyFTP, self).__init__(source, destination)
+        
+        self._server = server
+        self._port = int(port)
+        self._username = username
+        self._password = password
+        self._max_concurrent = max(int(max_concurrent), 1)
+        self._segment_size = max(int(segment_size), 1)
+        self._pool = pool or self._DEFAULT_POOL
+        self._features = None
+        
+    def _acquire(self):
+        """Take a logged-in session from the pool.
+        
+        Args:
+            None
+        
+        Returns:
+            (:class:`FTP`)
+        
+        Raises:
+            :class:`CopyError`: Could not connect or log into the server.
+        """
+        
+        return self._pool.acquire(self._server, self._port, self._username, self._password)
+    
+    def _release(self, session):
+        """Return a session to the pool.
+        
+        Args:
+            session (:class:`FTP`): The session to return.
+        
+        Returns:
+            None
+        
+        Raises:
+            None.
+        """
+        
+        self._pool.release(self._server, self._port, self._username, session)
+        
+    def _supports(self, session, feature):
+        """Determine if the server advertises a feature. The feature list is only requested once.
+        
+        Args:
+            session (:class:`FTP`): A logged-in session.
+            feature (str): The feature keyword. (e.g. "MDTM" or "REST STREAM")
+        
+        Returns:
+            (bln)
+        
+        Raises:
+            None.
+        """
+        
+        if self._features is None:
+            features = set()
+            
+            try:
+                for line in session.sendcmd('FEAT').splitlines()[1:-1]:
+                    features.add(' '.join(line.split()).upper())
+                    features.add(line.split()[0].upper())
+            except (error_perm, error_reply, IndexError):
+                pass
+            
+            self._features = features
+            
+        return feature.upper() in self._features
+    
+    def _parse_time(self, value):
+        """Convert a FTP time value to seconds since the epoch.
+        
+        Args:
+            value (str): A UTC time in the form "YYYYMMDDHHMMSS[.sss]".
+        
+        Returns:
+            (int): The time or None if the value is not valid.
+        
+        Raises:
+            None.
+        """
+        
+        try:
+            return timegm(strptime(value.strip()[:14], '%Y%m%d%H%M%S'))
+        except ValueError:
+            return None
+        
+    def _stat_file(self, session, path):
+        """Get the size and modification time of a file on the server.
+        
+        Args:
+            session (:class:`FTP`): A logged-in session.
+            path (str): The path of the file on the server.
+        
+        Returns:
+            ((int), (int)): The size and modification time of the file. The modification time is
+                None if the server doesn't support MDTM.
+        
+        Raises:
+            :class:`CopyError`: The file does not exist.
+        """
+        
+        try:
+            size = session.size(path)
+        except error_perm as e:
+            raise CopyError("Could not find '{0}' on '{1}'! Reason: {2}"
+                            .format(path, self._server, str(e)))
+            
+        mtime = None
+        
+        if self._supports(session, 'MDTM'):
+            try:
+                mtime = self._parse_time(session.sendcmd('MDTM {0}'.format(path)).split()[1])
+            except (error_perm, IndexError):
+                pass
+            
+        return (size, mtime)
+    
+    def _is_directory(self, session, path):
+        """Determine if a path on the server is a directory. The working directory of the session
+        is restored afterwards since sessions are shared.
+        
+        Args:
+            session (:class:`FTP`): A logged-in session.
+            path (str): The path on the server.
+        
+        Returns:
+            (bln)
+        
+        Raises:
+            None.
+        """
+        
+        home = session.pwd()
+        
+        try:
+            session.cwd(path)
+        except error_perm:
+            return False
+        
+        session.cwd(home)
+        
+        return True
+    
+    def _list_directory(self, session, path):
+        """List the files and sub-directories of a directory on the server. MLSD is used when the
+        server supports it. Otherwise NLST is used and every entry that has no size is assumed to
+        be a directory.
+        
+        Args:
+            session (:class:`FTP`): A logged-in session.
+            path (str): The path of the directory on the server.
+        
+        Returns:
+            ({str:(int, int)}): The size and modification time of every file keyed by name.
+            ([str]): The name of every sub-directory.
+        
+        Raises:
+            :class:`CopyError`: The directory could not be listed.
+        """
+        
+        files = {}
+        dirs = []
+        
+        try:
+            if self._supports(session, 'MLST'):
+                lines = []
+                session.retrlines('MLSD {0}'.format(path), lines.append)
+                
+                for line in lines:
+                    facts, _, name = line.partition(' ')
+                    facts = dict(fact.split('=', 1) for fact in facts.split(';') if '=' in fact)
+                    entry_type = facts.get('type', '').lower()
+                    
+                    if entry_type == 'dir':
+                        dirs.append(name)
+                    elif entry_type == 'file':
+                        files[name] = (int(facts.get('size', -1)), 
+                                       self._parse_time(facts.get('modify', '')))
+            else:
+                for name in session.nlst(path):
+                    name = posixpath.basename(name.rstrip('/'))
+                    
+                    if name in ('', '.', '..'):
+                        continue
+                    
+                    try:
+                        files[name] = self._stat_file(session, posixpath.join(path, name))
+                    except CopyError:
+                        dirs.append(name)
+        except all_errors as e:
+            raise CopyError("Could not list '{0}' on '{1}'! Reason: {2}"
+                            .format(path, self._server, str(e)))
+        except ValueError:
+            raise CopyError("The server '{0}' sent an invalid listing for '{1}'!"
+                            .format(self._server, path))
+            
+        return (files, dirs)
+    
+    def _walk(self):
+        """Walk the source directory tree on the server.
+        
+        Args:
+            None
+        
+        Returns:
+            ({str:(int, int)}): The size and modification time of every file keyed by relative 
+                path.
+            ([str]): The relative path of every directory.
+        
+        Raises:
+            :class:`CopyError`: The tree could not be listed.
+        """
+        
+        session = self._acquire()
+        all_files = {}
+        all_dirs = []
+        pending = ['']
+        
+        try:
+            while len(pending) > 0:
+                relative = pending.pop()
+                files, dirs = self._list_directory(session, posixpath.join(self._src, relative))
+                
+                for name, entry in files.items():
+                    all_files[posixpath.join(relative, name)] = entry
+                    
+                for name in dirs:
+                    all_dirs.append(posixpath.join(relative, name))
+                    pending.append(posixpath.join(relative, name))
+        except CopyError:
+            session.close()
+            raise
+        
+        self._release(session)
+        
+        return (all_files, all_dirs)
+    
+    def _is_current(self, destination, size, mtime):
+        """Determine if a local file already matches a remote file.
+        
+        Args:
+            destination (str): The local path of the file.
+            size (int): The size of the remote file.
+            mtime (int): The modification time of the remote file or None if unknown.
+        
+        Returns:
+            (bln)
+        
+        Raises:
+            None.
+        """
+        
+        try:
+            return (mtime is not None and 
+                    isfile(destination) and 
+                    getsize(destination) == size and
+                    int(getmtime(destination)) == mtime)
+        except OSError:
+            return False
+        
+    def _fetch_stream(self, path, partial, validator_path, size, mtime):
+        """Download a file over a single data connection, resuming a partial download of the same
+        version of the file with a REST offset.
+        
+        Args:
+            path (str): The path of the file on the server.
+            partial (str): The local path of the partial file.
+            validator_path (str): The local path that records the version of the partial file.
+            size (int): The size of the remote file.
+            mtime (int): The modification time of the remote file or None if unknown.
+        
+        Returns:
+            None
+        
+        Raises:
+            :class:`CopyError`: Could not copy the file.
+        """
+        
+        validator = '{0} {1}'.format(size, mtime)
+        
+        for attempt in range(DOWNLOAD_RETRIES):
+            offset = getsize(partial) if isfile(partial) else 0
+            
+            #Only resume if the partial file belongs to the version of the file on the server.
+            if offset > 0 and offset <= size and mtime is not None and self._supports_rest() and \
+               isfile(validator_path):
+                with open(validator_path) as validator_file:
+                    if validator_file.read() != validator:
+                        offset = 0
+            else:
+                offset = 0
+                
+            session = self._acquire()
+            
+            try:
+                with open(validator_path, 'w') as validator_file:
+                    validator_file.write(validator)
+                    
+                with open(partial, 'ab' if offset > 0 else 'wb') as partial_file:
+                    session.retrbinary('RETR {0}'.format(path), 
+                                       partial_file.write, 
+                                       FTP_CHUNK_SIZE, 
+                                       offset or None)
+            except all_errors as e:
+                #Keep the partial file so the next attempt resumes where this one stopped.
+                session.close()
+                
+                if isinstance(e, error_perm) or attempt == DOWNLOAD_RETRIES - 1:
+                    raise CopyError("Could not copy '{0}' from '{1}'! Reason: {2}"
+                                    .format(path, self._server, str(e)))
+                continue
+            
+            self._release(session)
+            
+            return
+        
+    def _fetch_segment(self, path, partial, start, end, size):
+        """Download one segment of a file into its place in a preallocated partial file.
+        
+        Args:
+            path (str): The path of the file on the server.
+            partial (str): The local path of the partial file.
+            start (int): The offset of the first byte of the segment.
+            end (int): The offset after the last byte of the segment.
+            size (int): The size of the remote file.
+        
+        Returns:
+            None
+        
+        Raises:
+            :class:`CopyError`: Could not copy the segment.
+        """
+        
+        for attempt in range(DOWNLOAD_RETRIES):
+            session = self._acquire()
+            offset = start
+            
+            try:
+                connection = session.transfercmd('RETR {0}'.format(path), start)
+                
+                try:
+                    with open(partial, 'r+b') as partial_file:
+                        partial_file.seek(start)
+                        
+                        while offset < end:
+                            chunk = connection.recv(min(FTP_CHUNK_SIZE, end - offset))
+                            
+                            if not chunk:
+                                break
+                            
+                            partial_file.write(chunk)
+                            offset += len(chunk)
+                finally:
+                    connection.close()
+                    
+                if offset < end:
+                    raise EOFError('The data connection closed after {0} of {1} bytes.'
+                                   .format(offset - start, end - start))
+                
+                #Stopping before the end of the file aborts the transfer. The reply to the abort
+                #can arrive late and be taken as the reply to a later command, so the session is
+                #discarded instead of going back to the pool.
+                if end < size:
+                    session.close()
+                    
+                    return
+                
+                session.voidresp()
+            except all_errors as e:
+                session.close()
+                
+                if isinstance(e, error_perm) or attempt == DOWNLOAD_RETRIES - 1:
+                    raise CopyError("Could not copy '{0}' from '{1}'! Reason: {2}"
+                                    .format(path, self._server, str(e)))
+                continue
+            
+            self._release(session)
+            
+            return
+        
+    def _fetch_segments(self, path, partial, size):
+        """Download a file as several segments in parallel.
+        
+        Args:
+            path (str): The path of the file on the server.
+            partial (str): The local path of the partial file.
+            size (int): The size of the remote file.
+        
+        Returns:
+            None
+        
+        Raises:
+            :class:`CopyError`: Could not copy one or more segments.
+        """
+        
+        count = min(self._max_concurrent, size // self._segment_size)
+        bounds = [size * i // count for i in range(count + 1)]
+        errors = []
+        
+        try:
+            with open(partial, 'wb') as partial_file:
+                partial_file.truncate(size)
+        except IOError as e:
+            raise CopyError("Could not create {0}".format(partial))
+        
+        def worker(start, end):
+            try:
+                self._fetch_segment(path, partial, start, end, size)
+            except CopyError as e:
+                errors.append(e.msg)
+                
+        workers = [Thread(target=worker, args=(bounds[i], bounds[i + 1])) for i in range(count)]
+        
+        for thread in workers:
+            thread.start()
+            
+        for thread in workers:
+            thread.join()
+            
+        if len(errors) > 0:
+            self._remove(partial)
+            raise CopyError("Could not copy {0} of {1} segments of '{2}'! Reasons: {3}"
+                            .format(len(errors), count, path, ' '.join(errors)))
+        
+    def _supports_rest(self):
+        """Determine if the server supports restarting transfers at an offset.
+        
+        Args:
+            None
+        
+        Returns:
+            (bln)
+        
+        Raises:
+            None.
+        """
+        
+        return self._features is not None and 'REST STREAM' in self._features
+    
+    def _fetch_file(self, path, destination, size, mtime, segmented=True):
+        """Download a file unless the local file already matches it. The local file is given the
+        modification time of the remote file so the next copy can skip it.
+        
+        Args:
+            path (str): The path of the file on the server.
+            destination (str): The local path of the file.
+            size (int): The size of the remote file.
+            mtime (int): The modification time of the remote file or None if unknown.
+            segmented (bln)(opt): Download large files in parallel segments.
+        
+        Returns:
+            (bln): True if the file was downloaded, False if it was skipped.
+        
+        Raises:
+            :class:`CopyError`: Could not copy the file.
+        """
+        
+        if self._is_current(destination, size, mtime):
+            return False
+        
+        partial = destination + PARTIAL_SUFFIX
+        validator_path = partial + VALIDATOR_SUFFIX
+        
+        try:
+            if not isdir(dirname(destination)) and dirname(destination) != '':
+                makedirs(dirname(destination))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise CopyError("Could not create {0}".format(dirname(destination)))
+            
+        if segmented and self._supports_rest() and size >= 2 * self._segment_size and \
+           self._max_concurrent > 1:
+            self._remove(validator_path)
+            self._fetch_segments(path, partial, size)
+        else:
+            self._fetch_stream(path, partial, validator_path, size, mtime)
+            
+        if getsize(partial) != size:
+            self._remove(partial, validator_path)
+            raise CopyError("The size of '{0}' changed while it was copied!".format(path))
+        
+        try:
+            if isfile(destination):
+                remove(destination)
+                
+            rename(partial, destination)
+            
+            if mtime is not None:
+                utime(destination, (mtime, mtime))
+        except OSError as e:
+            raise CopyError("Could not create {0}".format(destination))
+        
+        self._remove(validator_path)
+        
+        return True
+    
+    def _fetch_directory(self):
+        """Mirror the source directory tree with a bounded pool of workers. Large files are not 
+        segmented because the workers already keep every session busy.
+        
+        Args:
+            None
+        
+        Returns:
+            None
+        
+        Raises:
+            :class:`CopyError`: Could not copy one or more files.
+        """
+        
+        files, dirs = self._walk()
+        
+        for name in dirs:
+            local_dir = join(self._dst, *name.split('/'))
+            
+            if not isdir(local_dir):
+                try:
+                    makedirs(local_dir)
+                except OSError as e:
+                    if e.errno != errno.EEXIST:
+                        raise CopyError("Could not create {0}".format(local_dir))
+                    
+        pending = Queue()
+        errors = []
+        
+        for name in sorted(files):
+            pending.put(name)
+            
+        def worker():
+            while True:
+                try:
+                    name = pending.get_nowait()
+                except Empty:
+                    return
+                
+                try:
+                    self._fetch_file(posixpath.join(self._src, name),
+                                     join(self._dst, *name.split('/')),
+                                     files[name][0],
+                                     files[name][1],
+                                     segmented=False)
+                except CopyError as e:
+                    errors.append(e.msg)
+                    
+        workers = [Thread(target=worker) for _ in range(min(self._max_concurrent, 
+                                                             max(len(files), 1)))]
+        
+        for thread in workers:
+            thread.start()
+            
+        for thread in workers:
+            thread.join()
+            
+        if len(errors) > 0:
+            raise CopyError("Could not copy {0} of {1} files from '{2}'! Reasons: {3}"
+                            .format(len(errors), len(files), self._src, ' '.join(errors)))
+        
+    def copy(self):
+        """Copies a file/directory from a FTP server to a local destination.
+        
+        Args:
+            None
+        
+        Returns:
+            None
+        
+        Raises:
+            :class:`CopyError`: Could not copy.
+        """
+        
+        directory = self._src.endswith('/')
+        
+        if not directory:
+            session = self._acquire()
+            
+            try:
+                directory = self._is_directory(session, self._src)
+                
+                if not directory:
+                    size, mtime = self._stat_file(session, self._src)
+            except (CopyError, all_errors):
+                session.close()
+                raise
+            
+            self._release(session)
+            
+        if directory:
+            self._fetch_directory()
+        else:
+            self._fetch_file(self._src, self._dst, size, mtime)
+            
+        self._copy_state = True
+
+class _HTTPConnectionPool(object):
+    """A thread safe pool of keep-alive HTTP connections keyed by host and port so consecutive 
+    downloads from the same server reuse a connection instead of opening a new one every time.
+    
+    Args:
+        timeout (int)(opt): The socket timeout in seconds for new connections.
+        
+    Raises:
+        None.
+    """
+    
+    def __init__(self, timeout=HTTP_TIMEOUT):
+        self._timeout = timeout
+        self._idle = {}     #{(host, port):[HTTPConnection]}
+        self._lock = Lock()
+        
+    def acquire(self, host, port):
+        """Take an idle connection to the server or open a new one.
+        
+        Args:
+            host (str): The server hostname or IP address.
+            port (int): The server port.
+        
+        Returns:
+            (:class:`HTTPConnection`)
+        
+        Raises:
+            None.
+        """
+        
+        with self._lock:
+            idle = self._idle.get((host, port), [])
+            
+            if len(idle) > 0:
+                return idle.pop()
+            
+        return HTTPConnection(host, port, timeout=self._timeout)
+        
+    def release(self, host, port, connection):
+        """Return a connection to the pool once its response has been fully read.
+        
+        Args:
+            host (str): The server hostname or IP address.
+            port (int): The server port.
+            connection (:class:`HTTPConnection`): The connection to return.
+        
+        Returns:
+            None.
+        
+        Raises:
+            None.
+        """
+        
+        with self._lock:
+            self._idle.setdefault((host, port), []).append(connection)
+            
+    def close(self):
+        """Close every idle connection in the pool.
+        
+        Args:
+            None.
+        
+        Returns:
+            None.
+        
+        Raises:
+            None.
+        """
+        
+        with self._lock:
+            for connections in self._idle.values():
+                for connection in connections:
+                    connection.close()
+                    
+            self._idle.clear()
+
+class CopyHTTP(_CopySourcer):
+    """Copy a file or a directory from a HTTP server to a local destination. Files are streamed to
+    disk in chunks so memory use doesn't depend on the file size. Interrupted downloads are kept
+    as partial files and resumed with range requests. A source path that ends with "/" or that the
+    server reports as a directory is treated as a directory and must be served as a JSON manifest
+    (like the Bespoke artifact server does) so every file in it can be fetched concurrently and
+    verified against its digest.
+    
+    Args:
+        source (str): The path to the source file/directory on the server.
+        destination (str): The local path the file/directory will be copied to. 
+        server (str): The hostname or IP address of the HTTP server.
+        port (int)(opt): The port of the HTTP server.
+        username (str)(opt): The username for basic authentication.
+        password (str)(opt): The password for basic authentication.
+        checksum (str)(opt): The expected SHA-1 hex digest of a source file.
+        max_concurrent (int)(opt): The maximum number of files fetched at the same time.
+        pool (:class:`_HTTPConnectionPool`)(opt): The connection pool to use. Connections are
+            shared with every other CopyHTTP object by default.
+        
+    Raises:
+        None.
+    """
+    
+    #===============================================================================================
+    # Class Constants
+    #===============================================================================================
+    _DEFAULT_POOL = _HTTPConnectionPool()
+    
+    def __init__(self,
+                 source,
+                 destination,
+                 server,
+                 port=80,
+                 username=None,
+                 password=None,
+                 checksum=None,
+                 max_concurrent=MAX_CONCURRENT_DOWNLOADS,
+                 pool=None):
+        
+        super(CopyHTTP, self).__init__(source, destination)
+        
+        self._server = server
+        self._port = int(port)
+        self._checksum = checksum
+        self._max_concurrent = max_concurrent
+        self._pool = pool or self._DEFAULT_POOL
+        self._headers = {}
+        
+        if username is not None:
+            credentials = b64encode('{0}:{1}'.format(username, password or ''))
+            self._headers['Authorization'] = 'Basic {0}'.format(credentials)
+            
+    def _request(self, path, headers, method='GET'):
+        """Send a request with a pooled connection. A stale keep-alive connection is replaced
+        with a new connection once.
+        
+        Args:
+            path (str): The path on the server.
+            headers ({str:str}): Extra headers to send.
+            method (str)(opt): The HTTP method of the request.
+        
+        Returns:
+            ((:class:`HTTPConnection`), (:class:`HTTPResponse`)): The connection must be released
+                or closed once the response is read.
+        
+        Raises:
+            :class:`CopyError`: The request could not be sent.
+        """
+        
+        request_headers = dict(self._headers)
+        request_headers.update(headers)
+        
+        for attempt in range(2):
+            connection = self._pool.acquire(self._server, self._port)
+            
+            try:
+                connection.request(method, quote(path), headers=request_headers)
+                
+                return (connection, connection.getresponse())
+            except (HTTPException, socket.error) as e:
+                connection.close()
+                
+                if attempt == 1:
+                    raise CopyError("Could not request '{0}' from '{1}'! Reason: {2}"
+                                    .format(path, self._server, str(e)))
+                    
+    def _is_directory(self, path):
+        """Determine if a path on the server is a directory. The :class:`ArtifactServer` answers
+        with a manifest and plain HTTP servers redirect to the path with a trailing "/".
+        
+        Args:
+            path (str): The path on the server.
+        
+        Returns:
+            (bln)
+        
+        Raises:
+            :class:`CopyError`: The request could not be sent.
+        """
+        
+        connection, response = self._request(path, {}, 'HEAD')
+        
+        try:
+            response.read()
+        except (HTTPException, socket.error) as e:
+            connection.close()
+            raise CopyError("Could not request '{0}' from '{1}'! Reason: {2}"
+                            .format(path, self._server, str(e)))
+            
+        self._pool.release(self._server, self._port, connection)
+        
+        if response.status in (301, 302, 307, 308):
+            return (response.getheader('Location') or '').endswith(quote(path) + '/')
+        
+        return response.status == 200 and \
+            response.getheader('Content-Type') == MANIFEST_CONTENT_TYPE
+        
+    def _fetch_manifest(self):
+        """Fetch the manifest of a source directory.
+        
+        Args:
+            None
+        
+        Returns:
+            ({str:(int, str)}): The size and SHA-1 hex digest of every file keyed by relative path.
+            ([str]): The relative path of every directory.
+        
+        Raises:
+            :class:`CopyError`: The manifest could not be fetched.
+        """
+        
+        connection, response = self._request(self._src, {})
+        
+        try:
+            body = response.read()
+        except (HTTPException, socket.error) as e:
+            connection.close()
+            raise CopyError("Could not read the manifest of '{0}'! Reason: {1}"
+                            .format(self._src, str(e)))
+            
+        self._pool.release(self._server, self._port, connection)
+        
+        if response.status != 200:
+            raise CopyError("Could not fetch the manifest of '{0}'! Status: {1}"
+                            .format(self._src, response.status))
+        
+        try:
+            manifest = json.loads(body)
+            
+            return ({name: tuple(entry) for name, entry in manifest['files'].items()},
+                    list(manifest['dirs']))
+        except (ValueError, KeyError, TypeError):
+            raise CopyError("The manifest of '{0}' is not valid!".format(self._src))
+        
+    def _fetch_file(self, path, destination, checksum=None):
+        """Stream a file to disk, resuming a partial download if one exists.
+        
+        Args:
+            path (str): The path of the file on the server.
+            destination (str): The local path of the file.
+            checksum (str)(opt): The expected SHA-1 hex digest of the file.
+        
+        Returns:
+            None
+        
+        Raises:
+            :class:`CopyError`: Could not copy the file or the checksum didn't match.
+        """
+        
+        partial = destination + PARTIAL_SUFFIX
+        validator_path = partial + VALIDATOR_SUFFIX
+        
+        try:
+            if not isdir(dirname(destination)) and dirname(destination) != '':
+                makedirs(dirname(destination))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise CopyError("Could not create {0}".format(dirname(destination)))
+            
+        for attempt in range(DOWNLOAD_RETRIES):
+            headers = {}
+            offset = getsize(partial) if isfile(partial) else 0
+            
+            #Only resume if the server still has the version of the file we started with.
+            if offset > 0 and isfile(validator_path):
+                with open(validator_path) as validator_file:
+                    headers['Range'] = 'bytes={0}-'.format(offset)
+                    headers['If-Range'] = validator_file.read()
+            else:
+                offset = 0
+                
+            connection, response = self._request(path, headers)
+            
+            try:
+                if response.status == 416:
+                    #The partial file is no good so start over.
+                    response.read()
+                    self._pool.release(self._server, self._port, connection)
+                    self._remove(partial, validator_path)
+                    continue
+                elif response.status not in (200, 206):
+                    response.read()
+                    self._pool.release(self._server, self._port, connection)
+                    raise CopyError("Could not copy '{0}' from '{1}'! Status: {2}"
+                                    .format(path, self._server, response.status))
+                    
+                validator = response.getheader('ETag') or response.getheader('Last-Modified')
+                
+                #The full size of the file is needed to notice a response that was cut off early.
+                if response.status == 206:
+                    total = (response.getheader('Content-Range') or '').rsplit('/', 1)[-1]
+                else:
+                    total = response.getheader('Content-Length') or ''
+                    
+                expected = int(total) if total.strip().isdigit() else None
+                
+                if validator is not None:
+                    with open(validator_path, 'w') as validator_file:
+                        validator_file.write(validator)
+                        
+                with open(partial, 'ab' if response.status == 206 else 'wb') as partial_file:
+                    while True:
+                        chunk = response.read(HTTP_CHUNK_SIZE)
+                        
+                        if not chunk:
+                            break
+                        
+                        partial_file.write(chunk)
+            except (HTTPException, socket.error, IOError) as e:
+                #Keep the partial file so the next attempt resumes where this one stopped.
+                connection.close()
+                
+                if attempt == DOWNLOAD_RETRIES - 1:
+                    raise CopyError("Could not copy '{0}' from '{1}'! Reason: {2}"
+                                    .format(path, self._server, str(e)))
+                continue
+            
+            received = getsize(partial)
+            
+            if expected is not None and received != expected:
+                #A read that ends early doesn't raise so keep the partial file and resume it.
+                connection.close()
+                
+                if received > expected:
+                    self._remove(partial, validator_path)
+                    
+                if attempt == DOWNLOAD_RETRIES - 1:
+                    raise CopyError("Could not copy '{0}' from '{1}'! Received {2} of {3} bytes."
+                                    .format(path, self._server, received, expected))
+                continue
+            
+            self._pool.release(self._server, self._port, connection)
+            
+            if checksum is not None and file_digest(partial) != checksum.lower():
+                self._remove(partial, validator_path)
+                raise CopyError("The checksum of '{0}' does not match '{1}'!"
+                                .format(path, checksum))
+            
+            try:
+                if isfile(destination):
+                    remove(destination)
+                    
+                rename(partial, destination)
+            except OSError as e:
+                raise CopyError("Could not create {0}".format(destination))
+            
+            self._remove(validator_path)
+            
+            return
+        
+        raise CopyError("Could not copy '{0}' from '{1}'! The download was restarted too many "
+                        "times.".format(path, self._server))
+        
+    def _fetch_directory(self):
+        """Fetch every file of a source directory concurrently.
+        
+        Args:
+            None
+        
+        Returns:
+            None
+        
+        Raises:
+            :class:`CopyError`: Could not copy one or more files.
+        """
+        
+        files, dirs = self._fetch_manifest()
+        
+        for name in dirs:
+            local_dir = join(self._dst, *name.split('/'))
+            
+            if not isdir(local_dir):
+                try:
+                    makedirs(local_dir)
+                except OSError as e:
+                    if e.errno != errno.EEXIST:
+                        raise CopyError("Could not create {0}".format(local_dir))
+                    
+        pending = Queue()
+        errors = []
+        
+        for name in sorted(files):
+            pending.put(name)
+            
+        def worker():
+            while True:
+                try:
+                    name = pending.get_nowait()
+                except Empty:
+                    return
+                
+                try:
+                    self._fetch_file(posixpath.join(self._src, name),
+                                     join(self._dst, *name.split('/')),
+                                     files[name][1])
+                except CopyError as e:
+                    errors.append(e.msg)
+                    
+        workers = [Thread(target=worker) for _ in range(min(self._max_concurrent, 
+                                                             max(len(files), 1)))]
+        
+        for thread in workers:
+            thread.start()
+            
+        for thread in workers:
+            thread.join()
+            
+        if len(errors) > 0:
+            raise CopyError("Could not copy {0} of {1} files from '{2}'! Reasons: {3}"
+                            .format(len(errors), len(files), self._src, ' '.join(errors)))
+        
+    def copy(self):
+        """Copies a file/directory from a HTTP server to a local destination.
+        
+        Args:
+            None
+        
+        Returns:
+            None
+        
+        Raises:
+            :class:`CopyError`: Could not copy.
+        """
+        
+        if self._src.endswith('/') or self._is_directory(self._src):
+            self._fetch_directory()
+        else:
+            self._fetch_file(self._src, self._dst, self._checksum)
+            
+        self._copy_state = True
 
 # ===================================================================================================
 # Exceptions
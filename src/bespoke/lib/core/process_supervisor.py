@@ -0,0 +1,441 @@
+"""
+.. module:: core.process_supervisor
+   :platform: Linux, Windows
+   :synopsis: This module starts remote processes through STAF without blocking and tracks them
+       until they end from a single supervisor thread.
+   :license: BSD, see LICENSE for more details.
+
+.. moduleauthor:: Caleb Moniot <cmoniot@gmail.com>
+"""
+__version__ = 0.1
+
+# ===================================================================================================
+# Imports
+# ===================================================================================================
+from time import time
+from uuid import uuid1
+from threading import Thread, Lock, Event
+from PySTAF import STAFException
+
+# ===================================================================================================
+# Globals
+# ===================================================================================================
+NOTIFICATION_WAIT = 1000        #Milliseconds to wait for a process end notification at a time.
+POLL_INTERVAL = 30              #Seconds between queries of processes without a notification.
+MAX_POLL_FAILURES = 3           #Failed queries in a row before a process is considered lost.
+PROCESS_END = 'STAF/Process/End'
+
+# ===================================================================================================
+# Classes
+# ===================================================================================================
+class RemoteProcess(object):
+    """A process started by the :class:`ProcessSupervisor`. The exit code and output are filled in
+    by the supervisor thread when the process ends.
+
+    Args:
+        location (str): The machine the process runs on.
+        timeout (int): The number of seconds to wait before stopping the process.
+
+    Raises:
+        None.
+    """
+
+    def __init__(self, location, timeout):
+        self._location = location
+        self._key = str(uuid1())
+        self._handle = None
+        self._deadline = time() + timeout
+        self._next_poll = time() + POLL_INTERVAL
+        self._poll_failures = 0
+        self._ended = False
+        self._exit_code = None
+        self._output = None
+        self._error = None
+        self._done = Event()
+
+    def _complete(self, exit_code=None, output=None, error=None):
+        """Record the outcome of the process and wake up anybody waiting on it.
+
+        Args:
+            exit_code (int)(opt): The exit code of the process.
+            output (str)(opt): The output of the process.
+            error (str)(opt): Why the process could not be tracked to the end.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        self._exit_code = exit_code
+        self._output = output
+        self._error = error
+        self._done.set()
+
+    def done(self):
+        """Determine if the process has ended.
+
+        Args:
+            None.
+
+        Returns:
+            (bln)
+
+        Raises:
+            None.
+        """
+
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """Wait for the process to end.
+
+        Args:
+            timeout (float)(opt): The maximum number of seconds to wait. Waits forever if None.
+
+        Returns:
+            ((int), (str)): The exit code and output of the process.
+
+        Raises:
+            :class:`SupervisorError`: The process timed out, was lost or is still running after
+                "timeout" seconds.
+        """
+
+        #Waiting in short slices keeps the main thread responsive to KeyboardInterrupt.
+        deadline = None if timeout is None else time() + timeout
+
+        while not self._done.wait(1):
+            if deadline is not None and time() >= deadline:
+                raise SupervisorError('The process "{0}" on "{1}" is still '
+                                      'running!'.format(self._handle, self._location))
+
+        if self._error is not None:
+            raise SupervisorError(self._error)
+
+        return (self._exit_code, self._output)
+
+    @property
+    def handle(self):
+        """The STAF process handle on the remote machine.
+
+        Returns:
+            (str)
+        """
+
+        return self._handle
+
+    @property
+    def location(self):
+        """The machine the process runs on.
+
+        Returns:
+            (str)
+        """
+
+        return self._location
+
+class ProcessSupervisor(object):
+    """Start processes through the STAF process service without waiting for them and track every
+    running process from one background thread. Each process is started with a unique key and a
+    request for a "STAF/Process/End" notification, so the supervisor completes the process as soon
+    as the notification arrives in the queue of its handle. Processes that run for a long time
+    without a notification are queried every POLL_INTERVAL seconds to catch lost notifications
+    and unreachable machines, and processes that run past their timeout are stopped.
+
+    The notifications are delivered to the handle that started the process, so the supervisor
+    keeps one handle checked out of the pool for as long as it has processes to track.
+
+    Args:
+        pool (:class:`STAFHandlePool`): The pool to check the supervisor handle out of.
+
+    Raises:
+        None.
+    """
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._handle = None
+        self._processes = {}        #{key::class:`RemoteProcess`}
+        self._lock = Lock()
+        self._wakeup = Event()
+        self._thread = None
+
+    def _end(self, process, exit_code=None, output=None, error=None):
+        """Stop tracking a process, free its handle on the remote machine and complete it.
+
+        Args:
+            process (:class:`RemoteProcess`): The process that ended.
+            exit_code (int)(opt): The exit code of the process.
+            output (str)(opt): The output of the process.
+            error (str)(opt): Why the process could not be tracked to the end.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        with self._lock:
+            if self._processes.pop(process._key, None) is None:
+                return
+
+        try:
+            self._handle.submit(process.location,
+                                'process',
+                                'FREE HANDLE {0}'.format(process.handle))
+        except STAFException:
+            pass
+
+        process._complete(exit_code, output, error)
+
+    def _poll(self, process):
+        """Query a process that hasn't sent a notification in a while.
+
+        Args:
+            process (:class:`RemoteProcess`): The process to query.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        process._next_poll = time() + POLL_INTERVAL
+
+        try:
+            result = self._handle.submit(process.location,
+                                         'process',
+                                         'QUERY HANDLE {0}'.format(process.handle))
+        except STAFException as e:
+            result = None
+            reason = str(e)
+        else:
+            reason = result.result
+
+        if result is None or result.rc != result.Ok:
+            process._poll_failures += 1
+
+            if process._poll_failures >= MAX_POLL_FAILURES:
+                self._end(process, error='Lost track of the process "{0}" on "{1}"! '
+                                         'Reason: {2}'.format(process.handle,
+                                                              process.location,
+                                                              reason))
+            return
+
+        process._poll_failures = 0
+
+        try:
+            ended = result.resultObj['endTimestamp'] not in (None, '')
+            exit_code = result.resultObj['rc']
+        except (KeyError, TypeError):
+            return
+
+        #Give the notification one more interval to arrive since it carries the output.
+        if ended and process._ended:
+            self._end(process, int(exit_code), '')
+        elif ended:
+            process._ended = True
+
+    def _receive(self):
+        """Wait for a process end notification and complete the process it belongs to.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        #Waiting usually times out, so it is submitted through the raw handle to keep it out of
+        #the failure statistics of the pool.
+        try:
+            result = self._handle.raw.submit('local',
+                                             'queue',
+                                             'GET TYPE {0} WAIT {1}'.format(PROCESS_END,
+                                                                            NOTIFICATION_WAIT))
+        except STAFException:
+            return
+
+        if result.rc != result.Ok:
+            return
+
+        try:
+            message = result.resultObj['message']
+            key = message['key']
+            exit_code = int(message['rc'])
+            files = message.get('fileList') or []
+        except (KeyError, TypeError, ValueError):
+            return
+
+        with self._lock:
+            process = self._processes.get(key)
+
+        if process is not None:
+            #The notification may arrive before the response to the start request.
+            if process._handle is None:
+                process._handle = message.get('handle')
+
+            self._end(process, exit_code, files[0]['data'] if len(files) != 0 else '')
+
+    def _run(self):
+        """Track the running processes until there are none left, then wait for new ones.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        while True:
+            self._wakeup.wait()
+            self._track()
+
+    def _track(self):
+        """Wait for one notification, then stop the processes that ran past their timeout and
+        query the processes that are due a poll. The supervisor goes back to sleep once there are
+        no processes left to track.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        self._receive()
+
+        now = time()
+
+        with self._lock:
+            processes = list(self._processes.values())
+
+        for process in processes:
+            #Skip processes that are still being started.
+            if process.handle is None:
+                continue
+            elif now >= process._deadline:
+                self._stop(process)
+            elif now >= process._next_poll:
+                self._poll(process)
+
+        with self._lock:
+            if len(self._processes) == 0:
+                self._wakeup.clear()
+
+    def _stop(self, process):
+        """Stop a process that ran past its timeout.
+
+        Args:
+            process (:class:`RemoteProcess`): The process to stop.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        try:
+            self._handle.submit(process.location,
+                                'process',
+                                'STOP HANDLE {0}'.format(process.handle))
+        except STAFException:
+            pass
+
+        self._end(process, error='The process "{0}" on "{1}" timed out!'.format(process.handle,
+                                                                               process.location))
+
+    def start(self, location, request, timeout):
+        """Start a process without waiting for it to end.
+
+        Args:
+            location (str): The machine to start the process on.
+            request (str): The STAF process "START" request without any "WAIT" option.
+            timeout (int): The number of seconds to wait before stopping the process.
+
+        Returns:
+            (:class:`RemoteProcess`)
+
+        Raises:
+            :class:`SupervisorError`: The process could not be started.
+        """
+
+        process = RemoteProcess(location, timeout)
+
+        with self._lock:
+            try:
+                if self._handle is None:
+                    self._handle = self._pool.checkout()
+            except STAFException as e:
+                raise SupervisorError('Error registering with STAF, RC: {0}, '
+                                      'Result: {1}'.format(e.rc, e.result))
+
+            #Track the process before it starts since the notification may beat the response.
+            self._processes[process._key] = process
+
+            if self._thread is None:
+                self._thread = Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+
+        try:
+            result = self._handle.submit(location,
+                                         'process',
+                                         '{0} NOTIFY ONEND KEY {1}'.format(request, process._key))
+        except STAFException as e:
+            result = None
+            reason = str(e)
+        else:
+            reason = result.result
+
+        if result is None or result.rc != result.Ok:
+            with self._lock:
+                self._processes.pop(process._key, None)
+
+            raise SupervisorError(reason)
+
+        if process._handle is None:
+            process._handle = result.result
+
+        self._wakeup.set()
+
+        return process
+
+    @property
+    def running(self):
+        """The number of processes being tracked.
+
+        Returns:
+            (int)
+        """
+
+        return len(self._processes)
+
+# ===================================================================================================
+# Exceptions
+# ===================================================================================================
+class SupervisorError(Exception):
+    """Exception for errors in the process_supervisor module.
+
+    Args:
+        msg (str): A message describing the error.
+    """
+
+    def __init__(self, msg):
+        self.message = self.msg = msg
+
+    def __str__(self):
+        return "Supervisor Error: {0}".format(self.msg)
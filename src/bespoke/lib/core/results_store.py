@@ -0,0 +1,358 @@
+"""
+.. module:: core.results_store
+   :platform: Linux, Windows
+   :synopsis: This module provides a content addressed store for the results collected from
+       SystemUnderTests.
+   :license: BSD, see LICENSE for more details.
+
+.. moduleauthor:: Caleb Moniot <cmoniot@gmail.com>
+"""
+__version__ = 0.1
+
+# ===================================================================================================
+# Imports
+# ===================================================================================================
+import json
+import shutil
+import sqlite3
+from time import time
+from uuid import uuid1
+from contextlib import closing
+from os import makedirs, remove, rename
+from os.path import isdir, isfile, join, dirname
+from util import directory_manifest
+
+# ===================================================================================================
+# Globals
+# ===================================================================================================
+BLOBS = 'blobs'             #Directory that holds the file contents.
+MANIFESTS = 'manifests'     #Directory that holds one manifest per test.
+INDEX = 'index.db'          #The sqlite index of the manifests.
+PARTIAL_SUFFIX = '.part'    #Suffix for files that are still being written.
+
+_SCHEMA = ('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, run TEXT, plan TEXT, '
+           'test_case TEXT, test TEXT, status TEXT, created REAL)',
+           'CREATE INDEX IF NOT EXISTS results_by_test ON results (run, plan, test_case, test)',
+           'CREATE TABLE IF NOT EXISTS files (key TEXT, path TEXT, digest TEXT, size INTEGER, '
+           'PRIMARY KEY (key, path))',
+           'CREATE INDEX IF NOT EXISTS files_by_digest ON files (digest)')
+
+# ===================================================================================================
+# Classes
+# ===================================================================================================
+class ResultsStore(object):
+    """A content addressed store for the results of tests. The contents of every results file are
+    kept once at "<root>/blobs/<digest[:2]>/<digest>" no matter how many tests produced the same
+    bytes, each test is described by a manifest at "<root>/manifests/<key>.json", and an sqlite
+    index maps the run, plan, test case and test names onto the manifests so results can be
+    found without scanning directories.
+
+    Args:
+        root (str): The directory that holds the store.
+
+    Raises:
+        None.
+    """
+
+    def __init__(self, root):
+        self._root = root
+
+    @property
+    def root(self):
+        """The directory that holds the store.
+
+        Returns:
+            (str)
+        """
+
+        return self._root
+
+    def _connect(self):
+        """Open the index and create the tables if they don't exist yet.
+
+        Args:
+            None.
+
+        Returns:
+            (:class:`sqlite3.Connection`)
+
+        Raises:
+            :class:`ResultsStoreError`: The index could not be opened.
+        """
+
+        try:
+            if not isdir(self._root):
+                makedirs(self._root)
+
+            connection = sqlite3.connect(join(self._root, INDEX))
+
+            with connection:
+                for statement in _SCHEMA:
+                    connection.execute(statement)
+        except (OSError, sqlite3.Error) as e:
+            raise ResultsStoreError('Failed to open the results index in "{0}"! '
+                                    'Reason: {1}'.format(self._root, str(e)))
+
+        return connection
+
+    def _manifest_path(self, key):
+        """The path of the manifest of a result.
+
+        Args:
+            key (str): The unique key of the results.
+
+        Returns:
+            (str)
+
+        Raises:
+            None.
+        """
+
+        return join(self._root, MANIFESTS, key + '.json')
+
+    def _store_blob(self, path, digest):
+        """Move a file into the blob directory unless a blob with the same digest already exists,
+        in which case the file is simply removed.
+
+        Args:
+            path (str): The file to store.
+            digest (str): The hex digest of the file.
+
+        Returns:
+            None.
+
+        Raises:
+            IOError: The file could not be moved.
+            OSError: The file does not exist.
+        """
+
+        blob = self.blob_path(digest)
+
+        if isfile(blob):
+            remove(path)
+            return
+
+        if not isdir(dirname(blob)):
+            try:
+                makedirs(dirname(blob))
+            except OSError:
+                #Another writer created the directory first.
+                if not isdir(dirname(blob)):
+                    raise
+
+        #The results and the store normally share a volume so this is a cheap rename.
+        partial = '{0}.{1}{2}'.format(blob, uuid1().hex, PARTIAL_SUFFIX)
+
+        shutil.move(path, partial)
+
+        try:
+            rename(partial, blob)
+        except OSError:
+            #Another writer stored the same bytes first, which is fine.
+            if not isfile(blob):
+                raise
+
+            remove(partial)
+
+    def add(self, path, key, run='', plan='', test_case='', test='', status=''):
+        """Split a results directory into blobs and a manifest, index the manifest and remove the
+        directory. If storing fails part way the files that weren't moved into the store yet are
+        left in the directory.
+
+        Args:
+            path (str): The results directory.
+            key (str): The unique key of the results. (The UUID of the test.)
+            run (str)(opt): The name of the test run.
+            plan (str)(opt): The name of the test plan.
+            test_case (str)(opt): The name of the test case.
+            test (str)(opt): The name of the test.
+            status (str)(opt): The status of the test.
+
+        Returns:
+            ({str:obj}): The manifest of the results.
+
+        Raises:
+            :class:`ResultsStoreError`: The results could not be stored.
+        """
+
+        #Walking a missing directory yields nothing, which would index an empty manifest.
+        if not isdir(path):
+            raise ResultsStoreError('The results directory "{0}" does not exist!'.format(path))
+
+        try:
+            files, dirs = directory_manifest(path)
+        except (IOError, OSError) as e:
+            raise ResultsStoreError('Failed to read the results directory "{0}"! '
+                                    'Reason: {1}'.format(path, str(e)))
+
+        manifest = {'key': key,
+                    'run': run,
+                    'plan': plan,
+                    'test_case': test_case,
+                    'test': test,
+                    'status': status,
+                    'created': time(),
+                    'files': dict((name, {'size': size, 'digest': digest})
+                                  for name, (size, digest) in files.items()),
+                    'dirs': sorted(dirs)}
+
+        manifest_path = self._manifest_path(key)
+
+        try:
+            if not isdir(dirname(manifest_path)):
+                makedirs(dirname(manifest_path))
+
+            with open(manifest_path + PARTIAL_SUFFIX, 'w') as manifest_file:
+                json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+
+            if isfile(manifest_path):
+                remove(manifest_path)
+
+            rename(manifest_path + PARTIAL_SUFFIX, manifest_path)
+        except (IOError, OSError) as e:
+            raise ResultsStoreError('Failed to write the manifest for "{0}"! '
+                                    'Reason: {1}'.format(key, str(e)))
+
+        with closing(self._connect()) as connection:
+            try:
+                with connection:
+                    connection.execute('DELETE FROM files WHERE key = ?', (key,))
+                    connection.execute('INSERT OR REPLACE INTO results '
+                                       'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                       (key, run, plan, test_case, test, status,
+                                        manifest['created']))
+                    connection.executemany('INSERT INTO files VALUES (?, ?, ?, ?)',
+                                           [(key, name, digest, size)
+                                            for name, (size, digest) in files.items()])
+            except sqlite3.Error as e:
+                raise ResultsStoreError('Failed to index the results "{0}"! '
+                                        'Reason: {1}'.format(key, str(e)))
+
+        #The manifest and index are written first so a failure below never loses a file.
+        try:
+            for name, (size, digest) in files.items():
+                self._store_blob(join(path, name), digest)
+
+            shutil.rmtree(path)
+        except (IOError, OSError, shutil.Error) as e:
+            raise ResultsStoreError('Failed to store the results directory "{0}"! '
+                                    'Reason: {1}'.format(path, str(e)))
+
+        return manifest
+
+    def blob_path(self, digest):
+        """The path of the blob that holds the contents with the given digest.
+
+        Args:
+            digest (str): The hex digest of the contents.
+
+        Returns:
+            (str)
+
+        Raises:
+            None.
+        """
+
+        return join(self._root, BLOBS, digest[:2], digest)
+
+    def find(self, run=None, plan=None, test_case=None, test=None):
+        """Find the results of tests by name. Criteria that are None match every test.
+
+        Args:
+            run (str)(opt): The name of the test run.
+            plan (str)(opt): The name of the test plan.
+            test_case (str)(opt): The name of the test case.
+            test (str)(opt): The name of the test.
+
+        Returns:
+            ([{str:obj}]): The key, names, status and creation time of every matching result in
+                the order they were created.
+
+        Raises:
+            :class:`ResultsStoreError`: The index could not be queried.
+        """
+
+        criteria = [(column, value) for column, value in (('run', run),
+                                                           ('plan', plan),
+                                                           ('test_case', test_case),
+                                                           ('test', test)) if value is not None]
+
+        query = 'SELECT key, run, plan, test_case, test, status, created FROM results'
+
+        if criteria:
+            query += ' WHERE ' + ' AND '.join('{0} = ?'.format(column) for column, _ in criteria)
+
+        query += ' ORDER BY created'
+
+        with closing(self._connect()) as connection:
+            try:
+                rows = connection.execute(query, [value for _, value in criteria]).fetchall()
+            except sqlite3.Error as e:
+                raise ResultsStoreError('Failed to query the results index! '
+                                        'Reason: {0}'.format(str(e)))
+
+        return [dict(zip(('key', 'run', 'plan', 'test_case', 'test', 'status', 'created'), row))
+                for row in rows]
+
+    def manifest(self, key):
+        """Load the manifest of a result.
+
+        Args:
+            key (str): The unique key of the results.
+
+        Returns:
+            ({str:obj})
+
+        Raises:
+            :class:`ResultsStoreError`: The manifest does not exist or could not be read.
+        """
+
+        try:
+            with open(self._manifest_path(key)) as manifest_file:
+                return json.load(manifest_file)
+        except (IOError, OSError, ValueError) as e:
+            raise ResultsStoreError('Failed to load the manifest for "{0}"! '
+                                    'Reason: {1}'.format(key, str(e)))
+
+    def restore(self, key, target):
+        """Recreate the results directory of a test from the store.
+
+        Args:
+            key (str): The unique key of the results.
+            target (str): The directory to restore the results into.
+
+        Returns:
+            None.
+
+        Raises:
+            :class:`ResultsStoreError`: The results could not be restored.
+        """
+
+        manifest = self.manifest(key)
+
+        try:
+            for name in [''] + manifest['dirs']:
+                if not isdir(join(target, name)):
+                    makedirs(join(target, name))
+
+            for name, entry in manifest['files'].items():
+                shutil.copyfile(self.blob_path(entry['digest']), join(target, name))
+        except (IOError, OSError, KeyError) as e:
+            raise ResultsStoreError('Failed to restore the results "{0}" to "{1}"! '
+                                    'Reason: {2}'.format(key, target, str(e)))
+
+# ===================================================================================================
+# Exceptions
+# ===================================================================================================
+class ResultsStoreError(Exception):
+    """Exception for errors in the results_store module.
+
+    Args:
+        msg (str): A message describing the error.
+    """
+
+    def __init__(self, msg):
+        self.message = self.msg = msg
+
+    def __str__(self):
+        return "Results Store Error: {0}".format(self.msg)
@@ -0,0 +1,316 @@
+"""
+.. module:: core.staf_pool
+   :platform: Linux, Windows
+   :synopsis: This module provides a process wide pool of registered STAF handles.
+   :license: BSD, see LICENSE for more details.
+
+.. moduleauthor:: Caleb Moniot <cmoniot@gmail.com>
+"""
+__version__ = 0.1
+
+# ===================================================================================================
+# Imports
+# ===================================================================================================
+from time import time
+from uuid import uuid1
+from threading import Lock, current_thread
+from PySTAF import STAFHandle, STAFException
+
+# ===================================================================================================
+# Globals
+# ===================================================================================================
+MAX_IDLE_HANDLES = 16           #Idle handles beyond this many are unregistered when returned.
+HEALTH_CHECK_INTERVAL = 30      #Handles idle for longer than this many seconds are pinged first.
+
+# ===================================================================================================
+# Classes
+# ===================================================================================================
+class _PooledHandle(object):
+    """A registered STAF handle that belongs to a :class:`STAFHandlePool`. Requests are submitted
+    through the real handle and recorded in the statistics of the pool. A handle that raised a
+    STAF error is flagged as failed so it isn't pooled again. Every other attribute is looked up
+    on the real handle.
+
+    Args:
+        pool (:class:`STAFHandlePool`): The pool that owns the handle.
+        handle (:class:`STAFHandle`): The registered STAF handle.
+
+    Raises:
+        None.
+    """
+
+    def __init__(self, pool, handle):
+        self._pool = pool
+        self._handle = handle
+        self._last_used = time()
+        self._last_thread = None
+        self._failed = False
+
+    def __getattr__(self, name):
+        return getattr(self._handle, name)
+
+    def submit(self, location, service, request, *args):
+        """Submit a STAF request and record how long it took.
+
+        Args:
+            location (str): The machine to submit the request to.
+            service (str): The STAF service.
+            request (str): The request.
+
+        Returns:
+            (:class:`STAFResult`)
+
+        Raises:
+            STAFException: The request could not be submitted.
+        """
+
+        start = time()
+        result = None
+
+        try:
+            result = self._handle.submit(location, service, request, *args)
+        except STAFException:
+            self._failed = True
+            raise
+        finally:
+            self._pool.record(service, time() - start, result is None or result.rc != result.Ok)
+
+        return result
+
+    @property
+    def raw(self):
+        """The registered STAF handle. Requests submitted through it directly are not recorded,
+        which suits requests that are expected to time out.
+
+        Returns:
+            (:class:`STAFHandle`)
+        """
+
+        return self._handle
+
+    @property
+    def failed(self):
+        """A request submitted through the handle raised a STAF error.
+
+        Returns:
+            (bln)
+        """
+
+        return self._failed
+
+class STAFHandlePool(object):
+    """A pool of registered STAF handles that are checked out by tests and returned when they are
+    done, so short tests don't pay for registering and unregistering a handle every time. A
+    thread is given back the handle it returned last when it is idle, which keeps the STAF queue
+    of a handle with the thread that is waiting on it, and a handle that has been idle for a
+    while is pinged before it is handed out again. Every request submitted through a pooled
+    handle is counted by service.
+
+    Args:
+        max_idle (int)(opt): The maximum number of idle handles to keep registered.
+
+    Raises:
+        None.
+    """
+
+    def __init__(self, max_idle=MAX_IDLE_HANDLES):
+        self._max_idle = max_idle
+        self._idle = []             #[:class:`_PooledHandle`] with the most recently returned last.
+        self._lock = Lock()
+        self._registered = 0
+        self._stats = {}            #{service:[requests, failures, seconds]}
+
+    def _clear_queue(self, pooled):
+        """Delete any messages left in the queue of a handle, such as notifications for processes
+        its last user stopped waiting on, so they aren't received by its next user.
+
+        Args:
+            pooled (:class:`_PooledHandle`): The handle to clear.
+
+        Returns:
+            (bln): False if the queue could not be cleared.
+
+        Raises:
+            None.
+        """
+
+        try:
+            result = pooled._handle.submit('local', 'queue', 'DELETE')
+        except STAFException:
+            return False
+
+        return result.rc == result.Ok
+
+    def _healthy(self, pooled):
+        """Check that an idle handle can still talk to the local STAF daemon.
+
+        Args:
+            pooled (:class:`_PooledHandle`): The handle to check.
+
+        Returns:
+            (bln)
+
+        Raises:
+            None.
+        """
+
+        if time() - pooled._last_used < HEALTH_CHECK_INTERVAL:
+            return True
+
+        try:
+            result = pooled.submit('local', 'ping', 'ping')
+        except STAFException:
+            return False
+
+        return result.rc == result.Ok
+
+    def _unregister(self, pooled):
+        """Unregister a handle that is leaving the pool.
+
+        Args:
+            pooled (:class:`_PooledHandle`): The handle to unregister.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        try:
+            pooled._handle.unregister()
+        except STAFException:
+            pass
+
+        with self._lock:
+            self._registered -= 1
+
+    def checkin(self, pooled, healthy=True):
+        """Return a handle to the pool. The queue of a healthy handle is cleared before it is
+        pooled again and a handle that can't be pooled is unregistered.
+
+        Args:
+            pooled (:class:`_PooledHandle`): The handle checked out of the pool.
+            healthy (bln)(opt): False if the handle misbehaved and should be unregistered.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        pooled._last_used = time()
+        pooled._last_thread = current_thread().ident
+
+        with self._lock:
+            keep = healthy and len(self._idle) < self._max_idle
+
+        #The queue is cleared outside the lock since it takes a round trip to the STAF daemon.
+        if keep and self._clear_queue(pooled):
+            with self._lock:
+                if len(self._idle) < self._max_idle:
+                    self._idle.append(pooled)
+                    return
+
+        self._unregister(pooled)
+
+    def checkout(self):
+        """Check out an idle handle or register a new one if none is available.
+
+        Args:
+            None.
+
+        Returns:
+            (:class:`_PooledHandle`)
+
+        Raises:
+            STAFException: A new handle could not be registered.
+        """
+
+        thread = current_thread().ident
+
+        while True:
+            with self._lock:
+                if len(self._idle) == 0:
+                    break
+
+                #Prefer the handle this thread returned last, otherwise the most recent one.
+                matches = [index for index, idle in enumerate(self._idle)
+                           if idle._last_thread == thread]
+                pooled = self._idle.pop(matches[-1] if matches else -1)
+
+            if self._healthy(pooled):
+                return pooled
+
+            self._unregister(pooled)
+
+        pooled = _PooledHandle(self, STAFHandle(str(uuid1()), STAFHandle.Standard))
+
+        with self._lock:
+            self._registered += 1
+
+        return pooled
+
+    def close(self):
+        """Unregister every idle handle. Handles that are checked out are pooled again when they
+        are returned.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        with self._lock:
+            idle, self._idle = self._idle, []
+
+        for pooled in idle:
+            self._unregister(pooled)
+
+    def record(self, service, seconds, failed):
+        """Record a request submitted through a pooled handle.
+
+        Args:
+            service (str): The STAF service.
+            seconds (float): The duration of the request.
+            failed (bln): The request did not return the "Ok" return code.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        with self._lock:
+            stats = self._stats.setdefault(service.lower(), [0, 0, 0.0])
+            stats[0] += 1
+            stats[1] += int(failed)
+            stats[2] += seconds
+
+    @property
+    def registered(self):
+        """The number of handles registered by the pool, both idle and checked out.
+
+        Returns:
+            (int)
+        """
+
+        return self._registered
+
+    @property
+    def stats(self):
+        """The number of requests, failed requests and total seconds spent per STAF service.
+
+        Returns:
+            ({str:(int, int, float)})
+        """
+
+        with self._lock:
+            return dict((service, tuple(stats)) for service, stats in self._stats.items())
+
@@ -0,0 +1,846 @@
+"""
+.. module:: core.transport
+   :platform: Linux, Windows
+   :synopsis: This module provides the transports used to create directories, copy files and start
+       processes on a SystemUnderTest.
+   :license: BSD, see LICENSE for more details.
+
+.. moduleauthor:: Caleb Moniot <cmoniot@gmail.com>
+"""
+__version__ = 0.1
+
+# ===================================================================================================
+# Imports
+# ===================================================================================================
+import abc
+import shutil
+import signal
+import os
+from os import environ, makedirs, walk
+from os.path import isdir, isfile, join, dirname, relpath
+from subprocess import Popen, PIPE, STDOUT
+from threading import Thread, Event, Timer
+from time import time
+from PySTAF import STAFException
+from util import unix_style_path
+from core.process_supervisor import SupervisorError
+from core.agent_channel import AgentError
+
+# ===================================================================================================
+# Globals
+# ===================================================================================================
+AGENT_CONNECT_TIMEOUT = 60      #Seconds to wait for an agent that is reconnecting.
+AGENT_PING_TIMEOUT = 10         #Seconds an agent has to answer a ping.
+
+# ===================================================================================================
+# Classes
+# ===================================================================================================
+class Transport(object):
+    """This class is the abstract base class for all transports. A transport performs the basic
+    I/O operations on a SystemUnderTest on behalf of the tests.
+
+    Args:
+        None.
+
+    Raises:
+        None.
+    """
+
+    __metaclass__ = abc.ABCMeta
+
+    #Local transports reach the SystemUnderTest without a network link to measure or compress.
+    is_local = False
+
+    @abc.abstractmethod
+    def copy_dir(self, local_path, remote_path):
+        """Copy a directory from the local machine into a directory on the SystemUnderTest.
+
+        Args:
+            local_path (str): The local directory to copy.
+            remote_path (str): The copy destination (absolute) on the SystemUnderTest.
+
+        Returns:
+            None.
+
+        Raises:
+            :class:`TransportError`: Failed to copy the directory.
+        """
+
+        pass
+
+    @abc.abstractmethod
+    def copy_file(self, local_path, remote_path, overwrite=True, is_text_file=False):
+        """Copy a file from the local machine to the SystemUnderTest.
+
+        Args:
+            local_path (str): The local file to copy.
+            remote_path (str): The copy destination (absolute) on the SystemUnderTest.
+            overwrite (bln)(opt): Replace the destination if it exists.
+            is_text_file (bln)(opt): Convert the line endings for the SystemUnderTest.
+
+        Returns:
+            None.
+
+        Raises:
+            :class:`TransportError`: Failed to copy the file.
+        """
+
+        pass
+
+    @abc.abstractmethod
+    def create_dir(self, path, fail_if_exists=False):
+        """Create a directory and its parents on the SystemUnderTest.
+
+        Args:
+            path (str): The directory (absolute) to create.
+            fail_if_exists (bln)(opt): Fail if the directory already exists.
+
+        Returns:
+            None.
+
+        Raises:
+            :class:`TransportError`: Failed to create the directory.
+        """
+
+        pass
+
+    @abc.abstractmethod
+    def ping(self):
+        """Determine if the SystemUnderTest can be reached.
+
+        Args:
+            None.
+
+        Returns:
+            (bln)
+
+        Raises:
+            :class:`TransportError`: The transport itself failed.
+        """
+
+        pass
+
+    @abc.abstractmethod
+    def start_proc(self, command, working_dir, wait, params=[], env_vars={}):
+        """Start a process on the SystemUnderTest without waiting for it to end.
+
+        Args:
+            command (str): The command to execute.
+            working_dir (str): The working directory to start the process from within.
+            wait (int): The number of seconds to wait before stopping the process.
+            params ([str])(opt): A list of parameters to pass to the command.
+            env_vars ({str:str})(opt): Environment variables to set for the process.
+
+        Returns:
+            (obj): A process with a "result()" method that waits for the process and returns its
+                exit code and output.
+
+        Raises:
+            :class:`TransportError`: The process failed to start.
+        """
+
+        pass
+
+class STAFTransport(Transport):
+    """A transport that reaches the SystemUnderTest through STAF.
+
+    Args:
+        network_address (str): The network address of the SystemUnderTest.
+        staf_handle (:class:`STAFHandle`): The STAF handle to submit requests with.
+        supervisor (:class:`ProcessSupervisor`): Tracks the processes started on the
+            SystemUnderTest.
+
+    Raises:
+        None.
+    """
+
+    def __init__(self, network_address, staf_handle, supervisor):
+        self._network_address = network_address
+        self._staf_handle = staf_handle
+        self._supervisor = supervisor
+
+    def _submit(self, location, service, request):
+        """Submit a STAF request that must succeed.
+
+        Args:
+            location (str): The machine to submit the request to.
+            service (str): The STAF service.
+            request (str): The request.
+
+        Returns:
+            (:class:`STAFResult`)
+
+        Raises:
+            :class:`TransportError`: The request failed.
+        """
+
+        try:
+            result = self._staf_handle.submit(location, service, request)
+        except STAFException as e:
+            raise TransportError('STAF request failed, RC: {0}, Result: {1}'.format(e.rc,
+                                                                                    e.result))
+
+        if result.rc != result.Ok:
+            raise TransportError(result.result)
+
+        return result
+
+    def copy_dir(self, local_path, remote_path):
+        """Copy a directory from the local machine into a directory on the SystemUnderTest.
+
+        Args:
+            local_path (str): The local directory to copy.
+            remote_path (str): The copy destination (absolute) on the SystemUnderTest.
+
+        Returns:
+            None.
+
+        Raises:
+            :class:`TransportError`: Failed to copy the directory.
+        """
+
+        staf_request = ('COPY DIRECTORY "{0}" TODIRECTORY "{1}" TOMACHINE "{2}" RECURSE '
+                        'KEEPEMPTYDIRECTORIES'.format(unix_style_path(local_path),
+                                                      unix_style_path(remote_path),
+                                                      self._network_address))
+
+        self._submit('local', 'fs', staf_request)
+
+    def copy_file(self, local_path, remote_path, overwrite=True, is_text_file=False):
+        """Copy a file from the local machine to the SystemUnderTest.
+
+        Args:
+            local_path (str): The local file to copy.
+            remote_path (str): The copy destination (absolute) on the SystemUnderTest.
+            overwrite (bln)(opt): Replace the destination if it exists.
+            is_text_file (bln)(opt): Convert the line endings for the SystemUnderTest.
+
+        Returns:
+            None.
+
+        Raises:
+            :class:`TransportError`: Failed to copy the file.
+        """
+
+        self.create_dir(dirname(remote_path))
+
+        staf_request = ('COPY FILE "{0}" TOFILE "{1}" '
+                        'TOMACHINE "{2}"'.format(unix_style_path(local_path),
+                                                 unix_style_path(remote_path),
+                                                 self._network_address))
+        if is_text_file:
+            staf_request += ' TEXT'
+
+        if not overwrite:
+            staf_request += ' FAILIFEXISTS'
+
+        self._submit('local', 'fs', staf_request)
+
+    def create_dir(self, path, fail_if_exists=False):
+        """Create a directory and its parents on the SystemUnderTest.
+
+        Args:
+            path (str): The directory (absolute) to create.
+            fail_if_exists (bln)(opt): Fail if the directory already exists.
+
+        Returns:
+            None.
+
+        Raises:
+            :class:`TransportError`: Failed to create the directory.
+        """
+
+        staf_request = 'CREATE DIRECTORY "{0}" FULLPATH'.format(unix_style_path(path))
+
+        if fail_if_exists:
+            staf_request += ' FAILIFEXISTS'
+
+        self._submit(self._network_address, 'fs', staf_request)
+
+    def ping(self):
+        """Determine if the SystemUnderTest can be reached.
+
+        Args:
+            None.
+
+        Returns:
+            (bln)
+
+        Raises:
+            :class:`TransportError`: The STAF ping failed for a reason other than the
+                SystemUnderTest being unreachable.
+        """
+
+        try:
+            result = self._staf_handle.submit(self._network_address, 'ping', 'ping')
+        except STAFException as e:
+            raise TransportError('STAF request failed, RC: {0}, Result: {1}'.format(e.rc,
+                                                                                    e.result))
+
+        if result.rc == result.NoPathToMachine:
+            return False
+        elif result.rc != result.Ok:
+            raise TransportError(result.result)
+
+        return True
+
+    def start_proc(self, command, working_dir, wait, params=[], env_vars={}):
+        """Start a process on the SystemUnderTest without waiting for it to end.
+
+        Args:
+            command (str): The command to execute.
+            working_dir (str): The working directory to start the process from within.
+            wait (int): The number of seconds to wait before stopping the process.
+            params ([str])(opt): A list of parameters to pass to the command.
+            env_vars ({str:str})(opt): Environment variables to set for the process.
+
+        Returns:
+            (:class:`RemoteProcess`)
+
+        Raises:
+            :class:`TransportError`: The process failed to start.
+        """
+
+        staf_request = ('START SHELL COMMAND "{0}" WORKDIR "{1}" '
+                        'STDERRTOSTDOUT RETURNSTDOUT'.format(unix_style_path(command),
+                                                             unix_style_path(working_dir)))
+        if len(params) != 0:
+            staf_request += ' PARMS {0}'.format(" ".join(params))
+
+        for key in env_vars:
+            staf_request += ' ENV {0}={1}'.format(key, env_vars[key])
+
+        try:
+            return self._supervisor.start(self._network_address, staf_request, wait)
+        except SupervisorError as e:
+            raise TransportError(e.msg)
+
+class LocalProcess(object):
+    """A process started by the :class:`LocalTransport`. The process runs through the shell with
+    standard error redirected to standard output, the same as a process started through STAF.
+
+    Args:
+        command (str): The command line to execute.
+        working_dir (str): The working directory to start the process from within.
+        wait (int): The number of seconds to wait before killing the process.
+        env_vars ({str:str}): Environment variables to set for the process.
+
+    Raises:
+        :class:`TransportError`: The process failed to start.
+    """
+
+    def __init__(self, command, working_dir, wait, env_vars):
+        env = dict(environ)
+        env.update(env_vars)
+
+        #Start the shell in its own process group so a timeout kills the children it started too.
+        preexec_fn = None if os.name == 'nt' else os.setsid
+
+        try:
+            self._process = Popen(command,
+                                  cwd=working_dir,
+                                  env=env,
+                                  shell=True,
+                                  stdout=PIPE,
+                                  stderr=STDOUT,
+                                  preexec_fn=preexec_fn)
+        except (OSError, ValueError) as e:
+            raise TransportError('Failed to start "{0}"! Reason: {1}'.format(command, str(e)))
+
+        self._command = command
+        self._output = None
+        self._timed_out = False
+        self._done = Event()
+        self._timer = Timer(wait, self._kill)
+        self._timer.daemon = True
+        self._timer.start()
+
+        thread = Thread(target=self._collect)
+        thread.daemon = True
+        thread.start()
+
+    def _collect(self):
+        """Read the output of the process until it ends.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        self._output = self._process.communicate()[0]
+        self._timer.cancel()
+        self._done.set()
+
+    def _kill(self):
+        """Kill the process once it runs past its timeout.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        self._timed_out = True
+
+        try:
+            if os.name == 'nt':
+                self._process.kill()
+            else:
+                os.killpg(self._process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    def done(self):
+        """Determine if the process has ended.
+
+        Args:
+            None.
+
+        Returns:
+            (bln)
+
+        Raises:
+            None.
+        """
+
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """Wait for the process to end.
+
+        Args:
+            timeout (float)(opt): The maximum number of seconds to wait. Waits forever if None.
+
+        Returns:
+            ((int), (str)): The exit code and output of the process.
+
+        Raises:
+            :class:`TransportError`: The process timed out or is still running after "timeout"
+                seconds.
+        """
+
+        #Waiting in short slices keeps the main thread responsive to KeyboardInterrupt.
+        deadline = None if timeout is None else time() + timeout
+
+        while not self._done.wait(1):
+            if deadline is not None and time() >= deadline:
+                raise TransportError('The process "{0}" is still running!'.format(self._command))
+
+        if self._timed_out:
+            raise TransportError('The process "{0}" timed out!'.format(self._command))
+
+        return (self._process.returncode, self._output)
+
+class LocalTransport(Transport):
+    """A transport for a SystemUnderTest on the same machine as the Bespoke server, such as a
+    sandbox. Directories and files are copied with the file system and processes are started
+    with subprocess, so none of the operations pay for a STAF round trip.
+
+    Args:
+        None.
+
+    Raises:
+        None.
+    """
+
+    is_local = True
+
+    def copy_dir(self, local_path, remote_path):
+        """Copy a directory into a directory on the SystemUnderTest. Existing files are replaced
+        and other files in the destination are left alone.
+
+        Args:
+            local_path (str): The local directory to copy.
+            remote_path (str): The copy destination (absolute) on the SystemUnderTest.
+
+        Returns:
+            None.
+
+        Raises:
+            :class:`TransportError`: Failed to copy the directory.
+        """
+
+        if not isdir(local_path):
+            raise TransportError('The directory "{0}" does not exist!'.format(local_path))
+
+        try:
+            for root, dirs, files in walk(local_path):
+                target = join(remote_path, relpath(root, local_path))
+
+                if not isdir(target):
+                    makedirs(target)
+
+                for name in files:
+                    shutil.copy2(join(root, name), join(target, name))
+        except (IOError, OSError, shutil.Error) as e:
+            raise TransportError('Failed to copy "{0}" to "{1}"! Reason: {2}'.format(local_path,
+                                                                                     remote_path,
+                                                                                     str(e)))
+
+    def copy_file(self, local_path, remote_path, overwrite=True, is_text_file=False):
+        """Copy a file to the SystemUnderTest. Text files need no conversion on the same machine.
+
+        Args:
+            local_path (str): The local file to copy.
+            remote_path (str): The copy destination (absolute) on the SystemUnderTest.
+            overwrite (bln)(opt): Replace the destination if it exists.
+            is_text_file (bln)(opt): Ignored.
+
+        Returns:
+            None.
+
+        Raises:
+            :class:`TransportError`: Failed to copy the file.
+        """
+
+        if not overwrite and isfile(remote_path):
+            raise TransportError('The file "{0}" already exists!'.format(remote_path))
+
+        self.create_dir(dirname(remote_path))
+
+        try:
+            shutil.copy2(local_path, remote_path)
+        except (IOError, OSError) as e:
+            raise TransportError('Failed to copy "{0}" to "{1}"! Reason: {2}'.format(local_path,
+                                                                                     remote_path,
+                                                                                     str(e)))
+
+    def create_dir(self, path, fail_if_exists=False):
+        """Create a directory and its parents.
+
+        Args:
+            path (str): The directory (absolute) to create.
+            fail_if_exists (bln)(opt): Fail if the directory already exists.
+
+        Returns:
+            None.
+
+        Raises:
+            :class:`TransportError`: Failed to create the directory.
+        """
+
+        if isdir(path):
+            if fail_if_exists:
+                raise TransportError('The directory "{0}" already exists!'.format(path))
+
+            return
+
+        try:
+            makedirs(path)
+        except OSError as e:
+            #Another writer may have created the directory first, which is fine.
+            if not isdir(path):
+                raise TransportError('Failed to create the directory "{0}"! '
+                                     'Reason: {1}'.format(path, str(e)))
+
+    def ping(self):
+        """The local machine can always be reached.
+
+        Args:
+            None.
+
+        Returns:
+            (bln)
+
+        Raises:
+            None.
+        """
+
+        return True
+
+    def start_proc(self, command, working_dir, wait, params=[], env_vars={}):
+        """Start a process on the local machine without waiting for it to end.
+
+        Args:
+            command (str): The command to execute.
+            working_dir (str): The working directory to start the process from within.
+            wait (int): The number of seconds to wait before killing the process.
+            params ([str])(opt): A list of parameters to pass to the command.
+            env_vars ({str:str})(opt): Environment variables to set for the process.
+
+        Returns:
+            (:class:`LocalProcess`)
+
+        Raises:
+            :class:`TransportError`: The process failed to start.
+        """
+
+        command_line = ' '.join([command] + list(params))
+
+        return LocalProcess(command_line, working_dir, wait, env_vars)
+
+class AgentProcess(object):
+    """A process started by the :class:`AgentTransport`. The agent runs the process through the
+    shell with standard error redirected to standard output, the same as a process started
+    through STAF.
+
+    Args:
+        request (:class:`AgentRequest`): The "Exec" request of the process.
+        command (str): The command line of the process.
+
+    Raises:
+        None.
+    """
+
+    def __init__(self, request, command):
+        self._request = request
+        self._command = command
+
+    def done(self):
+        """Determine if the process has ended.
+
+        Args:
+            None.
+
+        Returns:
+            (bln)
+
+        Raises:
+            None.
+        """
+
+        return self._request.done()
+
+    def result(self, timeout=None):
+        """Wait for the process to end.
+
+        Args:
+            timeout (float)(opt): The maximum number of seconds to wait. Waits forever if None.
+
+        Returns:
+            ((int), (str)): The exit code and output of the process.
+
+        Raises:
+            :class:`TransportError`: The process timed out, the connection to the agent was lost
+                or the process is still running after "timeout" seconds.
+        """
+
+        try:
+            return self._request.result(timeout)
+        except AgentError as e:
+            raise TransportError('The process "{0}" failed! Reason: {1}'.format(self._command,
+                                                                                  e.msg))
+
+class AgentTransport(Transport):
+    """A transport for a SystemUnderTest running the Bespoke agent in daemon mode. Every
+    operation is a request on the persistent connection of the agent, so requests don't pay for a
+    new connection and a directory is copied without waiting for each file in turn.
+
+    Args:
+        server (:class:`AgentServer`): The server the agent is connected to.
+        name (str): The name the agent announced itself with.
+
+    Raises:
+        None.
+    """
+
+    def __init__(self, server, name):
+        self._server = server
+        self._name = name
+
+    def _connection(self):
+        """Get the current connection of the agent. An agent that reconnects, such as after a
+        restart of the SystemUnderTest, replaces its old connection.
+
+        Args:
+            None.
+
+        Returns:
+            (:class:`AgentConnection`)
+
+        Raises:
+            :class:`TransportError`: The agent did not connect within AGENT_CONNECT_TIMEOUT
+                seconds.
+        """
+
+        try:
+            return self._server.get(self._name, AGENT_CONNECT_TIMEOUT)
+        except AgentError as e:
+            raise TransportError(e.msg)
+
+    def _wait(self, requests, error):
+        """Wait for requests to complete and fail if any of them failed.
+
+        Args:
+            requests ([:class:`AgentRequest`]): The requests.
+            error (str): The error to report with the reason of the first failure.
+
+        Returns:
+            None.
+
+        Raises:
+            :class:`TransportError`: A request failed.
+        """
+
+        reasons = []
+
+        for request in requests:
+            try:
+                exit_code, message = request.result()
+            except AgentError as e:
+                exit_code, message = None, e.msg
+
+            if exit_code != 0:
+                reasons.append(message)
+
+        if len(reasons) > 0:
+            raise TransportError('{0} Reason: {1}'.format(error, reasons[0]))
+
+    def copy_dir(self, local_path, remote_path):
+        """Copy a directory into a directory on the SystemUnderTest. Every file is sent before
+        waiting for the first one to be written. Existing files are replaced and other files in
+        the destination are left alone.
+
+        Args:
+            local_path (str): The local directory to copy.
+            remote_path (str): The copy destination (absolute) on the SystemUnderTest.
+
+        Returns:
+            None.
+
+        Raises:
+            :class:`TransportError`: Failed to copy the directory.
+        """
+
+        if not isdir(local_path):
+            raise TransportError('The directory "{0}" does not exist!'.format(local_path))
+
+        error = 'Failed to copy "{0}" to "{1}"!'.format(local_path, remote_path)
+        connection = self._connection()
+        requests = []
+
+        try:
+            for root, dirs, files in walk(local_path):
+                target = join(remote_path, relpath(root, local_path))
+
+                #The agent creates the parents of the files it writes so only empty directories
+                #need to be created.
+                if len(files) == 0:
+                    requests.append(connection.request('MakeDir', {'path': target}))
+
+                for name in files:
+                    requests.append(connection.push(join(root, name), join(target, name)))
+        except AgentError as e:
+            raise TransportError('{0} Reason: {1}'.format(error, e.msg))
+
+        self._wait(requests, error)
+
+    def copy_file(self, local_path, remote_path, overwrite=True, is_text_file=False):
+        """Copy a file from the local machine to the SystemUnderTest.
+
+        Args:
+            local_path (str): The local file to copy.
+            remote_path (str): The copy destination (absolute) on the SystemUnderTest.
+            overwrite (bln)(opt): Replace the destination if it exists.
+            is_text_file (bln)(opt): Convert the line endings for the SystemUnderTest.
+
+        Returns:
+            None.
+
+        Raises:
+            :class:`TransportError`: Failed to copy the file.
+        """
+
+        error = 'Failed to copy "{0}" to "{1}"!'.format(local_path, remote_path)
+
+        try:
+            request = self._connection().push(local_path, remote_path, overwrite, is_text_file)
+        except AgentError as e:
+            raise TransportError('{0} Reason: {1}'.format(error, e.msg))
+
+        self._wait([request], error)
+
+    def create_dir(self, path, fail_if_exists=False):
+        """Create a directory and its parents on the SystemUnderTest.
+
+        Args:
+            path (str): The directory (absolute) to create.
+            fail_if_exists (bln)(opt): Fail if the directory already exists.
+
+        Returns:
+            None.
+
+        Raises:
+            :class:`TransportError`: Failed to create the directory.
+        """
+
+        error = 'Failed to create the directory "{0}"!'.format(path)
+
+        try:
+            request = self._connection().request('MakeDir', {'path': path,
+                                                             'fail_if_exists': fail_if_exists})
+        except AgentError as e:
+            raise TransportError('{0} Reason: {1}'.format(error, e.msg))
+
+        self._wait([request], error)
+
+    def ping(self):
+        """Determine if the agent is connected and answers a ping.
+
+        Args:
+            None.
+
+        Returns:
+            (bln)
+
+        Raises:
+            None.
+        """
+
+        try:
+            request = self._server.get(self._name).request('Ping', {})
+
+            return request.result(AGENT_PING_TIMEOUT)[0] == 0
+        except AgentError:
+            return False
+
+    def start_proc(self, command, working_dir, wait, params=[], env_vars={}):
+        """Start a process on the SystemUnderTest without waiting for it to end.
+
+        Args:
+            command (str): The command to execute.
+            working_dir (str): The working directory to start the process from within.
+            wait (int): The number of seconds before the agent kills the process.
+            params ([str])(opt): A list of parameters to pass to the command.
+            env_vars ({str:str})(opt): Environment variables to set for the process.
+
+        Returns:
+            (:class:`AgentProcess`)
+
+        Raises:
+            :class:`TransportError`: The process failed to start.
+        """
+
+        command_line = ' '.join([command] + list(params))
+
+        try:
+            request = self._connection().execute(command_line, working_dir, wait, env_vars)
+        except AgentError as e:
+            raise TransportError('Failed to start "{0}"! Reason: {1}'.format(command_line, e.msg))
+
+        return AgentProcess(request, command_line)
+
+# ===================================================================================================
+# Exceptions
+# ===================================================================================================
+class TransportError(Exception):
+    """Exception for errors in the transport module.
+
+    Args:
+        msg (str): A message describing the error.
+    """
+
+    def __init__(self, msg):
+        self.message = self.msg = msg
+
+    def __str__(self):
+        return "Transport Error: {0}".format(self.msg)
@@ -13,18 +13,30 @@ __version__ = 0.2
 # Imports
 # ===================================================================================================
 import abc
+import shutil
+from time import time
+from collections import namedtuple
+from threading import BoundedSemaphore, Event, Lock
+from contextlib import contextmanager
+from os import makedirs
+from os.path import isdir, join
 from vboxapi import VirtualBoxManager
 from util import retry
 
 # ===================================================================================================
 # Globals
 # ===================================================================================================
-VM_OP_TIMEOUT = 120 #Timeout for hypervisor VM related operations.
+VM_OP_TIMEOUT = 120 #Timeout in seconds for hypervisor VM related operations.
+PROGRESS_POLL_INTERVAL = 500 #Milliseconds between progress reports for hypervisor VM operations.
 VBOX_WEB_PORT = '18083'
+LOCAL_HOSTS = ('localhost', '127.0.0.1')
 
 # ===================================================================================================
 # Classes
 # ===================================================================================================
+#A snapshot of the progress of a long running VM operation. ("eta" is in seconds, -1 if unknown.)
+OperationProgress = namedtuple('OperationProgress', ['operation', 'percent', 'description', 'eta'])
+
 class _VirtualMachine(object):
     """This abc defines the necessary functionality for virtual mahcines for any supported
     hypervisor.
@@ -103,6 +115,57 @@ class _VirtualMachine(object):
         
         return self._name
     
+    @property
+    def is_sandbox(self):
+        """Indicates that the machine is a sandbox directory on the Bespoke server rather than a 
+        real virtual machine. Sandboxes do not need to boot and must never receive OS power events.
+        
+        Args:
+            None.
+        
+        Returns:
+            (bln)
+        
+        Raises:
+            None.
+        """
+        
+        return False
+    
+    @property
+    def last_progress(self):
+        """The most recent progress report for the current or last long running operation.
+        
+        Args:
+            None.
+        
+        Returns:
+            (:class:`OperationProgress`): The progress or None if the hypervisor does not report
+                progress.
+        
+        Raises:
+            None.
+        """
+        
+        return None
+    
+    def cancel(self):
+        """Request cancellation of the long running operation in progress. The operation raises 
+        :class:`VMError` once it has been cancelled. Hypervisors that cannot cancel operations 
+        ignore the request.
+        
+        Args:
+            None.
+        
+        Returns:
+            None.
+        
+        Raises:
+            None.
+        """
+        
+        pass
+    
     @abc.abstractmethod
     def setup(self):
         """Setup a virtual machine in preparation for use.
@@ -203,6 +266,43 @@ class _VirtualMachine(object):
         
         pass
     
+    @abc.abstractmethod
+    def suspend(self):
+        """Save the execution state of the VM to disk and stop it if running. A suspended VM picks
+        up exactly where it left off when resumed, so no boot is required.
+        
+        Args:
+            None.
+        
+        Returns:
+            None.
+        
+        Raises:
+            :class:`VMError`: State could not be changed or VM is not currently in the started 
+                state.
+            :class:`NotSupported`: This function is not supported for this hypervisor.
+        """
+        
+        pass
+    
+    @abc.abstractmethod
+    def resume(self):
+        """Resume the VM from its saved execution state if suspended.
+        
+        Args:
+            None.
+        
+        Returns:
+            None.
+        
+        Raises:
+            :class:`VMError`: State could not be changed or VM is not currently in the suspended 
+                state.
+            :class:`NotSupported`: This function is not supported for this hypervisor.
+        """
+        
+        pass
+    
     @abc.abstractmethod
     def destroy(self):
         """Destroy the VM created from a template.
@@ -237,6 +337,147 @@ class _VirtualMachine(object):
         
         pass
     
+    @abc.abstractmethod
+    def take_snapshot(self, snapshot_name):
+        """Take a snapshot of the VM. If the VM is running then the snapshot captures the running
+        state and applying the snapshot leaves the VM in the "Suspended" state ready to resume.
+        
+        Args:
+            snapshot_name (str): The name of the snapshot to create.
+        
+        Returns:
+            None.
+        
+        Raises:
+            :class:`VMError`: The snapshot could not be taken.
+            :class:`NotSupported`: This function is not supported for this hypervisor.
+        """
+        
+        pass
+    
+class _HostOperationLimiter(object):
+    """Admission control for disk heavy virtual machine operations on a single hypervisor host.
+    Running too many snapshot restores or boots on one host at once causes an I/O storm that makes
+    every operation slower than running them in sequence, so each operation type can be capped per
+    host. Operations on different hosts never block each other.
+    
+    Args:
+        host (str): The hypervisor host to limit.
+        limits ({str:int})(opt): The maximum number of concurrent operations keyed by operation 
+            type. ('apply_snapshot', 'start', 'stop') Operations without a limit are unlimited. The
+            first limits declared for a host are used for all machines on that host.
+        
+    Raises:
+        :class:`VMError`: An unknown operation type or invalid limit was specified.
+    """
+    
+    # ===============================================================================================
+    # Class Constants
+    # ===============================================================================================
+    OPERATIONS = ('apply_snapshot', 'start', 'stop')
+    
+    # ===============================================================================================
+    # Class Variables
+    # ===============================================================================================
+    _host_semaphores = {}   #A dictionary of {operation:BoundedSemaphore} keyed by host.
+    _host_limits = {}       #A dictionary of {operation:int} keyed by host.
+    _host_semaphores_lock = Lock()
+    
+    def __init__(self, host, limits=None):
+        self._host = host
+        
+        with _HostOperationLimiter._host_semaphores_lock:
+            semaphores = _HostOperationLimiter._host_semaphores.setdefault(host, {})
+            limits_in_use = _HostOperationLimiter._host_limits.setdefault(host, {})
+            
+            for operation, limit in (limits or {}).items():
+                if operation not in self.OPERATIONS:
+                    raise VMError('The operation "{0}" cannot be limited!'.format(operation), host)
+                if limit is None or operation in semaphores:
+                    continue
+                if int(limit) < 1:
+                    raise VMError('The limit for the operation "{0}" must be a positive '
+                                  'integer!'.format(operation), host)
+                
+                semaphores[operation] = BoundedSemaphore(int(limit))
+                limits_in_use[operation] = int(limit)
+                
+        self._semaphores = semaphores
+        self._limits = limits_in_use
+    
+    def limit(self, operation):
+        """The maximum number of concurrent operations of a given type on the host.
+        
+        Args:
+            operation (str): The operation type.
+        
+        Returns:
+            (int): The limit or None if the operation is unlimited.
+        
+        Raises:
+            None.
+        """
+        
+        return self._limits.get(operation)
+    
+    @contextmanager
+    def admit(self, operation):
+        """Block until an operation of the given type is allowed to run on the host and hold the 
+        slot for the duration of the "with" block.
+        
+        Args:
+            operation (str): The operation type.
+        
+        Returns:
+            None.
+        
+        Raises:
+            None.
+        """
+        
+        self.acquire(operation)
+        try:
+            yield
+        finally:
+            self.release(operation)
+    
+    def acquire(self, operation):
+        """Block until an operation of the given type is allowed to run on the host. Every call
+        must be paired with a call to :meth:`release`.
+        
+        Args:
+            operation (str): The operation type.
+        
+        Returns:
+            None.
+        
+        Raises:
+            None.
+        """
+        
+        semaphore = self._semaphores.get(operation)
+        
+        if semaphore is not None:
+            semaphore.acquire()
+    
+    def release(self, operation):
+        """Release a slot previously taken with :meth:`acquire`.
+        
+        Args:
+            operation (str): The operation type.
+        
+        Returns:
+            None.
+        
+        Raises:
+            None.
+        """
+        
+        semaphore = self._semaphores.get(operation)
+        
+        if semaphore is not None:
+            semaphore.release()
+    
 class _VBoxHostManager(object):
     """Establishes connections to VirtualBox hosts and keeps a cached list of active VBoxManagers to
     minimize connection proliferation.
@@ -316,10 +557,16 @@ class VBoxMachine(_VirtualMachine):
         name (str): The name of the virtual machine.
         user (str)(opt): The user name to use for authentication if host is remote.
         password (str)(opt): The password to use for authentication if host is remote.
+        op_limits ({str:int})(opt): The maximum number of concurrent "apply_snapshot", "start" and 
+            "stop" operations allowed on the host. See :class:`_HostOperationLimiter`.
+        op_timeouts ({str:int})(opt): Timeouts in seconds keyed by operation type. Operations 
+            without a timeout use VM_OP_TIMEOUT.
+        progress_callback (callable)(opt): Called with the machine and an 
+            :class:`OperationProgress` each time a long running operation reports progress.
         
     Raises:
         :class:`VMError`: The Virtual Machine host was unreachable. The Virtual Machine name is 
-            invalid.
+            invalid. The operation limits are invalid.
     """
     
     # ===============================================================================================
@@ -348,9 +595,23 @@ class VBoxMachine(_VirtualMachine):
                        20: 'Snapshotting', 
                        21: 'Bad'}
     
-    def __init__(self, host, name, user=None, password=None):
+    def __init__(self, 
+                 host, 
+                 name, 
+                 user=None, 
+                 password=None, 
+                 op_limits=None, 
+                 op_timeouts=None,
+                 progress_callback=None):
         super(VBoxMachine, self).__init__(host, name)
         
+        self._limiter = _HostOperationLimiter(host, op_limits)
+        self._op_timeouts = dict([(operation, int(timeout)) 
+                                  for (operation, timeout) in (op_timeouts or {}).items()
+                                  if timeout is not None])
+        self._progress_callback = progress_callback
+        self._last_progress = None
+        self._cancel_event = Event()
         self._mgr = _VBoxHostManager(host, user, password).manager
         self._vbox = self._mgr.vbox
         self._machine = None
@@ -390,6 +651,145 @@ class VBoxMachine(_VirtualMachine):
         
         return self._MACHINE_STATES[current_state]
     
+    @property
+    def last_progress(self):
+        """The most recent progress report for the current or last long running operation.
+        
+        Args:
+            None.
+        
+        Returns:
+            (:class:`OperationProgress`): The progress or None if no operation has reported yet.
+        
+        Raises:
+            None.
+        """
+        
+        return self._last_progress
+    
+    def cancel(self):
+        """Request cancellation of the long running operation in progress. The operation raises 
+        :class:`VMError` once it has been cancelled. A request made between two steps of an
+        operation cancels the next step that has to wait. A request made while no operation is in
+        progress is discarded when the next operation starts.
+        
+        Args:
+            None.
+        
+        Returns:
+            None.
+        
+        Raises:
+            None.
+        """
+        
+        self._cancel_event.set()
+    
+    def _wait_for_progress(self, progress, operation):
+        """Wait for a VirtualBox progress object to complete while reporting progress. The wait is
+        abandoned if the operation timeout expires or cancellation is requested.
+        
+        Args:
+            progress (IProgress): The progress object of the operation.
+            operation (str): The operation type used for timeouts and progress reports.
+        
+        Returns:
+            None.
+        
+        Raises:
+            RuntimeError: The operation failed, timed out or was cancelled.
+        """
+        
+        timeout = self._op_timeouts.get(operation, VM_OP_TIMEOUT)
+        deadline = time() + timeout
+        
+        self._report_progress(progress, operation)
+        
+        while not progress.completed:
+            #A cancellation that arrives between two steps of one operation stays pending for the
+            #next step.
+            if self._cancel_event.is_set():
+                self._cancel_event.clear()
+                self._cancel_progress(progress)
+                raise RuntimeError('The "{0}" operation was cancelled!'.format(operation))
+            if time() > deadline:
+                self._cancel_progress(progress)
+                raise RuntimeError('The "{0}" operation timed out after {1} '
+                                   'seconds!'.format(operation, timeout))
+            
+            progress.waitForCompletion(PROGRESS_POLL_INTERVAL)
+            self._report_progress(progress, operation)
+        
+        if progress.resultCode != 0:
+            try:
+                reason = progress.errorInfo.text
+            except Exception:
+                reason = 'Result code {0}'.format(progress.resultCode)
+            raise RuntimeError('The "{0}" operation failed! {1}'.format(operation, reason))
+    
+    def _report_progress(self, progress, operation):
+        """Record the current progress of an operation and pass it on to the progress callback.
+        
+        Args:
+            progress (IProgress): The progress object of the operation.
+            operation (str): The operation type.
+        
+        Returns:
+            None.
+        
+        Raises:
+            None.
+        """
+        
+        self._last_progress = OperationProgress(operation, 
+                                                progress.percent, 
+                                                progress.operationDescription, 
+                                                progress.timeRemaining)
+        
+        if self._progress_callback is not None:
+            self._progress_callback(self, self._last_progress)
+    
+    def _cancel_progress(self, progress):
+        """Cancel a VirtualBox operation if the operation allows it.
+        
+        Args:
+            progress (IProgress): The progress object of the operation.
+        
+        Returns:
+            None.
+        
+        Raises:
+            None.
+        """
+        
+        #Operations that are not cancelable are simply abandoned.
+        try:
+            if progress.cancelable:
+                progress.cancel()
+        except Exception:
+            pass
+    
+    def _close_session(self, session):
+        """Unlock the VM of a session after a failed operation so the VM isn't left locked. The
+        session may not hold a lock depending on where the operation failed.
+        
+        Args:
+            session (ISession): The session of the failed operation.
+        
+        Returns:
+            (bln): The session was unlocked and can be reused.
+        
+        Raises:
+            None.
+        """
+        
+        try:
+            self._mgr.closeMachineSession(session)
+        except Exception:
+            return False
+        
+        return True
+    
     @retry(5, exceptions=RuntimeError, delay=1)
     def _wait_for_state(self, state_object, expected_state):
         """Assert that an object has an attribute "state" at a given value.
@@ -472,54 +872,143 @@ class VBoxMachine(_VirtualMachine):
                 state.
         """
         
+        self._cancel_event.clear()
+        
         if self.current_state != 'Stopped':
             raise VMError('Virtual machine must be in stopped state before starting!', 
                           self._host,
                           self._name)
         
-        try:
-            session = self._mgr.mgr.getSessionObject(self._vbox)
-            progress = self._machine.launchVMProcess(session, 'gui', '')
-            progress.waitForCompletion(VM_OP_TIMEOUT)
-            self._wait_for_state(session, 2)        #Wait for the "Locked" state. (2)
-        except Exception as e:
-            raise VMError('Failed to start the virtual machine! Reason: {}'.format(str(e)),
-                          self._host,
-                          self._name)
-        finally:
-            self._mgr.closeMachineSession(session)
+        session = None
         
-    def stop(self):
-        """Stop the VM if running.
+        with self._limiter.admit('start'):
+            try:
+                session, progress = self._issue_start()
+                self._wait_for_progress(progress, 'start')
+                self._complete_start(session)
+            except Exception as e:
+                if session is not None:
+                    self._close_session(session)
+                
+                raise VMError('Failed to start the virtual machine! Reason: {}'.format(str(e)),
+                              self._host,
+                              self._name)
+    
+    def _issue_start(self, session=None):
+        """Launch the VM process without waiting for it to finish starting.
         
         Args:
-            None.
+            session (ISession)(opt): An unlocked session to reuse. A new session is created if None.
         
         Returns:
-            None.
+            (ISession, IProgress): The session used to launch the VM and the launch progress.
         
         Raises:
-            :class:`VMError`: State could not be changed or VM is not currently in the started 
-                state.
+            Exception: The VirtualBox API failed to launch the VM process.
         """
         
-        if self.current_state != 'Running':
-            raise VMError('Virtual machine must be in a running state before stopping!', 
-                          self._host,
-                          self._name)
+        if session is None:
+            session = self._mgr.mgr.getSessionObject(self._vbox)
         
         try:
-            session = self._mgr.mgr.getSessionObject(self._vbox)
-            self._machine.lockMachine(session, 1)   #Shared lock.
-            self._wait_for_state(session, 2)        #Wait for the "Locked" state. (2)
-            progress = session.console.powerDown()  #Powerdown kills session and lock.
-            progress.waitForCompletion(VM_OP_TIMEOUT)
-            
-            self._wait_for_machine_state('Stopped')
-        except Exception as e:
-            raise VMError('Failed to stop the virtual machine! Reason: {}'.format(str(e)),
+            return (session, self._machine.launchVMProcess(session, 'gui', ''))
+        except Exception:
+            self._close_session(session)
+            raise
+    
+    def _complete_start(self, session):
+        """Finish a start issued with :meth:`_issue_start` once its progress has completed.
+        
+        Args:
+            session (ISession): The session returned by :meth:`_issue_start`.
+        
+        Returns:
+            None.
+        
+        Raises:
+            RuntimeError: The session never reached the "Locked" state.
+        """
+        
+        try:
+            self._wait_for_state(session, 2)        #Wait for the "Locked" state. (2)
+        finally:
+            self._mgr.closeMachineSession(session)
+        
+    def stop(self):
+        """Stop the VM if running.
+        
+        Args:
+            None.
+        
+        Returns:
+            None.
+        
+        Raises:
+            :class:`VMError`: State could not be changed or VM is not currently in the started 
+                state.
+        """
+        
+        self._cancel_event.clear()
+        
+        if self.current_state != 'Running':
+            raise VMError('Virtual machine must be in a running state before stopping!', 
                           self._host,
                           self._name)
+        
+        session = None
+        
+        with self._limiter.admit('stop'):
+            try:
+                session, progress = self._issue_stop()
+                self._wait_for_progress(progress, 'stop')
+                self._complete_stop(session)
+            except Exception as e:
+                if session is not None:
+                    self._close_session(session)
+                
+                raise VMError('Failed to stop the virtual machine! Reason: {}'.format(str(e)),
+                              self._host,
+                              self._name)
+    
+    def _issue_stop(self, session=None):
+        """Begin powering down the VM without waiting for it to stop.
+        
+        Args:
+            session (ISession)(opt): An unlocked session to reuse. A new session is created if None.
+        
+        Returns:
+            (ISession, IProgress): The session locked to the VM and the power down progress.
+        
+        Raises:
+            Exception: The VirtualBox API failed to begin the power down.
+        """
+        
+        if session is None:
+            session = self._mgr.mgr.getSessionObject(self._vbox)
+        
+        try:
+            self._machine.lockMachine(session, 1)   #Shared lock.
+            self._wait_for_state(session, 2)        #Wait for the "Locked" state. (2)
+            
+            return (session, session.console.powerDown())  #Powerdown kills session and lock.
+        except Exception:
+            self._close_session(session)
+            raise
+    
+    def _complete_stop(self, session):
+        """Finish a stop issued with :meth:`_issue_stop` once its progress has completed.
+        
+        Args:
+            session (ISession): The session returned by :meth:`_issue_stop`.
+        
+        Returns:
+            None.
+        
+        Raises:
+            RuntimeError: The VM never reached the "Stopped" state.
+        """
+        
+        self._wait_for_machine_state('Stopped')
     
     #TODO: Create unit test for this method.
     def shutdown(self, wait):
@@ -587,6 +1076,84 @@ class VBoxMachine(_VirtualMachine):
             raise VMError('Failed to restart the virtual machine! Reason: {}'.format(str(e)),
                           self._host,
                           self._name)
+    
+    def suspend(self):
+        """Save the execution state of the VM to disk and stop it if running.
+        
+        Args:
+            None.
+        
+        Returns:
+            None.
+        
+        Raises:
+            :class:`VMError`: State could not be changed or VM is not currently in the started 
+                state.
+        """
+        
+        self._cancel_event.clear()
+        
+        if self.current_state != 'Running':
+            raise VMError('Virtual machine must be in a running state before suspending!', 
+                          self._host,
+                          self._name)
+        
+        session = None
+        
+        with self._limiter.admit('stop'):
+            try:
+                session = self._mgr.mgr.getSessionObject(self._vbox)
+                self._machine.lockMachine(session, 1)   #Shared lock.
+                self._wait_for_state(session, 2)        #Wait for the "Locked" state. (2)
+                progress = session.console.saveState()  #Saving state kills session and lock.
+                self._wait_for_progress(progress, 'suspend')
+                
+                self._wait_for_machine_state('Suspended')
+            except Exception as e:
+                if session is not None:
+                    self._close_session(session)
+                
+                raise VMError('Failed to suspend the virtual machine! Reason: {}'.format(str(e)),
+                              self._host,
+                              self._name)
+    
+    def resume(self):
+        """Resume the VM from its saved execution state if suspended.
+        
+        Args:
+            None.
+        
+        Returns:
+            None.
+        
+        Raises:
+            :class:`VMError`: State could not be changed or VM is not currently in the suspended 
+                state.
+        """
+        
+        self._cancel_event.clear()
+        
+        if self.current_state != 'Suspended':
+            raise VMError('Virtual machine must be in suspended state before resuming!', 
+                          self._host,
+                          self._name)
+        
+        session = None
+        
+        #Launching a VM with a saved state restores that state instead of booting.
+        with self._limiter.admit('start'):
+            try:
+                session = self._mgr.mgr.getSessionObject(self._vbox)
+                progress = self._machine.launchVMProcess(session, 'gui', '')
+                self._wait_for_progress(progress, 'resume')
+                self._wait_for_state(session, 2)        #Wait for the "Locked" state. (2)
+            except Exception as e:
+                raise VMError('Failed to resume the virtual machine! Reason: {}'.format(str(e)),
+                              self._host,
+                              self._name)
+            finally:
+                if session is not None:
+                    self._mgr.closeMachineSession(session)
 
     def destroy(self):
         """Destroy the VM created from a template.
@@ -625,7 +1192,8 @@ class VBoxMachine(_VirtualMachine):
                           self._name)
 
     def apply_snapshot(self, snapshot_name):
-        """Apply a snapshot to the VM.
+        """Apply a snapshot to the VM. Applying a snapshot taken from a running VM leaves the VM in
+        the "Suspended" state.
         
         Args:
             snapshot_name (str): Apply a snapshot to the VM.
@@ -634,29 +1202,323 @@ class VBoxMachine(_VirtualMachine):
             None.
         
         Raises:
-            :class:`VMError`: Machine is not in the stopped state, snapshot failed to be applied
-                or snapshot with given name not found.
+            :class:`VMError`: Machine is not in the stopped or suspended state, snapshot failed to 
+                be applied or snapshot with given name not found.
         """
         
+        self._cancel_event.clear()
+        
         snapshot = self._get_snapshot(snapshot_name)
         
-        if self.current_state != 'Stopped':
+        if self.current_state not in ('Stopped', 'Suspended'):
             raise VMError('Virtual machine must be in stopped state before applying snapshot!', 
                           self._host,
                           self._name)
         
+        session = None
+        
+        with self._limiter.admit('apply_snapshot'):
+            try:
+                session, progress = self._issue_restore(snapshot)
+                self._wait_for_progress(progress, 'apply_snapshot')
+                self._complete_restore(session)
+            except Exception as e:
+                if session is not None:
+                    self._close_session(session)
+                
+                raise VMError('Failed to apply snapshot! Reason: {}'.format(str(e)),
+                              self._host,
+                              self._name)
+    
+    def _issue_restore(self, snapshot, session=None):
+        """Begin restoring a snapshot without waiting for the restore to finish.
+        
+        Args:
+            snapshot (ISnapshot): The snapshot to restore.
+            session (ISession)(opt): An unlocked session to reuse. A new session is created if None.
+        
+        Returns:
+            (ISession, IProgress): The session locked to the VM and the restore progress.
+        
+        Raises:
+            Exception: The VirtualBox API failed to begin the restore.
+        """
+        
+        if session is None:
+            session = self._mgr.mgr.getSessionObject(self._vbox)
+        
+        try:
+            self._machine.lockMachine(session, 1)       #Shared lock.
+            self._wait_for_state(session, 2)            #Wait for the "Locked" state. (2)
+            
+            return (session, session.console.restoreSnapshot(snapshot))
+        except Exception:
+            self._close_session(session)
+            raise
+    
+    def _complete_restore(self, session):
+        """Finish a restore issued with :meth:`_issue_restore` once its progress has completed.
+        
+        Args:
+            session (ISession): The session returned by :meth:`_issue_restore`.
+        
+        Returns:
+            None.
+        
+        Raises:
+            Exception: The session could not be unlocked.
+        """
+        
+        session.unlockMachine()
+    
+    def take_snapshot(self, snapshot_name, description=''):
+        """Take a snapshot of the VM. Taking a snapshot of a running VM captures the running state
+        (a live snapshot) so that applying it later only requires a resume instead of a boot.
+        
+        Args:
+            snapshot_name (str): The name of the snapshot to create.
+            description (str)(opt): The description of the snapshot.
+        
+        Returns:
+            None.
+        
+        Raises:
+            :class:`VMError`: Machine is in a transitional state or the snapshot failed to be taken.
+        """
+        
+        self._cancel_event.clear()
+        
+        if self.current_state not in ('Running', 'Stopped', 'Suspended'):
+            raise VMError('Virtual machine must be running, stopped or suspended before taking a '
+                          'snapshot!', 
+                          self._host,
+                          self._name)
+        
+        session = None
+        
         try:
             session = self._mgr.mgr.getSessionObject(self._vbox)
             self._machine.lockMachine(session, 1)       #Shared lock.
             self._wait_for_state(session, 2)            #Wait for the "Locked" state. (2)
-            progress = session.console.restoreSnapshot(snapshot)
-            progress.waitForCompletion(VM_OP_TIMEOUT)
+            progress = session.console.takeSnapshot(snapshot_name, description)
+            self._wait_for_progress(progress, 'take_snapshot')
             session.unlockMachine()
         except Exception as e:
-            raise VMError('Failed to apply snapshot! Reason: {}'.format(str(e)),
+            if session is not None:
+                self._close_session(session)
+            
+            raise VMError('Failed to take snapshot! Reason: {}'.format(str(e)),
                           self._host,
                           self._name)
 
+class VBoxHost(object):
+    """This class provides batch operations for static VirtualBox virtual machines that live on the
+    same host. Every operation in a batch is issued up front and then waited on together, so 
+    preparing a multi-machine topology costs one round of progress waits instead of one round per
+    machine. The per-host operation limits still apply, so a batch larger than the limit for an
+    operation is executed in waves no larger than the limit.
+    
+    A VirtualBox session can only lock one machine at a time, so every VM in a wave needs a
+    session of its own. The sessions are unlocked again when their operations complete and are
+    kept by the host for the following waves and batches instead of creating new ones.
+    
+    Args:
+        host (str): The host that contains the target VMs.
+        
+    Raises:
+        None.
+    """
+    
+    def __init__(self, host):
+        self._host = host
+        self._limiter = _HostOperationLimiter(host)
+        self._sessions = []         #Unlocked sessions left over from earlier operations.
+    
+    @property
+    def host(self):
+        """The host that contains the virtual machines.
+        
+        Args:
+            None.
+        
+        Returns:
+            (str)
+        
+        Raises:
+            None.
+        """
+        
+        return self._host
+    
+    def start_many(self, machines):
+        """Start many stopped VMs at once.
+        
+        Args:
+            machines ([:class:`VBoxMachine`]): The VMs to start.
+        
+        Returns:
+            None.
+        
+        Raises:
+            :class:`VMError`: A VM is not on this host or one or more VMs failed to start.
+        """
+        
+        self._run_batch('start',
+                        [(machine, ()) for machine in machines],
+                        ('Stopped',),
+                        'Virtual machine must be in stopped state before starting!',
+                        lambda machine, session: machine._issue_start(session),
+                        lambda machine, session: machine._complete_start(session))
+    
+    def stop_many(self, machines):
+        """Stop many running VMs at once.
+        
+        Args:
+            machines ([:class:`VBoxMachine`]): The VMs to stop.
+        
+        Returns:
+            None.
+        
+        Raises:
+            :class:`VMError`: A VM is not on this host or one or more VMs failed to stop.
+        """
+        
+        self._run_batch('stop',
+                        [(machine, ()) for machine in machines],
+                        ('Running',),
+                        'Virtual machine must be in a running state before stopping!',
+                        lambda machine, session: machine._issue_stop(session),
+                        lambda machine, session: machine._complete_stop(session))
+    
+    def restore_many(self, restores):
+        """Apply snapshots to many VMs at once.
+        
+        Args:
+            restores ([(:class:`VBoxMachine`, str)]): A list of VM and snapshot name pairs.
+        
+        Returns:
+            None.
+        
+        Raises:
+            :class:`VMError`: A VM is not on this host or one or more snapshots failed to be 
+                applied.
+        """
+        
+        self._run_batch('apply_snapshot',
+                        [(machine, (snapshot_name,)) for (machine, snapshot_name) in restores],
+                        ('Stopped', 'Suspended'),
+                        'Virtual machine must be in stopped state before applying snapshot!',
+                        lambda machine, session, name: machine._issue_restore(
+                            machine._get_snapshot(name), session),
+                        lambda machine, session: machine._complete_restore(session))
+    
+    def _run_batch(self, operation, requests, valid_states, state_error, issue, complete):
+        """Run an operation against many VMs in waves bounded by the host operation limit.
+        
+        Args:
+            operation (str): The operation type. ('apply_snapshot', 'start', 'stop')
+            requests ([(:class:`VBoxMachine`, tuple)]): The VMs to operate on along with the extra
+                arguments for the "issue" callable.
+            valid_states ((str)): The VM states that allow the operation.
+            state_error (str): The failure reason for VMs that are not in a valid state.
+            issue (callable): Begins the operation on a VM with a reusable session (or None) and 
+                returns the session and progress.
+            complete (callable): Finishes the operation on a VM once its progress has completed.
+        
+        Returns:
+            None.
+        
+        Raises:
+            :class:`VMError`: A VM is not on this host or the operation failed for one or more VMs.
+        """
+        
+        failures = []
+        pending = []
+        
+        for (machine, args) in requests:
+            if machine.host != self._host:
+                raise VMError('Virtual machine is not on the batch host!', 
+                              self._host, 
+                              machine.name)
+            
+            #A cancellation left over from before the batch doesn't apply to it.
+            machine._cancel_event.clear()
+            
+            if machine.current_state in valid_states:
+                pending.append((machine, args))
+            else:
+                failures.append((machine.name, state_error))
+        
+        wave_size = self._limiter.limit(operation) or max(len(pending), 1)
+        
+        for index in range(0, len(pending), wave_size):
+            failures.extend(self._run_wave(operation, 
+                                           pending[index:index + wave_size], 
+                                           issue, 
+                                           complete))
+        
+        if failures:
+            raise VMError('Failed to {0} {1} of {2} virtual machines! Reasons: {3}'.format(
+                              operation.replace('_', ' '),
+                              len(failures),
+                              len(requests),
+                              ' '.join(['"{0}": {1}'.format(name, reason) 
+                                        for (name, reason) in failures])),
+                          self._host)
+    
+    def _run_wave(self, operation, requests, issue, complete):
+        """Issue an operation against every VM in a wave and then wait for all of them to finish.
+        
+        Args:
+            operation (str): The operation type. ('apply_snapshot', 'start', 'stop')
+            requests ([(:class:`VBoxMachine`, tuple)]): The VMs to operate on along with the extra
+                arguments for the "issue" callable.
+            issue (callable): Begins the operation on a VM with a reusable session (or None) and 
+                returns the session and progress.
+            complete (callable): Finishes the operation on a VM once its progress has completed.
+        
+        Returns:
+            ([(str, str)]): The name and failure reason for every VM that failed.
+        
+        Raises:
+            None.
+        """
+        
+        failures = []
+        issued = []
+        
+        for (machine, args) in requests:
+            self._limiter.acquire(operation)
+            
+            session = self._sessions.pop() if self._sessions else None
+            
+            try:
+                (session, progress) = issue(machine, session, *args)
+            except Exception as e:
+                self._limiter.release(operation)
+                failures.append((machine.name, getattr(e, 'msg', str(e))))
+            else:
+                issued.append((machine, session, progress))
+        
+        #The operations run concurrently on the host so the first wait absorbs most of the others.
+        for (machine, session, progress) in issued:
+            try:
+                machine._wait_for_progress(progress, operation)
+                complete(machine, session)
+            except Exception as e:
+                failures.append((machine.name, str(e)))
+                
+                #A failed operation may still hold the lock on its VM.
+                if machine._close_session(session):
+                    self._sessions.append(session)
+            else:
+                #A completed operation leaves its session unlocked and ready for the next one.
+                self._sessions.append(session)
+            finally:
+                self._limiter.release(operation)
+        
+        return failures
+
 class VagrantMachine(_VirtualMachine):
     """This class will allow access to VirtualBox virtual machines on local and remote hosts.
     
@@ -928,7 +1790,325 @@ class VagrantMachine(_VirtualMachine):
             raise VMError('Failed to apply snapshot! Reason: {}'.format(str(e)),
                           self._host,
                           self._name)
-            
+
+class LocalMachine(_VirtualMachine):
+    """This class provides a light-weight "machine" that is nothing more than a sandbox directory
+    on the Bespoke server. Snapshots are copies of the sandbox directory and the power operations
+    only track state, so steps that just need an isolated directory and a process can be executed
+    as local processes without paying for a virtual machine restore and boot.
+
+    Args:
+        host (str): The host of the sandbox. (Must be the local machine.)
+        name (str): The name of the sandbox.
+        sandbox (str): The absolute path to the sandbox directory.
+        snapshot_root (str)(opt): The directory that stores the snapshots for the sandbox. If not
+            specified then a sibling directory of the sandbox named "<sandbox>.snapshots" is used.
+
+    Raises:
+        :class:`VMError`: The host is not the local machine.
+    """
+
+    # ===============================================================================================
+    # Class Constants
+    # ===============================================================================================
+    _SNAPSHOT_SUFFIX = '.snapshots'
+
+    def __init__(self, host, name, sandbox, snapshot_root=None):
+        super(LocalMachine, self).__init__(host, name)
+
+        if host not in LOCAL_HOSTS:
+            raise VMError('Sandbox machines can only be hosted on the local machine!',
+                          self._host,
+                          self._name)
+
+        self._sandbox = sandbox
+        self._snapshot_root = snapshot_root if snapshot_root is not None else \
+            sandbox.rstrip('/\\') + self._SNAPSHOT_SUFFIX
+        self._state = 'Stopped'
+
+    @property
+    def current_state(self):
+        """Report the current state of the sandbox.
+
+        Returns:
+            (str): The current state of the sandbox.
+                "Running"
+                "Stopped"
+                "Suspended"
+
+        Raises:
+            None.
+        """
+
+        return self._state
+
+    @property
+    def is_sandbox(self):
+        """Indicates that the machine is a sandbox directory on the Bespoke server.
+
+        Returns:
+            (bln)
+
+        Raises:
+            None.
+        """
+
+        return True
+
+    @property
+    def sandbox(self):
+        """The absolute path to the sandbox directory.
+
+        Returns:
+            (str)
+
+        Raises:
+            None.
+        """
+
+        return self._sandbox
+
+    @property
+    def snapshot_root(self):
+        """The directory that stores the snapshots for the sandbox.
+
+        Returns:
+            (str)
+
+        Raises:
+            None.
+        """
+
+        return self._snapshot_root
+
+    def setup(self):
+        """Create the sandbox directory if it doesn't exist.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            :class:`VMError`: The sandbox directory could not be created.
+        """
+
+        if not isdir(self._sandbox):
+            try:
+                makedirs(self._sandbox)
+            except OSError as e:
+                raise VMError('Failed to create the sandbox! Reason: {}'.format(str(e)),
+                              self._host,
+                              self._name)
+
+    def tear_down(self):
+        """Post use clean up tasks.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        #The sandbox is left in place for inspection until the next snapshot is applied.
+        pass
+
+    def start(self):
+        """Start the sandbox if stopped. (Only the state is tracked.)
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            :class:`VMError`: The sandbox is not currently in the stopped state.
+        """
+
+        if self._state != 'Stopped':
+            raise VMError('Virtual machine must be in stopped state before starting!',
+                          self._host,
+                          self._name)
+
+        self._state = 'Running'
+
+    def stop(self):
+        """Stop the sandbox if running. (Only the state is tracked.)
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            :class:`VMError`: The sandbox is not currently in the running state.
+        """
+
+        if self._state != 'Running':
+            raise VMError('Virtual machine must be in a running state before stopping!',
+                          self._host,
+                          self._name)
+
+        self._state = 'Stopped'
+
+    def shutdown(self, wait):
+        """Shutdown the sandbox if running. (Only the state is tracked.)
+
+        Args:
+            wait (bln) = Ignored, sandbox shutdown is always immediate.
+
+        Returns:
+            None.
+
+        Raises:
+            :class:`VMError`: The sandbox is not currently in the running state.
+        """
+
+        self.stop()
+
+    def restart(self):
+        """Restart the sandbox if running. (Nothing to do for a sandbox.)
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            :class:`VMError`: The sandbox is not currently in the running state.
+        """
+
+        if self._state != 'Running':
+            raise VMError('Virtual machine must be in a running state before restarting!',
+                          self._host,
+                          self._name)
+
+    def suspend(self):
+        """Suspend the sandbox if running. (Only the state is tracked.)
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            :class:`VMError`: The sandbox is not currently in the running state.
+        """
+
+        if self._state != 'Running':
+            raise VMError('Virtual machine must be in a running state before suspending!',
+                          self._host,
+                          self._name)
+
+        self._state = 'Suspended'
+
+    def resume(self):
+        """Resume the sandbox if suspended. (Only the state is tracked.)
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            :class:`VMError`: The sandbox is not currently in the suspended state.
+        """
+
+        if self._state != 'Suspended':
+            raise VMError('Virtual machine must be in suspended state before resuming!',
+                          self._host,
+                          self._name)
+
+        self._state = 'Running'
+
+    def destroy(self):
+        """Destroy the VM created from a template.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            :class:`NotSupported`: This function is not supported for sandboxes.
+        """
+
+        raise NotSupported(host=self._host, vm_name=self._name)
+
+    def apply_snapshot(self, snapshot_name):
+        """Replace the contents of the sandbox with the contents of a snapshot directory.
+
+        Args:
+            snapshot_name (str): The name of the snapshot to apply.
+
+        Returns:
+            None.
+
+        Raises:
+            :class:`VMError`: Sandbox is not in the stopped or suspended state, snapshot failed to
+                be applied or snapshot with given name not found.
+        """
+
+        snapshot_path = join(self._snapshot_root, snapshot_name)
+
+        if not isdir(snapshot_path):
+            raise VMError('Failed to find snapshot with the name "{}"!'.format(snapshot_name),
+                          self._host,
+                          self._name)
+
+        if self._state not in ('Stopped', 'Suspended'):
+            raise VMError('Virtual machine must be in stopped state before applying snapshot!',
+                          self._host,
+                          self._name)
+
+        try:
+            if isdir(self._sandbox):
+                shutil.rmtree(self._sandbox)
+            shutil.copytree(snapshot_path, self._sandbox, symlinks=True)
+        except (IOError, OSError, shutil.Error) as e:
+            raise VMError('Failed to apply snapshot! Reason: {}'.format(str(e)),
+                          self._host,
+                          self._name)
+
+        #Sandbox snapshots never capture a running state.
+        self._state = 'Stopped'
+
+    def take_snapshot(self, snapshot_name):
+        """Capture the current contents of the sandbox as a snapshot. An existing snapshot with the
+        same name is replaced.
+
+        Args:
+            snapshot_name (str): The name of the snapshot to create.
+
+        Returns:
+            None.
+
+        Raises:
+            :class:`VMError`: The snapshot could not be created.
+        """
+
+        snapshot_path = join(self._snapshot_root, snapshot_name)
+
+        try:
+            if isdir(snapshot_path):
+                shutil.rmtree(snapshot_path)
+            shutil.copytree(self._sandbox, snapshot_path, symlinks=True)
+        except (IOError, OSError, shutil.Error) as e:
+            raise VMError('Failed to take snapshot! Reason: {}'.format(str(e)),
+                          self._host,
+                          self._name)
+
 # ===================================================================================================
 # Exceptions
 # ===================================================================================================
@@ -11,9 +11,15 @@ __version__ = 0.1
 # ===================================================================================================
 # Imports
 # ===================================================================================================
-from os.path import join
+import logging
+from os import environ
+from os.path import join, isdir
+from collections import OrderedDict
 from util import merge_dictionaries
-from core import TestRun, BespokeGlobals
+from core import TestRun, BespokeGlobals, ArtifactPrefetcher
+from core.results_store import ResultsStore, ResultsStoreError
+from core.agent_channel import AgentServer, AgentError, TOKEN_VARIABLE
+from artifact_server import ArtifactServer, ArtifactServerError
 from config import BuildConfig, ToolConfig, GlobalConfig, ResourceConfig, TestRunConfig, \
 ConfigError, TestPlanConfig
 
@@ -27,6 +33,8 @@ BUILD_CONFIG_XSD = 'build_config.xsd'
 TOOL_CONFIG_XSD = 'tool_config.xsd'
 TEST_PLAN_XSD = 'test_plan.xsd'
 
+_LOGGER = logging.getLogger(__name__)
+
 # ===================================================================================================
 # Exceptions
 # ===================================================================================================
@@ -63,6 +71,8 @@ class ExecuteTestRun(object):
             file paths (paths must be absolute).
         build_config_files <opt>|[str]| = An optional override to use for the build configuration 
             file paths (paths must be absolute).
+        store_results <opt>|bln| = Move the results collected by the test run into the results 
+            store once the test run ends. (The plain results directories are removed.)
         
     Raises:
         :class:`ExecutionError` = Could not load configuration files for a variety of reasons.
@@ -76,7 +86,8 @@ class ExecuteTestRun(object):
                  resource_config_files=[],
                  test_plan_files=[], 
                  tools_config_files=[],
-                 build_config_files=[]):
+                 build_config_files=[],
+                 store_results=False):
         
         ## init ##
         self._bespoke_root = bespoke_root
@@ -87,6 +98,7 @@ class ExecuteTestRun(object):
         self._test_plan_files = test_plan_files
         self._tools_config_files = tools_config_files
         self._build_config_files = build_config_files
+        self._use_results_store = store_results
         
         ## XSD ##
         self._global_xsd_path = join(self._xsd_path, GLOBAL_CONFIG_XSD)
@@ -108,6 +120,8 @@ class ExecuteTestRun(object):
         self._tools = {}
         self._test_plan_configs = []
         self._test_run = None
+        self._artifact_server = None
+        self._prefetcher = None
         
         ## load ##
         self._load_global()
@@ -207,6 +221,15 @@ class ExecuteTestRun(object):
         BespokeGlobals.ABS_LOCAL_TESTS = self._test_script_path
         BespokeGlobals.ABS_LOCAL_TOOLS = self._global_config['ToolPath']
         BespokeGlobals.BESPOKE_SERVER_HOSTNAME = self._global_config['BespokeServerHostname']
+        
+        #Stage artifacts under the results path unless a staging path is specified.
+        if 'StagingPath' in self._global_config:
+            BespokeGlobals.ABS_LOCAL_STAGING = self._global_config['StagingPath']
+        else:
+            BespokeGlobals.ABS_LOCAL_STAGING = join(self._global_config['ResultsPath'], '.staging')
+            
+        if 'MaxConcurrentStaging' in self._global_config:
+            BespokeGlobals.MAX_CONCURRENT_STAGING = int(self._global_config['MaxConcurrentStaging'])
                 
     def _load_resources(self):
         """Parse and load the resource configuration file.
@@ -333,6 +356,184 @@ class ExecuteTestRun(object):
         else:
             self._tools = tmp_tools[0]
     
+    def _start_agent_server(self):
+        """Start the agent server if a port is configured in the global configuration file so 
+        SystemUnderTests running the Bespoke agent in daemon mode are reached through the agent 
+        instead of STAF. The token shared with the agents is taken from the global configuration
+        file or the environment variable the agents read it from.
+        
+        Args:
+            None.
+        
+        Returns:
+            None.
+        
+        Raises:
+            :class:`ExecutionError`
+        """
+        
+        if 'AgentServerPort' not in self._global_config:
+            return
+        
+        if 'AgentToken' in self._global_config:
+            token = self._global_config['AgentToken']
+        else:
+            token = environ.get(TOKEN_VARIABLE)
+        
+        try:
+            BespokeGlobals.AGENT_SERVER = AgentServer(BespokeGlobals.BESPOKE_SERVER_HOSTNAME,
+                                                      token,
+                                                      int(self._global_config['AgentServerPort']))
+        except AgentError as e:
+            raise ExecutionError(e.msg)
+        
+    def _start_artifact_server(self):
+        """Start the artifact server if a port is configured in the global configuration file so 
+        SystemUnderTests can pull tools, tests and staged artifacts over HTTP.
+        
+        Args:
+            None.
+        
+        Returns:
+            None.
+        
+        Raises:
+            :class:`ExecutionError`
+        """
+        
+        if 'ArtifactServerPort' not in self._global_config:
+            return
+        
+        roots = {'tools': BespokeGlobals.ABS_LOCAL_TOOLS,
+                 'tests': BespokeGlobals.ABS_LOCAL_TESTS,
+                 'staging': BespokeGlobals.ABS_LOCAL_STAGING}
+        
+        try:
+            self._artifact_server = ArtifactServer(roots,
+                                                   BespokeGlobals.BESPOKE_SERVER_HOSTNAME,
+                                                   self._global_config['ArtifactServerPort'])
+        except ArtifactServerError as e:
+            raise ExecutionError(e.msg)
+        
+        self._artifact_server.start()
+        
+        BespokeGlobals.ARTIFACT_SERVER_URL = 'http://{0}:{1}'.format(
+            BespokeGlobals.BESPOKE_SERVER_HOSTNAME, 
+            self._artifact_server.port)
+        
+    def _start_prefetch(self):
+        """Start staging every build and tool used by the test run on the Bespoke server in the
+        background so the copies overlap with the snapshot restores and boots of the SUTs.
+        
+        Args:
+            None.
+        
+        Returns:
+            None.
+        
+        Raises:
+            None.
+        """
+        
+        tools = OrderedDict()
+        
+        for test_plan in self._test_run.get_test_plans:
+            for test_case in test_plan.get_test_cases.values():
+                for tool in test_case.get_tools:
+                    tools[id(tool)] = tool
+                    
+        if len(tools) > 0:
+            self._prefetcher = ArtifactPrefetcher(tools.values())
+            self._prefetcher.start()
+            
+    def _stop_agent_server(self):
+        """Stop the agent server if it is running and close the connections of the agents.
+        
+        Args:
+            None.
+        
+        Returns:
+            None.
+        
+        Raises:
+            None.
+        """
+        
+        if BespokeGlobals.AGENT_SERVER is not None:
+            BespokeGlobals.AGENT_SERVER.close()
+            BespokeGlobals.AGENT_SERVER = None
+            
+    def _stop_artifact_server(self):
+        """Stop the artifact server if it is running.
+        
+        Args:
+            None.
+        
+        Returns:
+            None.
+        
+        Raises:
+            None.
+        """
+        
+        if self._artifact_server is not None:
+            self._artifact_server.stop()
+            self._artifact_server = None
+            
+        BespokeGlobals.ARTIFACT_SERVER_URL = ''
+        
+    def _stop_prefetch(self):
+        """Wait for the background staging to finish.
+        
+        Args:
+            None.
+        
+        Returns:
+            None.
+        
+        Raises:
+            None.
+        """
+        
+        if self._prefetcher is not None:
+            self._prefetcher.wait()
+            self._prefetcher = None
+            
+    def _store_results(self):
+        """Move the results collected by the test run into the results store so identical files 
+        are only kept once and results can be looked up by test. The results of a test that can't
+        be stored are left where they are and the failure is logged.
+        
+        Args:
+            None.
+        
+        Returns:
+            None.
+        
+        Raises:
+            None.
+        """
+        
+        store = ResultsStore(join(BespokeGlobals.ABS_LOCAL_RESULTS, BespokeGlobals.RESULTS_STORE))
+        
+        for test_plan in self._test_run.get_test_plans:
+            for test_case in test_plan.get_test_cases.values():
+                for test in test_case.get_tests:
+                    if not hasattr(test, 'local_results') or not isdir(test.local_results):
+                        continue
+                    
+                    try:
+                        store.add(test.local_results, 
+                                  test.uuid, 
+                                  self._test_run.name, 
+                                  test_plan.name, 
+                                  test_case.name, 
+                                  test.name, 
+                                  test.status)
+                    except ResultsStoreError as e:
+                        _LOGGER.warning('Failed to store the results of the "%s" test in the "%s" '
+                                        'test case! %s', test.name, test_case.name, e.msg)
+            
     def execute_test_run(self):
         """Execute the TestRun.
         
@@ -345,9 +546,30 @@ class ExecuteTestRun(object):
         Raises:
             :class:`FatalError`: Fatal error occurred and unreliable results possibly recorded.
             :class:`Failure`: The TestRun failed during execution.
+            :class:`ExecutionError`: The artifact server or agent server could not be started.
         """
         
-        self._test_run.execute()
+        self._start_agent_server()
+        
+        try:
+            self._start_artifact_server()
+        except ExecutionError:
+            self._stop_agent_server()
+            raise
+        
+        self._start_prefetch()
+        
+        try:
+            self._test_run.execute()
+        finally:
+            self._stop_prefetch()
+            self._stop_artifact_server()
+            self._stop_agent_server()
+            
+            if self._use_results_store:
+                self._store_results()
+                
+            BespokeGlobals.STAF_HANDLE_POOL.close()
         
     @property
     def builds(self):
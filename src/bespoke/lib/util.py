@@ -12,9 +12,24 @@ __version__ = 0.2
 # Imports
 #===================================================================================================
 import time
-from collections import Counter
+import zlib
+import hashlib
+from os import stat, walk
+from os.path import abspath, join, relpath, isdir
+from threading import Lock
+from collections import Counter, OrderedDict
 from itertools import chain
 #===================================================================================================
+# Globals
+#===================================================================================================
+DIGEST_CHUNK_SIZE = 1024 * 1024    #Number of bytes read at a time when computing file digests.
+SAMPLE_SIZE = 256 * 1024           #Number of bytes sampled to estimate how compressible data is.
+SAMPLE_CHUNK_SIZE = 32 * 1024      #Number of bytes sampled from a single file.
+DIGEST_MEMO_SIZE = 65536           #Maximum number of file digests remembered.
+
+_digest_memo = OrderedDict()        #File digests keyed by (path, size, modification time).
+_digest_memo_lock = Lock()
+#===================================================================================================
 # Decorators
 #===================================================================================================
 class retry(object):
@@ -121,3 +136,164 @@ def merge_dictionaries(dicts, fail_on_duplicates=False):
             raise KeyError('The dictionaries have duplicate keys! {0}'.format(duplicates))
         
     return {k:v for d in dicts for k, v in d.iteritems()}
+
+def file_digest(path):
+    """Calculate the SHA-1 digest of a file's contents. Digests are remembered by path, size and 
+    modification time so an unchanged file is only read once. Only the DIGEST_MEMO_SIZE most 
+    recently used digests are remembered.
+        
+    Args:
+        path (str) = The path of the file.
+    
+    Returns:
+        (str) = The hex digest of the file contents.
+    
+    Raises:
+        IOError = The file could not be read.
+        OSError = The file does not exist.
+    """
+    
+    file_stat = stat(path)
+    memo_key = (abspath(path), file_stat.st_size, file_stat.st_mtime)
+    
+    with _digest_memo_lock:
+        digest = _digest_memo.pop(memo_key, None)
+        
+        #Re-insert the digest to mark it as the most recently used.
+        if digest is not None:
+            _digest_memo[memo_key] = digest
+    
+    if digest is None:
+        sha1 = hashlib.sha1()
+        
+        with open(path, 'rb') as file_handle:
+            for chunk in iter(lambda: file_handle.read(DIGEST_CHUNK_SIZE), b''):
+                sha1.update(chunk)
+        
+        digest = sha1.hexdigest()
+        
+        with _digest_memo_lock:
+            _digest_memo[memo_key] = digest
+            
+            while len(_digest_memo) > DIGEST_MEMO_SIZE:
+                _digest_memo.popitem(last=False)
+    
+    return digest
+
+def directory_digest(path):
+    """Calculate the SHA-1 digest of a directory tree. The digest covers the relative path and
+    contents of every file and the relative path of every directory, so it changes whenever a file
+    is added, removed, renamed or modified.
+        
+    Args:
+        path (str) = The path of the directory.
+    
+    Returns:
+        (str) = The hex digest of the directory tree.
+    
+    Raises:
+        IOError = A file could not be read.
+        OSError = A file does not exist.
+    """
+    
+    sha1 = hashlib.sha1()
+    files, dirs = directory_manifest(path)
+    
+    #Hash in a stable order so the digest doesn't depend on the file system.
+    for name in sorted(dirs):
+        sha1.update('D {0}\n'.format(name))
+    
+    for name in sorted(files):
+        sha1.update('F {0} {1}\n'.format(name, files[name][1]))
+    
+    return sha1.hexdigest()
+
+def directory_manifest(path):
+    """Describe every file and directory in a directory tree. Paths in the manifest are relative
+    to the given directory and always use Unix style separators.
+        
+    Args:
+        path (str) = The path of the directory.
+    
+    Returns:
+        ({str:(int, str)}, [str]) = The size and hex digest of every file keyed by relative path
+            and a list of the relative paths of every directory.
+    
+    Raises:
+        IOError = A file could not be read.
+        OSError = A file does not exist.
+    """
+    
+    files = {}
+    dirs = []
+    
+    for root, dir_names, file_names in walk(path):
+        for name in dir_names:
+            dirs.append(unix_style_path(relpath(join(root, name), path)))
+        
+        for name in file_names:
+            full_path = join(root, name)
+            files[unix_style_path(relpath(full_path, path))] = (stat(full_path).st_size, 
+                                                                file_digest(full_path))
+    
+    return (files, dirs)
+
+def payload_files(path):
+    """List every file of a payload with its size. A payload is either a single file or a
+    directory tree.
+        
+    Args:
+        path (str) = The path of the file or directory.
+    
+    Returns:
+        ([(str, int)]) = The path and size of every file.
+    
+    Raises:
+        OSError = A file does not exist.
+    """
+    
+    if not isdir(path):
+        return [(path, stat(path).st_size)]
+    
+    return [(join(root, name), stat(join(root, name)).st_size) 
+            for root, dir_names, file_names in walk(path) for name in file_names]
+
+def compression_ratio(path, sample_size=SAMPLE_SIZE):
+    """Estimate how well a file or directory tree compresses by compressing a quick sample of it.
+    A chunk is taken from the middle of each file, largest first, so a few small text files can't
+    hide a tree of already compressed archives.
+        
+    Args:
+        path (str) = The path of the file or directory.
+        sample_size (int)(opt) = The maximum number of bytes to sample.
+    
+    Returns:
+        (float) = The compressed size of the sample divided by its size. (1.0 if nothing was 
+            sampled.)
+    
+    Raises:
+        IOError = A file could not be read.
+        OSError = A file does not exist.
+    """
+    
+    sample = []
+    remaining = sample_size
+    
+    for file_path, size in sorted(payload_files(path), key=lambda entry: -entry[1]):
+        if remaining <= 0:
+            break
+        
+        chunk_size = min(SAMPLE_CHUNK_SIZE, remaining, size)
+        
+        with open(file_path, 'rb') as file_handle:
+            file_handle.seek((size - chunk_size) // 2)
+            sample.append(file_handle.read(chunk_size))
+            
+        remaining -= chunk_size
+        
+    sample = b''.join(sample)
+    
+    if len(sample) == 0:
+        return 1.0
+    
+    return len(zlib.compress(sample, 1)) / float(len(sample))
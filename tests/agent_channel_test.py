@@ -0,0 +1,363 @@
+"""
+.. module:: agent_channel_test
+   :platform: Linux, Windows
+   :synopsis: Unit tests for the agent_channel module against agent sessions on the loopback
+       interface.
+   :license: BSD, see LICENSE for more details.
+
+.. moduleauthor:: Caleb Moniot <cmoniot@gmail.com>
+"""
+__version__ = 0.1
+
+#===================================================================================================
+# Imports
+#===================================================================================================
+import sys
+import socket
+import shutil
+from io import BytesIO
+from time import time, sleep
+from tempfile import mkdtemp
+from threading import Thread, Lock
+from os import makedirs
+from os.path import join, isdir, isfile, dirname
+from unittest import TestCase
+from mock import patch
+from bespoke_agent import AgentSession
+from core.agent_channel import AgentServer, AgentError, CHUNK_SIZE, HEADER, send_message
+
+#===================================================================================================
+# Functions
+#===================================================================================================
+def _write_file(path, content):
+    """Write a file and any missing parent directories."""
+
+    if not isdir(dirname(path)):
+        makedirs(dirname(path))
+
+    with open(path, 'wb') as file_handle:
+        file_handle.write(content)
+
+def _read_file(path):
+    """Read the contents of a file."""
+
+    with open(path, 'rb') as file_handle:
+        return file_handle.read()
+
+def _python(code):
+    """A command line that runs a line of Python with the interpreter running the tests."""
+
+    return '"{0}" -c "{1}"'.format(sys.executable, code)
+
+#===================================================================================================
+# Tests
+#===================================================================================================
+class _AgentChannelTestCase(TestCase):
+    """Base class for tests that talk to agent sessions connected to a server on the loopback
+    interface."""
+
+    def setUp(self):
+        self.temp_dir = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+
+        self.server = AgentServer('127.0.0.1', 'secret', port=0)
+        self.addCleanup(self.server.close)
+
+    def _connect_agent(self, name='agent1', token='secret'):
+        """Connect an agent session to the server and return its socket."""
+
+        sock = socket.create_connection(('127.0.0.1', self.server.port))
+
+        thread = Thread(target=AgentSession(sock, name, token).run)
+        thread.daemon = True
+        thread.start()
+
+        return sock
+
+    def _raw_socket(self):
+        """Connect a socket that greets the server by hand and fails its reads after 5
+        seconds."""
+
+        sock = socket.create_connection(('127.0.0.1', self.server.port))
+        sock.settimeout(5)
+        self.addCleanup(sock.close)
+
+        return sock
+
+    def _dropped(self, sock):
+        """Determine if the server closed a socket. Closing with unread data resets the
+        connection instead of ending it."""
+
+        try:
+            return sock.recv(1) == ''
+        except socket.timeout:
+            return False
+        except socket.error:
+            return True
+
+    def _connection(self, name='agent1'):
+        """Connect an agent and return its connection on the server."""
+
+        self._connect_agent(name)
+
+        return self.server.get(name, timeout=10)
+
+class AgentChannelTests(_AgentChannelTestCase):
+    """Tests for the AgentServer and AgentConnection classes in the agent_channel module with
+    the AgentSession of the agent."""
+
+    def test1_ping(self):
+        """Verify that a connected agent answers a ping."""
+
+        connection = self._connection()
+
+        self.assertEqual(connection.request('Ping', {}).result(10), (0, ''))
+        self.assertEqual(self.server.agents, ['agent1'])
+
+    def test2_exec(self):
+        """Verify that a command runs in its working directory with its environment and its exit
+        code and output are returned."""
+
+        code = ('import os, sys; sys.stdout.write(os.getcwd() + os.environ[\'BESPOKE_TEST\']); '
+                'sys.stderr.write(\'!\'); sys.exit(3)')
+
+        request = self._connection().execute(_python(code),
+                                             working_dir=self.temp_dir,
+                                             env_vars={'BESPOKE_TEST': '-env'})
+
+        self.assertEqual(request.result(30), (3, self.temp_dir + '-env!'))
+        self.assertFalse(request.timed_out)
+
+    def test3_exec_streams_output(self):
+        """Verify that the output of a command is handed over as it arrives."""
+
+        chunks = []
+        code = 'import sys; sys.stdout.write(\'x\' * {0})'.format(CHUNK_SIZE * 3)
+
+        request = self._connection().execute(_python(code), on_output=chunks.append)
+
+        self.assertEqual(request.result(30), (0, ''))
+        self.assertEqual(''.join(chunks), 'x' * CHUNK_SIZE * 3)
+
+    def test4_push(self):
+        """Verify that a file larger than a chunk is pushed to the agent."""
+
+        content = ''.join(chr(index % 256) for index in range(CHUNK_SIZE * 2 + 10))
+        local_path = join(self.temp_dir, 'local.bin')
+        remote_path = join(self.temp_dir, 'remote', 'pushed.bin')
+        _write_file(local_path, content)
+
+        request = self._connection().push(local_path, remote_path)
+
+        self.assertEqual(request.result(30)[0], 0)
+        self.assertEqual(_read_file(remote_path), content)
+
+    def test5_pull(self):
+        """Verify that a file larger than a chunk is pulled from the agent."""
+
+        content = ''.join(chr(index % 256) for index in range(CHUNK_SIZE * 2 + 10))
+        remote_path = join(self.temp_dir, 'remote.bin')
+        local_file = BytesIO()
+        _write_file(remote_path, content)
+
+        request = self._connection().pull(remote_path, local_file)
+
+        self.assertEqual(request.result(30)[0], 0)
+        self.assertEqual(local_file.getvalue(), content)
+
+    def test6_make_dir(self):
+        """Verify that a directory and its parents are created on the agent machine."""
+
+        path = join(self.temp_dir, 'a', 'b')
+
+        self.assertEqual(self._connection().request('MakeDir', {'path': path}).result(10)[0], 0)
+        self.assertTrue(isdir(path))
+
+    def test7_cancel(self):
+        """Verify that a cancelled command is killed."""
+
+        connection = self._connection()
+        request = connection.execute(_python('import time; time.sleep(30)'))
+
+        connection.cancel(request)
+
+        start = time()
+        exit_code, _ = request.result(20)
+
+        self.assertNotEqual(exit_code, 0)
+        self.assertLess(time() - start, 10)
+
+    def test8_reconnect(self):
+        """Verify that an agent that reconnects replaces its old connection and the requests
+        waiting on the old connection fail."""
+
+        old = self._connection()
+        request = old.execute(_python('import time; time.sleep(30)'))
+
+        self._connect_agent()
+
+        start = time()
+
+        while self.server.get('agent1', timeout=10) is old and time() - start < 10:
+            sleep(0.01)
+
+        new = self.server.get('agent1')
+
+        self.assertIsNot(new, old)
+        self.assertTrue(old.closed)
+        self.assertEqual(new.request('Ping', {}).result(10), (0, ''))
+
+        with self.assertRaises(AgentError) as cm:
+            request.result(10)
+
+        self.assertEqual(cm.exception.msg, 'Lost the connection to the agent "agent1"!')
+
+    def test9_concurrent_requests(self):
+        """Verify that requests run concurrently on the one connection."""
+
+        connection = self._connection()
+
+        start = time()
+        requests = [connection.execute(_python('import time; time.sleep(1)')) for _ in range(5)]
+
+        for request in requests:
+            self.assertEqual(request.result(30)[0], 0)
+
+        self.assertLess(time() - start, 4)
+
+class AgentChannelTests_Negative(_AgentChannelTestCase):
+    """Negative tests for the AgentServer and AgentConnection classes in the agent_channel
+    module with the AgentSession of the agent."""
+
+    def test1_exec_timeout(self):
+        """Verify that a command that runs past its timeout is killed with the children it
+        started and reported as timed out."""
+
+        marker = join(self.temp_dir, 'marker.txt')
+        code = ('import subprocess, sys, time; subprocess.Popen([sys.executable, \'-c\', '
+                '\\"import time; time.sleep(2); open(r\'{0}\', \'w\')\\"]); '
+                'time.sleep(30)').format(marker)
+
+        start = time()
+        request = self._connection().execute(_python(code), timeout=1)
+
+        with self.assertRaises(AgentError) as cm:
+            request.result(20)
+
+        self.assertLess(time() - start, 10)
+        self.assertTrue(request.timed_out)
+        self.assertEqual(cm.exception.msg, 'The request "1" timed out! The command timed out '
+                                           'after 1 seconds!')
+
+        #The child would have written the marker by now had it survived the kill.
+        sleep(3)
+
+        self.assertFalse(isfile(marker))
+
+    def test2_wrong_token(self):
+        """Verify that an agent that doesn't know the token is dropped."""
+
+        self._connect_agent('intruder', 'guess')
+
+        with self.assertRaises(AgentError) as cm:
+            self.server.get('intruder', timeout=1)
+
+        self.assertEqual(cm.exception.msg, 'The agent "intruder" is not connected!')
+
+    def test3_no_token(self):
+        """Attempt to start a server without a token."""
+
+        with self.assertRaises(AgentError) as cm:
+            AgentServer('127.0.0.1', '', port=0)
+
+        self.assertEqual(cm.exception.msg, 'A token is required to accept agents!')
+
+    def test4_pull_missing_file(self):
+        """Verify that a failed request is reported with the error of the agent."""
+
+        missing = join(self.temp_dir, 'missing.bin')
+
+        exit_code, message = self._connection().pull(missing, BytesIO()).result(10)
+
+        self.assertEqual(exit_code, 1)
+        self.assertIn(missing, message)
+
+    def test5_lost_connection(self):
+        """Verify that requests fail when the agent disconnects and no more can be sent."""
+
+        sock = self._connect_agent()
+        connection = self.server.get('agent1', timeout=10)
+        request = connection.execute(_python('import time; time.sleep(30)'))
+
+        sock.shutdown(socket.SHUT_RDWR)
+
+        with self.assertRaises(AgentError):
+            request.result(10)
+
+        with self.assertRaises(AgentError) as cm:
+            connection.request('Ping', {})
+
+        self.assertEqual(cm.exception.msg, 'The connection to the agent "agent1" is closed!')
+
+    def test6_push_missing_file(self):
+        """Verify that a push of a local file that doesn't exist is cancelled."""
+
+        connection = self._connection()
+        missing = join(self.temp_dir, 'missing.bin')
+
+        with self.assertRaises(AgentError) as cm:
+            connection.push(missing, join(self.temp_dir, 'pushed.bin'))
+
+        self.assertTrue(cm.exception.msg.startswith('Failed to read "{0}"!'.format(missing)))
+        self.assertEqual(connection.request('Ping', {}).result(10), (0, ''))
+
+    def test7_exec_missing_working_dir(self):
+        """Verify that a command that can't be started is reported and can still be followed by
+        other requests."""
+
+        connection = self._connection()
+        missing = join(self.temp_dir, 'missing')
+
+        exit_code, message = connection.execute(_python('pass'), working_dir=missing).result(10)
+
+        self.assertEqual(exit_code, 1)
+        self.assertIn(missing, message)
+        self.assertEqual(connection.request('Ping', {}).result(10), (0, ''))
+
+    def test8_oversized_greeting(self):
+        """Verify that an agent announcing a greeting too large to be one is dropped before the
+        greeting is read."""
+
+        sock = self._raw_socket()
+        sock.sendall(HEADER.pack(2 ** 31) + 'x' * 10)
+
+        self.assertTrue(self._dropped(sock))
+
+    def test9_slow_greeting(self):
+        """Verify that an agent trickling its greeting is dropped once the greeting timeout has
+        passed, even though every read returns some bytes."""
+
+        with patch('core.agent_channel.GREETING_TIMEOUT', 1):
+            sock = self._raw_socket()
+            sock.sendall(HEADER.pack(100))
+            start = time()
+
+            try:
+                while time() - start < 4:
+                    sock.sendall(' ')
+                    sleep(0.2)
+            except socket.error:
+                pass
+
+            self.assertTrue(self._dropped(sock))
+            self.assertLess(time() - start, 4)
+
+    def test10_name_not_string(self):
+        """Verify that an agent announcing a name that isn't a string is dropped even with the
+        right token."""
+
+        sock = self._raw_socket()
+        send_message(sock, Lock(), {'name': ['agent1'], 'token': 'secret'})
+
+        self.assertTrue(self._dropped(sock))
+        self.assertEqual(self.server.agents, [])
@@ -0,0 +1,168 @@
+"""
+.. module:: artifact_cache_test
+   :platform: Linux, Windows
+   :synopsis: Unit tests for the artifact_cache module.
+   :license: BSD, see LICENSE for more details.
+
+.. moduleauthor:: Caleb Moniot <cmoniot@gmail.com>
+"""
+__version__ = 0.1
+
+#===================================================================================================
+# Imports
+#===================================================================================================
+import shutil
+from zipfile import ZipFile
+from tempfile import mkdtemp
+from os import makedirs, listdir
+from os.path import join, isdir, isfile, basename, dirname
+from unittest import TestCase
+from core.artifact_cache import LocalArtifactCache, CacheError, write_archive, ARCHIVE_SUFFIX
+
+#===================================================================================================
+# Functions
+#===================================================================================================
+def _write_file(path, content):
+    """Write a file and any missing parent directories."""
+
+    if not isdir(dirname(path)):
+        makedirs(dirname(path))
+
+    with open(path, 'wb') as file_handle:
+        file_handle.write(content)
+
+#===================================================================================================
+# Tests
+#===================================================================================================
+class LocalArtifactCacheTests(TestCase):
+    """Tests for the LocalArtifactCache class in the artifact_cache module."""
+
+    def setUp(self):
+        self.temp_dir = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+
+        self.source = join(self.temp_dir, 'tool')
+        _write_file(join(self.source, 'bin', 'tool.exe'), 'binary')
+        _write_file(join(self.source, 'readme.txt'), 'text')
+        makedirs(join(self.source, 'empty'))
+
+        self.cache = LocalArtifactCache(join(self.temp_dir, 'cache'))
+
+    def test1_store_file(self):
+        """Verify that a file is stored under its digest with its original name."""
+
+        digest, cached_path = self.cache.store(join(self.source, 'readme.txt'))
+
+        self.assertEqual(cached_path, join(self.cache.root, digest, 'readme.txt'))
+        self.assertTrue(self.cache.contains(digest))
+
+        with open(cached_path, 'rb') as cached_file:
+            self.assertEqual(cached_file.read(), 'text')
+
+    def test2_store_directory(self):
+        """Verify that a directory tree is stored with its empty directories."""
+
+        digest, cached_path = self.cache.store(self.source)
+
+        self.assertEqual(basename(cached_path), 'tool')
+        self.assertTrue(isfile(join(cached_path, 'bin', 'tool.exe')))
+        self.assertTrue(isdir(join(cached_path, 'empty')))
+
+    def test3_store_same_bytes_once(self):
+        """Verify that storing the same bytes twice reuses the first entry."""
+
+        copy = join(self.temp_dir, 'copy', 'tool')
+        shutil.copytree(self.source, copy)
+
+        first = self.cache.store(self.source)
+        second = self.cache.store(copy)
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(listdir(self.cache.root)), 1)
+
+    def test4_changed_bytes_new_entry(self):
+        """Verify that a changed file is stored under a new digest."""
+
+        first_digest, _ = self.cache.store(self.source)
+
+        _write_file(join(self.source, 'readme.txt'), 'changed')
+
+        second_digest, _ = self.cache.store(self.source)
+
+        self.assertNotEqual(first_digest, second_digest)
+        self.assertTrue(self.cache.contains(first_digest))
+        self.assertTrue(self.cache.contains(second_digest))
+
+    def test5_store_archive(self):
+        """Verify that an archive holds the contents of the directory and doesn't collide with a
+        plain copy of the same directory."""
+
+        digest, _ = self.cache.store(self.source)
+        key, archive_path = self.cache.store_archive(self.source)
+
+        self.assertEqual(key, digest + ARCHIVE_SUFFIX)
+        self.assertEqual(basename(archive_path), 'tool' + ARCHIVE_SUFFIX)
+
+        with ZipFile(archive_path) as archive:
+            names = sorted(archive.namelist())
+
+        self.assertEqual(names, ['bin/tool.exe', 'empty/', 'readme.txt'])
+
+    def test6_no_partial_entries_left(self):
+        """Verify that no partial entries are left behind after storing."""
+
+        self.cache.store(self.source)
+        self.cache.store_archive(self.source)
+
+        self.assertEqual([name for name in listdir(self.cache.root) if name.endswith('.part')], [])
+
+class LocalArtifactCacheTests_Negative(TestCase):
+    """Negative tests for the LocalArtifactCache class in the artifact_cache module."""
+
+    def setUp(self):
+        self.temp_dir = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+
+        self.cache = LocalArtifactCache(join(self.temp_dir, 'cache'))
+
+    def test1_store_missing_path(self):
+        """Attempt to store a path that doesn't exist."""
+
+        missing = join(self.temp_dir, 'missing')
+
+        with self.assertRaises(CacheError) as cm:
+            self.cache.store(missing)
+
+        self.assertEqual(cm.exception.msg,
+                         'The file/directory "{0}" does not exist!'.format(missing))
+
+    def test2_archive_file(self):
+        """Attempt to store a file as an archive."""
+
+        path = join(self.temp_dir, 'file.txt')
+        _write_file(path, 'text')
+
+        with self.assertRaises(CacheError) as cm:
+            self.cache.store_archive(path)
+
+        self.assertEqual(cm.exception.msg, 'The directory "{0}" does not exist!'.format(path))
+
+class WriteArchiveTests(TestCase):
+    """Tests for the write_archive function in the artifact_cache module."""
+
+    def setUp(self):
+        self.temp_dir = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+
+    def test1_rename_file(self):
+        """Verify that a single file can be archived under another name."""
+
+        path = join(self.temp_dir, 'file.txt')
+        target = join(self.temp_dir, 'file.zip')
+        _write_file(path, 'text')
+
+        write_archive(path, target, 'renamed.txt')
+
+        with ZipFile(target) as archive:
+            self.assertEqual(archive.namelist(), ['renamed.txt'])
+            self.assertEqual(archive.read('renamed.txt'), 'text')
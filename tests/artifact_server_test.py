@@ -0,0 +1,182 @@
+"""
+.. module:: artifact_server_test
+   :platform: Linux, Windows
+   :synopsis: Unit tests for the artifact_server module.
+   :license: BSD, see LICENSE for more details.
+
+.. moduleauthor:: Caleb Moniot <cmoniot@gmail.com>
+"""
+__version__ = 0.1
+
+#===================================================================================================
+# Imports
+#===================================================================================================
+import json
+import shutil
+from httplib import HTTPConnection
+from tempfile import mkdtemp
+from os import makedirs
+from os.path import join, isdir, dirname
+from unittest import TestCase
+from util import file_digest, directory_digest
+from artifact_server import ArtifactServer, ArtifactServerError
+
+#===================================================================================================
+# Functions
+#===================================================================================================
+def _write_file(path, content):
+    """Write a file and any missing parent directories."""
+
+    if not isdir(dirname(path)):
+        makedirs(dirname(path))
+
+    with open(path, 'wb') as file_handle:
+        file_handle.write(content)
+
+#===================================================================================================
+# Tests
+#===================================================================================================
+class _ArtifactServerTestCase(TestCase):
+    """Base class for tests that make requests to an artifact server serving a temporary
+    directory."""
+
+    def setUp(self):
+        self.temp_dir = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+
+        self.tools_dir = join(self.temp_dir, 'tools')
+        self.content = ''.join(chr(index % 256) for index in range(1000))
+
+        _write_file(join(self.tools_dir, 'tool.bin'), self.content)
+        _write_file(join(self.tools_dir, 'sub dir', 'readme.txt'), 'text')
+
+        self.server = ArtifactServer({'tools': self.tools_dir}, 'localhost')
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+    def _request(self, path, headers=None, method='GET'):
+        """Make a request and return the status, headers and body of the response."""
+
+        connection = HTTPConnection('localhost', self.server.port, timeout=10)
+
+        try:
+            connection.request(method, path, headers=headers or {})
+            response = connection.getresponse()
+
+            return (response.status, dict(response.getheaders()), response.read())
+        finally:
+            connection.close()
+
+class ArtifactServerTests(_ArtifactServerTestCase):
+    """Tests for the ArtifactServer class in the artifact_server module."""
+
+    def test1_get_file(self):
+        """Verify that a file is served with its digest as a strong ETag."""
+
+        status, headers, body = self._request('/tools/tool.bin')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(body, self.content)
+        self.assertEqual(headers['etag'], '"{0}"'.format(file_digest(join(self.tools_dir,
+                                                                          'tool.bin'))))
+
+    def test2_not_modified(self):
+        """Verify that an unchanged file is not sent again."""
+
+        _, headers, _ = self._request('/tools/tool.bin')
+        status, _, body = self._request('/tools/tool.bin', {'If-None-Match': headers['etag']})
+
+        self.assertEqual(status, 304)
+        self.assertEqual(body, '')
+
+    def test3_byte_range(self):
+        """Verify that byte ranges are honoured to resume a download."""
+
+        status, headers, body = self._request('/tools/tool.bin', {'Range': 'bytes=100-199'})
+
+        self.assertEqual(status, 206)
+        self.assertEqual(body, self.content[100:200])
+        self.assertEqual(headers['content-range'], 'bytes 100-199/1000')
+
+    def test4_open_and_suffix_ranges(self):
+        """Verify that open ended and suffix byte ranges are honoured."""
+
+        self.assertEqual(self._request('/tools/tool.bin', {'Range': 'bytes=990-'})[2],
+                         self.content[990:])
+        self.assertEqual(self._request('/tools/tool.bin', {'Range': 'bytes=-10'})[2],
+                         self.content[-10:])
+
+    def test5_stale_if_range(self):
+        """Verify that the whole file is sent if the client has a different version of it."""
+
+        status, _, body = self._request('/tools/tool.bin', {'Range': 'bytes=100-199',
+                                                            'If-Range': '"stale"'})
+
+        self.assertEqual(status, 200)
+        self.assertEqual(body, self.content)
+
+    def test6_manifest(self):
+        """Verify that a directory is served as a manifest of its contents."""
+
+        status, headers, body = self._request('/tools')
+        manifest = json.loads(body)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(sorted(manifest['files']), ['sub dir/readme.txt', 'tool.bin'])
+        self.assertEqual(manifest['dirs'], ['sub dir'])
+        self.assertEqual(headers['etag'], '"{0}"'.format(directory_digest(self.tools_dir)))
+
+    def test7_quoted_path(self):
+        """Verify that URLs built by the server resolve to the artifact."""
+
+        url = self.server.url('tools', 'sub dir/readme.txt')
+
+        self.assertEqual(url, 'http://localhost:{0}/tools/sub%20dir/readme.txt'.format(
+            self.server.port))
+        self.assertEqual(self._request(url.split(str(self.server.port), 1)[1])[2], 'text')
+
+    def test8_head(self):
+        """Verify that a HEAD request describes the file without sending it."""
+
+        status, headers, body = self._request('/tools/tool.bin', method='HEAD')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['content-length'], '1000')
+        self.assertEqual(body, '')
+
+class ArtifactServerTests_Negative(_ArtifactServerTestCase):
+    """Negative tests for the ArtifactServer class in the artifact_server module."""
+
+    def test1_missing_file(self):
+        """Verify that a missing file is not found."""
+
+        self.assertEqual(self._request('/tools/missing.bin')[0], 404)
+
+    def test2_unknown_root(self):
+        """Verify that a root that isn't served is not found."""
+
+        self.assertEqual(self._request('/tests/test.py')[0], 404)
+
+    def test3_escape_root(self):
+        """Verify that a path can't escape its root."""
+
+        _write_file(join(self.temp_dir, 'secret.txt'), 'secret')
+
+        self.assertEqual(self._request('/tools/../secret.txt')[0], 404)
+        self.assertEqual(self._request('/tools/%2E%2E/secret.txt')[0], 404)
+
+    def test4_unsatisfiable_range(self):
+        """Verify that a range past the end of the file is rejected."""
+
+        status, headers, _ = self._request('/tools/tool.bin', {'Range': 'bytes=1000-'})
+
+        self.assertEqual(status, 416)
+        self.assertEqual(headers['content-range'], 'bytes */1000')
+
+    def test5_unknown_url_root(self):
+        """Verify that a URL can't be built for a root that isn't served."""
+
+        with self.assertRaises(ArtifactServerError) as cm:
+            self.server.url('tests', 'test.py')
+
+        self.assertEqual(cm.exception.msg, 'The root "tests" is not served!')
@@ -407,7 +407,52 @@ class ResourceConfigTests(TestCase):
         
         self.assertEqual(excep.msg, 'The extended config element "VagrantHypervisor" is required '
                                     'for the Vagrant template "BVT-2k3-R2-32"!')
-        
+
+class ResourceConfigLocalTests(TestCase):
+    """Tests for sandbox resources in the ResourceConfig class in the config module."""
+
+    @skipIf(SKIP_EVERYTHING, 'Skip if we are creating/modifying tests!')
+    def test1_happy_path_local(self):
+        """Happy path test to verify local sandbox SystemUnderTest machines are handled correct."""
+        from hypervisor import LocalMachine
+
+        test_config = ResourceConfig(r'configs/resource/happy_path_local.xml',
+                                     r'../src/bespoke/xsd/resource_config.xsd')
+
+        actual_vm_1 = test_config['Sandbox-1']
+
+        #VM1 Verification
+        self.assertEqual(actual_vm_1.alias, 'Sandbox-1')
+        self.assertEqual(actual_vm_1.network_address, 'localhost')
+        self.assertEqual(actual_vm_1.bespoke_root, '/opt/Bespoke/Sandboxes/Sandbox-1')
+        self.assertEqual(actual_vm_1.machine_type, 'static')
+        self.assertDictEqual(actual_vm_1.check_points, {'Clean': []})
+        self.assertTrue(actual_vm_1.is_sandbox)
+        self.assertIsInstance(actual_vm_1._machine, LocalMachine)
+        self.assertEqual(actual_vm_1._machine.sandbox, '/opt/Bespoke/Sandboxes/Sandbox-1')
+        self.assertEqual(actual_vm_1._machine.snapshot_root,
+                         '/opt/Bespoke/Sandboxes/Sandbox-1.snapshots')
+
+class ResourceConfigOperationLimitsTests(TestCase):
+    """Tests for the per-host operation limits in the ResourceConfig class in the config module."""
+
+    @skipIf(SKIP_EVERYTHING, 'Skip if we are creating/modifying tests!')
+    @patch('config.VBoxMachine')
+    def test1_happy_path_operation_limits(self, vbox_machine_mock):
+        """Happy path test to verify host operation limits are passed to the virtual machines."""
+
+        ResourceConfig(r'configs/resource/happy_path_operation_limits.xml',
+                       r'../src/bespoke/xsd/resource_config.xsd')
+
+        expected_limits = {'apply_snapshot':'2', 'start':'1', 'stop':None}
+        expected_timeouts = {'apply_snapshot':'600', 'start':None, 'stop':'60'}
+
+        self.assertEqual(vbox_machine_mock.call_count, 2)
+        for (args, kwargs) in vbox_machine_mock.call_args_list:
+            self.assertEqual(args[0], 'cornholio.fancylads.local')
+            self.assertDictEqual(kwargs['op_limits'], expected_limits)
+            self.assertDictEqual(kwargs['op_timeouts'], expected_timeouts)
+
 class TestPlanConfigTests(TestCase):
     """Tests for the TestPlanConfig class in the config module."""
     
@@ -714,4 +759,21 @@ class TestPlanConfigTests(TestCase):
         
         self.assertEqual(excep.msg, "Element 'Executable': '' is not a valid value of the atomic "
                                     "type 'nonEmptyString'. Line: 23 Column: 0")
+        
+    @skipIf(SKIP_EVERYTHING, 'Skip if we are creating/modifying tests!')
+    def test11_test_step_transfer_modes(self):
+        """Verify that the "Step" elements have the correct transfer mode for the test directory."""
+        
+        test_config = TestPlanConfig(r'configs/test_plan/happy_path.xml', 
+                                     r'../src/bespoke/xsd/test_plan.xsd',
+                                     self.builds,
+                                     self.tools,
+                                     self.resources)
+        
+        self.assertEqual(test_config['Happy_Test_Case_1']._tests[11]._transfer_mode, 
+                         'copy', 
+                         'Incorrect transfer mode!')
+        self.assertEqual(test_config['Happy_Test_Case_1']._tests[14]._transfer_mode, 
+                         'archive', 
+                         'Incorrect transfer mode!')
         
\ No newline at end of file
@@ -0,0 +1,835 @@
+"""
+.. module:: copy_sourcer_test
+   :platform: Linux, Windows
+   :synopsis: Unit tests for the copy_sourcer module. The HTTP and FTP tests run against servers
+       on the local machine so they can be ran in any environment.
+   :license: BSD, see LICENSE for more details.
+
+.. moduleauthor:: Caleb Moniot <cmoniot@gmail.com>
+"""
+__version__ = 0.1
+
+#===================================================================================================
+# Imports
+#===================================================================================================
+import io
+import shutil
+import socket
+import hashlib
+import posixpath
+from time import gmtime, strftime
+from threading import Thread
+from tempfile import mkdtemp
+from os import makedirs, listdir, utime, chmod, stat
+from os.path import join, isfile, isdir, dirname, getsize, getmtime
+from unittest import TestCase
+from mock import patch
+from SocketServer import ThreadingMixIn, ThreadingTCPServer, StreamRequestHandler
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SimpleHTTPServer import SimpleHTTPRequestHandler
+from artifact_server import ArtifactServer
+from core.copy_sourcer import CopyBasic, CopyHTTP, CopyFTP, CopyError, _HTTPConnectionPool, \
+_FTPSessionPool, PARTIAL_SUFFIX, VALIDATOR_SUFFIX, DOWNLOAD_RETRIES
+
+#===================================================================================================
+# Globals
+#===================================================================================================
+CONTENT = ''.join(chr(i % 256) for i in range(300 * 1024))
+MTIME = 1500000000
+
+#===================================================================================================
+# Classes
+#===================================================================================================
+class _StaticHandler(SimpleHTTPRequestHandler):
+    """A plain static file handler without range support that serves files from "root" and doesn't
+    log to the console."""
+
+    root = ''
+
+    def translate_path(self, path):
+        return join(self.root, path.split('?', 1)[0].lstrip('/'))
+
+    def log_message(self, format, *args):
+        pass
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class _TruncatingHandler(BaseHTTPRequestHandler):
+    """Serves "content" for any path with range support. The body of the first "truncated"
+    responses is cut off after 100 bytes like a server that dropped the connection. The offset of
+    every request is kept in "offsets"."""
+
+    content = ''
+    truncated = 0
+    offsets = []
+
+    def do_GET(self):
+        range_header = self.headers.getheader('Range')
+        offset = int(range_header[len('bytes='):].split('-')[0]) if range_header else 0
+        body = self.content[offset:]
+
+        _TruncatingHandler.offsets.append(offset)
+
+        self.send_response(206 if offset > 0 else 200)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', '"v1"')
+
+        if offset > 0:
+            self.send_header('Content-Range', 'bytes {0}-{1}/{2}'.format(offset,
+                                                                        len(self.content) - 1,
+                                                                        len(self.content)))
+        self.end_headers()
+
+        if _TruncatingHandler.truncated > 0:
+            _TruncatingHandler.truncated -= 1
+            body = body[:100]
+
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class _FTPHandler(StreamRequestHandler):
+    """A minimal passive mode FTP server that serves files from "root". Only the commands used by 
+    CopyFTP are implemented."""
+
+    root = ''
+    features = ('MDTM', 'MLST type*;size*;modify*;', 'REST STREAM', 'SIZE')
+
+    def _reply(self, line):
+        self.wfile.write(line + '\r\n')
+
+    def _local(self, path):
+        return join(self.root, *[p for p in posixpath.normpath(path).split('/') if p])
+
+    def _modify(self, local_path):
+        return strftime('%Y%m%d%H%M%S', gmtime(getmtime(local_path)))
+
+    def _transfer(self, data):
+        connection, _ = self.data_server.accept()
+        self.data_server.close()
+        self._reply('150 Opening data connection.')
+
+        try:
+            connection.sendall(data)
+            self._reply('226 Transfer complete.')
+        except socket.error:
+            self._reply('426 Connection closed; transfer aborted.')
+        finally:
+            connection.close()
+
+    def handle(self):
+        self.server.logins += 1
+        self._reply('220 Ready.')
+        rest = 0
+
+        while True:
+            line = self.rfile.readline().strip()
+
+            if not line:
+                return
+
+            command, _, arg = line.partition(' ')
+            command = command.upper()
+            self.server.commands.append(command)
+            local_path = self._local(arg)
+
+            if command == 'USER':
+                self._reply('331 Password required.')
+            elif command == 'PASS':
+                self._reply('230 Logged in.')
+            elif command in ('TYPE', 'NOOP'):
+                self._reply('200 OK.')
+            elif command == 'FEAT':
+                self._reply('211-Features:')
+
+                for feature in self.features:
+                    self._reply(' ' + feature)
+
+                self._reply('211 End')
+            elif command == 'SIZE' and isfile(local_path):
+                self._reply('213 {0}'.format(getsize(local_path)))
+            elif command == 'MDTM' and isfile(local_path):
+                self._reply('213 {0}'.format(self._modify(local_path)))
+            elif command == 'PWD':
+                self._reply('257 "/" is the current directory.')
+            elif command == 'CWD' and isdir(local_path):
+                self._reply('250 OK.')
+            elif command == 'PASV':
+                self.data_server = socket.socket()
+                self.data_server.bind(('127.0.0.1', 0))
+                self.data_server.listen(1)
+                port = self.data_server.getsockname()[1]
+                self._reply('227 Entering Passive Mode (127,0,0,1,{0},{1}).'.format(port // 256,
+                                                                                   port % 256))
+            elif command == 'REST':
+                rest = int(arg)
+                self._reply('350 Restarting at {0}.'.format(rest))
+            elif command == 'RETR' and isfile(local_path):
+                with open(local_path, 'rb') as local_file:
+                    local_file.seek(rest)
+                    rest = 0
+                    self._transfer(local_file.read())
+            elif command in ('MLSD', 'NLST') and isdir(local_path):
+                entries = []
+
+                for name in sorted(listdir(local_path)):
+                    full_path = join(local_path, name)
+
+                    if command == 'NLST':
+                        entries.append(name)
+                    elif isdir(full_path):
+                        entries.append('type=dir;modify={0}; {1}'.format(self._modify(full_path),
+                                                                         name))
+                    else:
+                        entries.append('type=file;size={0};modify={1}; {2}'.format(
+                            getsize(full_path), self._modify(full_path), name))
+
+                self._transfer(''.join(entry + '\r\n' for entry in entries))
+            elif command == 'QUIT':
+                self._reply('221 Bye.')
+                return
+            else:
+                self._reply('550 {0} failed.'.format(command))
+
+class _ShortWriteFile(object):
+    """A file that writes at most "limit" bytes at a time like an unbuffered file may."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.data = bytearray()
+
+    def seek(self, offset):
+        del self.data[offset:]
+
+    def write(self, data):
+        self.data.extend(data[:self.limit])
+
+        return min(len(data), self.limit)
+
+class _FTPServer(ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+#===================================================================================================
+# Tests
+#===================================================================================================
+class CopyBasicTests(TestCase):
+    """Tests for the CopyBasic class in the copy_sourcer module."""
+
+    def setUp(self):
+        self.source_dir = join(mkdtemp(), 'tools')
+        self.target_dir = join(mkdtemp(), 'tools')
+
+        makedirs(join(self.source_dir, 'sub'))
+        makedirs(join(self.source_dir, 'empty'))
+
+        for name in ('a.py', 'b.py', join('sub', 'c.py')):
+            with open(join(self.source_dir, name), 'w') as test_file:
+                test_file.write(name * 100)
+
+    def tearDown(self):
+        shutil.rmtree(dirname(self.source_dir), ignore_errors=True)
+        shutil.rmtree(dirname(self.target_dir), ignore_errors=True)
+
+    def _assert_same_tree(self):
+        for name in ('a.py', 'b.py', join('sub', 'c.py')):
+            with open(join(self.source_dir, name)) as source_file:
+                with open(join(self.target_dir, name)) as target_file:
+                    self.assertEqual(source_file.read(), target_file.read())
+
+        self.assertTrue(isdir(join(self.target_dir, 'empty')))
+
+    def test1_copy_directory(self):
+        """Verify that a directory is copied and the bytes copied are reported."""
+
+        copier = CopyBasic(self.source_dir, self.target_dir)
+        copier.copy()
+
+        self.assertTrue(copier.was_copied)
+        self.assertEqual(copier.bytes_copied, 2 * 400 + 800)
+        self._assert_same_tree()
+
+    def test2_mirror_directory(self):
+        """Verify that mirror mode only copies changed files and removes stale files."""
+
+        CopyBasic(self.source_dir, self.target_dir, mirror=True).copy()
+
+        with open(join(self.source_dir, 'a.py'), 'w') as test_file:
+            test_file.write('changed')
+
+        shutil.rmtree(join(self.source_dir, 'sub'))
+
+        with open(join(self.target_dir, 'stale.py'), 'w') as test_file:
+            test_file.write('stale')
+
+        copier = CopyBasic(self.source_dir, self.target_dir, mirror=True)
+        copier.copy()
+
+        self.assertEqual(copier.bytes_copied, len('changed'))
+        self.assertFalse(isfile(join(self.target_dir, 'stale.py')))
+        self.assertFalse(isdir(join(self.target_dir, 'sub')))
+
+        with open(join(self.target_dir, 'a.py')) as test_file:
+            self.assertEqual(test_file.read(), 'changed')
+
+    def test3_mirror_directory_digests(self):
+        """Verify that mirror mode with digests copies a changed file with the same size and time.
+        """
+
+        CopyBasic(self.source_dir, self.target_dir, mirror=True).copy()
+
+        with open(join(self.target_dir, 'b.py'), 'w') as test_file:
+            test_file.write('x' * 400)
+
+        utime(join(self.target_dir, 'b.py'), (getmtime(join(self.source_dir, 'b.py')),) * 2)
+
+        copier = CopyBasic(self.source_dir, self.target_dir, mirror=True)
+        copier.copy()
+        self.assertEqual(copier.bytes_copied, 0)
+
+        copier = CopyBasic(self.source_dir, self.target_dir, mirror=True, compare_digests=True)
+        copier.copy()
+        self.assertEqual(copier.bytes_copied, 400)
+        self._assert_same_tree()
+
+    def test4_copy_directory_parallel(self):
+        """Verify that a tree of many files is copied by several workers with its metadata."""
+
+        for i in range(200):
+            path = join(self.source_dir, 'many', str(i % 7), '{0}.txt'.format(i))
+
+            if not isdir(dirname(path)):
+                makedirs(dirname(path))
+
+            with open(path, 'w') as test_file:
+                test_file.write(str(i))
+
+            utime(path, (MTIME + i, MTIME + i))
+
+        chmod(join(self.source_dir, 'a.py'), 0o500)
+        utime(join(self.source_dir, 'many'), (MTIME, MTIME))
+
+        CopyBasic(self.source_dir, self.target_dir, max_concurrent=4).copy()
+
+        self._assert_same_tree()
+        self.assertEqual(stat(join(self.target_dir, 'a.py')).st_mode & 0o777, 0o500)
+        self.assertEqual(int(getmtime(join(self.target_dir, 'many'))), MTIME)
+
+        for i in range(200):
+            path = join(self.target_dir, 'many', str(i % 7), '{0}.txt'.format(i))
+
+            with open(path) as test_file:
+                self.assertEqual(test_file.read(), str(i))
+
+            self.assertEqual(int(getmtime(path)), MTIME + i)
+
+    def test5_copy_large_file(self):
+        """Verify that a large file is copied by the kernel and the throughput is reported."""
+
+        source = join(self.source_dir, 'disk.img')
+        target = join(self.target_dir, 'images', 'disk.img')
+
+        with open(source, 'wb') as image_file:
+            image_file.write(CONTENT * 10)
+
+        with patch('core.copy_sourcer.LARGE_FILE_SIZE', len(CONTENT)):
+            copier = CopyBasic(source, target)
+            copier.copy()
+
+        self.assertEqual(copier.bytes_copied, len(CONTENT) * 10)
+        self.assertGreater(copier.throughput, 0)
+
+        with open(target, 'rb') as image_file:
+            self.assertEqual(image_file.read(), CONTENT * 10)
+
+    def test6_copy_large_file_buffered(self):
+        """Verify that a large file is copied through a buffer if the kernel can't copy it."""
+
+        source = join(self.source_dir, 'disk.img')
+        target = join(self.target_dir, 'disk.img')
+
+        with open(source, 'wb') as image_file:
+            image_file.write(CONTENT * 10)
+
+        with patch.multiple('core.copy_sourcer', 
+                            LARGE_FILE_SIZE=len(CONTENT), 
+                            LARGE_COPY_BUFFER=len(CONTENT) - 1,
+                            _libc=None, 
+                            fcntl=None):
+            CopyBasic(source, target).copy()
+
+        with open(target, 'rb') as image_file:
+            self.assertEqual(image_file.read(), CONTENT * 10)
+
+    def test7_copy_short_writes(self):
+        """Verify that the buffered copy keeps writing until every byte of a chunk is written."""
+
+        target_file = _ShortWriteFile(1000)
+
+        with patch('core.copy_sourcer.LARGE_COPY_BUFFER', 64 * 1024):
+            CopyBasic('', '')._buffered_copy(io.BytesIO(CONTENT), target_file, 0)
+
+        self.assertEqual(str(target_file.data), CONTENT)
+
+class CopyHTTPTests(TestCase):
+    """Tests for the CopyHTTP class in the copy_sourcer module."""
+
+    def setUp(self):
+        self.source_dir = mkdtemp()
+        self.target_dir = mkdtemp()
+
+        with open(join(self.source_dir, 'tool.bin'), 'wb') as tool_file:
+            tool_file.write(CONTENT)
+
+        makedirs(join(self.source_dir, 'tests', 'sub'))
+        makedirs(join(self.source_dir, 'tests', 'empty'))
+
+        for name in ('a.py', 'b.py', join('sub', 'c.py')):
+            with open(join(self.source_dir, 'tests', name), 'w') as test_file:
+                test_file.write(name * 100)
+
+        self.artifact_server = ArtifactServer({'tools': self.source_dir}, 'localhost')
+        self.artifact_server.start()
+        self.pool = _HTTPConnectionPool()
+
+    def tearDown(self):
+        self.pool.close()
+        self.artifact_server.stop()
+        shutil.rmtree(self.source_dir, ignore_errors=True)
+        shutil.rmtree(self.target_dir, ignore_errors=True)
+
+    def _copy(self, source, destination, **kwargs):
+        return CopyHTTP(source,
+                        destination,
+                        'localhost',
+                        self.artifact_server.port,
+                        pool=self.pool,
+                        **kwargs)
+
+    def test1_copy_file_plain_http_server(self):
+        """Verify that a file can be copied from a plain HTTP server."""
+
+        _StaticHandler.root = self.source_dir
+        server = _ThreadingHTTPServer(('localhost', 0), _StaticHandler)
+        thread = Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        try:
+            target = join(self.target_dir, 'tool.bin')
+            copier = CopyHTTP('/tool.bin', target, 'localhost', server.server_address[1],
+                              pool=self.pool)
+            copier.copy()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertTrue(copier.was_copied)
+
+        with open(target, 'rb') as target_file:
+            self.assertEqual(target_file.read(), CONTENT)
+
+    def test2_copy_file_checksum(self):
+        """Verify that a file with a matching checksum is copied."""
+
+        target = join(self.target_dir, 'nested', 'tool.bin')
+
+        self._copy('/tools/tool.bin', target, checksum=hashlib.sha1(CONTENT).hexdigest()).copy()
+
+        with open(target, 'rb') as target_file:
+            self.assertEqual(target_file.read(), CONTENT)
+
+    def test3_resume_partial_download(self):
+        """Verify that a partial download is resumed rather than fetched again."""
+
+        target = join(self.target_dir, 'tool.bin')
+        copier = self._copy('/tools/tool.bin', target)
+
+        #Learn the ETag the server uses for the file.
+        connection, response = copier._request('/tools/tool.bin', {})
+        response.read()
+        etag = response.getheader('ETag')
+        connection.close()
+
+        #Mark the partial file so it is obvious that only the remainder was fetched.
+        with open(target + PARTIAL_SUFFIX, 'wb') as partial_file:
+            partial_file.write('X' * 1000)
+
+        with open(target + PARTIAL_SUFFIX + VALIDATOR_SUFFIX, 'w') as validator_file:
+            validator_file.write(etag)
+
+        copier.copy()
+
+        with open(target, 'rb') as target_file:
+            self.assertEqual(target_file.read(), 'X' * 1000 + CONTENT[1000:])
+
+        self.assertFalse(isfile(target + PARTIAL_SUFFIX))
+        self.assertFalse(isfile(target + PARTIAL_SUFFIX + VALIDATOR_SUFFIX))
+
+    def test4_copy_directory(self):
+        """Verify that a directory can be copied concurrently using the directory manifest."""
+
+        target = join(self.target_dir, 'tests')
+
+        self._copy('/tools/tests/', target, max_concurrent=3).copy()
+
+        for name in ('a.py', 'b.py', join('sub', 'c.py')):
+            with open(join(target, name)) as test_file:
+                self.assertEqual(test_file.read(), name * 100)
+
+        self.assertTrue(isfile(join(target, 'sub', 'c.py')))
+
+    def test5_connection_reuse(self):
+        """Verify that consecutive copies from the same server reuse the keep-alive connection."""
+
+        self._copy('/tools/tool.bin', join(self.target_dir, '1.bin')).copy()
+        first = self.pool.acquire('localhost', self.artifact_server.port)
+        self.pool.release('localhost', self.artifact_server.port, first)
+
+        self._copy('/tools/tool.bin', join(self.target_dir, '2.bin')).copy()
+        second = self.pool.acquire('localhost', self.artifact_server.port)
+
+        self.assertIs(first, second)
+
+    def test6_resume_truncated_response(self):
+        """Verify that a response that ends before its Content-Length is resumed."""
+
+        _TruncatingHandler.content = CONTENT[:1000]
+        _TruncatingHandler.truncated = 1
+        _TruncatingHandler.offsets = []
+        server = _ThreadingHTTPServer(('localhost', 0), _TruncatingHandler)
+        thread = Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        try:
+            target = join(self.target_dir, 'tool.bin')
+            CopyHTTP('/tool.bin', target, 'localhost', server.server_address[1],
+                     pool=self.pool).copy()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        with open(target, 'rb') as target_file:
+            self.assertEqual(target_file.read(), CONTENT[:1000])
+
+        self.assertEqual(_TruncatingHandler.offsets, [0, 100])
+        self.assertFalse(isfile(target + PARTIAL_SUFFIX))
+
+    def test7_copy_directory_without_slash(self):
+        """Verify that a source path without a trailing "/" is copied as a directory if the server
+        reports it as one."""
+
+        target = join(self.target_dir, 'tests')
+
+        self._copy('/tools/tests', target).copy()
+
+        for name in ('a.py', 'b.py', join('sub', 'c.py')):
+            with open(join(target, name)) as test_file:
+                self.assertEqual(test_file.read(), name * 100)
+
+class CopyHTTPTests_Negative(TestCase):
+    """Negative tests for the CopyHTTP class in the copy_sourcer module."""
+
+    def setUp(self):
+        self.source_dir = mkdtemp()
+        self.target_dir = mkdtemp()
+
+        with open(join(self.source_dir, 'tool.bin'), 'wb') as tool_file:
+            tool_file.write(CONTENT)
+
+        self.artifact_server = ArtifactServer({'tools': self.source_dir}, 'localhost')
+        self.artifact_server.start()
+        self.pool = _HTTPConnectionPool()
+
+    def tearDown(self):
+        self.pool.close()
+        self.artifact_server.stop()
+        shutil.rmtree(self.source_dir, ignore_errors=True)
+        shutil.rmtree(self.target_dir, ignore_errors=True)
+
+    def test1_checksum_mismatch(self):
+        """Verify that a file with the wrong checksum is rejected and not left behind."""
+
+        target = join(self.target_dir, 'tool.bin')
+        copier = CopyHTTP('/tools/tool.bin', target, 'localhost', self.artifact_server.port,
+                          checksum='0' * 40, pool=self.pool)
+
+        with self.assertRaises(CopyError):
+            copier.copy()
+
+        self.assertFalse(copier.was_copied)
+        self.assertFalse(isfile(target))
+        self.assertFalse(isfile(target + PARTIAL_SUFFIX))
+
+    def test2_missing_file(self):
+        """Verify that a missing file is reported."""
+
+        copier = CopyHTTP('/tools/missing.bin', join(self.target_dir, 'missing.bin'), 'localhost',
+                          self.artifact_server.port, pool=self.pool)
+
+        with self.assertRaises(CopyError) as cm:
+            copier.copy()
+
+        self.assertIn('Status: 404', cm.exception.msg)
+
+    def test3_stale_partial_download(self):
+        """Verify that a partial download of an older version of the file is discarded."""
+
+        target = join(self.target_dir, 'tool.bin')
+
+        with open(target + PARTIAL_SUFFIX, 'wb') as partial_file:
+            partial_file.write('X' * 1000)
+
+        with open(target + PARTIAL_SUFFIX + VALIDATOR_SUFFIX, 'w') as validator_file:
+            validator_file.write('"stale"')
+
+        CopyHTTP('/tools/tool.bin', target, 'localhost', self.artifact_server.port,
+                 pool=self.pool).copy()
+
+        with open(target, 'rb') as target_file:
+            self.assertEqual(target_file.read(), CONTENT)
+
+    def test4_truncated_response(self):
+        """Verify that a file whose responses keep ending early is not saved as complete and the
+        partial download is kept."""
+
+        _TruncatingHandler.content = CONTENT[:1000]
+        _TruncatingHandler.truncated = DOWNLOAD_RETRIES
+        _TruncatingHandler.offsets = []
+        server = _ThreadingHTTPServer(('localhost', 0), _TruncatingHandler)
+        thread = Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        target = join(self.target_dir, 'tool.bin')
+        copier = CopyHTTP('/tool.bin', target, 'localhost', server.server_address[1],
+                          pool=self.pool)
+
+        try:
+            with self.assertRaises(CopyError) as cm:
+                copier.copy()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertIn('Received 300 of 1000 bytes.', cm.exception.msg)
+        self.assertFalse(copier.was_copied)
+        self.assertFalse(isfile(target))
+        self.assertEqual(getsize(target + PARTIAL_SUFFIX), 300)
+
+class CopyFTPTests(TestCase):
+    """Tests for the CopyFTP class in the copy_sourcer module."""
+
+    def setUp(self):
+        self.source_dir = mkdtemp()
+        self.target_dir = mkdtemp()
+
+        with open(join(self.source_dir, 'tool.bin'), 'wb') as tool_file:
+            tool_file.write(CONTENT)
+
+        makedirs(join(self.source_dir, 'tests', 'sub'))
+        makedirs(join(self.source_dir, 'tests', 'empty'))
+
+        for name in ('a.py', 'b.py', join('sub', 'c.py')):
+            with open(join(self.source_dir, 'tests', name), 'w') as test_file:
+                test_file.write(name * 100)
+
+            utime(join(self.source_dir, 'tests', name), (MTIME, MTIME))
+
+        _FTPHandler.root = self.source_dir
+        _FTPHandler.features = ('MDTM', 'MLST type*;size*;modify*;', 'REST STREAM', 'SIZE')
+        self.server = _FTPServer(('127.0.0.1', 0), _FTPHandler)
+        self.server.logins = 0
+        self.server.commands = []
+        self.thread = Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.pool = _FTPSessionPool()
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.source_dir, ignore_errors=True)
+        shutil.rmtree(self.target_dir, ignore_errors=True)
+
+    def _copy(self, source, destination, **kwargs):
+        return CopyFTP(source,
+                       destination,
+                       '127.0.0.1',
+                       self.server.server_address[1],
+                       'user',
+                       'password',
+                       pool=self.pool,
+                       **kwargs)
+
+    def test1_copy_file(self):
+        """Verify that a file can be copied and is given the modification time of the source."""
+
+        target = join(self.target_dir, 'nested', 'tool.bin')
+        copier = self._copy('/tool.bin', target)
+        copier.copy()
+
+        self.assertTrue(copier.was_copied)
+        self.assertEqual(int(getmtime(target)), int(getmtime(join(self.source_dir, 'tool.bin'))))
+
+        with open(target, 'rb') as target_file:
+            self.assertEqual(target_file.read(), CONTENT)
+
+    def test2_copy_file_segmented(self):
+        """Verify that a large file is downloaded in parallel segments."""
+
+        target = join(self.target_dir, 'tool.bin')
+
+        self._copy('/tool.bin', target, segment_size=64 * 1024, max_concurrent=3).copy()
+
+        with open(target, 'rb') as target_file:
+            self.assertEqual(target_file.read(), CONTENT)
+
+        self.assertEqual(self.server.commands.count('REST'), 3)
+        self.assertFalse(isfile(target + PARTIAL_SUFFIX))
+
+    def test3_copy_directory(self):
+        """Verify that a directory tree is mirrored and unchanged files are skipped."""
+
+        target = join(self.target_dir, 'tests')
+
+        self._copy('/tests/', target, max_concurrent=2).copy()
+
+        for name in ('a.py', 'b.py', join('sub', 'c.py')):
+            with open(join(target, name)) as test_file:
+                self.assertEqual(test_file.read(), name * 100)
+
+        self.assertTrue(isdir(join(target, 'empty')))
+
+        #Only the file that changed on the server is copied again.
+        with open(join(self.source_dir, 'tests', 'a.py'), 'w') as test_file:
+            test_file.write('changed')
+
+        self.server.commands = []
+        self._copy('/tests/', target, max_concurrent=2).copy()
+
+        self.assertEqual(self.server.commands.count('RETR'), 1)
+
+        with open(join(target, 'a.py')) as test_file:
+            self.assertEqual(test_file.read(), 'changed')
+
+    def test4_copy_directory_without_mlsd(self):
+        """Verify that a directory tree is mirrored from a server that doesn't support MLSD."""
+
+        _FTPHandler.features = ('REST STREAM', 'SIZE')
+        target = join(self.target_dir, 'tests')
+
+        self._copy('/tests/', target).copy()
+
+        for name in ('a.py', 'b.py', join('sub', 'c.py')):
+            with open(join(target, name)) as test_file:
+                self.assertEqual(test_file.read(), name * 100)
+
+        self.assertNotIn('MLSD', self.server.commands)
+
+    def test5_resume_partial_download(self):
+        """Verify that a partial download of the same version of the file is resumed."""
+
+        target = join(self.target_dir, 'tool.bin')
+        modify = int(getmtime(join(self.source_dir, 'tool.bin')))
+
+        with open(target + PARTIAL_SUFFIX, 'wb') as partial_file:
+            partial_file.write('X' * 1000)
+
+        with open(target + PARTIAL_SUFFIX + VALIDATOR_SUFFIX, 'w') as validator_file:
+            validator_file.write('{0} {1}'.format(len(CONTENT), modify))
+
+        self._copy('/tool.bin', target).copy()
+
+        with open(target, 'rb') as target_file:
+            self.assertEqual(target_file.read(), 'X' * 1000 + CONTENT[1000:])
+
+        self.assertFalse(isfile(target + PARTIAL_SUFFIX + VALIDATOR_SUFFIX))
+
+    def test6_session_reuse(self):
+        """Verify that consecutive copies from the same server reuse the logged-in session."""
+
+        self._copy('/tool.bin', join(self.target_dir, '1.bin')).copy()
+        self._copy('/tool.bin', join(self.target_dir, '2.bin')).copy()
+
+        self.assertEqual(self.server.logins, 1)
+        self.assertEqual(self.server.commands.count('PASS'), 1)
+
+    def test7_aborted_segments_discarded(self):
+        """Verify that sessions whose segment aborted the transfer aren't returned to the pool."""
+
+        target = join(self.target_dir, 'tool.bin')
+
+        self._copy('/tool.bin', target, segment_size=64 * 1024, max_concurrent=3).copy()
+
+        #Only the session that read the last segment to the end of the file can be reused.
+        self.assertEqual(sum(len(sessions) for sessions in self.pool._idle.values()), 1)
+
+        self.server.commands = []
+        self._copy('/tool.bin', join(self.target_dir, '2.bin')).copy()
+
+        with open(join(self.target_dir, '2.bin'), 'rb') as target_file:
+            self.assertEqual(target_file.read(), CONTENT)
+
+        self.assertNotIn('PASS', self.server.commands)
+
+    def test8_copy_directory_without_slash(self):
+        """Verify that a relative source path without a trailing "/" is copied as a directory if
+        the server can change into it."""
+
+        target = join(self.target_dir, 'tests')
+
+        self._copy('tests', target).copy()
+
+        for name in ('a.py', 'b.py', join('sub', 'c.py')):
+            with open(join(target, name)) as test_file:
+                self.assertEqual(test_file.read(), name * 100)
+
+        self.assertNotIn('SIZE', self.server.commands)
+
+class CopyFTPTests_Negative(TestCase):
+    """Negative tests for the CopyFTP class in the copy_sourcer module."""
+
+    def setUp(self):
+        self.target_dir = mkdtemp()
+        _FTPHandler.root = self.target_dir
+        self.server = _FTPServer(('127.0.0.1', 0), _FTPHandler)
+        self.server.logins = 0
+        self.server.commands = []
+        self.thread = Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.target_dir, ignore_errors=True)
+
+    def test1_missing_file(self):
+        """Verify that a missing file is reported."""
+
+        copier = CopyFTP('/missing.bin', join(self.target_dir, 'out.bin'), '127.0.0.1',
+                         self.server.server_address[1], pool=_FTPSessionPool())
+
+        with self.assertRaises(CopyError) as cm:
+            copier.copy()
+
+        self.assertIn('missing.bin', cm.exception.msg)
+        self.assertFalse(copier.was_copied)
+
+    def test2_no_server(self):
+        """Verify that a server that can't be reached is reported."""
+
+        port = self.server.server_address[1]
+        self.server.shutdown()
+        self.server.server_close()
+
+        copier = CopyFTP('/tool.bin', join(self.target_dir, 'out.bin'), '127.0.0.1', port,
+                         pool=_FTPSessionPool(timeout=5))
+
+        with self.assertRaises(CopyError):
+            copier.copy()
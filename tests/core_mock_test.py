@@ -0,0 +1,1746 @@
+"""
+.. module:: core_mock_test
+   :platform: Linux, Windows
+   :synopsis: Unit tests for the core module with a mocked STAF handle.
+   :license: BSD, see LICENSE for more details.
+
+.. moduleauthor:: Caleb Moniot <cmoniot@gmail.com>
+"""
+__version__ = 0.1
+
+#===================================================================================================
+# Imports
+#===================================================================================================
+import os
+import json
+import shutil
+from time import sleep
+from zipfile import ZipFile
+from tempfile import mkdtemp
+from os import makedirs
+from os.path import join, isdir, isfile, dirname
+from threading import Lock, Thread, Event
+from unittest import TestCase
+from mock import patch, Mock
+from util import directory_manifest
+from config import ToolConfig
+from artifact_server import ArtifactServer
+from copy_sourcer_test import _FTPServer, _FTPHandler
+from core import BespokeGlobals, SystemUnderTest, TestPrep, TestStep, PowerControl, Tool, \
+BasicInstaller, FanOutStager, ArtifactPrefetcher, CoreError, _ResultsStreamer
+from core import TestCase as TestCase_
+from core.copy_sourcer import CopyError
+from core.transport import STAFTransport, LocalTransport, AgentTransport
+
+#===================================================================================================
+# Classes
+#===================================================================================================
+class _STAFResultStub(object):
+    """A stand-in for a STAF result."""
+
+    Ok = 0
+    NoPathToMachine = 16
+    DoesNotExist = 48
+
+    def __init__(self, rc=0, result='', resultObj=None):
+        self.rc = rc
+        self.result = result
+        self.resultObj = resultObj if resultObj is not None else result
+
+class _STAFHandleStub(object):
+    """A stand-in for a STAF handle that records every request. A request is answered by the first
+    rule whose service matches and whose prefix starts the request. A rule answers with a result
+    or a function that accepts the request and returns a result. Anything else succeeds."""
+
+    failed = False
+
+    def __init__(self, rules=None):
+        self.rules = list(rules or [])
+        self.requests = []
+
+    def submit(self, location, service, request):
+        self.requests.append((location, service, request))
+
+        for rule_service, prefix, answer in self.rules:
+            if rule_service == service and request.startswith(prefix):
+                return answer(request) if callable(answer) else answer
+
+        return _STAFResultStub()
+
+    def sent(self, service=None, prefix=''):
+        """The requests sent to a service that start with a prefix."""
+
+        return [request for _, request_service, request in self.requests
+                if service in (None, request_service) and request.startswith(prefix)]
+
+class _MachineStub(object):
+    """A stand-in for a virtual machine that does nothing."""
+
+    is_sandbox = False
+    last_progress = None
+
+    def stop(self):
+        pass
+
+    def restart(self):
+        pass
+
+    def shutdown(self, wait):
+        pass
+
+    def apply_snapshot(self, name):
+        pass
+
+    def cancel(self):
+        pass
+
+class _STAFHandlePoolStub(object):
+    """A stand-in for the STAF handle pool that always hands out the same handle."""
+
+    def __init__(self, staf_handle):
+        self.staf_handle = staf_handle
+        self.checked_out = 0
+
+    def checkout(self):
+        self.checked_out += 1
+
+        return self.staf_handle
+
+    def checkin(self, staf_handle, healthy=True):
+        self.checked_out -= 1
+        self.healthy = healthy
+
+class _ProcessStub(object):
+    """A stand-in for a process started by the process supervisor."""
+
+    def __init__(self, exit_code, output):
+        self._exit_code = exit_code
+        self._output = output
+
+    def result(self, timeout=None):
+        return (self._exit_code, self._output)
+
+class _ProcessSupervisorStub(object):
+    """A stand-in for the process supervisor that records every process request and ends every
+    process right away with the same exit code."""
+
+    def __init__(self, exit_code=0, output=''):
+        self.exit_code = exit_code
+        self.output = output
+        self.requests = []
+
+    def start(self, location, staf_request, wait):
+        self.requests.append((location, staf_request, wait))
+
+        return _ProcessStub(self.exit_code, self.output)
+
+#===================================================================================================
+# Functions
+#===================================================================================================
+def _write_file(path, content):
+    """Write a file and any missing parent directories."""
+
+    if not isdir(dirname(path)):
+        makedirs(dirname(path))
+
+    with open(path, 'wb') as file_handle:
+        file_handle.write(content)
+
+def _create_sut(alias='sut1', os='Windows'):
+    """Create a static SUT backed by a machine stub."""
+
+    return SystemUnderTest(alias,
+                           _MachineStub(),
+                           'C:/bespoke',
+                           {'Administrator': 'password'},
+                           'static',
+                           '10.0.0.1',
+                           os,
+                           'Windows 7',
+                           'x64',
+                           'client',
+                           {},
+                           [])
+
+class _CoreTestCase(TestCase):
+    """Base class for tests that run core tests against a mocked STAF handle with a temporary
+    local staging area."""
+
+    def setUp(self):
+        self.temp_dir = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+
+        for name in ('ABS_LOCAL_STAGING', 'ABS_LOCAL_TESTS', 'ABS_LOCAL_RESULTS'):
+            self.addCleanup(setattr, BespokeGlobals, name, getattr(BespokeGlobals, name))
+
+        BespokeGlobals.ABS_LOCAL_STAGING = join(self.temp_dir, 'staging')
+        BespokeGlobals.ABS_LOCAL_TESTS = join(self.temp_dir, 'tests')
+        BespokeGlobals.ABS_LOCAL_RESULTS = join(self.temp_dir, 'results')
+
+        self.sut = _create_sut()
+        self.staf_handle = _STAFHandleStub()
+
+    def _attach(self, test):
+        """Give a test the mocked STAF handle and a transport over it as if the handle was checked
+        out of the pool."""
+
+        test._staf_handle = self.staf_handle
+        test._transport = STAFTransport(self.sut.network_address,
+                                        self.staf_handle,
+                                        BespokeGlobals.PROCESS_SUPERVISOR)
+
+        return test
+
+#===================================================================================================
+# Tests
+#===================================================================================================
+class STAFHandleTests(_CoreTestCase):
+    """Tests for checking the STAF handle of a test out of the pool and returning it."""
+
+    def setUp(self):
+        super(STAFHandleTests, self).setUp()
+
+        self.pool = _STAFHandlePoolStub(self.staf_handle)
+
+        pool_patcher = patch.object(BespokeGlobals, 'STAF_HANDLE_POOL', self.pool)
+        pool_patcher.start()
+        self.addCleanup(pool_patcher.stop)
+
+        self.test = TestPrep('prep', self.sut, 10, 0)
+        self.test._init_staf_handle()
+
+    def test1_healthy(self):
+        """Verify that a handle that didn't raise a STAF error is pooled again."""
+
+        self.test._close_staf_handle()
+
+        self.assertTrue(self.pool.healthy)
+        self.assertEqual(self.pool.checked_out, 0)
+
+    def test2_failed(self):
+        """Verify that a handle that raised a STAF error is returned as unhealthy."""
+
+        self.staf_handle.failed = True
+
+        self.test._close_staf_handle()
+
+        self.assertFalse(self.pool.healthy)
+        self.assertEqual(self.test._staf_handle, None)
+
+    def test3_transport(self):
+        """Verify that the transport of the SUT is created once per checked out handle and other
+        machines are reached through STAF."""
+
+        transport = self.test._get_transport()
+
+        self.assertIsInstance(transport, STAFTransport)
+        self.assertIs(self.test._get_transport('10.0.0.1'), transport)
+        self.assertIsNot(self.test._get_transport('10.0.0.2'), transport)
+
+        self.test._close_staf_handle()
+
+        self.assertEqual(self.test._transport, None)
+
+    def test4_sandbox_transport(self):
+        """Verify that a sandbox SUT is reached through the local transport."""
+
+        self.test._close_staf_handle()
+        self.sut._machine.is_sandbox = True
+        self.test._init_staf_handle()
+
+        self.assertIsInstance(self.test._get_transport(), LocalTransport)
+        self.assertIsInstance(self.test._get_transport('10.0.0.2'), STAFTransport)
+
+    def test5_agent_transport(self):
+        """Verify that a SUT whose agent is connected under its alias or network address is
+        reached through the agent and other machines through STAF."""
+
+        for name in ('sut1', '10.0.0.1'):
+            self.test._close_staf_handle()
+
+            with patch.object(BespokeGlobals, 'AGENT_SERVER', Mock(agents=['other', name])):
+                self.test._init_staf_handle()
+
+            transport = self.test._get_transport()
+
+            self.assertIsInstance(transport, AgentTransport)
+            self.assertEqual(transport._name, name)
+            self.assertIsInstance(self.test._get_transport('10.0.0.2'), STAFTransport)
+
+    def test6_agent_not_connected(self):
+        """Verify that a SUT whose agent isn't connected is reached through STAF."""
+
+        self.test._close_staf_handle()
+
+        with patch.object(BespokeGlobals, 'AGENT_SERVER', Mock(agents=['other'])):
+            self.test._init_staf_handle()
+
+        self.assertIsInstance(self.test._get_transport(), STAFTransport)
+
+class CachedCopyTests(_CoreTestCase):
+    """Tests for copying artifacts into the artifact cache on the SUT."""
+
+    def setUp(self):
+        super(CachedCopyTests, self).setUp()
+
+        self.source = join(self.temp_dir, 'tool')
+        _write_file(join(self.source, 'tool.exe'), 'binary')
+
+        self.test = self._attach(TestPrep('prep', self.sut, 10, 0))
+
+    def test1_cache_hit(self):
+        """Verify that nothing is copied when the SUT already holds the artifact."""
+
+        self.staf_handle.rules.append(('fs', 'GET ENTRY', _STAFResultStub(result='D')))
+
+        remote_path = self.test._staf_cached_copy(self.source)
+
+        self.assertTrue(remote_path.startswith(join('C:/bespoke', BespokeGlobals.CACHE)))
+        self.assertEqual(len(self.staf_handle.requests), 1)
+
+    def test2_cache_miss(self):
+        """Verify that a missing artifact is copied to a partial entry and then published."""
+
+        self.staf_handle.rules.append(('fs', 'GET ENTRY',
+                                       _STAFResultStub(_STAFResultStub.DoesNotExist)))
+
+        remote_path = self.test._staf_cached_copy(self.source)
+        remote_entry = dirname(remote_path)
+        remote_partial = remote_entry + '.part'
+
+        requests = [request for _, _, request in self.staf_handle.requests]
+
+        self.assertEqual(len(requests), 4)
+        self.assertTrue(requests[1].startswith('DELETE ENTRY "{0}"'.format(remote_partial)))
+        self.assertTrue(requests[2].startswith('COPY DIRECTORY'))
+        self.assertIn('TODIRECTORY "{0}/tool"'.format(remote_partial), requests[2])
+        self.assertTrue(requests[3].startswith('MOVE DIRECTORY "{0}" TODIRECTORY "{1}"'.format(
+            remote_partial, remote_entry)))
+
+    def test3_same_bytes_same_entry(self):
+        """Verify that two copies of the same bytes are cached under the same entry."""
+
+        copy = join(self.temp_dir, 'copy', 'tool')
+        shutil.copytree(self.source, copy)
+
+        self.assertEqual(self.test._staf_cached_copy(self.source),
+                         self.test._staf_cached_copy(copy))
+
+class CachedCopyTests_Negative(_CoreTestCase):
+    """Negative tests for copying artifacts into the artifact cache on the SUT."""
+
+    def setUp(self):
+        super(CachedCopyTests_Negative, self).setUp()
+
+        self.source = join(self.temp_dir, 'tool')
+        _write_file(join(self.source, 'tool.exe'), 'binary')
+
+        self.test = self._attach(TestPrep('prep', self.sut, 10, 0))
+
+        self.staf_handle.rules.append(('fs', 'GET ENTRY',
+                                       _STAFResultStub(_STAFResultStub.DoesNotExist)))
+
+    def test1_publish_failure(self):
+        """Verify that a failure to publish the entry is reported."""
+
+        self.staf_handle.rules.append(('fs', 'MOVE DIRECTORY', _STAFResultStub(10, 'Disk full')))
+
+        with self.assertRaises(CoreError) as cm:
+            self.test._staf_cached_copy(self.source)
+
+        self.assertEqual(cm.exception.msg, 'Disk full')
+
+    def test2_missing_source(self):
+        """Verify that a missing local artifact is reported before anything is sent."""
+
+        with self.assertRaises(CoreError):
+            self.test._staf_cached_copy(join(self.temp_dir, 'missing'))
+
+        self.assertEqual(self.staf_handle.requests, [])
+
+class DeleteRootDirTests(_CoreTestCase):
+    """Tests for deleting the Bespoke root directory on the SUT."""
+
+    def setUp(self):
+        super(DeleteRootDirTests, self).setUp()
+
+        self.test = self._attach(TestPrep('prep', self.sut, 10, 0))
+
+    def test1_no_cache(self):
+        """Verify that the root directory is deleted in a single request without a cache."""
+
+        self.test._delete_root_dir([BespokeGlobals.TOOLS, BespokeGlobals.TESTS])
+
+        self.assertEqual(self.staf_handle.sent('fs'),
+                         ['DELETE ENTRY "C:/bespoke" RECURSE CONFIRM '])
+
+    def test2_keep_cache(self):
+        """Verify that everything except the cache is deleted."""
+
+        self.test._delete_root_dir([BespokeGlobals.TOOLS, BespokeGlobals.CACHE])
+
+        self.assertEqual(self.staf_handle.sent('fs'),
+                         ['DELETE ENTRY "C:/bespoke/tools" RECURSE CONFIRM '])
+
+    def test3_empty(self):
+        """Verify that nothing is sent when the root directory is empty."""
+
+        self.test._delete_root_dir([])
+
+        self.assertEqual(self.staf_handle.requests, [])
+
+class _InstallBespokeTestCase(_CoreTestCase):
+    """Base class for tests that install Bespoke on a SUT whose root directory holds the given
+    entries."""
+
+    def _install(self, entries, cleanup='full'):
+        """Run the install step of a TestPrep with the given cleanup mode."""
+
+        self.staf_handle.rules.append(('fs', 'LIST DIRECTORY', _STAFResultStub(resultObj=entries)))
+
+        test = self._attach(TestPrep('prep', self.sut, 10, 0, cleanup=cleanup))
+        test._install_bespoke()
+
+        return test
+
+class InstallBespokeTests(_InstallBespokeTestCase):
+    """Tests for installing Bespoke on the SUT with each cleanup mode."""
+
+    def test1_incremental_warm(self):
+        """Verify that an incremental cleanup only clears the results and tests directories."""
+
+        self._install(list(TestPrep._SKELETON) + [BespokeGlobals.CACHE], 'incremental')
+
+        self.assertEqual(self.staf_handle.sent('fs', 'DELETE'),
+                         ['DELETE ENTRY "C:/bespoke/results" CHILDREN RECURSE CONFIRM',
+                          'DELETE ENTRY "C:/bespoke/tests" CHILDREN RECURSE CONFIRM'])
+        self.assertEqual(self.staf_handle.sent('zip'), [])
+
+    def test2_incremental_missing_directory(self):
+        """Verify that an incremental cleanup skips missing directories and creates the directory
+        structure."""
+
+        self._install([BespokeGlobals.TESTS, BespokeGlobals.CACHE], 'incremental')
+
+        self.assertEqual(self.staf_handle.sent('fs', 'DELETE'),
+                         ['DELETE ENTRY "C:/bespoke/tests" CHILDREN RECURSE CONFIRM'])
+        self.assertEqual(len(self.staf_handle.sent('zip', 'UNZIP')), 1)
+
+    def test3_full(self):
+        """Verify that a full cleanup deletes everything except the cache and then creates the
+        directory structure."""
+
+        self._install(list(TestPrep._SKELETON) + [BespokeGlobals.CACHE])
+
+        deleted = self.staf_handle.sent('fs', 'DELETE')
+
+        self.assertEqual(len(deleted), len(TestPrep._SKELETON))
+        self.assertFalse([request for request in deleted if '/cache' in request])
+        self.assertEqual(len(self.staf_handle.sent('zip', 'UNZIP')), 1)
+
+class InstallBespokeTests_Negative(_CoreTestCase):
+    """Negative tests for installing Bespoke on the SUT."""
+
+    def test1_unknown_cleanup_mode(self):
+        """Attempt to create a TestPrep with an unknown cleanup mode."""
+
+        with self.assertRaises(CoreError) as cm:
+            TestPrep('prep', self.sut, 10, 0, cleanup='partial')
+
+        self.assertEqual(cm.exception.msg, 'The cleanup mode "partial" is not supported!')
+
+    def test2_clean_failure(self):
+        """Verify that a failure to clear a directory is reported."""
+
+        self.staf_handle.rules.append(('fs', 'DELETE ENTRY', _STAFResultStub(10, 'Access denied')))
+
+        test = self._attach(TestPrep('prep', self.sut, 10, 0, cleanup='incremental'))
+
+        with self.assertRaises(CoreError) as cm:
+            test._clean_root_dir([BespokeGlobals.RESULTS])
+
+        self.assertEqual(cm.exception.msg, 'Access denied')
+
+class CreateSkeletonTests(_CoreTestCase):
+    """Tests for creating the Bespoke directory structure on the SUT."""
+
+    def setUp(self):
+        super(CreateSkeletonTests, self).setUp()
+
+        self.test = self._attach(TestPrep('prep', self.sut, 10, 0))
+
+    def test1_archive_of_empty_directories(self):
+        """Verify that the directory structure is sent as an archive of empty directories."""
+
+        self.test._create_skeleton()
+
+        local_skeleton = join(BespokeGlobals.ABS_LOCAL_STAGING, BespokeGlobals.SKELETON)
+        archives = [join(root, name) for root, _, names in os.walk(BespokeGlobals.ABS_LOCAL_STAGING)
+                    for name in names if name.endswith('.zip')]
+
+        with ZipFile(archives[0]) as archive:
+            names = sorted(archive.namelist())
+
+        self.assertEqual(names, sorted(name + '/' for name in TestPrep._SKELETON))
+        self.assertTrue(isdir(join(local_skeleton, BespokeGlobals.RESULTS)))
+        self.assertIn('TODIRECTORY "C:/bespoke" REPLACE', self.staf_handle.sent('zip')[0])
+
+    def test2_reuse_local_skeleton(self):
+        """Verify that the same archive is extracted when the directory structure is created
+        again."""
+
+        self.test._create_skeleton()
+        self.test._create_skeleton()
+
+        first, second = self.staf_handle.sent('zip')
+
+        self.assertEqual(first, second)
+
+class ArchiveCopyTests(_CoreTestCase):
+    """Tests for copying a directory to the SUT as a single archive."""
+
+    def setUp(self):
+        super(ArchiveCopyTests, self).setUp()
+
+        self.source = join(self.temp_dir, 'tool')
+        _write_file(join(self.source, 'tool.exe'), 'binary')
+
+        self.test = self._attach(TestPrep('prep', self.sut, 10, 0))
+
+        logger_patcher = patch('core._LOGGER')
+        self.logger = logger_patcher.start()
+        self.addCleanup(logger_patcher.stop)
+
+    def _unzip_results(self, *results):
+        """Answer the UNZIP requests with the given results in order."""
+
+        results = list(results)
+
+        self.staf_handle.rules.append(('zip', 'UNZIP', lambda request: results.pop(0)))
+
+    def test1_cached_archive(self):
+        """Verify that an archive the SUT already holds is extracted in a single round trip."""
+
+        self._unzip_results(_STAFResultStub())
+
+        self.test._staf_archive_copy(self.source, 'C:/bespoke/tools')
+
+        self.assertEqual(len(self.staf_handle.requests), 1)
+        self.assertIn('TODIRECTORY "C:/bespoke/tools" REPLACE', self.staf_handle.sent('zip')[0])
+
+    def test2_archive_not_cached(self):
+        """Verify that the archive is copied and extracted if the SUT doesn't hold it yet."""
+
+        self._unzip_results(_STAFResultStub(_STAFResultStub.DoesNotExist), _STAFResultStub())
+        self.staf_handle.rules.append(('fs', 'GET ENTRY',
+                                       _STAFResultStub(_STAFResultStub.DoesNotExist)))
+
+        self.test._staf_archive_copy(self.source, 'C:/bespoke/tools')
+
+        first, second = self.staf_handle.sent('zip')
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.staf_handle.sent('fs', 'MOVE DIRECTORY')), 1)
+        self.assertTrue(self.logger.debug.called)
+        self.assertFalse(self.logger.warning.called)
+
+    def test3_extract_failure_logged(self):
+        """Verify that the reason the cached archive couldn't be extracted is logged before the
+        archive is copied again."""
+
+        self._unzip_results(_STAFResultStub(10, 'Corrupt archive'), _STAFResultStub())
+
+        self.test._staf_archive_copy(self.source, 'C:/bespoke/tools')
+
+        self.assertEqual(len(self.staf_handle.sent('zip')), 2)
+        self.assertEqual(self.logger.warning.call_args[0][-1], 'Corrupt archive')
+
+class ArchiveCopyTests_Negative(_CoreTestCase):
+    """Negative tests for copying a directory to the SUT as a single archive."""
+
+    def test1_extract_failure(self):
+        """Verify that a failure to extract the copied archive is reported."""
+
+        source = join(self.temp_dir, 'tool')
+        _write_file(join(source, 'tool.exe'), 'binary')
+
+        self.staf_handle.rules.append(('zip', 'UNZIP', _STAFResultStub(10, 'Disk full')))
+
+        test = self._attach(TestPrep('prep', self.sut, 10, 0))
+
+        with patch('core._LOGGER'):
+            with self.assertRaises(CoreError) as cm:
+                test._staf_archive_copy(source, 'C:/bespoke/tools')
+
+        self.assertEqual(cm.exception.msg, 'Disk full')
+
+class SyncCopyTests(_CoreTestCase):
+    """Tests for delta synchronizing a directory on the SUT."""
+
+    def setUp(self):
+        super(SyncCopyTests, self).setUp()
+
+        self.source = join(self.temp_dir, 'test1')
+        _write_file(join(self.source, 'same.txt'), 'same')
+        _write_file(join(self.source, 'changed.txt'), 'new')
+        _write_file(join(self.source, 'added', 'added.txt'), 'added')
+
+        self.remote_path = 'C:/bespoke/cache/sync/test1'
+        self.remote_manifest_path = self.remote_path + BespokeGlobals.SYNC_MANIFEST_SUFFIX
+        self.written_manifests = []
+
+        self.staf_handle.rules.append(('fs', 'COPY FILE', self._capture_manifest))
+
+        self.test = self._attach(TestPrep('prep', self.sut, 10, 0))
+
+    def _capture_manifest(self, request):
+        """Remember the contents of every manifest copied to the SUT."""
+
+        local_path = request.split('"')[1]
+
+        if local_path.endswith(BespokeGlobals.SYNC_MANIFEST_SUFFIX):
+            with open(local_path, 'rb') as manifest_file:
+                self.written_manifests.append(json.load(manifest_file))
+
+        return _STAFResultStub()
+
+    def _remote_manifest(self, files, dirs):
+        """Answer requests for the remote manifest with the given contents."""
+
+        self.staf_handle.rules.insert(0, ('fs', 'GET FILE',
+                                          _STAFResultStub(result=json.dumps({'files': files,
+                                                                             'dirs': dirs}))))
+
+    def test1_no_manifest(self):
+        """Verify that a directory without a manifest is replaced with a full copy."""
+
+        self.staf_handle.rules.insert(0, ('fs', 'GET FILE',
+                                          _STAFResultStub(_STAFResultStub.DoesNotExist)))
+
+        self.test._staf_sync_copy(self.source, self.remote_path)
+
+        self.assertEqual(self.staf_handle.sent('fs', 'DELETE ENTRY'),
+                         ['DELETE ENTRY "{0}" RECURSE CONFIRM '.format(self.remote_path)])
+        self.assertEqual(len(self.staf_handle.sent('fs', 'COPY DIRECTORY')), 1)
+
+    def test2_manifest_written_last(self):
+        """Verify that the manifest describes the local directory and is written last."""
+
+        self.staf_handle.rules.insert(0, ('fs', 'GET FILE',
+                                          _STAFResultStub(_STAFResultStub.DoesNotExist)))
+
+        self.test._staf_sync_copy(self.source, self.remote_path)
+
+        files, dirs = directory_manifest(self.source)
+
+        self.assertEqual(self.written_manifests, [{'files': {name: list(entry)
+                                                             for name, entry in files.items()},
+                                                   'dirs': dirs}])
+        self.assertIn('TOFILE "{0}"'.format(self.remote_manifest_path),
+                      self.staf_handle.requests[-1][2])
+
+    def test3_only_changes_sent(self):
+        """Verify that only new and changed files are copied and stale entries are deleted."""
+
+        files, _ = directory_manifest(self.source)
+
+        self._remote_manifest({'same.txt': files['same.txt'],
+                               'changed.txt': [3, 'old digest'],
+                               'stale.txt': [5, 'stale digest']},
+                              ['stale'])
+
+        self.test._staf_sync_copy(self.source, self.remote_path)
+
+        copied = [request.split('"')[3] for request in self.staf_handle.sent('fs', 'COPY FILE')]
+
+        self.assertEqual(copied, [self.remote_path + '/added/added.txt',
+                                  self.remote_path + '/changed.txt',
+                                  self.remote_manifest_path])
+        self.assertEqual(sorted(self.staf_handle.sent('fs', 'DELETE ENTRY')),
+                         ['DELETE ENTRY "{0}/stale" RECURSE CONFIRM '.format(self.remote_path),
+                          'DELETE ENTRY "{0}/stale.txt" RECURSE CONFIRM '.format(self.remote_path)])
+        self.assertEqual(self.staf_handle.sent('fs', 'CREATE DIRECTORY')[0],
+                         'CREATE DIRECTORY "{0}/added" FULLPATH'.format(self.remote_path))
+        self.assertEqual(self.staf_handle.sent('fs', 'COPY DIRECTORY'), [])
+
+    def test4_unchanged(self):
+        """Verify that only the manifest is sent when nothing changed."""
+
+        files, dirs = directory_manifest(self.source)
+
+        self._remote_manifest(files, dirs)
+
+        self.test._staf_sync_copy(self.source, self.remote_path)
+
+        self.assertEqual(len(self.staf_handle.sent('fs', 'COPY FILE')), 1)
+        self.assertEqual(self.staf_handle.sent('fs', 'DELETE ENTRY'), [])
+
+    def test5_corrupt_manifest(self):
+        """Verify that an unreadable manifest is treated like a missing one."""
+
+        self.staf_handle.rules.insert(0, ('fs', 'GET FILE', _STAFResultStub(result='{"files"')))
+
+        self.test._staf_sync_copy(self.source, self.remote_path)
+
+        self.assertEqual(len(self.staf_handle.sent('fs', 'COPY DIRECTORY')), 1)
+
+class SyncCopyTests_Negative(_CoreTestCase):
+    """Negative tests for delta synchronizing a directory on the SUT."""
+
+    def setUp(self):
+        super(SyncCopyTests_Negative, self).setUp()
+
+        self.test = self._attach(TestPrep('prep', self.sut, 10, 0))
+
+    def test1_manifest_query_failure(self):
+        """Verify that a failure to read the remote manifest is reported."""
+
+        source = join(self.temp_dir, 'test1')
+        _write_file(join(source, 'file.txt'), 'text')
+
+        self.staf_handle.rules.append(('fs', 'GET FILE', _STAFResultStub(16, 'No path')))
+
+        with self.assertRaises(CoreError) as cm:
+            self.test._staf_sync_copy(source, 'C:/bespoke/cache/sync/test1')
+
+        self.assertEqual(cm.exception.msg, 'No path')
+        self.assertEqual(self.staf_handle.sent('fs', 'COPY'), [])
+
+    def test2_missing_source(self):
+        """Verify that a missing local directory is reported before anything is sent."""
+
+        with self.assertRaises(CoreError):
+            self.test._staf_sync_copy(join(self.temp_dir, 'missing'), 'C:/bespoke/cache/sync/x')
+
+        self.assertEqual(self.staf_handle.requests, [])
+
+class StagedDirectoryTests(_CoreTestCase):
+    """Tests for tracking the directories staged on a SystemUnderTest."""
+
+    def setUp(self):
+        super(StagedDirectoryTests, self).setUp()
+
+        self.sut.mark_staged('C:/bespoke/tests/test1', 'digest1')
+
+    def test1_mark_staged(self):
+        """Verify that the digest of a staged directory is remembered by path."""
+
+        self.assertEqual(self.sut.staged_digest('C:/bespoke/tests/test1'), 'digest1')
+        self.assertEqual(self.sut.staged_digest('C:/bespoke/tests/test2'), None)
+
+    def test2_mark_unstaged(self):
+        """Verify that marking a path with no digest forgets it."""
+
+        self.sut.mark_staged('C:/bespoke/tests/test1', None)
+        self.sut.mark_staged('C:/bespoke/tests/test2', None)
+
+        self.assertEqual(self.sut.staged_digest('C:/bespoke/tests/test1'), None)
+
+    def test3_forget_staged(self):
+        """Verify that every staged directory is forgotten."""
+
+        self.sut.mark_staged('C:/bespoke/tests/test2', 'digest2')
+        self.sut.forget_staged()
+
+        self.assertEqual(self.sut.staged_digest('C:/bespoke/tests/test1'), None)
+        self.assertEqual(self.sut.staged_digest('C:/bespoke/tests/test2'), None)
+
+    def test4_power_events_forget(self):
+        """Verify that power events that lose the contents of the SUT forget staged directories."""
+
+        for power_event in (self.sut.stop,
+                            self.sut.restart,
+                            lambda: self.sut.shutdown(True),
+                            lambda: self.sut.apply_snapshot('clean')):
+            self.sut.mark_staged('C:/bespoke/tests/test1', 'digest1')
+
+            power_event()
+
+            self.assertEqual(self.sut.staged_digest('C:/bespoke/tests/test1'), None)
+
+    def test5_install_forgets(self):
+        """Verify that re-installing Bespoke on the SUT forgets staged directories."""
+
+        self.staf_handle.rules.append(('fs', 'LIST DIRECTORY',
+                                       _STAFResultStub(resultObj=list(TestPrep._SKELETON))))
+
+        test = self._attach(TestPrep('prep', self.sut, 10, 0))
+
+        test._install_bespoke()
+
+        self.assertEqual(self.sut.staged_digest('C:/bespoke/tests/test1'), None)
+
+class StageTestStepTests(_CoreTestCase):
+    """Tests for skipping test directories that are already staged on the SUT."""
+
+    def setUp(self):
+        super(StageTestStepTests, self).setUp()
+
+        _write_file(join(BespokeGlobals.ABS_LOCAL_TESTS, 'test1', 'test.py'), 'print "test"')
+
+    def _test_step(self):
+        """Create a test step for the test directory with the mocked STAF handle."""
+
+        return self._attach(TestStep('step', self.sut, 'test1', 'python', 'test.py', {}, 10, 0))
+
+    def test1_skip_staged(self):
+        """Verify that a directory staged by an earlier step is not copied again."""
+
+        self._test_step()._stage_test_step()
+        self._test_step()._stage_test_step()
+
+        self.assertEqual(len(self.staf_handle.sent('fs', 'COPY DIRECTORY')), 1)
+
+    def test2_restage_changed(self):
+        """Verify that a directory that changed since it was staged is copied again."""
+
+        self._test_step()._stage_test_step()
+
+        _write_file(join(BespokeGlobals.ABS_LOCAL_TESTS, 'test1', 'test.py'), 'print "changed"')
+
+        self._test_step()._stage_test_step()
+
+        self.assertEqual(len(self.staf_handle.sent('fs', 'COPY DIRECTORY')), 2)
+
+    def test3_restage_after_forget(self):
+        """Verify that a directory is copied again after the SUT forgets what is staged."""
+
+        self._test_step()._stage_test_step()
+        self.sut.forget_staged()
+        self._test_step()._stage_test_step()
+
+        self.assertEqual(len(self.staf_handle.sent('fs', 'COPY DIRECTORY')), 2)
+
+class StageTestStepTests_Negative(_CoreTestCase):
+    """Negative tests for skipping test directories that are already staged on the SUT."""
+
+    def test1_failed_copy_not_staged(self):
+        """Verify that a directory that failed to copy is not considered staged."""
+
+        _write_file(join(BespokeGlobals.ABS_LOCAL_TESTS, 'test1', 'test.py'), 'print "test"')
+
+        test = self._attach(TestStep('step', self.sut, 'test1', 'python', 'test.py', {}, 10, 0))
+        remote_path = test._remote_target_path
+
+        self.sut.mark_staged(remote_path, 'old digest')
+        self.staf_handle.rules.append(('fs', 'COPY DIRECTORY', _STAFResultStub(10, 'Disk full')))
+
+        with self.assertRaises(CoreError):
+            test._stage_test_step()
+
+        self.assertEqual(self.sut.staged_digest(remote_path), None)
+
+class _FanOutTestCase(_CoreTestCase):
+    """Base class for tests that stage an artifact on several SUTs through a mocked pool."""
+
+    def setUp(self):
+        super(_FanOutTestCase, self).setUp()
+
+        self.source = join(self.temp_dir, 'tool')
+        _write_file(join(self.source, 'tool.exe'), 'binary')
+
+        self.suts = [_create_sut('sut{0}'.format(index)) for index in range(3)]
+
+        for index, sut in enumerate(self.suts):
+            sut._network_address = '10.0.0.{0}'.format(index)
+
+        self.staf_handle.rules.append(('fs', 'GET ENTRY',
+                                       _STAFResultStub(_STAFResultStub.DoesNotExist)))
+
+        self.pool = _STAFHandlePoolStub(self.staf_handle)
+
+        patcher = patch.object(BespokeGlobals, 'STAF_HANDLE_POOL', self.pool)
+        self.addCleanup(patcher.stop)
+        patcher.start()
+
+class FanOutStagerTests(_FanOutTestCase):
+    """Tests for the FanOutStager class in the core module."""
+
+    def test1_stage_all(self):
+        """Verify that the artifact is cached on every SUT and every handle is returned."""
+
+        stager = FanOutStager(self.source, self.suts)
+        stager.execute()
+
+        published = [location for location, _, request in self.staf_handle.requests
+                     if request.startswith('MOVE DIRECTORY')]
+
+        self.assertEqual(stager.status, 'Pass')
+        self.assertEqual(sorted(published), ['10.0.0.0', '10.0.0.1', '10.0.0.2'])
+        self.assertEqual(self.pool.checked_out, 0)
+
+    def test2_progress(self):
+        """Verify that every SUT reports running and then its final status."""
+
+        reports = []
+        reports_lock = Lock()
+
+        def progress_callback(alias, status, message):
+            with reports_lock:
+                reports.append((alias, status))
+
+        stager = FanOutStager(self.source, self.suts, progress_callback=progress_callback)
+        stager.execute()
+
+        for sut in self.suts:
+            self.assertEqual([status for alias, status in reports if alias == sut.alias],
+                             ['Running', 'Pass'])
+
+        self.assertEqual(stager.progress.keys(), ['sut0', 'sut1', 'sut2'])
+        self.assertEqual(stager.progress['sut1'], ('Pass', ''))
+
+    def test3_max_concurrent(self):
+        """Verify that no more than the maximum number of SUTs are copied to at the same time."""
+
+        in_flight = []
+        peak = []
+        flight_lock = Lock()
+
+        def copy(request):
+            with flight_lock:
+                in_flight.append(request)
+                peak.append(len(in_flight))
+
+            with flight_lock:
+                in_flight.remove(request)
+
+            return _STAFResultStub()
+
+        self.staf_handle.rules.append(('fs', 'COPY DIRECTORY', copy))
+
+        stager = FanOutStager(self.source, self.suts, max_concurrent=1)
+        stager.execute()
+
+        self.assertEqual(stager.status, 'Pass')
+        self.assertEqual(max(peak), 1)
+
+class FanOutStagerTests_Negative(_FanOutTestCase):
+    """Negative tests for the FanOutStager class in the core module."""
+
+    def test1_unreachable_sut(self):
+        """Verify that one unreachable SUT fails the staging without stopping the others."""
+
+        self.staf_handle.rules.insert(0, ('fs', 'COPY DIRECTORY',
+                                          lambda request: _STAFResultStub(16, 'No path')
+                                          if '"10.0.0.1"' in request else _STAFResultStub()))
+
+        stager = FanOutStager(self.source, self.suts)
+        stager.execute()
+
+        self.assertEqual(stager.status, 'Fail')
+        self.assertEqual(stager.progress['sut1'], ('Fail', 'No path'))
+        self.assertEqual(stager.progress['sut2'], ('Pass', ''))
+        self.assertIn('on 1 of 3 SUTs', stager.message)
+        self.assertEqual(self.pool.checked_out, 0)
+
+    def test2_missing_artifact(self):
+        """Verify that a missing artifact fails the staging before anything is sent."""
+
+        stager = FanOutStager(join(self.temp_dir, 'missing'), self.suts)
+        stager.execute()
+
+        self.assertEqual(stager.status, 'Fail')
+        self.assertEqual(self.staf_handle.requests, [])
+
+    def test3_no_ping(self):
+        """Verify that nothing is sent to a SUT that doesn't answer a ping."""
+
+        self.staf_handle.rules.insert(0, ('ping', 'ping', _STAFResultStub(16, 'No path')))
+
+        stager = FanOutStager(self.source, self.suts[:1])
+
+        with patch('util.time.sleep'):
+            stager.execute()
+
+        self.assertEqual(stager.status, 'Fail')
+        self.assertEqual(self.staf_handle.sent('fs'), [])
+
+class _InstallerTestCase(_CoreTestCase):
+    """Base class for tests of test cases that install tools on two SUTs."""
+
+    def setUp(self):
+        super(_InstallerTestCase, self).setUp()
+
+        self.addCleanup(setattr, BespokeGlobals, 'ABS_LOCAL_TOOLS', BespokeGlobals.ABS_LOCAL_TOOLS)
+        BespokeGlobals.ABS_LOCAL_TOOLS = join(self.temp_dir, 'tools')
+
+        self.suts = [_create_sut('sut1'), _create_sut('sut2')]
+
+        patcher = patch('core.FanOutStager')
+        self.addCleanup(patcher.stop)
+        self.fan_out_stager = patcher.start()
+
+    def _installer(self, sut, name, copy_once=True):
+        """Create a basic installer of a tool."""
+
+        tool = Tool(name,
+                    'Windows',
+                    'x64',
+                    source_copy_once=copy_once,
+                    install_type='basic',
+                    install_properties={'source_path': name})
+
+        return BasicInstaller(tool, sut, 10)
+
+class StageSharedArtifactsTests(_InstallerTestCase):
+    """Tests for staging the artifacts shared by the installers of a test case."""
+
+    def test1_shared(self):
+        """Verify that an artifact installed on several SUTs is fanned out to all of them."""
+
+        TestCase_('test')._stage_shared_artifacts([self._installer(self.suts[0], 'tool1'),
+                                                   self._installer(self.suts[1], 'tool1')])
+
+        self.fan_out_stager.assert_called_once_with(join(BespokeGlobals.ABS_LOCAL_TOOLS, 'tool1'),
+                                                    self.suts)
+        self.fan_out_stager.return_value.execute.assert_called_once_with()
+
+    def test2_not_shared(self):
+        """Verify that artifacts installed on a single SUT or not cached are left alone."""
+
+        TestCase_('test')._stage_shared_artifacts([self._installer(self.suts[0], 'tool1'),
+                                                   self._installer(self.suts[0], 'tool1'),
+                                                   self._installer(self.suts[0], 'tool2', False),
+                                                   self._installer(self.suts[1], 'tool2', False)])
+
+        self.assertFalse(self.fan_out_stager.called)
+
+    def test3_staged_before_fan_out(self):
+        """Verify that a shared artifact is only fanned out once its tool is staged."""
+
+        order = []
+        installers = [self._installer(self.suts[0], 'tool1'),
+                      self._installer(self.suts[1], 'tool1')]
+
+        self.fan_out_stager.return_value.execute.side_effect = lambda: order.append('fan out')
+
+        with patch.object(Tool, 'stage', autospec=True,
+                          side_effect=lambda tool: order.append('stage')):
+            TestCase_('test')._stage_shared_artifacts(installers)
+
+        self.assertEqual(order, ['stage', 'fan out'])
+
+class StageSharedArtifactsTests_Negative(_InstallerTestCase):
+    """Negative tests for staging the artifacts shared by the installers of a test case."""
+
+    def test1_fan_out_failure(self):
+        """Verify that a failed fan out is logged and left for the installers to copy."""
+
+        self.fan_out_stager.return_value.status = 'Fail'
+        self.fan_out_stager.return_value.message = 'No space left on device'
+
+        with patch('core._LOGGER') as logger:
+            TestCase_('test')._stage_shared_artifacts([self._installer(self.suts[0], 'tool1'),
+                                                       self._installer(self.suts[1], 'tool1')])
+
+        logger.warning.assert_called_once_with('Failed to fan out "%s"! The installers copy it on '
+                                               'their own. Reason: %s',
+                                               join(BespokeGlobals.ABS_LOCAL_TOOLS, 'tool1'),
+                                               'No space left on device')
+
+    def test2_stage_failure(self):
+        """Verify that an artifact whose tool fails to stage isn't fanned out."""
+
+        installers = [self._installer(self.suts[0], 'tool1'),
+                      self._installer(self.suts[1], 'tool1')]
+
+        with patch.object(Tool, 'stage', side_effect=CoreError('No route to host')):
+            with patch('core._LOGGER') as logger:
+                TestCase_('test')._stage_shared_artifacts(installers)
+
+        self.assertFalse(self.fan_out_stager.called)
+        self.assertTrue(logger.warning.called)
+
+class TestCaseOrderTests(_InstallerTestCase):
+    """Tests for the order that a test case executes its tests in."""
+
+    def setUp(self):
+        super(TestCaseOrderTests, self).setUp()
+
+        self.executed = []
+        self.staged = []
+
+        for name, side_effect in (('_execute_test', self.executed.append),
+                                  ('_stage_shared_artifacts', self.staged.append),
+                                  ('_checkout_resources', None),
+                                  ('_checkin_resources', None)):
+            patcher = patch.object(TestCase_, name, side_effect=side_effect)
+            self.addCleanup(patcher.stop)
+            patcher.start()
+
+    def test1_order(self):
+        """Verify that tests run in the order they were added."""
+
+        test_case = TestCase_('test')
+        test_case._tests = [TestPrep('prep1', self.suts[0], 10, 0),
+                            self._installer(self.suts[0], 'tool1'),
+                            PowerControl('power1', self.suts[0], 'restart', False),
+                            TestPrep('prep2', self.suts[1], 10, 0),
+                            self._installer(self.suts[1], 'tool1'),
+                            TestStep('step', self.suts[0], 'test1', 'python', 'test.py', {}, 10, 0)]
+
+        test_case.execute()
+
+        self.assertEqual(self.executed, test_case._tests)
+
+    def test2_consecutive_installers(self):
+        """Verify that only installers that run back to back are staged together."""
+
+        test_case = TestCase_('test')
+        test_case._tests = [TestPrep('prep1', self.suts[0], 10, 0),
+                            TestPrep('prep2', self.suts[1], 10, 0),
+                            self._installer(self.suts[0], 'tool1'),
+                            self._installer(self.suts[1], 'tool1'),
+                            PowerControl('power1', self.suts[0], 'restart', False),
+                            self._installer(self.suts[0], 'tool2')]
+
+        test_case.execute()
+
+        self.assertEqual(self.executed, test_case._tests)
+        self.assertEqual(self.staged, [test_case._tests[2:4], test_case._tests[5:]])
+        self.assertEqual(test_case.status, 'Pass')
+
+class _HTTPPullTestCase(_CoreTestCase):
+    """Base class for tests that cache an artifact on a SUT while the artifact server runs."""
+
+    def setUp(self):
+        super(_HTTPPullTestCase, self).setUp()
+
+        self.source = join(self.temp_dir, 'tool')
+        _write_file(join(self.source, 'tool.exe'), 'binary')
+
+        self.supervisor = _ProcessSupervisorStub()
+
+        for name, value in (('ARTIFACT_SERVER_URL', 'http://bespoke:8080'),
+                            ('PROCESS_SUPERVISOR', self.supervisor)):
+            patcher = patch.object(BespokeGlobals, name, value)
+            self.addCleanup(patcher.stop)
+            patcher.start()
+
+        self.staf_handle.rules.append(('fs', 'GET ENTRY',
+                                       _STAFResultStub(_STAFResultStub.DoesNotExist)))
+
+        self.test = self._attach(TestPrep('prep', self.sut, 10, 0))
+
+class HTTPPullTests(_HTTPPullTestCase):
+    """Tests for SUTs pulling cached artifacts from the artifact server."""
+
+    def test1_windows_pull(self):
+        """Verify that a Windows SUT downloads an archive instead of having it copied."""
+
+        remote_path = self.test._staf_cached_copy(self.source, archive=True)
+        digest = dirname(remote_path).split('/')[-1]
+
+        self.assertEqual(len(self.supervisor.requests), 1)
+
+        location, staf_request, _ = self.supervisor.requests[0]
+
+        self.assertEqual(location, '10.0.0.1')
+        self.assertTrue(staf_request.startswith('START SHELL COMMAND "powershell"'))
+        self.assertIn('-Uri http://bespoke:8080/staging/{0}/tool.zip'.format(digest),
+                      staf_request)
+        self.assertIn('-OutFile {0}.part/tool.zip'.format(dirname(remote_path)), staf_request)
+        self.assertEqual(self.staf_handle.sent('fs', 'COPY FILE'), [])
+        self.assertEqual(len(self.staf_handle.sent('fs', 'MOVE DIRECTORY')), 1)
+
+    def test2_linux_pull(self):
+        """Verify that a Linux SUT downloads with curl."""
+
+        self.sut._os = 'Linux'
+
+        self.test._staf_cached_copy(self.source, archive=True)
+
+        self.assertTrue(self.supervisor.requests[0][1].startswith('START SHELL COMMAND "curl"'))
+        self.assertEqual(self.staf_handle.sent('fs', 'COPY FILE'), [])
+
+    def test3_directory_pushed(self):
+        """Verify that a directory is still copied because only files can be pulled."""
+
+        self.test._staf_cached_copy(self.source)
+
+        self.assertEqual(self.supervisor.requests, [])
+        self.assertEqual(len(self.staf_handle.sent('fs', 'COPY DIRECTORY')), 1)
+
+    def test4_server_disabled(self):
+        """Verify that the archive is copied when the artifact server isn't running."""
+
+        BespokeGlobals.ARTIFACT_SERVER_URL = ''
+
+        self.test._staf_cached_copy(self.source, archive=True)
+
+        self.assertEqual(self.supervisor.requests, [])
+        self.assertEqual(len(self.staf_handle.sent('fs', 'COPY FILE')), 1)
+
+class HTTPPullTests_Negative(_HTTPPullTestCase):
+    """Negative tests for SUTs pulling cached artifacts from the artifact server."""
+
+    def test1_failed_pull(self):
+        """Verify that the archive is copied when the download fails."""
+
+        self.supervisor.exit_code = 1
+
+        self.test._staf_cached_copy(self.source, archive=True)
+
+        self.assertEqual(len(self.supervisor.requests), 1)
+        self.assertEqual(len(self.staf_handle.sent('fs', 'COPY FILE')), 1)
+
+class ToolStageTests(_CoreTestCase):
+    """Tests for staging tools on the Bespoke server."""
+
+    def setUp(self):
+        super(ToolStageTests, self).setUp()
+
+        self.addCleanup(setattr, BespokeGlobals, 'ABS_LOCAL_TOOLS', BespokeGlobals.ABS_LOCAL_TOOLS)
+        BespokeGlobals.ABS_LOCAL_TOOLS = join(self.temp_dir, 'tools')
+
+        self.source = join(self.temp_dir, 'share', 'tool1')
+        _write_file(join(self.source, 'tool.exe'), 'binary')
+
+    def test1_basic_copy(self):
+        """Verify that a tool is copied to its target path on the Bespoke server."""
+
+        tool = Tool('tool1',
+                    'Windows',
+                    'x64',
+                    source_type='basic_copy',
+                    source_properties={'source_path': self.source, 'target_path': 'tool1'})
+
+        tool.stage()
+
+        self.assertTrue(tool.staged)
+
+        with open(join(BespokeGlobals.ABS_LOCAL_TOOLS, 'tool1', 'tool.exe'), 'rb') as tool_file:
+            self.assertEqual(tool_file.read(), 'binary')
+
+    def test2_copy_once(self):
+        """Verify that a tool is only copied once no matter how many times it is staged."""
+
+        tool = Tool('tool1', 'Windows', 'x64')
+        copier = Mock()
+
+        with patch.object(tool, '_get_copier', return_value=copier):
+            tool.stage()
+            tool.stage()
+
+        self.assertEqual(copier.copy.call_count, 1)
+
+    def test3_wait_for_copy(self):
+        """Verify that a caller that arrives during a copy waits for it instead of copying again."""
+
+        tool = Tool('tool1', 'Windows', 'x64')
+        copying = Event()
+        release = Event()
+        copier = Mock()
+
+        def copy():
+            copying.set()
+            release.wait(10)
+
+        copier.copy.side_effect = copy
+
+        with patch.object(tool, '_get_copier', return_value=copier):
+            first = Thread(target=tool.stage)
+            first.start()
+            copying.wait(10)
+
+            second = Thread(target=tool.stage)
+            second.start()
+            second.join(0.1)
+
+            #The second caller is still waiting on the first copy.
+            self.assertTrue(second.is_alive())
+
+            release.set()
+            first.join(10)
+            second.join(10)
+
+        self.assertEqual(copier.copy.call_count, 1)
+        self.assertTrue(tool.staged)
+
+    def test4_not_copied(self):
+        """Verify that a tool without a source type is staged without copying anything."""
+
+        tool = Tool('tool1', 'Windows', 'x64')
+        tool.stage()
+
+        self.assertTrue(tool.staged)
+        self.assertEqual(tool.local_path, None)
+
+    def test5_sample_ftp_tool(self):
+        """Verify that the sample FTP tool with a relative directory path is staged."""
+
+        _write_file(join(self.temp_dir, 'share', 'Programs', 'tophat', 'tophat_12.0c', 'th.exe'),
+                    'binary')
+
+        _FTPHandler.root = join(self.temp_dir, 'share')
+        server = _FTPServer(('127.0.0.1', 0), _FTPHandler)
+        server.logins = 0
+        server.commands = []
+        thread = Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        tool = ToolConfig(r'configs/tools/happy_path.xml',
+                          r'../src/bespoke/xsd/tool_config.xsd',
+                          r'Tool')['Top Hat']
+        tool.source_properties.update({'source_server': '127.0.0.1',
+                                       'source_server_port': server.server_address[1]})
+
+        try:
+            tool.stage()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        with open(join(BespokeGlobals.ABS_LOCAL_TOOLS, 'tophat', 'th.exe'), 'rb') as tool_file:
+            self.assertEqual(tool_file.read(), 'binary')
+
+    def test6_sample_http_tool(self):
+        """Verify that the sample HTTP tool with a relative directory path is staged."""
+
+        _write_file(join(self.temp_dir, 'share', 'Programs', 'cobbler', 'cobbler_1.0',
+                         'Cobbler.msi'), 'package')
+
+        server = ArtifactServer({'Programs': join(self.temp_dir, 'share', 'Programs')},
+                                'localhost')
+        server.start()
+        self.addCleanup(server.stop)
+
+        tool = ToolConfig(r'configs/tools/happy_path.xml',
+                          r'../src/bespoke/xsd/tool_config.xsd',
+                          r'Tool')['Cobbler']
+        tool.source_properties.update({'source_server': 'localhost',
+                                       'source_server_port': server.port})
+
+        tool.stage()
+
+        with open(join(BespokeGlobals.ABS_LOCAL_TOOLS, 'cobbler', 'Cobbler.msi'), 'rb') as msi:
+            self.assertEqual(msi.read(), 'package')
+
+class ToolStageTests_Negative(_CoreTestCase):
+    """Negative tests for staging tools on the Bespoke server."""
+
+    def test1_copy_failure(self):
+        """Verify that a failed copy is reported and tried again by the next caller."""
+
+        tool = Tool('tool1', 'Windows', 'x64')
+        copier = Mock()
+        copier.copy.side_effect = [CopyError('No route to host'), None]
+
+        with patch.object(tool, '_get_copier', return_value=copier):
+            with self.assertRaises(CoreError) as cm:
+                tool.stage()
+
+            self.assertFalse(tool.staged)
+
+            tool.stage()
+
+        self.assertEqual(cm.exception.msg, 'Failed to stage the tool "tool1" on the Bespoke '
+                                           'server! Reason: No route to host')
+        self.assertTrue(tool.staged)
+
+class _PrefetchTestCase(TestCase):
+    """Base class for tests that prefetch tools with mocked copiers."""
+
+    def _tools(self, count, copy=None):
+        """Create tools that are staged by calling "copy" with the tool name."""
+
+        tools = []
+
+        for index in range(count):
+            tool = Tool('tool{0}'.format(index), 'Windows', 'x64')
+            copier = Mock()
+            copier.copy.side_effect = (lambda name=tool.name: copy(name)) if copy else None
+
+            patcher = patch.object(tool, '_get_copier', return_value=copier)
+            self.addCleanup(patcher.stop)
+            patcher.start()
+
+            tools.append(tool)
+
+        return tools
+
+class ArtifactPrefetcherTests(_PrefetchTestCase):
+    """Tests for the ArtifactPrefetcher class in the core module."""
+
+    def test1_stage_all(self):
+        """Verify that every tool is staged in the background."""
+
+        tools = self._tools(3)
+
+        prefetcher = ArtifactPrefetcher(tools)
+        prefetcher.start()
+        prefetcher.wait()
+
+        self.assertEqual(prefetcher.status, 'Pass')
+        self.assertTrue(all(tool.staged for tool in tools))
+
+    def test2_max_concurrent(self):
+        """Verify that no more than the maximum number of tools are copied at the same time."""
+
+        in_flight = []
+        peak = []
+        flight_lock = Lock()
+
+        def copy(name):
+            with flight_lock:
+                in_flight.append(name)
+                peak.append(len(in_flight))
+
+            with flight_lock:
+                in_flight.remove(name)
+
+        prefetcher = ArtifactPrefetcher(self._tools(4, copy), max_concurrent=2)
+        prefetcher.start()
+        prefetcher.wait()
+
+        self.assertEqual(len(peak), 4)
+        self.assertLessEqual(max(peak), 2)
+
+    def test3_wait_before_start(self):
+        """Verify that waiting on a prefetcher that never started returns right away."""
+
+        prefetcher = ArtifactPrefetcher(self._tools(1))
+        prefetcher.wait()
+
+        self.assertEqual(prefetcher.status, 'NotRan')
+
+class ArtifactPrefetcherTests_Negative(_PrefetchTestCase):
+    """Negative tests for the ArtifactPrefetcher class in the core module."""
+
+    def test1_failed_tool(self):
+        """Verify that a failed tool is recorded without stopping the others."""
+
+        def copy(name):
+            if name == 'tool1':
+                raise CopyError('No route to host')
+
+        tools = self._tools(3, copy)
+
+        prefetcher = ArtifactPrefetcher(tools)
+        prefetcher.start()
+        prefetcher.wait()
+
+        self.assertEqual(prefetcher.status, 'Fail')
+        self.assertEqual([tool.staged for tool in tools], [True, False, True])
+        self.assertEqual(prefetcher.message, 'Failed to prefetch 1 of 3 tools! Reasons: "tool1": '
+                                             'Failed to stage the tool "tool1" on the Bespoke '
+                                             'server! Reason: No route to host')
+
+class CompressTransferTests(_CoreTestCase):
+    """Tests for deciding when to compress transfers to the SUT."""
+
+    def setUp(self):
+        super(CompressTransferTests, self).setUp()
+
+        self.compressible = join(self.temp_dir, 'log.txt')
+        self.incompressible = join(self.temp_dir, 'random.bin')
+
+        _write_file(self.compressible, 'All work and no play. ' * 10000)
+        _write_file(self.incompressible, os.urandom(200000))
+
+        patcher = patch.object(BespokeGlobals, 'COMPRESSION_MIN_SIZE', 100000)
+        self.addCleanup(patcher.stop)
+        patcher.start()
+
+        self.test = self._attach(TestPrep('prep', self.sut, 10, 0))
+
+    def test1_compress(self):
+        """Verify that a large payload that compresses well is compressed on an unmeasured link."""
+
+        self.assertTrue(self.test._compress_transfer(self.compressible))
+
+    def test2_small(self):
+        """Verify that a small payload is never compressed."""
+
+        small = join(self.temp_dir, 'small.txt')
+        _write_file(small, 'All work and no play. ' * 100)
+
+        self.assertFalse(self.test._compress_transfer(small))
+
+    def test3_incompressible(self):
+        """Verify that a payload that doesn't compress well is sent as is."""
+
+        self.assertFalse(self.test._compress_transfer(self.incompressible))
+
+    def test4_fast_link(self):
+        """Verify that nothing is compressed over a fast link."""
+
+        self.sut.record_transfer(BespokeGlobals.COMPRESSION_MAX_THROUGHPUT, 1)
+
+        self.assertFalse(self.test._compress_transfer(self.compressible))
+
+    def test5_slow_link(self):
+        """Verify that a payload is compressed over a slow link."""
+
+        self.sut.record_transfer(BespokeGlobals.COMPRESSION_MAX_THROUGHPUT // 10, 1)
+
+        self.assertTrue(self.test._compress_transfer(self.compressible))
+
+    def test6_linux(self):
+        """Verify that nothing is compressed for a SUT that relies on file modes."""
+
+        self.sut._os = 'Linux'
+
+        self.assertFalse(self.test._compress_transfer(self.compressible))
+
+    def test7_compressed_copy(self):
+        """Verify that a compressed file is sent as an archive and extracted in place."""
+
+        self.test._staf_file_copy(self.compressible, 'C:/bespoke/tools/log.txt')
+
+        copies = self.staf_handle.sent('fs', 'COPY FILE')
+        unzips = self.staf_handle.sent('zip', 'UNZIP')
+        remote_archive = copies[0].split('"')[3]
+
+        self.assertEqual(len(copies), 1)
+        self.assertTrue(remote_archive.endswith('.zip'))
+        self.assertEqual(unzips, ['UNZIP ZIPFILE "{0}" TODIRECTORY "C:/bespoke/tools" '
+                                  'REPLACE'.format(remote_archive)])
+        self.assertEqual(self.staf_handle.sent('fs', 'DELETE ENTRY'),
+                         ['DELETE ENTRY "{0}" RECURSE CONFIRM '.format(remote_archive)])
+        self.assertEqual(os.listdir(BespokeGlobals.ABS_LOCAL_STAGING), [])
+
+    def test8_uncompressed_copy_measured(self):
+        """Verify that an uncompressed transfer measures the link."""
+
+        self.test._staf_file_copy(self.incompressible, 'C:/bespoke/tools/random.bin')
+
+        self.assertEqual(self.staf_handle.sent('zip'), [])
+        self.assertNotEqual(self.sut.link_throughput, None)
+
+class CompressTransferTests_Negative(_CoreTestCase):
+    """Negative tests for deciding when to compress transfers to the SUT."""
+
+    def test1_missing_path(self):
+        """Verify that a payload that can't be read is not compressed."""
+
+        test = self._attach(TestPrep('prep', self.sut, 10, 0))
+
+        self.assertFalse(test._compress_transfer(join(self.temp_dir, 'missing')))
+
+class RecordTransferTests(TestCase):
+    """Tests for measuring the throughput of the link to a SystemUnderTest."""
+
+    def setUp(self):
+        self.sut = _create_sut()
+
+    def test1_first_transfer(self):
+        """Verify that the first transfer sets the throughput."""
+
+        self.sut.record_transfer(1000, 2)
+
+        self.assertEqual(self.sut.link_throughput, 500)
+
+    def test2_average(self):
+        """Verify that each transfer is averaged with the throughput so far."""
+
+        self.sut.record_transfer(1000, 1)
+        self.sut.record_transfer(3000, 1)
+        self.sut.record_transfer(6000, 1)
+
+        self.assertEqual(self.sut.link_throughput, ((1000 + 3000) / 2.0 + 6000) / 2.0)
+
+    def test3_instant_transfer(self):
+        """Verify that a transfer that took no measurable time doesn't divide by zero."""
+
+        self.sut.record_transfer(1000, 0)
+
+        self.assertEqual(self.sut.link_throughput, 1000 / 0.001)
+
+    def test4_small_transfer_ignored(self):
+        """Verify that transfers too small to measure the link are ignored."""
+
+        temp_dir = mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir, True)
+
+        small = join(temp_dir, 'small.txt')
+        _write_file(small, 'text')
+
+        TestPrep('prep', self.sut, 10, 0)._record_transfer(small, 0)
+
+        self.assertEqual(self.sut.link_throughput, None)
+
+class _ResultsStreamerTestCase(_CoreTestCase):
+    """Base class for tests that stream results from a fake results directory on the SUT."""
+
+    def setUp(self):
+        super(_ResultsStreamerTestCase, self).setUp()
+
+        self.remote_path = 'C:/bespoke/results/uuid'
+        self.local_path = join(self.temp_dir, 'results')
+        self.remote_files = {}      #{relative path:(content, modified)}
+        self.remote_dirs = []
+
+        self.staf_handle.rules.extend([('fs', 'LIST DIRECTORY', self._list),
+                                       ('fs', 'COPY FILE', self._copy)])
+
+        self.streamer = _ResultsStreamer(self.sut, self.remote_path, self.local_path, 0.01)
+
+    def _list(self, request):
+        """Answer a listing of the fake results directory."""
+
+        if request.endswith('TYPE D LONG'):
+            return _STAFResultStub(resultObj=[{'name': name, 'size': '0',
+                                               'lastModifiedTimestamp': '20170101-00:00:00'}
+                                              for name in self.remote_dirs])
+
+        return _STAFResultStub(resultObj=[{'name': name, 'size': str(len(content)),
+                                           'lastModifiedTimestamp': modified}
+                                          for name, (content, modified)
+                                          in self.remote_files.items()])
+
+    def _copy(self, request):
+        """Copy a file of the fake results directory to the local machine."""
+
+        remote_file, local_file = request.split('"')[1], request.split('"')[3]
+        name = remote_file[len(self.remote_path) + 1:]
+
+        if name not in self.remote_files:
+            return _STAFResultStub(_STAFResultStub.DoesNotExist, 'Does not exist')
+
+        _write_file(local_file, self.remote_files[name][0])
+
+        return _STAFResultStub()
+
+    def _local(self, name):
+        """Read a local results file or return None if it doesn't exist."""
+
+        if not isfile(join(self.local_path, name)):
+            return None
+
+        with open(join(self.local_path, name), 'rb') as results_file:
+            return results_file.read()
+
+class ResultsStreamerTests(_ResultsStreamerTestCase):
+    """Tests for the _ResultsStreamer class in the core module."""
+
+    def test1_settled_file(self):
+        """Verify that a new file is copied once it has stopped changing."""
+
+        self.remote_files['log.txt'] = ('line 1', '20170101-00:00:01')
+
+        self.streamer.sync(self.staf_handle)
+
+        self.assertEqual(self._local('log.txt'), None)
+        self.assertFalse(self.streamer.synced)
+
+        self.streamer.sync(self.staf_handle)
+
+        self.assertEqual(self._local('log.txt'), 'line 1')
+        self.assertTrue(self.streamer.synced)
+        self.assertFalse(isfile(join(self.local_path, 'log.txt.part')))
+
+    def test2_unchanged_file(self):
+        """Verify that a file that didn't change since it was synced isn't copied again."""
+
+        self.remote_files['log.txt'] = ('line 1', '20170101-00:00:01')
+
+        self.streamer.sync(self.staf_handle, final=True)
+        self.streamer.sync(self.staf_handle)
+        self.streamer.sync(self.staf_handle)
+
+        self.assertEqual(len(self.staf_handle.sent('fs', 'COPY FILE')), 1)
+
+    def test3_growing_file(self):
+        """Verify that a file that keeps growing is deferred but still copied eventually."""
+
+        for index in range(BespokeGlobals.RESULTS_STREAM_MAX_DEFER + 1):
+            self.remote_files['log.txt'] = ('line\n' * (index + 1),
+                                            '20170101-00:00:{0:02}'.format(index))
+            self.streamer.sync(self.staf_handle)
+
+        self.assertEqual(len(self.staf_handle.sent('fs', 'COPY FILE')), 1)
+        self.assertEqual(self._local('log.txt'),
+                         'line\n' * (BespokeGlobals.RESULTS_STREAM_MAX_DEFER + 1))
+
+    def test4_appended_file(self):
+        """Verify that a file appended to after it was synced is copied again."""
+
+        self.remote_files['log.txt'] = ('line 1', '20170101-00:00:01')
+        self.streamer.sync(self.staf_handle, final=True)
+
+        self.remote_files['log.txt'] = ('line 1 line 2', '20170101-00:00:02')
+        self.streamer.sync(self.staf_handle)
+        self.streamer.sync(self.staf_handle)
+
+        self.assertEqual(self._local('log.txt'), 'line 1 line 2')
+
+    def test5_reconcile(self):
+        """Verify that reconciling copies every change, removes deleted files and creates empty
+        directories."""
+
+        self.remote_files['deleted.txt'] = ('temporary', '20170101-00:00:01')
+        self.streamer.sync(self.staf_handle, final=True)
+
+        del self.remote_files['deleted.txt']
+        self.remote_files['log.txt'] = ('line 1', '20170101-00:00:02')
+        self.remote_dirs.append('empty')
+
+        self.streamer.reconcile(self.staf_handle)
+
+        self.assertEqual(self._local('log.txt'), 'line 1')
+        self.assertEqual(self._local('deleted.txt'), None)
+        self.assertTrue(isdir(join(self.local_path, 'empty')))
+
+    def test6_background_sync(self):
+        """Verify that results are synced in the background with a pooled handle."""
+
+        pool = _STAFHandlePoolStub(self.staf_handle)
+        self.remote_files['log.txt'] = ('line 1', '20170101-00:00:01')
+
+        with patch.object(BespokeGlobals, 'STAF_HANDLE_POOL', pool):
+            self.streamer.start()
+
+            for _ in range(500):
+                if self.streamer.synced:
+                    break
+
+                sleep(0.01)
+
+            self.streamer.stop()
+
+        self.assertEqual(self._local('log.txt'), 'line 1')
+        self.assertEqual(pool.checked_out, 0)
+
+class ResultsStreamerTests_Negative(_ResultsStreamerTestCase):
+    """Negative tests for the _ResultsStreamer class in the core module."""
+
+    def test1_copy_failure(self):
+        """Verify that a failed copy is retried by the next sync instead of being reported."""
+
+        self.remote_files['log.txt'] = ('line 1', '20170101-00:00:01')
+        self.staf_handle.rules.insert(0, ('fs', 'COPY FILE', _STAFResultStub(16, 'No path')))
+
+        self.streamer.sync(self.staf_handle)
+        self.streamer.sync(self.staf_handle)
+
+        self.assertFalse(self.streamer.synced)
+
+        del self.staf_handle.rules[0]
+        self.streamer.sync(self.staf_handle)
+
+        self.assertEqual(self._local('log.txt'), 'line 1')
+
+    def test2_final_copy_failure(self):
+        """Verify that a failed copy is reported by the final sync."""
+
+        self.remote_files['log.txt'] = ('line 1', '20170101-00:00:01')
+        self.staf_handle.rules.insert(0, ('fs', 'COPY FILE', _STAFResultStub(16, 'No path')))
+
+        with self.assertRaises(CoreError) as cm:
+            self.streamer.reconcile(self.staf_handle)
+
+        self.assertEqual(cm.exception.msg, 'No path')
+
+    def test3_unexpected_listing(self):
+        """Verify that a listing without the expected fields is reported."""
+
+        self.staf_handle.rules.insert(0, ('fs', 'LIST DIRECTORY',
+                                          _STAFResultStub(resultObj=[{'name': 'log.txt'}])))
+
+        with self.assertRaises(CoreError) as cm:
+            self.streamer.sync(self.staf_handle)
+
+        self.assertEqual(cm.exception.msg, 'Unexpected listing of the remote results directory '
+                                           '"{0}"!'.format(self.remote_path))
@@ -12,6 +12,12 @@ __version__ = 0.1
 #===================================================================================================
 # Imports
 #===================================================================================================
+import shutil
+from time import sleep
+from threading import Thread, Lock
+from tempfile import mkdtemp
+from os import makedirs
+from os.path import join, isfile
 from unittest import TestCase, skip
 from mock import patch
 #===================================================================================================
@@ -225,6 +231,30 @@ class _ProgressStub(object):
         None.
     """
     
+    def __init__(self):
+        self.completed = True
+        self.cancelable = True
+        self.canceled = False
+        self.percent = 100
+        self.operationDescription = 'Done'
+        self.timeRemaining = 0
+        self.resultCode = 0
+    
+    def cancel(self):
+        """Cancels the task.
+        
+        Args:
+            None.
+        
+        Returns:
+            None.
+        
+        Raises:
+            None.
+        """
+        
+        self.canceled = True
+    
     def waitForCompletion(self, timeout):
         """Waits until the task is done (including all sub-operations) with a given timeout in
         milliseconds; specify -1 for an indefinite wait. 
@@ -271,6 +301,21 @@ class _ConsoleStub(object):
         
         return self._progress
 
+    def saveState(self):
+        """Saves the current execution state of a running virtual machine and stops its execution.
+        
+        Args:
+            None.
+        
+        Returns:
+            (_ProgressStub)
+        
+        Raises:
+            None.
+        """
+        
+        return self._progress
+
     def reset(self):
         """Resets the virtual machine.
         
@@ -302,6 +347,23 @@ class _ConsoleStub(object):
         
         return self._progress
     
+    def takeSnapshot(self, name, description):
+        """Saves the current execution state and all settings of the machine and creates 
+        differencing images for all normal (non-independent) media.
+        
+        Args:
+            name (str): Short name for the snapshot.
+            description (str): Optional description of the snapshot.
+        
+        Returns:
+            (_ProgressStub)
+        
+        Raises:
+            None.
+        """
+        
+        return self._progress
+    
 class _SnapshotStub(object):
     """This stub class provides dummy methods, attributes and properties for
     the 'ISnapshot' interface class in the 'vboxapi' module.
@@ -373,6 +435,97 @@ class VBoxMachineTests(TestCase):
         self.test_vm._mgr.mgr._session.state = 2
         
         self.test_vm.apply_snapshot('Basic')
+    
+    def test5_suspend_vm(self):
+        """Verify that a running VM can be suspended."""
+        
+        #Set the machine state to "Running"
+        self.test_vm._machine.state = 5
+        
+        #Set the session lock state to "Locked"
+        self.test_vm._mgr.mgr._session.state = 2
+        
+        with patch.object(self.test_vm, '_wait_for_machine_state') as wait_mock:
+            self.test_vm.suspend()
+        
+        wait_mock.assert_called_once_with('Suspended')
+    
+    def test6_resume_vm(self):
+        """Verify that a suspended VM can be resumed."""
+        
+        #Set the machine state to "Suspended"
+        self.test_vm._machine.state = 2
+        
+        #Set the session lock state to "Locked"
+        self.test_vm._mgr.mgr._session.state = 2
+        
+        self.test_vm.resume()
+    
+    def test7_take_live_snapshot(self):
+        """Verify that a snapshot can be taken of a running machine."""
+        
+        #Set the machine state to "Running"
+        self.test_vm._machine.state = 5
+        
+        #Set the session lock state to "Locked"
+        self.test_vm._mgr.mgr._session.state = 2
+        
+        self.test_vm.take_snapshot('Live')
+    
+    def test8_apply_snapshot_to_suspended_vm(self):
+        """Verify that a snapshot can be applied to a suspended machine."""
+        
+        #Set the machine state to "Suspended"
+        self.test_vm._machine.state = 2
+        
+        #Set the session lock state to "Locked"
+        self.test_vm._mgr.mgr._session.state = 2
+        
+        self.test_vm.apply_snapshot('Basic')
+    
+    def test9_progress_callback(self):
+        """Verify that operation progress is reported to the progress callback."""
+        from hypervisor import VBoxMachine, OperationProgress
+        
+        reports = []
+        test_vm = VBoxMachine('localhost', 
+                              'fake', 
+                              progress_callback=lambda vm, progress: reports.append(progress))
+        
+        #Set the machine state to "Stopped"
+        test_vm._machine.state = 1
+        
+        #Set the session lock state to "Locked"
+        test_vm._mgr.mgr._session.state = 2
+        
+        test_vm.start()
+        
+        self.assertEqual(reports[-1], OperationProgress('start', 100, 'Done', 0))
+        self.assertEqual(test_vm.last_progress, reports[-1])
+    
+    def test10_cancel_while_idle(self):
+        """Verify that a cancellation made while no operation is in progress doesn't cancel the
+        next operation."""
+        
+        #Set the machine state to "Stopped"
+        self.test_vm._machine.state = 1
+        
+        #Set the session lock state to "Locked"
+        self.test_vm._mgr.mgr._session.state = 2
+        
+        #The restore completes before the cancellation arrives.
+        self.test_vm.apply_snapshot('Basic')
+        self.test_vm.cancel()
+        
+        progress = self.test_vm._machine._progress
+        progress.completed = False
+        
+        #The start finishes on its first wait unless the cancellation is still pending.
+        with patch.object(progress, 'waitForCompletion', 
+                          side_effect=lambda timeout: setattr(progress, 'completed', True)):
+            self.test_vm.start()
+        
+        self.assertFalse(progress.canceled)
         
 class VBoxMachineTests_Negative(TestCase):
     """Negative tests for the VBoxMachine class in the hypervisor module."""
@@ -462,4 +615,459 @@ class VBoxMachineTests_Negative(TestCase):
                                      "snapshot!"))
         self.assertEqual(excep.host, 'localhost')
         self.assertEqual(excep.vm_name, 'fake')
-        
\ No newline at end of file
+    
+    def test5_resume_running_vm(self):
+        """Attempt to resume a VM that is not suspended."""
+        from hypervisor import VMError  #Import local to avoid screwing up mock.
+        
+        #Set the machine state to "Running"
+        self.test_vm._machine.state = 5
+        
+        #Set the session lock state to "Locked"
+        self.test_vm._mgr.mgr._session.state = 2
+        
+        with self.assertRaises(VMError) as cm:
+            self.test_vm.resume()
+             
+        #Make sure exception contains correct error information.
+        excep = cm.exception
+        self.assertEqual(excep.msg, "Virtual machine must be in suspended state before resuming!")
+        self.assertEqual(excep.host, 'localhost')
+        self.assertEqual(excep.vm_name, 'fake')
+    
+    def test6_suspend_stopped_vm(self):
+        """Attempt to suspend a stopped VM."""
+        from hypervisor import VMError  #Import local to avoid screwing up mock.
+        
+        #Set the machine state to "Stopped"
+        self.test_vm._machine.state = 1
+        
+        #Set the session lock state to "Locked"
+        self.test_vm._mgr.mgr._session.state = 2
+        
+        with self.assertRaises(VMError) as cm:
+            self.test_vm.suspend()
+             
+        #Make sure exception contains correct error information.
+        excep = cm.exception
+        self.assertEqual(excep.msg, "Virtual machine must be in a running state before suspending!")
+        self.assertEqual(excep.host, 'localhost')
+        self.assertEqual(excep.vm_name, 'fake')
+    
+    def test7_start_vm_timeout(self):
+        """Attempt to start a VM that never finishes starting before the start timeout."""
+        from hypervisor import VBoxMachine, VMError
+        
+        test_vm = VBoxMachine('localhost', 'fake', op_timeouts={'start':0})
+        
+        #Set the machine state to "Stopped"
+        test_vm._machine.state = 1
+        
+        #Set the progress to never complete.
+        progress = test_vm._machine._progress
+        progress.completed = False
+        self.addCleanup(setattr, progress, 'completed', True)
+        
+        with self.assertRaises(VMError) as cm:
+            test_vm.start()
+        
+        excep = cm.exception
+        self.assertEqual(excep.msg, 'Failed to start the virtual machine! Reason: The "start" '
+                                    'operation timed out after 0 seconds!')
+        self.assertTrue(progress.canceled)
+    
+    def test8_cancel_start_vm(self):
+        """Attempt to start a VM while cancelling the start."""
+        from hypervisor import VMError  #Import local to avoid screwing up mock.
+        
+        #Set the machine state to "Stopped"
+        self.test_vm._machine.state = 1
+        
+        #Set the progress to never complete.
+        progress = self.test_vm._machine._progress
+        progress.completed = False
+        self.addCleanup(setattr, progress, 'completed', True)
+        
+        #Cancel while the start is waiting for its progress.
+        with patch.object(progress, 'waitForCompletion', 
+                          side_effect=lambda timeout: self.test_vm.cancel()):
+            with self.assertRaises(VMError) as cm:
+                self.test_vm.start()
+        
+        excep = cm.exception
+        self.assertEqual(excep.msg, 'Failed to start the virtual machine! Reason: The "start" '
+                                    'operation was cancelled!')
+        self.assertTrue(progress.canceled)
+    
+    def test9_resume_vm_session_failure(self):
+        """Attempt to resume a VM when no session can be created."""
+        from hypervisor import VMError  #Import local to avoid screwing up mock.
+        
+        #Set the machine state to "Suspended"
+        self.test_vm._machine.state = 2
+        
+        with patch.object(self.test_vm._mgr.mgr, 'getSessionObject') as session_mock:
+            session_mock.side_effect = RuntimeError('No session!')
+            
+            with self.assertRaises(VMError) as cm:
+                self.test_vm.resume()
+        
+        #The session failure is reported instead of being hidden by the session clean up.
+        excep = cm.exception
+        self.assertEqual(excep.msg, 'Failed to resume the virtual machine! Reason: No session!')
+    
+    def test10_apply_snapshot_issue_failure(self):
+        """Attempt to apply a snapshot that fails to start after the VM was locked."""
+        from hypervisor import VMError  #Import local to avoid screwing up mock.
+        
+        #Set the machine state to "Stopped"
+        self.test_vm._machine.state = 1
+        
+        #Set the session lock state to "Locked"
+        session = self.test_vm._mgr.mgr._session
+        session.state = 2
+        
+        with patch.object(session.console, 'restoreSnapshot') as restore_mock:
+            restore_mock.side_effect = RuntimeError('Busy!')
+            
+            with patch.object(self.test_vm._mgr, 'closeMachineSession') as close_mock:
+                with self.assertRaises(VMError) as cm:
+                    self.test_vm.apply_snapshot('Basic')
+        
+        #The VM isn't left locked by the failed restore.
+        close_mock.assert_called_with(session)
+        self.assertEqual(cm.exception.msg, 'Failed to apply snapshot! Reason: Busy!')
+    
+    def test11_apply_snapshot_progress_failure(self):
+        """Attempt to apply a snapshot that fails while the restore is in progress."""
+        from hypervisor import VMError  #Import local to avoid screwing up mock.
+        
+        #Set the machine state to "Stopped"
+        self.test_vm._machine.state = 1
+        
+        #Set the session lock state to "Locked"
+        session = self.test_vm._mgr.mgr._session
+        session.state = 2
+        
+        progress = session.console._progress
+        progress.resultCode = 1
+        self.addCleanup(setattr, progress, 'resultCode', 0)
+        
+        with patch.object(self.test_vm._mgr, 'closeMachineSession') as close_mock:
+            with self.assertRaises(VMError) as cm:
+                self.test_vm.apply_snapshot('Basic')
+        
+        #The VM isn't left locked by the failed restore.
+        close_mock.assert_called_once_with(session)
+        self.assertEqual(cm.exception.msg, 'Failed to apply snapshot! Reason: The '
+                                           '"apply_snapshot" operation failed! Result code 1')
+
+class HostOperationLimiterTests(TestCase):
+    """Tests for the per-host admission control used by the VBoxMachine class."""
+    
+    def setUp(self):
+        patcher = patch('vboxapi.VirtualBoxManager')
+        self.addCleanup(patcher.stop)
+        self.virtual_box_manager_mock = patcher.start()
+        self.virtual_box_manager_mock.return_value = _VboxManagerStub()
+        
+    def _run_concurrent(self, limiter, operation, count):
+        """Run several fake operations at once and return the peak concurrency observed."""
+        
+        state = {'active':0, 'peak':0}
+        state_lock = Lock()
+        
+        def fake_operation():
+            with limiter.admit(operation):
+                with state_lock:
+                    state['active'] += 1
+                    state['peak'] = max(state['peak'], state['active'])
+                sleep(0.05)
+                with state_lock:
+                    state['active'] -= 1
+        
+        threads = [Thread(target=fake_operation) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        return state['peak']
+    
+    def test1_limit_operation(self):
+        """Verify that concurrent operations on one host are capped at the configured limit."""
+        from hypervisor import _HostOperationLimiter  #Import local to avoid screwing up mock.
+        
+        limiter = _HostOperationLimiter('limit-host-1', {'apply_snapshot':2})
+        
+        self.assertEqual(limiter.limit('apply_snapshot'), 2)
+        self.assertIsNone(limiter.limit('start'))
+        self.assertEqual(self._run_concurrent(limiter, 'apply_snapshot', 6), 2)
+    
+    def test2_hosts_are_independent(self):
+        """Verify that limits are shared by machines on a host but not across hosts."""
+        from hypervisor import _HostOperationLimiter  #Import local to avoid screwing up mock.
+        
+        first_limiter = _HostOperationLimiter('limit-host-2', {'start':1})
+        second_limiter = _HostOperationLimiter('limit-host-2', {'start':4})
+        other_limiter = _HostOperationLimiter('limit-host-3')
+        
+        #The first limits declared for a host win.
+        self.assertEqual(first_limiter.limit('start'), 1)
+        self.assertEqual(second_limiter.limit('start'), 1)
+        self.assertIsNone(other_limiter.limit('start'))
+        self.assertEqual(self._run_concurrent(second_limiter, 'start', 3), 1)
+        self.assertGreater(self._run_concurrent(other_limiter, 'start', 3), 1)
+    
+    def test3_limited_start_vm(self):
+        """Verify that a stopped VM can be started on a host with a start limit."""
+        from hypervisor import VBoxMachine
+        
+        test_vm = VBoxMachine('localhost', 'fake', op_limits={'start':1})
+        
+        #Set the machine state to "Stopped"
+        test_vm._machine.state = 1
+        
+        #Set the session lock state to "Locked"
+        test_vm._mgr.mgr._session.state = 2
+        
+        test_vm.start()
+        
+        #A second start would block forever if the first start did not release its slot.
+        test_vm._machine.state = 1
+        test_vm.start()
+    
+    def test4_unknown_operation(self):
+        """Attempt to limit an operation that cannot be limited."""
+        from hypervisor import _HostOperationLimiter, VMError
+        
+        with self.assertRaises(VMError) as cm:
+            _HostOperationLimiter('limit-host-4', {'restart':1})
+        
+        excep = cm.exception
+        self.assertEqual(excep.msg, 'The operation "restart" cannot be limited!')
+        self.assertEqual(excep.host, 'limit-host-4')
+
+class VBoxHostTests(TestCase):
+    """Tests for the batch operations of the VBoxHost class in the hypervisor module."""
+    
+    def setUp(self):
+        patcher = patch('vboxapi.VirtualBoxManager')
+        self.addCleanup(patcher.stop)
+        self.virtual_box_manager_mock = patcher.start()
+        self.virtual_box_manager_mock.return_value = _VboxManagerStub()
+        
+        from hypervisor import VBoxHost, VBoxMachine
+        self.test_host = VBoxHost('localhost')
+        self.test_vms = [VBoxMachine('localhost', 'fake'), VBoxMachine('localhost', 'fake')]
+        
+        #Set the session lock state to "Locked"
+        self.test_vms[0]._mgr.mgr._session.state = 2
+        
+    def test1_start_many(self):
+        """Verify that many stopped VMs can be started in one batch."""
+        
+        #Set the machine state to "Stopped" (The VMs share the same machine stub.)
+        self.test_vms[0]._machine.state = 1
+        
+        self.test_host.start_many(self.test_vms)
+    
+    def test2_restore_many(self):
+        """Verify that snapshots can be applied to many VMs in one batch."""
+        
+        #Set the machine state to "Stopped" (The VMs share the same machine stub.)
+        self.test_vms[0]._machine.state = 1
+        
+        self.test_host.restore_many([(vm, 'Basic') for vm in self.test_vms])
+    
+    def test3_start_many_running_vms(self):
+        """Attempt to start many VMs that are already running."""
+        from hypervisor import VMError  #Import local to avoid screwing up mock.
+        
+        #Set the machine state to "Running" (The VMs share the same machine stub.)
+        self.test_vms[0]._machine.state = 5
+        
+        with self.assertRaises(VMError) as cm:
+            self.test_host.start_many(self.test_vms)
+        
+        #Every failure is reported in the one exception.
+        excep = cm.exception
+        self.assertTrue(excep.msg.startswith('Failed to start 2 of 2 virtual machines!'))
+        self.assertEqual(excep.msg.count('Virtual machine must be in stopped state before '
+                                         'starting!'), 2)
+        self.assertEqual(excep.host, 'localhost')
+    
+    def test4_wrong_host(self):
+        """Attempt to batch a VM from a different host."""
+        from hypervisor import VBoxHost, VMError
+        
+        with self.assertRaises(VMError) as cm:
+            VBoxHost('otherhost').stop_many(self.test_vms)
+        
+        excep = cm.exception
+        self.assertEqual(excep.msg, 'Virtual machine is not on the batch host!')
+        self.assertEqual(excep.host, 'otherhost')
+        self.assertEqual(excep.vm_name, 'fake')
+    
+    def test5_sessions_reused(self):
+        """Verify that the sessions of completed operations are reused by later waves."""
+        
+        #Set the machine state to "Stopped" (The VMs share the same machine stub.)
+        self.test_vms[0]._machine.state = 1
+        
+        session_mgr = self.test_vms[0]._mgr.mgr
+        
+        with patch.object(session_mgr, 
+                          'getSessionObject', 
+                          wraps=session_mgr.getSessionObject) as session_mock:
+            self.test_host.restore_many([(vm, 'Basic') for vm in self.test_vms])
+            self.test_host.start_many(self.test_vms)
+        
+        #One session per VM in the first wave and none afterwards.
+        self.assertEqual(session_mock.call_count, 2)
+    
+    def test6_failed_wave_unlocks_sessions(self):
+        """Verify that the session of an operation that fails while in progress is unlocked and
+        kept for later operations."""
+        from hypervisor import VMError  #Import local to avoid screwing up mock.
+        
+        #Set the machine state to "Stopped"
+        self.test_vms[0]._machine.state = 1
+        
+        session = self.test_vms[0]._mgr.mgr._session
+        progress = session.console._progress
+        progress.resultCode = 1
+        self.addCleanup(setattr, progress, 'resultCode', 0)
+        
+        with patch.object(self.test_vms[0]._mgr, 'closeMachineSession') as close_mock:
+            with self.assertRaises(VMError):
+                self.test_host.restore_many([(self.test_vms[0], 'Basic')])
+        
+        close_mock.assert_called_once_with(session)
+        self.assertEqual(self.test_host._sessions, [session])
+    
+    def test7_failed_issue_unlocks_session(self):
+        """Verify that the session of an operation that fails to start after locking the VM is
+        unlocked."""
+        from hypervisor import VMError  #Import local to avoid screwing up mock.
+        
+        #Set the machine state to "Running"
+        self.test_vms[0]._machine.state = 5
+        
+        session = self.test_vms[0]._mgr.mgr._session
+        
+        with patch.object(session.console, 'powerDown') as power_down_mock:
+            power_down_mock.side_effect = RuntimeError('Busy!')
+            
+            with patch.object(self.test_vms[0]._mgr, 'closeMachineSession') as close_mock:
+                with self.assertRaises(VMError) as cm:
+                    self.test_host.stop_many([self.test_vms[0]])
+        
+        close_mock.assert_called_once_with(session)
+        self.assertIn('"fake": Busy!', cm.exception.msg)
+
+class LocalMachineTests(TestCase):
+    """Happy path tests for the LocalMachine class in the hypervisor module."""
+    
+    def setUp(self):
+        patcher = patch('vboxapi.VirtualBoxManager')
+        self.addCleanup(patcher.stop)
+        patcher.start()
+        
+        self.root = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        
+        from hypervisor import LocalMachine
+        self.test_vm = LocalMachine('localhost', 'fake', join(self.root, 'sandbox'))
+        self.test_vm.setup()
+        
+    def test1_start_stop_vm(self):
+        """Verify that a sandbox can be started and stopped."""
+        
+        self.test_vm.start()
+        self.assertEqual(self.test_vm.current_state, 'Running')
+        
+        self.test_vm.restart()
+        self.assertEqual(self.test_vm.current_state, 'Running')
+        
+        self.test_vm.stop()
+        self.assertEqual(self.test_vm.current_state, 'Stopped')
+        
+    def test2_apply_snapshot(self):
+        """Verify that applying a snapshot restores the sandbox directory."""
+        
+        open(join(self.test_vm.sandbox, 'keep.txt'), 'w').close()
+        self.test_vm.take_snapshot('Basic')
+        
+        #Dirty the sandbox.
+        makedirs(join(self.test_vm.sandbox, 'junk'))
+        open(join(self.test_vm.sandbox, 'junk', 'junk.txt'), 'w').close()
+        
+        self.test_vm.apply_snapshot('Basic')
+        
+        self.assertTrue(isfile(join(self.test_vm.sandbox, 'keep.txt')))
+        self.assertFalse(isfile(join(self.test_vm.sandbox, 'junk', 'junk.txt')))
+        self.assertTrue(self.test_vm.is_sandbox)
+    
+    def test3_suspend_resume_vm(self):
+        """Verify that a sandbox can be suspended and resumed."""
+        
+        self.test_vm.start()
+        
+        self.test_vm.suspend()
+        self.assertEqual(self.test_vm.current_state, 'Suspended')
+        
+        self.test_vm.resume()
+        self.assertEqual(self.test_vm.current_state, 'Running')
+        
+class LocalMachineTests_Negative(TestCase):
+    """Negative tests for the LocalMachine class in the hypervisor module."""
+    
+    def setUp(self):
+        patcher = patch('vboxapi.VirtualBoxManager')
+        self.addCleanup(patcher.stop)
+        patcher.start()
+        
+        self.root = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        
+        from hypervisor import LocalMachine
+        self.test_vm = LocalMachine('localhost', 'fake', join(self.root, 'sandbox'))
+        self.test_vm.setup()
+        
+    def test1_remote_host(self):
+        """Attempt to create a sandbox on a remote host."""
+        from hypervisor import LocalMachine, VMError  #Import local to avoid screwing up mock.
+        
+        with self.assertRaises(VMError) as cm:
+            LocalMachine('cornholio.fancylads.local', 'fake', join(self.root, 'sandbox'))
+             
+        #Make sure exception contains correct error information.
+        excep = cm.exception
+        self.assertEqual(excep.msg, "Sandbox machines can only be hosted on the local machine!")
+        self.assertEqual(excep.host, 'cornholio.fancylads.local')
+        self.assertEqual(excep.vm_name, 'fake')
+        
+    def test2_start_running_vm(self):
+        """Attempt to start an already running sandbox."""
+        from hypervisor import VMError  #Import local to avoid screwing up mock.
+        
+        self.test_vm.start()
+        
+        with self.assertRaises(VMError) as cm:
+            self.test_vm.start()
+             
+        #Make sure exception contains correct error information.
+        excep = cm.exception
+        self.assertEqual(excep.msg, "Virtual machine must be in stopped state before starting!")
+        
+    def test3_apply_missing_snapshot(self):
+        """Attempt to apply a snapshot that doesn't exist."""
+        from hypervisor import VMError  #Import local to avoid screwing up mock.
+        
+        with self.assertRaises(VMError) as cm:
+            self.test_vm.apply_snapshot('Missing')
+             
+        #Make sure exception contains correct error information.
+        excep = cm.exception
+        self.assertEqual(excep.msg, 'Failed to find snapshot with the name "Missing"!')
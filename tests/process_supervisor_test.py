@@ -0,0 +1,319 @@
+"""
+.. module:: process_supervisor_test
+   :platform: Linux, Windows
+   :synopsis: Unit tests for the process_supervisor module with a mocked STAF handle.
+   :license: BSD, see LICENSE for more details.
+
+.. moduleauthor:: Caleb Moniot <cmoniot@gmail.com>
+"""
+__version__ = 0.1
+
+#===================================================================================================
+# Imports
+#===================================================================================================
+import re
+from unittest import TestCase
+from mock import patch
+from core.staf_pool import STAFHandlePool
+from core.process_supervisor import ProcessSupervisor, SupervisorError, PROCESS_END
+
+#===================================================================================================
+# Classes
+#===================================================================================================
+class _STAFResultStub(object):
+    """A stand-in for a STAF result."""
+
+    Ok = 0
+    Timeout = 37
+
+    def __init__(self, rc=0, result='', resultObj=None):
+        self.rc = rc
+        self.result = result
+        self.resultObj = resultObj if resultObj is not None else result
+
+class _RawHandleStub(object):
+    """A stand-in for a registered STAF handle with a queue of process end notifications. Process
+    requests are answered by the function set for the request type and succeed otherwise. Waiting
+    on an empty queue times out right away."""
+
+    Standard = 0
+
+    def __init__(self, *args):
+        self.queue = []
+        self.answers = {}
+        self.requests = []
+
+    def submit(self, location, service, request):
+        self.requests.append((service, request))
+
+        if service == 'queue':
+            if len(self.queue) == 0:
+                return _STAFResultStub(_STAFResultStub.Timeout)
+
+            return _STAFResultStub(resultObj={'message': self.queue.pop(0)})
+
+        answer = self.answers.get(request.split(' ', 1)[0])
+
+        return answer(request) if answer is not None else _STAFResultStub()
+
+    def unregister(self):
+        pass
+
+    def notify(self, key, handle, rc=0, output=None):
+        """Queue the process end notification that STAF sends for a process."""
+
+        self.queue.append({'key': key,
+                           'handle': handle,
+                           'rc': str(rc),
+                           'fileList': [{'data': output}] if output is not None else []})
+
+    def sent(self, prefix):
+        """The process requests that start with a prefix."""
+
+        return [request for service, request in self.requests
+                if service == 'process' and request.startswith(prefix)]
+
+class _PooledHandleStub(object):
+    """A stand-in for a pooled STAF handle that records which requests were submitted through the
+    pool instead of the raw handle."""
+
+    def __init__(self):
+        self.raw = _RawHandleStub()
+        self.recorded = []
+
+    def submit(self, location, service, request):
+        self.recorded.append(service)
+
+        return self.raw.submit(location, service, request)
+
+class _STAFHandlePoolStub(object):
+    """A stand-in for the STAF handle pool that always hands out the same handle."""
+
+    def __init__(self, pooled):
+        self.pooled = pooled
+
+    def checkout(self):
+        return self.pooled
+
+#===================================================================================================
+# Functions
+#===================================================================================================
+def _key(request):
+    """The notification key of a process start request."""
+
+    return re.search(r'KEY (\S+)', request).group(1)
+
+#===================================================================================================
+# Tests
+#===================================================================================================
+class _ProcessSupervisorTestCase(TestCase):
+    """Base class for tests that drive a supervisor by hand instead of from its thread."""
+
+    def setUp(self):
+        thread_patcher = patch('core.process_supervisor.Thread')
+        thread_patcher.start()
+        self.addCleanup(thread_patcher.stop)
+
+        self.pooled = _PooledHandleStub()
+        self.handle = self.pooled.raw
+        self.supervisor = ProcessSupervisor(_STAFHandlePoolStub(self.pooled))
+
+    def _start(self, timeout=60, handle='7'):
+        """Start a process that STAF knows by the given handle."""
+
+        self.handle.answers['START'] = lambda request: _STAFResultStub(result=handle)
+
+        return self.supervisor.start('10.0.0.1', 'START COMMAND "hostname"', timeout)
+
+    def _query_results(self, *results):
+        """Answer the QUERY requests with the given results in order."""
+
+        results = list(results)
+
+        self.handle.answers['QUERY'] = lambda request: results.pop(0)
+
+class ProcessSupervisorTests(_ProcessSupervisorTestCase):
+    """Tests for the ProcessSupervisor class in the process_supervisor module."""
+
+    def test1_notification(self):
+        """Verify that a process is completed with the exit code and output of its
+        notification."""
+
+        process = self._start()
+        key = _key(self.handle.sent('START')[0])
+
+        self.handle.notify(key, '7', 3, 'output')
+        self.supervisor._track()
+
+        self.assertEqual(process.result(), (3, 'output'))
+        self.assertEqual(self.handle.sent('FREE'), ['FREE HANDLE 7'])
+        self.assertIn('NOTIFY ONEND KEY {0}'.format(key), self.handle.sent('START')[0])
+
+    def test2_notification_before_response(self):
+        """Verify that a notification that beats the response to the start request completes the
+        process with the handle it carries."""
+
+        def start(request):
+            self.handle.notify(_key(request), '7', 0, 'output')
+            self.supervisor._receive()
+
+            return _STAFResultStub(result='7')
+
+        self.handle.answers['START'] = start
+
+        process = self.supervisor.start('10.0.0.1', 'START COMMAND "hostname"', 60)
+
+        self.assertTrue(process.done())
+        self.assertEqual(process.handle, '7')
+        self.assertEqual(process.result(), (0, 'output'))
+        self.assertEqual(self.handle.sent('FREE'), ['FREE HANDLE 7'])
+
+    def test3_lost_notification(self):
+        """Verify that a process found ended by a poll is only completed after one more interval
+        without a notification."""
+
+        ended = _STAFResultStub(resultObj={'endTimestamp': '20170101-00:00:01', 'rc': '5'})
+        self._query_results(ended, ended)
+
+        process = self._start()
+
+        self.supervisor._poll(process)
+
+        self.assertFalse(process.done())
+
+        self.supervisor._poll(process)
+
+        self.assertEqual(process.result(), (5, ''))
+
+    def test4_running_process_polled(self):
+        """Verify that a running process is only queried once its poll interval has passed."""
+
+        running = _STAFResultStub(resultObj={'endTimestamp': '', 'rc': None})
+        self._query_results(running)
+
+        process = self._start()
+
+        self.supervisor._track()
+
+        self.assertEqual(self.handle.sent('QUERY'), [])
+
+        process._next_poll = 0
+        self.supervisor._track()
+
+        self.assertEqual(self.handle.sent('QUERY'), ['QUERY HANDLE 7'])
+        self.assertFalse(process.done())
+
+    def test5_stop_at_deadline(self):
+        """Verify that a process that runs past its timeout is stopped and freed."""
+
+        process = self._start(timeout=0)
+
+        self.supervisor._track()
+
+        self.assertEqual(self.handle.sent('STOP'), ['STOP HANDLE 7'])
+        self.assertEqual(self.handle.sent('FREE'), ['FREE HANDLE 7'])
+
+        with self.assertRaises(SupervisorError) as cm:
+            process.result()
+
+        self.assertEqual(cm.exception.msg, 'The process "7" on "10.0.0.1" timed out!')
+
+    def test6_notification_after_stop(self):
+        """Verify that the notification STAF sends for a stopped process is received and
+        ignored."""
+
+        process = self._start(timeout=0)
+        self.supervisor._track()
+
+        self.handle.notify(_key(self.handle.sent('START')[0]), '7', 1, 'output')
+        self.supervisor._track()
+
+        self.assertEqual(self.handle.queue, [])
+        self.assertEqual(self.handle.sent('FREE'), ['FREE HANDLE 7'])
+
+        with self.assertRaises(SupervisorError):
+            process.result()
+
+    def test7_wakeup_cleared(self):
+        """Verify that the supervisor only goes back to sleep once every process has ended."""
+
+        first = self._start(handle='7')
+        self._start(handle='8')
+
+        self.handle.notify(_key(self.handle.sent('START')[0]), '7')
+        self.supervisor._track()
+
+        self.assertTrue(first.done())
+        self.assertTrue(self.supervisor._wakeup.is_set())
+
+        self.handle.notify(_key(self.handle.sent('START')[1]), '8')
+        self.supervisor._track()
+
+        self.assertFalse(self.supervisor._wakeup.is_set())
+        self.assertEqual(self.supervisor.running, 0)
+
+    def test8_wait_not_recorded(self):
+        """Verify that waiting for a notification isn't recorded in the pool statistics."""
+
+        self._start()
+        self.supervisor._track()
+
+        self.assertEqual(self.pooled.recorded, ['process'])
+        self.assertIn(('queue', 'GET TYPE {0} WAIT 1000'.format(PROCESS_END)),
+                      self.handle.requests)
+
+    def test9_pooled_wait_timeout(self):
+        """Verify that a notification wait that times out doesn't count as a failure in a real
+        pool."""
+
+        with patch('core.staf_pool.STAFHandle', _RawHandleStub):
+            supervisor = ProcessSupervisor(STAFHandlePool())
+            pool = supervisor._pool
+
+            supervisor.start('10.0.0.1', 'START COMMAND "hostname"', 60)
+            supervisor._track()
+
+        self.assertNotIn('queue', pool.stats)
+        self.assertEqual(pool.stats['process'][:2], (1, 0))
+
+class ProcessSupervisorTests_Negative(_ProcessSupervisorTestCase):
+    """Negative tests for the ProcessSupervisor class in the process_supervisor module."""
+
+    def test1_start_failure(self):
+        """Verify that a process that fails to start is reported and not tracked."""
+
+        self.handle.answers['START'] = lambda request: _STAFResultStub(16, 'No path')
+
+        with self.assertRaises(SupervisorError) as cm:
+            self.supervisor.start('10.0.0.1', 'START COMMAND "hostname"', 60)
+
+        self.assertEqual(cm.exception.msg, 'No path')
+        self.assertEqual(self.supervisor.running, 0)
+
+    def test2_lost_process(self):
+        """Verify that a process is given up on after too many failed queries in a row."""
+
+        self._query_results(*[_STAFResultStub(16, 'No path')] * 3)
+
+        process = self._start()
+
+        for _ in range(3):
+            self.assertFalse(process.done())
+            self.supervisor._poll(process)
+
+        with self.assertRaises(SupervisorError) as cm:
+            process.result()
+
+        self.assertEqual(cm.exception.msg, 'Lost track of the process "7" on "10.0.0.1"! '
+                                           'Reason: No path')
+
+    def test3_unknown_notification(self):
+        """Verify that a notification for a process that isn't tracked is ignored."""
+
+        process = self._start()
+
+        self.handle.notify('unknown', '9', 0)
+        self.supervisor._track()
+
+        self.assertFalse(process.done())
+        self.assertEqual(self.handle.sent('FREE'), [])
@@ -0,0 +1,178 @@
+"""
+.. module:: results_store_test
+   :platform: Linux, Windows
+   :synopsis: Unit tests for the results_store module.
+   :license: BSD, see LICENSE for more details.
+
+.. moduleauthor:: Caleb Moniot <cmoniot@gmail.com>
+"""
+__version__ = 0.1
+
+#===================================================================================================
+# Imports
+#===================================================================================================
+import shutil
+from tempfile import mkdtemp
+from os import makedirs, walk
+from os.path import join, isdir, isfile, dirname
+from unittest import TestCase
+from util import file_digest
+from core.results_store import ResultsStore, ResultsStoreError
+
+#===================================================================================================
+# Functions
+#===================================================================================================
+def _write_file(path, content):
+    """Write a file and any missing parent directories."""
+
+    if not isdir(dirname(path)):
+        makedirs(dirname(path))
+
+    with open(path, 'wb') as file_handle:
+        file_handle.write(content)
+
+def _read_file(path):
+    """Read the contents of a file."""
+
+    with open(path, 'rb') as file_handle:
+        return file_handle.read()
+
+#===================================================================================================
+# Tests
+#===================================================================================================
+class _ResultsStoreTestCase(TestCase):
+    """Base class for tests that add results directories to a temporary results store."""
+
+    def setUp(self):
+        self.temp_dir = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+
+        self.store = ResultsStore(join(self.temp_dir, 'store'))
+
+    def _results(self, name, log='log'):
+        """Create a results directory with a log, a shared file and an empty directory."""
+
+        path = join(self.temp_dir, 'results', name)
+
+        _write_file(join(path, 'logs', 'test.log'), log)
+        _write_file(join(path, 'shared.bin'), 'shared')
+        makedirs(join(path, 'empty'))
+
+        return path
+
+    def _blobs(self):
+        """List the blob files in the store."""
+
+        return [name for _, _, names in walk(join(self.store.root, 'blobs')) for name in names]
+
+class ResultsStoreTests(_ResultsStoreTestCase):
+    """Tests for the ResultsStore class in the results_store module."""
+
+    def test1_add(self):
+        """Verify that results are split into blobs and a manifest and the directory is removed."""
+
+        path = self._results('test1')
+        digest = file_digest(join(path, 'logs', 'test.log'))
+
+        manifest = self.store.add(path, 'key1', 'run', 'plan', 'case', 'test1', 'Pass')
+
+        self.assertFalse(isdir(path))
+        self.assertEqual(sorted(manifest['files']), ['logs/test.log', 'shared.bin'])
+        self.assertEqual(manifest['files']['logs/test.log'], {'size': 3, 'digest': digest})
+        self.assertEqual(manifest['dirs'], ['empty', 'logs'])
+        self.assertEqual(_read_file(self.store.blob_path(digest)), 'log')
+
+    def test2_same_bytes_stored_once(self):
+        """Verify that identical files of different tests are kept as a single blob."""
+
+        first = self.store.add(self._results('test1', 'first'), 'key1')
+        second = self.store.add(self._results('test2', 'second'), 'key2')
+
+        self.assertEqual(first['files']['shared.bin'], second['files']['shared.bin'])
+        self.assertEqual(len(self._blobs()), 3)
+
+    def test3_find(self):
+        """Verify that results are found by name and criteria that are None match everything."""
+
+        self.store.add(self._results('test1'), 'key1', 'run', 'plan', 'case1', 'test1', 'Pass')
+        self.store.add(self._results('test2'), 'key2', 'run', 'plan', 'case2', 'test2', 'Fail')
+
+        found = self.store.find(test_case='case2')
+
+        self.assertEqual([result['key'] for result in found], ['key2'])
+        self.assertEqual(found[0]['status'], 'Fail')
+        self.assertEqual([result['key'] for result in self.store.find(run='run')],
+                         ['key1', 'key2'])
+        self.assertEqual(self.store.find(test='missing'), [])
+
+    def test4_manifest(self):
+        """Verify that the manifest of stored results can be loaded by key."""
+
+        added = self.store.add(self._results('test1'), 'key1', test='test1')
+
+        self.assertEqual(self.store.manifest('key1'), added)
+
+    def test5_restore(self):
+        """Verify that a results directory is recreated from the store."""
+
+        self.store.add(self._results('test1'), 'key1')
+
+        target = join(self.temp_dir, 'restored')
+        self.store.restore('key1', target)
+
+        self.assertEqual(_read_file(join(target, 'logs', 'test.log')), 'log')
+        self.assertEqual(_read_file(join(target, 'shared.bin')), 'shared')
+        self.assertTrue(isdir(join(target, 'empty')))
+
+    def test6_add_again(self):
+        """Verify that adding results under an existing key replaces the earlier results."""
+
+        self.store.add(self._results('test1', 'first'), 'key1', test='test1', status='Fail')
+        self.store.add(self._results('test1', 'second'), 'key1', test='test1', status='Pass')
+
+        found = self.store.find(test='test1')
+
+        self.assertEqual([result['status'] for result in found], ['Pass'])
+        self.assertEqual(self.store.manifest('key1')['files']['logs/test.log']['size'], 6)
+
+class ResultsStoreTests_Negative(_ResultsStoreTestCase):
+    """Negative tests for the ResultsStore class in the results_store module."""
+
+    def test1_missing_manifest(self):
+        """Attempt to load the manifest of results that were never stored."""
+
+        with self.assertRaises(ResultsStoreError) as cm:
+            self.store.manifest('missing')
+
+        self.assertTrue(cm.exception.msg.startswith('Failed to load the manifest for "missing"!'))
+
+    def test2_restore_missing(self):
+        """Attempt to restore results that were never stored."""
+
+        with self.assertRaises(ResultsStoreError):
+            self.store.restore('missing', join(self.temp_dir, 'restored'))
+
+        self.assertFalse(isdir(join(self.temp_dir, 'restored')))
+
+    def test3_restore_missing_blob(self):
+        """Attempt to restore results whose blob was removed from the store."""
+
+        manifest = self.store.add(self._results('test1'), 'key1')
+        shutil.rmtree(dirname(self.store.blob_path(manifest['files']['shared.bin']['digest'])))
+
+        with self.assertRaises(ResultsStoreError) as cm:
+            self.store.restore('key1', join(self.temp_dir, 'restored'))
+
+        self.assertTrue(cm.exception.msg.startswith('Failed to restore the results "key1"'))
+
+    def test4_add_missing_directory(self):
+        """Attempt to add a results directory that was removed, leaving nothing in the store."""
+
+        missing = join(self.temp_dir, 'missing')
+
+        with self.assertRaises(ResultsStoreError) as cm:
+            self.store.add(missing, 'key1')
+
+        self.assertEqual(cm.exception.msg,
+                         'The results directory "{0}" does not exist!'.format(missing))
+        self.assertFalse(isfile(join(self.store.root, 'manifests', 'key1.json')))
@@ -0,0 +1,228 @@
+"""
+.. module:: staf_pool_test
+   :platform: Linux, Windows
+   :synopsis: Unit tests for the staf_pool module with a mocked STAF handle.
+   :license: BSD, see LICENSE for more details.
+
+.. moduleauthor:: Caleb Moniot <cmoniot@gmail.com>
+"""
+__version__ = 0.1
+
+#===================================================================================================
+# Imports
+#===================================================================================================
+from threading import Thread
+from unittest import TestCase
+from mock import patch
+from PySTAF import STAFException
+from core.staf_pool import STAFHandlePool, HEALTH_CHECK_INTERVAL
+
+#===================================================================================================
+# Classes
+#===================================================================================================
+class _STAFResultStub(object):
+    """A stand-in for a STAF result."""
+
+    Ok = 0
+
+    def __init__(self, rc=0, result=''):
+        self.rc = rc
+        self.result = result
+
+class _STAFHandleStub(object):
+    """A stand-in for a registered STAF handle. Requests to a service are answered with the result
+    or exception set for the service and succeed otherwise."""
+
+    Standard = 0
+
+    def __init__(self, name, handle_type):
+        self.answers = {}
+        self.requests = []
+        self.unregistered = False
+
+    def submit(self, location, service, request):
+        self.requests.append((service, request))
+
+        answer = self.answers.get(service, _STAFResultStub())
+
+        if isinstance(answer, Exception):
+            raise answer
+
+        return answer
+
+    def unregister(self):
+        self.unregistered = True
+
+#===================================================================================================
+# Tests
+#===================================================================================================
+class _STAFHandlePoolTestCase(TestCase):
+    """Base class for tests that check handles in and out of a pool that registers handle
+    stubs."""
+
+    def setUp(self):
+        handle_patcher = patch('core.staf_pool.STAFHandle', _STAFHandleStub)
+        handle_patcher.start()
+        self.addCleanup(handle_patcher.stop)
+
+        self.pool = STAFHandlePool(max_idle=2)
+
+    def _checkin_from_thread(self, pooled):
+        """Return a handle to the pool from another thread."""
+
+        thread = Thread(target=self.pool.checkin, args=(pooled,))
+        thread.start()
+        thread.join()
+
+    def _age(self, pooled):
+        """Make a handle look like it has been idle long enough to be pinged."""
+
+        pooled._last_used -= HEALTH_CHECK_INTERVAL + 1
+
+class STAFHandlePoolTests(_STAFHandlePoolTestCase):
+    """Tests for the STAFHandlePool class in the staf_pool module."""
+
+    def test1_reuse(self):
+        """Verify that a returned handle is handed out again instead of registering a new one."""
+
+        pooled = self.pool.checkout()
+        self.pool.checkin(pooled)
+
+        self.assertIs(self.pool.checkout(), pooled)
+        self.assertEqual(self.pool.registered, 1)
+
+    def test2_thread_affinity(self):
+        """Verify that a thread is given back the handle it returned last over a handle another
+        thread returned more recently."""
+
+        mine = self.pool.checkout()
+        other = self.pool.checkout()
+
+        self.pool.checkin(mine)
+        self._checkin_from_thread(other)
+
+        self.assertIs(self.pool.checkout(), mine)
+        self.assertIs(self.pool.checkout(), other)
+
+    def test3_idle_cap(self):
+        """Verify that handles returned beyond the idle cap are unregistered."""
+
+        handles = [self.pool.checkout() for _ in range(3)]
+
+        for pooled in handles:
+            self.pool.checkin(pooled)
+
+        self.assertEqual(self.pool.registered, 2)
+        self.assertEqual([pooled._handle.unregistered for pooled in handles],
+                         [False, False, True])
+
+    def test4_recent_handle_not_pinged(self):
+        """Verify that a handle returned recently is handed out without a ping."""
+
+        pooled = self.pool.checkout()
+        self.pool.checkin(pooled)
+
+        self.pool.checkout()
+
+        self.assertNotIn(('ping', 'ping'), pooled._handle.requests)
+
+    def test5_idle_handle_pinged(self):
+        """Verify that a handle that has been idle for a while is pinged before it is reused."""
+
+        pooled = self.pool.checkout()
+        self.pool.checkin(pooled)
+        self._age(pooled)
+
+        self.assertIs(self.pool.checkout(), pooled)
+        self.assertIn(('ping', 'ping'), pooled._handle.requests)
+
+    def test6_queue_cleared(self):
+        """Verify that the queue of a handle is cleared when it is returned."""
+
+        pooled = self.pool.checkout()
+        self.pool.checkin(pooled)
+
+        self.assertEqual(pooled._handle.requests, [('queue', 'DELETE')])
+        self.assertEqual(self.pool.stats, {})
+
+    def test7_stats(self):
+        """Verify that requests are counted by service with failures."""
+
+        pooled = self.pool.checkout()
+        pooled._handle.answers['fs'] = _STAFResultStub(48, 'Does not exist')
+
+        pooled.submit('local', 'fs', 'GET ENTRY "C:/missing" TYPE')
+        pooled.submit('local', 'PROCESS', 'START COMMAND "hostname"')
+
+        stats = self.pool.stats
+
+        self.assertEqual(stats['fs'][:2], (1, 1))
+        self.assertEqual(stats['process'][:2], (1, 0))
+
+    def test8_close(self):
+        """Verify that closing the pool unregisters the idle handles."""
+
+        pooled = self.pool.checkout()
+        self.pool.checkin(pooled)
+        self.pool.close()
+
+        self.assertTrue(pooled._handle.unregistered)
+        self.assertEqual(self.pool.registered, 0)
+
+class STAFHandlePoolTests_Negative(_STAFHandlePoolTestCase):
+    """Negative tests for the STAFHandlePool class in the staf_pool module."""
+
+    def test1_unhealthy_checkin(self):
+        """Verify that a handle returned as unhealthy is unregistered."""
+
+        pooled = self.pool.checkout()
+        self.pool.checkin(pooled, healthy=False)
+
+        self.assertTrue(pooled._handle.unregistered)
+        self.assertIsNot(self.pool.checkout(), pooled)
+
+    def test2_failed_ping(self):
+        """Verify that an idle handle that fails its ping is replaced by a new handle."""
+
+        pooled = self.pool.checkout()
+        self.pool.checkin(pooled)
+        self._age(pooled)
+        pooled._handle.answers['ping'] = _STAFResultStub(1, 'Invalid handle')
+
+        self.assertIsNot(self.pool.checkout(), pooled)
+        self.assertTrue(pooled._handle.unregistered)
+        self.assertEqual(self.pool.registered, 1)
+
+    def test3_ping_error(self):
+        """Verify that an idle handle whose ping raises a STAF error is replaced."""
+
+        pooled = self.pool.checkout()
+        self.pool.checkin(pooled)
+        self._age(pooled)
+        pooled._handle.answers['ping'] = STAFException(1, 'Invalid handle')
+
+        self.assertIsNot(self.pool.checkout(), pooled)
+        self.assertTrue(pooled._handle.unregistered)
+
+    def test4_failed_flag(self):
+        """Verify that a handle that raised a STAF error is flagged as failed."""
+
+        pooled = self.pool.checkout()
+        pooled._handle.answers['fs'] = STAFException(21, 'STAF not running')
+
+        with self.assertRaises(STAFException):
+            pooled.submit('local', 'fs', 'LIST DIRECTORY "C:/"')
+
+        self.assertTrue(pooled.failed)
+        self.assertEqual(self.pool.stats['fs'][:2], (1, 1))
+
+    def test5_queue_not_cleared(self):
+        """Verify that a handle whose queue can't be cleared is unregistered."""
+
+        pooled = self.pool.checkout()
+        pooled._handle.answers['queue'] = _STAFResultStub(2, 'Unknown service')
+
+        self.pool.checkin(pooled)
+
+        self.assertTrue(pooled._handle.unregistered)
+        self.assertEqual(self.pool.registered, 0)
@@ -0,0 +1,406 @@
+"""
+.. module:: transport_test
+   :platform: Linux, Windows
+   :synopsis: Unit tests for the local transport and the agent transport in the transport
+       module.
+   :license: BSD, see LICENSE for more details.
+
+.. moduleauthor:: Caleb Moniot <cmoniot@gmail.com>
+"""
+__version__ = 0.1
+
+#===================================================================================================
+# Imports
+#===================================================================================================
+import sys
+import socket
+import shutil
+from time import time, sleep
+from tempfile import mkdtemp
+from threading import Thread
+from os import makedirs, linesep
+from os.path import join, isdir, isfile, dirname
+from unittest import TestCase
+from mock import patch
+from bespoke_agent import AgentSession
+from core.agent_channel import AgentServer
+from core.transport import LocalTransport, AgentTransport, TransportError
+
+#===================================================================================================
+# Functions
+#===================================================================================================
+def _write_file(path, content):
+    """Write a file and any missing parent directories."""
+
+    if not isdir(dirname(path)):
+        makedirs(dirname(path))
+
+    with open(path, 'wb') as file_handle:
+        file_handle.write(content)
+
+def _read_file(path):
+    """Read the contents of a file."""
+
+    with open(path, 'rb') as file_handle:
+        return file_handle.read()
+
+def _python(code):
+    """A command line that runs a line of Python with the interpreter running the tests."""
+
+    return '"{0}" -c "{1}"'.format(sys.executable, code)
+
+#===================================================================================================
+# Tests
+#===================================================================================================
+class _LocalTransportTestCase(TestCase):
+    """Base class for tests that use the local transport in a temporary directory."""
+
+    def setUp(self):
+        self.temp_dir = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+
+        self.transport = LocalTransport()
+
+class LocalTransportTests(_LocalTransportTestCase):
+    """Tests for the LocalTransport class in the transport module."""
+
+    def test1_copy_dir(self):
+        """Verify that a directory tree is copied with its empty directories and other files in
+        the destination are left alone."""
+
+        source = join(self.temp_dir, 'source')
+        target = join(self.temp_dir, 'target')
+
+        _write_file(join(source, 'bin', 'tool.exe'), 'binary')
+        _write_file(join(source, 'readme.txt'), 'new')
+        makedirs(join(source, 'empty'))
+        _write_file(join(target, 'readme.txt'), 'old')
+        _write_file(join(target, 'other.txt'), 'other')
+
+        self.transport.copy_dir(source, target)
+
+        self.assertEqual(_read_file(join(target, 'bin', 'tool.exe')), 'binary')
+        self.assertEqual(_read_file(join(target, 'readme.txt')), 'new')
+        self.assertEqual(_read_file(join(target, 'other.txt')), 'other')
+        self.assertTrue(isdir(join(target, 'empty')))
+
+    def test2_copy_file(self):
+        """Verify that a file is copied and its missing parent directories are created."""
+
+        source = join(self.temp_dir, 'tool.exe')
+        target = join(self.temp_dir, 'target', 'bin', 'tool.exe')
+        _write_file(source, 'binary')
+
+        self.transport.copy_file(source, target)
+
+        self.assertEqual(_read_file(target), 'binary')
+
+    def test3_copy_file_overwrite(self):
+        """Verify that an existing file is replaced by default."""
+
+        source = join(self.temp_dir, 'tool.exe')
+        target = join(self.temp_dir, 'target.exe')
+        _write_file(source, 'new')
+        _write_file(target, 'old')
+
+        self.transport.copy_file(source, target)
+
+        self.assertEqual(_read_file(target), 'new')
+
+    def test4_create_dir(self):
+        """Verify that a directory and its parents are created and an existing directory is
+        accepted."""
+
+        path = join(self.temp_dir, 'a', 'b')
+
+        self.transport.create_dir(path)
+        self.transport.create_dir(path)
+
+        self.assertTrue(isdir(path))
+
+    def test5_start_proc(self):
+        """Verify that a process is started in its working directory with its parameters and
+        environment, and its exit code and output are returned."""
+
+        code = ('import os, sys; sys.stdout.write(os.getcwd() + os.environ[\'BESPOKE_TEST\'] + '
+                'sys.argv[1]); sys.stderr.write(\'!\'); sys.exit(3)')
+
+        process = self.transport.start_proc(_python(code),
+                                            self.temp_dir,
+                                            30,
+                                            ['-param'],
+                                            {'BESPOKE_TEST': '-env'})
+
+        exit_code, output = process.result(30)
+
+        self.assertEqual(exit_code, 3)
+        self.assertEqual(output, self.temp_dir + '-env-param!')
+        self.assertTrue(process.done())
+
+    def test6_ping(self):
+        """Verify that the local machine can always be reached."""
+
+        self.assertTrue(self.transport.ping())
+        self.assertTrue(self.transport.is_local)
+
+class LocalTransportTests_Negative(_LocalTransportTestCase):
+    """Negative tests for the LocalTransport class in the transport module."""
+
+    def test1_copy_missing_dir(self):
+        """Attempt to copy a directory that doesn't exist."""
+
+        missing = join(self.temp_dir, 'missing')
+
+        with self.assertRaises(TransportError) as cm:
+            self.transport.copy_dir(missing, join(self.temp_dir, 'target'))
+
+        self.assertEqual(cm.exception.msg, 'The directory "{0}" does not exist!'.format(missing))
+
+    def test2_copy_file_no_overwrite(self):
+        """Attempt to replace an existing file when overwriting is not allowed."""
+
+        source = join(self.temp_dir, 'tool.exe')
+        target = join(self.temp_dir, 'target.exe')
+        _write_file(source, 'new')
+        _write_file(target, 'old')
+
+        with self.assertRaises(TransportError) as cm:
+            self.transport.copy_file(source, target, overwrite=False)
+
+        self.assertEqual(cm.exception.msg, 'The file "{0}" already exists!'.format(target))
+        self.assertEqual(_read_file(target), 'old')
+
+    def test3_copy_missing_file(self):
+        """Attempt to copy a file that doesn't exist."""
+
+        with self.assertRaises(TransportError):
+            self.transport.copy_file(join(self.temp_dir, 'missing'),
+                                     join(self.temp_dir, 'target'))
+
+    def test4_create_existing_dir(self):
+        """Attempt to create a directory that already exists when that is not allowed."""
+
+        with self.assertRaises(TransportError) as cm:
+            self.transport.create_dir(self.temp_dir, fail_if_exists=True)
+
+        self.assertEqual(cm.exception.msg,
+                         'The directory "{0}" already exists!'.format(self.temp_dir))
+
+    def test5_start_proc_timeout(self):
+        """Verify that a process that runs past its timeout is killed with the children it
+        started."""
+
+        marker = join(self.temp_dir, 'marker.txt')
+        code = ('import subprocess, sys, time; subprocess.Popen([sys.executable, \'-c\', '
+                '\\"import time; time.sleep(2); open(r\'{0}\', \'w\')\\"]); '
+                'time.sleep(30)').format(marker)
+
+        start = time()
+        process = self.transport.start_proc(_python(code), self.temp_dir, 1)
+
+        with self.assertRaises(TransportError) as cm:
+            process.result(20)
+
+        self.assertLess(time() - start, 10)
+        self.assertTrue(cm.exception.msg.endswith('timed out!'))
+
+        #The child would have written the marker by now had it survived the kill.
+        sleep(3)
+
+        self.assertFalse(isfile(marker))
+
+    def test6_result_still_running(self):
+        """Verify that waiting on a process that is still running gives up after the timeout."""
+
+        #The first wait on a process lasts a second, so the kill comes well after it.
+        process = self.transport.start_proc(_python('import time; time.sleep(30)'),
+                                            self.temp_dir,
+                                            3)
+
+        with self.assertRaises(TransportError) as cm:
+            process.result(0)
+
+        self.assertTrue(cm.exception.msg.endswith('is still running!'))
+
+        #Let the process be killed so it doesn't outlive the test.
+        with self.assertRaises(TransportError):
+            process.result(20)
+
+class _AgentTransportTestCase(TestCase):
+    """Base class for tests that use the agent transport with an agent session connected to a
+    server on the loopback interface."""
+
+    def setUp(self):
+        self.temp_dir = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+
+        self.server = AgentServer('127.0.0.1', 'secret', port=0)
+        self.addCleanup(self.server.close)
+
+        sock = socket.create_connection(('127.0.0.1', self.server.port))
+
+        thread = Thread(target=AgentSession(sock, 'agent1', 'secret').run)
+        thread.daemon = True
+        thread.start()
+
+        self.server.get('agent1', timeout=10)
+        self.transport = AgentTransport(self.server, 'agent1')
+
+class AgentTransportTests(_AgentTransportTestCase):
+    """Tests for the AgentTransport class in the transport module."""
+
+    def test1_copy_dir(self):
+        """Verify that a directory tree is copied with its empty directories and other files in
+        the destination are left alone."""
+
+        source = join(self.temp_dir, 'source')
+        target = join(self.temp_dir, 'target')
+
+        _write_file(join(source, 'bin', 'tool.exe'), 'binary')
+        _write_file(join(source, 'readme.txt'), 'new')
+        makedirs(join(source, 'empty', 'nested'))
+        _write_file(join(target, 'readme.txt'), 'old')
+        _write_file(join(target, 'other.txt'), 'other')
+
+        self.transport.copy_dir(source, target)
+
+        self.assertEqual(_read_file(join(target, 'bin', 'tool.exe')), 'binary')
+        self.assertEqual(_read_file(join(target, 'readme.txt')), 'new')
+        self.assertEqual(_read_file(join(target, 'other.txt')), 'other')
+        self.assertTrue(isdir(join(target, 'empty', 'nested')))
+
+    def test2_copy_file(self):
+        """Verify that a file is copied and its missing parent directories are created."""
+
+        source = join(self.temp_dir, 'tool.exe')
+        target = join(self.temp_dir, 'target', 'bin', 'tool.exe')
+        _write_file(source, 'binary\r\n')
+
+        self.transport.copy_file(source, target)
+
+        self.assertEqual(_read_file(target), 'binary\r\n')
+
+    def test3_copy_text_file(self):
+        """Verify that the line endings of a text file are converted for the agent machine, even
+        when a line ending is split between two chunks."""
+
+        source = join(self.temp_dir, 'readme.txt')
+        target = join(self.temp_dir, 'target.txt')
+        _write_file(source, 'one\r\ntwo\nthree\r')
+
+        with patch('core.agent_channel.CHUNK_SIZE', 4):
+            self.transport.copy_file(source, target, is_text_file=True)
+
+        self.assertEqual(_read_file(target), 'one{0}two{0}three\r'.format(linesep))
+
+    def test4_create_dir(self):
+        """Verify that a directory and its parents are created and an existing directory is
+        accepted."""
+
+        path = join(self.temp_dir, 'a', 'b')
+
+        self.transport.create_dir(path)
+        self.transport.create_dir(path)
+
+        self.assertTrue(isdir(path))
+
+    def test5_start_proc(self):
+        """Verify that a process is started in its working directory with its parameters and
+        environment, and its exit code and output are returned."""
+
+        code = ('import os, sys; sys.stdout.write(os.getcwd() + os.environ[\'BESPOKE_TEST\'] + '
+                'sys.argv[1]); sys.stderr.write(\'!\'); sys.exit(3)')
+
+        process = self.transport.start_proc(_python(code),
+                                            self.temp_dir,
+                                            30,
+                                            ['-param'],
+                                            {'BESPOKE_TEST': '-env'})
+
+        exit_code, output = process.result(30)
+
+        self.assertEqual(exit_code, 3)
+        self.assertEqual(output, self.temp_dir + '-env-param!')
+        self.assertTrue(process.done())
+
+    def test6_ping(self):
+        """Verify that a connected agent can be reached."""
+
+        self.assertTrue(self.transport.ping())
+        self.assertFalse(self.transport.is_local)
+
+class AgentTransportTests_Negative(_AgentTransportTestCase):
+    """Negative tests for the AgentTransport class in the transport module."""
+
+    def test1_copy_missing_dir(self):
+        """Attempt to copy a directory that doesn't exist."""
+
+        missing = join(self.temp_dir, 'missing')
+
+        with self.assertRaises(TransportError) as cm:
+            self.transport.copy_dir(missing, join(self.temp_dir, 'target'))
+
+        self.assertEqual(cm.exception.msg, 'The directory "{0}" does not exist!'.format(missing))
+
+    def test2_copy_file_no_overwrite(self):
+        """Attempt to replace an existing file when overwriting is not allowed."""
+
+        source = join(self.temp_dir, 'tool.exe')
+        target = join(self.temp_dir, 'target.exe')
+        _write_file(source, 'new')
+        _write_file(target, 'old')
+
+        with self.assertRaises(TransportError) as cm:
+            self.transport.copy_file(source, target, overwrite=False)
+
+        self.assertEqual(cm.exception.msg,
+                         'Failed to copy "{0}" to "{1}"! Reason: The file "{1}" already '
+                         'exists!'.format(source, target))
+        self.assertEqual(_read_file(target), 'old')
+
+    def test3_copy_missing_file(self):
+        """Attempt to copy a file that doesn't exist."""
+
+        with self.assertRaises(TransportError):
+            self.transport.copy_file(join(self.temp_dir, 'missing'),
+                                     join(self.temp_dir, 'target'))
+
+        self.assertTrue(self.transport.ping())
+
+    def test4_create_existing_dir(self):
+        """Attempt to create a directory that already exists when that is not allowed."""
+
+        with self.assertRaises(TransportError) as cm:
+            self.transport.create_dir(self.temp_dir, fail_if_exists=True)
+
+        self.assertEqual(cm.exception.msg,
+                         'Failed to create the directory "{0}"! Reason: The directory "{0}" '
+                         'already exists!'.format(self.temp_dir))
+
+    def test5_start_proc_timeout(self):
+        """Verify that a process that runs past its timeout is reported as timed out."""
+
+        start = time()
+        process = self.transport.start_proc(_python('import time; time.sleep(30)'),
+                                            self.temp_dir,
+                                            1)
+
+        with self.assertRaises(TransportError) as cm:
+            process.result(20)
+
+        self.assertLess(time() - start, 10)
+        self.assertTrue(cm.exception.msg.endswith('The command timed out after 1 seconds!'))
+
+    def test6_agent_not_connected(self):
+        """Verify that an agent that isn't connected can't be pinged and operations fail once
+        it doesn't reconnect in time."""
+
+        transport = AgentTransport(self.server, 'missing')
+
+        self.assertFalse(transport.ping())
+
+        with patch('core.transport.AGENT_CONNECT_TIMEOUT', 0):
+            with self.assertRaises(TransportError) as cm:
+                transport.create_dir(join(self.temp_dir, 'a'))
+
+        self.assertEqual(cm.exception.msg, 'The agent "missing" is not connected!')
@@ -0,0 +1,66 @@
+"""
+.. module:: util_test
+   :platform: Linux, Windows
+   :synopsis: Unit tests for the util module.
+   :license: BSD, see LICENSE for more details.
+
+.. moduleauthor:: Caleb Moniot <cmoniot@gmail.com>
+"""
+__version__ = 0.1
+
+#===================================================================================================
+# Imports
+#===================================================================================================
+import shutil
+import hashlib
+from tempfile import mkdtemp
+from os.path import join
+from unittest import TestCase
+from mock import patch
+import util
+
+#===================================================================================================
+# Tests
+#===================================================================================================
+class FileDigestTests(TestCase):
+    """Tests for the file_digest function in the util module."""
+
+    def setUp(self):
+        self.temp_dir = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+
+        patcher = patch.object(util, '_digest_memo', util.OrderedDict())
+        self.addCleanup(patcher.stop)
+        patcher.start()
+
+        self.paths = []
+
+        for index in range(3):
+            path = join(self.temp_dir, 'file{0}.txt'.format(index))
+
+            with open(path, 'wb') as file_handle:
+                file_handle.write('content {0}'.format(index))
+
+            self.paths.append(path)
+
+    def test1_digest(self):
+        """Verify that the digest is the SHA-1 of the file contents."""
+
+        self.assertEqual(util.file_digest(self.paths[0]), hashlib.sha1('content 0').hexdigest())
+
+    def test2_memo_is_bounded(self):
+        """Verify that only the most recently used digests are remembered."""
+
+        with patch.object(util, 'DIGEST_MEMO_SIZE', 2):
+            util.file_digest(self.paths[0])
+            util.file_digest(self.paths[1])
+
+            #Using the first digest again makes the second one the least recently used.
+            util.file_digest(self.paths[0])
+            util.file_digest(self.paths[2])
+
+        remembered = [key[0] for key in util._digest_memo]
+
+        self.assertEqual(len(remembered), 2)
+        self.assertIn(self.paths[0], remembered)
+        self.assertIn(self.paths[2], remembered)